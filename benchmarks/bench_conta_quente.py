@@ -0,0 +1,106 @@
+
+"""Vazão de depósitos numa conta só, com e sem o modo de conta quente.
+
+Cada ponto roda num processo novo (CLIENTES_DB_CONTAS_QUENTES vazio ou com a
+conta do teste): N clientes concorrentes depositam na mesma conta via ASGI.
+Mostra depósitos/s, p95, respostas de erro e se o saldo final bate com a
+soma dos depósitos confirmados.
+
+    python -m benchmarks.bench_conta_quente [--req 2000] [--concorrencia 32]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+CONTA = {"agencia": "0001", "numero_conta": "9999"}
+
+
+async def _rodada(requisicoes: int, concorrencia: int) -> dict:
+    import httpx
+
+    from clientes_db.app.db import engine
+    from clientes_db.app.main import app
+    from clientes_db.app.schema import preparar_schema
+
+    preparar_schema(engine)
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        r = await client.post("/contas", json={
+            **CONTA, "nome": "Loja", "cpf": "99999999999", "telefone": 11999999999,
+            "email": "loja@ex.com", "saldo_cc": 0.0,
+        })
+        r.raise_for_status()
+
+        latencias = []
+        confirmados = 0
+        pendentes = iter(range(requisicoes))
+
+        async def cliente():
+            nonlocal confirmados
+            for _ in pendentes:
+                inicio = time.perf_counter()
+                r = await client.post("/contas/operacoes/depositar", json={**CONTA, "saldo": 1.0})
+                confirmados += r.status_code == 200
+                latencias.append(time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(cliente() for _ in range(concorrencia)))
+        duracao = time.perf_counter() - inicio
+        saldo = (await client.get(f"/contas/{CONTA['agencia']}/{CONTA['numero_conta']}")).json()["saldo_cc"]
+
+    return {
+        "depositos_s": confirmados / duracao,
+        "erros": requisicoes - confirmados,
+        "p95_ms": statistics.quantiles(latencias, n=20)[-1] * 1000,
+        "saldo_confere": saldo == confirmados,
+    }
+
+
+def _ponto(quente: bool, requisicoes: int, concorrencia: int, diretorio: str) -> dict:
+    nome = "quente" if quente else "normal"
+    env = {
+        **os.environ,
+        "CLIENTES_DB_DATABASE_URL": f"sqlite:///{os.path.join(diretorio, f'{nome}.db')}",
+        "CLIENTES_DB_CONTAS_QUENTES": f"{CONTA['agencia']}/{CONTA['numero_conta']}" if quente else "",
+    }
+    r = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_conta_quente", "--ponto",
+         "--req", str(requisicoes), "--concorrencia", str(concorrencia)],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(r.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--req", type=int, default=2000)
+    parser.add_argument("--concorrencia", type=int, default=32)
+    parser.add_argument("--ponto", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.ponto:
+        print(json.dumps(asyncio.run(_rodada(args.req, args.concorrencia))))
+        return
+
+    print(f"{os.cpu_count()} núcleos, {args.concorrencia} clientes na mesma conta")
+    print(f"{'modo':>7} {'depósitos/s':>12} {'p95 ms':>9} {'erros':>6} {'saldo ok':>9}")
+    with tempfile.TemporaryDirectory() as d:
+        for quente in (False, True):
+            r = _ponto(quente, args.req, args.concorrencia, d)
+            modo = "quente" if quente else "normal"
+            print(
+                f"{modo:>7} {r['depositos_s']:>12.0f} {r['p95_ms']:>9.1f} "
+                f"{r['erros']:>6} {str(r['saldo_confere']):>9}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+
+"""Vazão do clientes_db por número de threads/conexões.
+
+Cada ponto roda num processo novo com CLIENTES_DB_POOL_SIZE (e, por tabela,
+CLIENTES_DB_WORKERS) no valor do ponto: dispara requisições concorrentes
+contra o app via ASGI, num SQLite em arquivo, e mostra req/s, p95, as
+esperas médias por thread e por conexão e as respostas de erro (com muitos
+escritores o SQLite passa a devolver "database is locked"). O joelho da
+curva é o ponto a partir do qual mais threads não aumentam a vazão.
+
+    python -m benchmarks.bench_executor [--workers 1,2,4,8,16,32] [--req 2000] [--concorrencia 64]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+CONTAS = 200
+
+
+async def _rodada(requisicoes: int, concorrencia: int) -> dict:
+    import httpx
+
+    from clientes_db.app import metricas
+    from clientes_db.app.db import engine
+    from clientes_db.app.main import app
+    from clientes_db.app.schema import preparar_schema
+
+    preparar_schema(engine)
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for i in range(CONTAS):
+            r = await client.post("/contas", json={
+                "agencia": "0001", "numero_conta": f"{i:04d}", "nome": f"Bench {i}",
+                "cpf": f"{i:011d}", "telefone": 11999999999, "email": f"b{i}@ex.com",
+                "saldo_cc": 100.0,
+            })
+            r.raise_for_status()
+        metricas.espera_fila = metricas.Medidor()
+        metricas.espera_conexao = metricas.Medidor()
+
+        latencias = []
+        erros = 0
+        pendentes = iter(range(requisicoes))
+
+        async def cliente(c: int):
+            # Cada cliente deposita só na própria conta: o ponto mede vazão,
+            # não conflitos de versão entre escritores da mesma conta.
+            nonlocal erros
+            propria = f"{c % CONTAS:04d}"
+            for i in pendentes:
+                inicio = time.perf_counter()
+                # 4 leituras para cada escrita.
+                if i % 5:
+                    r = await client.get(f"/contas/0001/{i % CONTAS:04d}")
+                else:
+                    r = await client.post("/contas/operacoes/depositar", json={
+                        "agencia": "0001", "numero_conta": propria, "saldo": 1.0,
+                    })
+                erros += r.status_code >= 400
+                latencias.append(time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(cliente(c) for c in range(concorrencia)))
+        duracao = time.perf_counter() - inicio
+
+    return {
+        "req_s": requisicoes / duracao,
+        "erros": erros,
+        "p95_ms": statistics.quantiles(latencias, n=20)[-1] * 1000,
+        "fila_ms": metricas.espera_fila.resumo()["media_ms"],
+        "conexao_ms": metricas.espera_conexao.resumo()["media_ms"],
+    }
+
+
+def _ponto(workers: int, requisicoes: int, concorrencia: int, diretorio: str) -> dict:
+    env = {
+        **os.environ,
+        "CLIENTES_DB_DATABASE_URL": f"sqlite:///{os.path.join(diretorio, f'w{workers}.db')}",
+        "CLIENTES_DB_POOL_SIZE": str(workers),
+    }
+    env.pop("CLIENTES_DB_WORKERS", None)
+    r = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_executor", "--ponto",
+         "--req", str(requisicoes), "--concorrencia", str(concorrencia)],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(r.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,2,4,8,16,32")
+    parser.add_argument("--req", type=int, default=2000)
+    parser.add_argument("--concorrencia", type=int, default=64)
+    parser.add_argument("--ponto", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.ponto:
+        print(json.dumps(asyncio.run(_rodada(args.req, args.concorrencia))))
+        return
+
+    with tempfile.TemporaryDirectory() as d:
+        print(
+            f"{'workers':>8} {'req/s':>9} {'p95 ms':>9} {'fila ms':>9} "
+            f"{'conexão ms':>11} {'erros':>6}"
+        )
+        for w in (int(w) for w in args.workers.split(",")):
+            r = _ponto(w, args.req, args.concorrencia, d)
+            print(
+                f"{w:>8} {r['req_s']:>9.0f} {r['p95_ms']:>9.1f} "
+                f"{r['fila_ms']:>9.2f} {r['conexao_ms']:>11.2f} {r['erros']:>6}"
+            )
+
+
+if __name__ == "__main__":
+    main()
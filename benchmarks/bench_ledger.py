@@ -0,0 +1,67 @@
+
+"""Custo do livro-razão (movimentacoes) em depositar/sacar.
+
+Roda as rotas do clientes_db direto, num SQLite em arquivo, com e sem a
+gravação da movimentação, e mostra a diferença por operação.
+
+    python -m benchmarks.bench_ledger [--ops 2000]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from clientes_db.app import repositorio
+from clientes_db.app.repositorio import RepositorioSQL
+from clientes_db.app.routers import contas as rotas
+from clientes_db.app.schema import preparar_schema
+from clientes_db.app.schemas import ContaCreate, OperacaoPorChaves
+
+
+def _sessao(diretorio: str, nome: str):
+    engine = create_engine(f"sqlite:///{os.path.join(diretorio, nome)}")
+    preparar_schema(engine)
+    return sessionmaker(bind=engine, autocommit=False, autoflush=False)()
+
+
+def _rodada(db, ops: int) -> float:
+    rotas.criar_conta(body=ContaCreate(
+        agencia="0001", numero_conta="0001", nome="Bench", cpf="00000000001",
+        telefone=11999999999, email="bench@ex.com", saldo_cc=1000.0
+    ), repo=RepositorioSQL(db))
+    op = OperacaoPorChaves(agencia="0001", numero_conta="0001", saldo=1.0)
+
+    inicio = time.perf_counter()
+    for i in range(ops):
+        if i % 2:
+            rotas.sacar(body=op, repo=RepositorioSQL(db))
+        else:
+            rotas.depositar(body=op, repo=RepositorioSQL(db))
+    return time.perf_counter() - inicio
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ops", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as d:
+        original = repositorio.registrar_movimentacao
+        repositorio.registrar_movimentacao = lambda *a, **k: None
+        try:
+            sem = _rodada(_sessao(d, "sem_ledger.db"), args.ops)
+        finally:
+            repositorio.registrar_movimentacao = original
+        com = _rodada(_sessao(d, "com_ledger.db"), args.ops)
+
+    for nome, t in (("sem ledger", sem), ("com ledger", com)):
+        print(f"{nome:>10}: {args.ops / t:8.0f} ops/s  {t / args.ops * 1e6:8.1f} us/op")
+    print(f"overhead: {(com / sem - 1) * 100:+.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+
+"""Vazão de escrita do clientes_db por número de shards.
+
+Cada ponto roda num processo novo com CLIENTES_DB_SHARDS no valor do ponto:
+cria contas em várias agências (espalhadas pelos shards) e dispara depósitos
+concorrentes, cada cliente na própria conta, contra o app via ASGI. Mostra
+escritas/s, p95 e respostas de erro. Com um arquivo só as escritas são
+serializadas pelo lock do SQLite; com N arquivos até N commits andam juntos.
+
+    python -m benchmarks.bench_shards [--shards 1,2,4] [--req 2000] [--concorrencia 32]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+AGENCIAS = 64
+
+
+async def _rodada(requisicoes: int, concorrencia: int) -> dict:
+    import httpx
+
+    from clientes_db.app.db import engine, engines_extras
+    from clientes_db.app.main import app
+    from clientes_db.app.schema import preparar_schema
+
+    for bind in (engine, *engines_extras()):
+        preparar_schema(bind)
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for c in range(concorrencia):
+            r = await client.post("/contas", json={
+                "agencia": f"{1000 + c % AGENCIAS}", "numero_conta": f"{c:04d}",
+                "nome": f"Bench {c}", "cpf": f"{c:011d}", "telefone": 11999999999,
+                "email": f"b{c}@ex.com", "saldo_cc": 0.0,
+            })
+            r.raise_for_status()
+
+        latencias = []
+        erros = 0
+        pendentes = iter(range(requisicoes))
+
+        async def cliente(c: int):
+            nonlocal erros
+            op = {"agencia": f"{1000 + c % AGENCIAS}", "numero_conta": f"{c:04d}", "saldo": 1.0}
+            for _ in pendentes:
+                inicio = time.perf_counter()
+                r = await client.post("/contas/operacoes/depositar", json=op)
+                erros += r.status_code >= 400
+                latencias.append(time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(cliente(c) for c in range(concorrencia)))
+        duracao = time.perf_counter() - inicio
+
+    return {
+        "escritas_s": requisicoes / duracao,
+        "erros": erros,
+        "p95_ms": statistics.quantiles(latencias, n=20)[-1] * 1000,
+    }
+
+
+def _ponto(shards: int, requisicoes: int, concorrencia: int, diretorio: str) -> dict:
+    env = {
+        **os.environ,
+        "CLIENTES_DB_DATABASE_URL": f"sqlite:///{os.path.join(diretorio, f's{shards}.db')}",
+        "CLIENTES_DB_SHARDS": str(shards),
+    }
+    r = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_shards", "--ponto",
+         "--req", str(requisicoes), "--concorrencia", str(concorrencia)],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(r.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shards", default="1,2,4")
+    parser.add_argument("--req", type=int, default=2000)
+    parser.add_argument("--concorrencia", type=int, default=32)
+    parser.add_argument("--ponto", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.ponto:
+        print(json.dumps(asyncio.run(_rodada(args.req, args.concorrencia))))
+        return
+
+    print(f"{os.cpu_count()} núcleos")
+    print(f"{'shards':>7} {'escritas/s':>11} {'p95 ms':>9} {'erros':>6}")
+    with tempfile.TemporaryDirectory() as d:
+        for n in (int(s) for s in args.shards.split(",")):
+            r = _ponto(n, args.req, args.concorrencia, d)
+            print(f"{n:>7} {r['escritas_s']:>11.0f} {r['p95_ms']:>9.1f} {r['erros']:>6}")
+
+
+if __name__ == "__main__":
+    main()
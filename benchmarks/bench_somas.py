@@ -0,0 +1,81 @@
+
+"""Somas sobre contas: saldo em FLOAT (reais) x INTEGER (centavos).
+
+Monta duas tabelas iguais num SQLite em arquivo, uma com os valores em
+reais (REAL) e outra em centavos (INTEGER), e mede o SUM simples e o
+agregado por agência usado pelo resumo.
+
+    python -m benchmarks.bench_somas [--linhas 200000] [--repeticoes 5]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+AGREGADO = """
+    SELECT agencia, count(*), sum(CASE WHEN saldo > 0 THEN saldo ELSE {zero} END),
+           sum(CASE WHEN saldo < 0 THEN -saldo ELSE {zero} END),
+           sum(max({zero}, limite - CASE WHEN saldo < 0 THEN -saldo ELSE {zero} END))
+    FROM {tabela} GROUP BY agencia
+"""
+
+
+def _popular(conn: sqlite3.Connection, linhas: int) -> None:
+    rnd = random.Random(35)
+    conn.execute("CREATE TABLE reais (agencia TEXT, saldo REAL, limite REAL)")
+    conn.execute("CREATE TABLE centavos (agencia TEXT, saldo INTEGER, limite INTEGER)")
+
+    dados = [
+        (f"{rnd.randint(1, 50):04d}", rnd.randint(-500_000, 5_000_000), rnd.choice([0, 50_000, 200_000]))
+        for _ in range(linhas)
+    ]
+    conn.executemany("INSERT INTO centavos VALUES (?, ?, ?)", dados)
+    conn.executemany(
+        "INSERT INTO reais VALUES (?, ?, ?)",
+        [(ag, s / 100, l / 100) for ag, s, l in dados],
+    )
+    conn.commit()
+
+
+def _melhor(conn: sqlite3.Connection, sql: str, repeticoes: int) -> tuple[float, list]:
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = conn.execute(sql).fetchall()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor, resultado
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--linhas", type=int, default=200_000)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as d:
+        conn = sqlite3.connect(os.path.join(d, "somas.db"))
+        _popular(conn, args.linhas)
+
+        for nome, sql in (
+            ("SUM(saldo)", "SELECT sum(saldo) FROM {tabela}"),
+            ("resumo", AGREGADO),
+        ):
+            t_reais, r_reais = _melhor(conn, sql.format(tabela="reais", zero="0.0"), args.repeticoes)
+            t_cent, r_cent = _melhor(conn, sql.format(tabela="centavos", zero="0"), args.repeticoes)
+            print(
+                f"{nome:>10}: reais {t_reais * 1e3:7.2f} ms  centavos {t_cent * 1e3:7.2f} ms  "
+                f"({(t_reais / t_cent - 1) * 100:+.1f}%)"
+            )
+
+        # Quanto a soma em float se afasta da soma exata em centavos.
+        exato = conn.execute("SELECT sum(saldo) FROM centavos").fetchone()[0]
+        em_float = conn.execute("SELECT sum(saldo) FROM reais").fetchone()[0]
+        print(f"desvio da soma em float: {abs(em_float * 100 - exato):.6f} centavos")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+
+"""Carga com vários processos (workers) sobre o mesmo clientes.db.
+
+Simula `uvicorn --workers N`: N processos, cada um com o app e o engine
+próprios, batem no mesmo arquivo SQLite ao mesmo tempo. Mede leituras
+(GET da conta) e escritas (depósito na conta do próprio worker) por segundo
+somando todos os processos, e as respostas de erro.
+
+Leituras devem escalar com o número de workers (até o número de núcleos);
+escritas são serializadas pelo SQLite e devem ficar estáveis, sem erros.
+
+    python -m benchmarks.bench_workers [--workers 1,2,4] [--segundos 5]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+CONTAS = 64
+
+
+def _preparar(url: str) -> None:
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from clientes_db.app.db import configurar_sqlite
+    from clientes_db.app.models import Conta
+    from clientes_db.app.schema import preparar_schema
+
+    engine = configurar_sqlite(create_engine(url))
+    preparar_schema(engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all(
+        Conta(
+            agencia="0001", numero_conta=f"{i:04d}", nome=f"Bench {i}", cpf=f"{i:011d}",
+            telefone=11999999999, email=f"b{i}@ex.com", correntista=True,
+            saldo_centavos=0, cheque_especial_contratado=False, limite_centavos=0,
+        )
+        for i in range(CONTAS)
+    )
+    db.commit()
+    db.close()
+    engine.dispose()
+
+
+async def _worker(indice: int, modo: str, inicio: float, segundos: float) -> dict:
+    import httpx
+
+    from clientes_db.app.main import app
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    ops = erros = 0
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await asyncio.sleep(max(0.0, inicio - time.time()))
+        fim = time.perf_counter() + segundos
+        while time.perf_counter() < fim:
+            numero = f"{(indice + ops) % CONTAS:04d}"
+            if modo == "leitura":
+                r = await client.get(f"/contas/0001/{numero}")
+            else:
+                r = await client.post("/contas/operacoes/depositar", json={
+                    "agencia": "0001", "numero_conta": f"{indice % CONTAS:04d}", "saldo": 1.0,
+                })
+            ops += 1
+            erros += r.status_code >= 400
+    return {"ops": ops, "erros": erros}
+
+
+def _rodada(url: str, workers: int, modo: str, segundos: float) -> dict:
+    env = {**os.environ, "CLIENTES_DB_DATABASE_URL": url}
+    # Margem para todos importarem o app antes de começar a medir.
+    inicio = time.time() + 2 + 1.5 * workers
+    processos = [
+        subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.bench_workers", "--worker", str(i),
+             "--modo", modo, "--inicio", str(inicio), "--segundos", str(segundos)],
+            env=env, stdout=subprocess.PIPE, text=True,
+        )
+        for i in range(workers)
+    ]
+    resultados = [json.loads(p.communicate()[0].strip().splitlines()[-1]) for p in processos]
+    return {
+        "ops_s": sum(r["ops"] for r in resultados) / segundos,
+        "erros": sum(r["erros"] for r in resultados),
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--segundos", type=float, default=5.0)
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--modo", default="leitura", help=argparse.SUPPRESS)
+    parser.add_argument("--inicio", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker is not None:
+        r = asyncio.run(_worker(args.worker, args.modo, args.inicio, args.segundos))
+        print(json.dumps(r))
+        return
+
+    print(f"{os.cpu_count()} núcleos")
+    print(f"{'workers':>8} {'leituras/s':>11} {'erros':>6} {'escritas/s':>11} {'erros':>6}")
+    with tempfile.TemporaryDirectory() as d:
+        for n in (int(w) for w in args.workers.split(",")):
+            url = f"sqlite:///{os.path.join(d, f'w{n}.db')}"
+            _preparar(url)
+            leitura = _rodada(url, n, "leitura", args.segundos)
+            escrita = _rodada(url, n, "escrita", args.segundos)
+            print(
+                f"{n:>8} {leitura['ops_s']:>11.0f} {leitura['erros']:>6} "
+                f"{escrita['ops_s']:>11.0f} {escrita['erros']:>6}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,27 @@
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 
 from .routers import contas
+from .services import admissao, disjuntor
+from .services.db_conta import fechar_clientes
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Os clientes HTTP compartilhados (um por instância do clientes_db).
+    await fechar_clientes()
 
 
 app = FastAPI(
     title="PYTHER - contas_api",
     version="2.0.0",
-    description="API pública (gateway) das contas. Não expõe ID. Calcula score e encaminha operações ao serviço interno clientes_db."
+    description="API pública (gateway) das contas. Não expõe ID. Calcula score e encaminha operações ao serviço interno clientes_db.",
+    lifespan=lifespan,
 )
 
 
@@ -53,3 +65,22 @@ async def validation_exception_handler(request, exc: RequestValidationError):
 
 
 app.include_router(contas.router)
+app.add_middleware(admissao.Admissao)
+
+
+@app.get(
+    "/interno/metricas/admissao",
+    tags=["interno"],
+    summary="Vagas, fila e requisições recusadas por classe (leitura/escrita)"
+)
+async def metricas_admissao():
+    return admissao.metricas()
+
+
+@app.get(
+    "/interno/metricas/disjuntores",
+    tags=["interno"],
+    summary="Estado do disjuntor, p95 e leituras redundantes por instância do clientes_db"
+)
+async def metricas_disjuntores():
+    return disjuntor.metricas()
@@ -1,24 +1,57 @@
 ﻿
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from httpx import HTTPStatusError, RequestError
-from typing import List
+from typing import List, Optional, Union
 import os
 
-from ..services.db_conta import DbConta
-from ..services.models import ContaModel
+from ..services.db_conta import DbConta, repassar_cabecalhos
+from ..services import prazo
+from ..services.eventos import Repetidor, repetidor_para
+from ..services.roteamento import DbContas, contas_para, ler_instancias
+from ..services.models import (
+    AlteracoesModel,
+    ContaModel,
+    ContaPaginaModel,
+    ConsultaLoteModel,
+    ExtratoModel,
+    RankingScoreModel,
+    ResumoAgenciaModel,
+    ScoreCreditoModel,
+)
 from ..services.schemas import (
     ContaCreateIn,
     ContaUpdateIn,
     OperacaoPorChavesIn,
-    ChequeEspecialCadastroIn
+    ChequeEspecialCadastroIn,
+    ConsultaLoteIn,
 )
 
-router = APIRouter(prefix="/contas", tags=["contas"])
+# Todas as chamadas ao clientes_db de uma requisição dividem o prazo da rota
+# e levam os cabeçalhos repassados (X-Min-Alteracao).
+router = APIRouter(
+    prefix="/contas",
+    tags=["contas"],
+    dependencies=[Depends(prazo.definir_prazo), Depends(repassar_cabecalhos)],
+)
 
 
-def get_db() -> DbConta:
+def get_db() -> Union[DbConta, DbContas]:
+    # CLIENTES_DB_URLS (várias instâncias, com réplicas) tem precedência
+    # sobre CLIENTES_DB_URL (uma só).
+    instancias = os.getenv("CLIENTES_DB_URLS")
+    if instancias:
+        return contas_para(instancias)
     base_url = os.getenv("CLIENTES_DB_URL", "http://localhost:8001")
-    return DbConta(base_url=base_url)
+    return DbConta(base_url=base_url, compartilhado=True)
+
+
+def get_repetidor() -> Repetidor:
+    instancias = os.getenv("CLIENTES_DB_URLS")
+    if instancias:
+        return repetidor_para(*ler_instancias(instancias))
+    return repetidor_para(os.getenv("CLIENTES_DB_URL", "http://localhost:8001"))
 
 
 def _safe_detail(e: HTTPStatusError) -> dict:
@@ -50,7 +83,47 @@ def _safe_detail(e: HTTPStatusError) -> dict:
         }
 
 
+def _campos_publicos(fields: Optional[str]) -> Optional[str]:
+    # ?fields= só aceita campos do ContaModel (o id interno não é público).
+    if fields is None:
+        return None
+    campos = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    invalidos = [f for f in campos if f not in ContaModel.model_fields]
+    if not campos or invalidos:
+        raise HTTPException(
+            status_code=422,
+            detail={
+                "status": 422,
+                "code": "CAMPOS_INVALIDOS",
+                "message": "Campos inválidos em fields: " + (", ".join(invalidos) or "(vazio)")
+            }
+        )
+    return ",".join(campos)
+
+
+def _com_etag(response: Response, conta: dict) -> dict:
+    # A versão da linha no clientes_db vira o ETag público; o corpo segue
+    # sem ela (ContaModel), como acontece com o id.
+    if conta.get("versao"):
+        response.headers["ETag"] = f'"{conta["versao"]}"'
+    # Marca da escrita: mandada de volta em X-Min-Alteracao, o GET da conta
+    # pelo gateway já a enxerga.
+    if conta.get("alteracao") is not None:
+        response.headers["X-Alteracao"] = str(conta["alteracao"])
+    return conta
+
+
 def _raise_unavailable():
+    # Timeout por falta de prazo não é indisponibilidade do clientes_db.
+    if prazo.esgotado():
+        raise HTTPException(
+            status_code=504,
+            detail={
+                "status": 504,
+                "code": "PRAZO_ESGOTADO",
+                "message": "O prazo da requisição acabou antes da resposta do clientes_db"
+            }
+        )
     raise HTTPException(
         status_code=503,
         detail={
@@ -67,9 +140,9 @@ def _raise_unavailable():
     status_code=status.HTTP_201_CREATED,
     summary="Criar Conta"
 )
-async def criar_conta(body: ContaCreateIn, db: DbConta = Depends(get_db)):
+async def criar_conta(body: ContaCreateIn, response: Response, db: DbConta = Depends(get_db)):
     try:
-        return await db.criar_conta(body.model_dump(by_alias=True))
+        return _com_etag(response, await db.criar_conta(body.model_dump(by_alias=True)))
     except HTTPStatusError as e:
         raise HTTPException(e.response.status_code, _safe_detail(e))
     except RequestError:
@@ -77,8 +150,14 @@ async def criar_conta(body: ContaCreateIn, db: DbConta = Depends(get_db)):
 
 
 @router.get("", response_model=List[ContaModel], summary="Listar Contas")
-async def listar_contas(db: DbConta = Depends(get_db)):
+async def listar_contas(
+    fields: Optional[str] = Query(None, description="Campos separados por vírgula"),
+    db: DbConta = Depends(get_db)
+):
+    campos = _campos_publicos(fields)
     try:
+        if campos:
+            return JSONResponse(await db.listar_contas_campos(campos))
         return await db.listar_contas()
     except HTTPStatusError as e:
         raise HTTPException(e.response.status_code, _safe_detail(e))
@@ -86,14 +165,135 @@ async def listar_contas(db: DbConta = Depends(get_db)):
         _raise_unavailable()
 
 
+@router.post(
+    "/consulta-lote",
+    response_model=ConsultaLoteModel,
+    summary="Consultar contas em lote"
+)
+async def consultar_lote(body: ConsultaLoteIn, db: DbConta = Depends(get_db)):
+    try:
+        return await db.consultar_lote(body.model_dump()["chaves"])
+    except HTTPStatusError as e:
+        raise HTTPException(e.response.status_code, _safe_detail(e))
+    except RequestError:
+        _raise_unavailable()
+
+
+@router.get(
+    "/busca",
+    response_model=ContaPaginaModel,
+    summary="Buscar contas"
+)
+async def buscar_contas(
+    cpf: Optional[str] = None,
+    email: Optional[str] = None,
+    nome: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: DbConta = Depends(get_db)
+):
+    filtros = {"cpf": cpf, "email": email, "nome": nome, "after": after}
+    params = {k: v for k, v in filtros.items() if v}
+    params["limit"] = limit
+
+    try:
+        return await db.buscar_contas(params)
+    except HTTPStatusError as e:
+        raise HTTPException(e.response.status_code, _safe_detail(e))
+    except RequestError:
+        _raise_unavailable()
+
+
+@router.get(
+    "/resumo",
+    response_model=List[ResumoAgenciaModel],
+    summary="Resumo por agência"
+)
+async def resumo_agencias(db: DbConta = Depends(get_db)):
+    try:
+        return await db.resumo_agencias()
+    except HTTPStatusError as e:
+        raise HTTPException(e.response.status_code, _safe_detail(e))
+    except RequestError:
+        _raise_unavailable()
+
+
+@router.get(
+    "/eventos",
+    response_class=StreamingResponse,
+    summary="Stream (SSE) de depósitos, saques, cheque especial e desativações"
+)
+async def stream_eventos(repetidor: Repetidor = Depends(get_repetidor)):
+    return StreamingResponse(
+        repetidor.stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get(
+    "/alteracoes",
+    response_model=AlteracoesModel,
+    summary="Contas alteradas ou removidas desde uma marca"
+)
+async def listar_alteracoes(
+    desde: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=1000),
+    db: DbConta = Depends(get_db)
+):
+    params = {"limit": limit}
+    if desde:
+        params["desde"] = desde
+    try:
+        return await db.alteracoes(params)
+    except HTTPStatusError as e:
+        raise HTTPException(e.response.status_code, _safe_detail(e))
+    except RequestError:
+        _raise_unavailable()
+
+
+@router.get(
+    "/ranking",
+    response_model=List[RankingScoreModel],
+    summary="Ranking por score de crédito"
+)
+async def ranking_score(
+    top: int = Query(10, ge=1, le=100),
+    db: DbConta = Depends(get_db)
+):
+    try:
+        return await db.ranking_score(top)
+    except HTTPStatusError as e:
+        raise HTTPException(e.response.status_code, _safe_detail(e))
+    except RequestError:
+        _raise_unavailable()
+
+
 @router.get(
     "/{agencia}/{numero_conta}",
     response_model=ContaModel,
     summary="Obter Conta"
 )
-async def obter_conta(agencia: str, numero_conta: str, db: DbConta = Depends(get_db)):
+async def obter_conta(
+    agencia: str,
+    numero_conta: str,
+    response: Response,
+    fields: Optional[str] = Query(None, description="Campos separados por vírgula"),
+    if_none_match: Optional[str] = Header(None),
+    db: DbConta = Depends(get_db)
+):
+    campos = _campos_publicos(fields)
     try:
-        return await db.obter_conta(agencia, numero_conta)
+        if campos:
+            return JSONResponse(await db.obter_conta_campos(agencia, numero_conta, campos))
+        if if_none_match:
+            # O clientes_db confere a versão; 304 volta sem corpo e sem
+            # passar pelo ContaModel.
+            conta, etag = await db.obter_conta_se_mudou(agencia, numero_conta, if_none_match)
+            if conta is None:
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+            return _com_etag(response, conta)
+        return _com_etag(response, await db.obter_conta(agencia, numero_conta))
     except HTTPStatusError as e:
         raise HTTPException(e.response.status_code, _safe_detail(e))
     except RequestError:
@@ -108,12 +308,14 @@ async def atualizar_conta(
     agencia: str,
     numero_conta: str,
     body: ContaUpdateIn,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     db: DbConta = Depends(get_db)
 ):
     try:
-        return await db.atualizar_conta(
-            agencia, numero_conta, body.model_dump(exclude_unset=True)
-        )
+        return _com_etag(response, await db.atualizar_conta(
+            agencia, numero_conta, body.model_dump(exclude_unset=True), if_match=if_match
+        ))
     except HTTPStatusError as e:
         raise HTTPException(e.response.status_code, _safe_detail(e))
     except RequestError:
@@ -151,6 +353,8 @@ async def desativar_conta(agencia: str, numero_conta: str, db: DbConta = Depends
         return None
     except HTTPStatusError as e:
         raise HTTPException(e.response.status_code, _safe_detail(e))
+    except RequestError:
+        _raise_unavailable()
 
 
 @router.post(
@@ -158,9 +362,9 @@ async def desativar_conta(agencia: str, numero_conta: str, db: DbConta = Depends
     response_model=ContaModel,
     summary="Depositar"
 )
-async def depositar(body: OperacaoPorChavesIn, db: DbConta = Depends(get_db)):
+async def depositar(body: OperacaoPorChavesIn, response: Response, db: DbConta = Depends(get_db)):
     try:
-        return await db.depositar(body.model_dump(by_alias=True))
+        return _com_etag(response, await db.depositar(body.model_dump(by_alias=True)))
     except HTTPStatusError as e:
         raise HTTPException(e.response.status_code, _safe_detail(e))
     except RequestError:
@@ -172,9 +376,9 @@ async def depositar(body: OperacaoPorChavesIn, db: DbConta = Depends(get_db)):
     response_model=ContaModel,
     summary="Sacar"
 )
-async def sacar(body: OperacaoPorChavesIn, db: DbConta = Depends(get_db)):
+async def sacar(body: OperacaoPorChavesIn, response: Response, db: DbConta = Depends(get_db)):
     try:
-        return await db.sacar(body.model_dump(by_alias=True))
+        return _com_etag(response, await db.sacar(body.model_dump(by_alias=True)))
     except HTTPStatusError as e:
         raise HTTPException(e.response.status_code, _safe_detail(e))
     except RequestError:
@@ -190,6 +394,8 @@ async def cadastrar_cheque_especial_gateway(
     agencia: str,
     numero_conta: str,
     body: ChequeEspecialCadastroIn,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     db: DbConta = Depends(get_db)
 ):
 
@@ -209,7 +415,9 @@ async def cadastrar_cheque_especial_gateway(
     }
 
     try:
-        return await db.cadastrar_cheque_especial(id_, payload)
+        return _com_etag(
+            response, await db.cadastrar_cheque_especial(id_, payload, if_match=if_match)
+        )
     except HTTPStatusError as e:
         raise HTTPException(e.response.status_code, _safe_detail(e))
     except RequestError:
@@ -218,6 +426,7 @@ async def cadastrar_cheque_especial_gateway(
 
 @router.get(
     "/{agencia}/{numero_conta}/score_credito",
+    response_model=ScoreCreditoModel,
     summary="Score de crédito"
 )
 async def calcular_score_gateway(
@@ -225,16 +434,40 @@ async def calcular_score_gateway(
     numero_conta: str,
     db: DbConta = Depends(get_db)
 ):
+    # O clientes_db calcula score e percentil num único SELECT indexado.
     try:
-        conta = await db.obter_conta(agencia, numero_conta)
+        return await db.score_credito(agencia, numero_conta)
     except HTTPStatusError as e:
         raise HTTPException(e.response.status_code, _safe_detail(e))
+    except RequestError:
+        _raise_unavailable()
 
-    saldo = float(conta["saldo_cc"])
-    score = 0.0 if saldo < 0 else round(saldo * 0.1, 4)
 
-    return {
-        "agencia": agencia,
-        "numero_conta": numero_conta,
-        "score_credito": score
-    }
+@router.get(
+    "/{agencia}/{numero_conta}/extrato",
+    response_model=ExtratoModel,
+    summary="Extrato"
+)
+async def extrato(
+    agencia: str,
+    numero_conta: str,
+    desde: Optional[datetime] = None,
+    ate: Optional[datetime] = None,
+    after: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: DbConta = Depends(get_db)
+):
+    params = {"limit": limit}
+    if desde is not None:
+        params["desde"] = desde.isoformat()
+    if ate is not None:
+        params["ate"] = ate.isoformat()
+    if after is not None:
+        params["after"] = after
+
+    try:
+        return await db.extrato(agencia, numero_conta, params)
+    except HTTPStatusError as e:
+        raise HTTPException(e.response.status_code, _safe_detail(e))
+    except RequestError:
+        _raise_unavailable()
@@ -0,0 +1,221 @@
+"""Controle de admissão do gateway.
+
+Quando o clientes_db fica lento o gateway não deve continuar aceitando
+trabalho até tudo estourar o timeout. Cada requisição em /contas passa por:
+
+- um balde de tokens por cliente (X-Cliente-Id, ou o IP), que recusa com
+  429 quem passa da taxa combinada;
+- um limite de requisições em andamento, com uma fila curta de espera:
+  sem vaga e com a fila cheia (ou depois de esperar ESPERA_FILA_S), 503.
+
+Leituras e escritas têm orçamentos separados: as escritas, que no SQLite
+andam uma de cada vez, não tomam as vagas das leituras. As recusas saem na
+hora, com Retry-After, e ficam contadas em metricas().
+"""
+
+import asyncio
+import json
+import math
+import os
+import time
+from collections import deque
+from typing import Optional
+
+# Requisições em andamento por classe, e quantas podem esperar vaga.
+LEITURAS_SIMULTANEAS = int(os.getenv("CLIENTES_API_LEITURAS_SIMULTANEAS", "64"))
+ESCRITAS_SIMULTANEAS = int(os.getenv("CLIENTES_API_ESCRITAS_SIMULTANEAS", "16"))
+FILA_LEITURAS = int(os.getenv("CLIENTES_API_FILA_LEITURAS", "64"))
+FILA_ESCRITAS = int(os.getenv("CLIENTES_API_FILA_ESCRITAS", "16"))
+ESPERA_FILA_S = float(os.getenv("CLIENTES_API_ESPERA_FILA_MS", "200")) / 1000
+# Requisições por segundo por cliente (0 = sem limite); a rajada é de um
+# segundo de taxa.
+TAXA_LEITURAS = float(os.getenv("CLIENTES_API_TAXA_LEITURAS", "0"))
+TAXA_ESCRITAS = float(os.getenv("CLIENTES_API_TAXA_ESCRITAS", "0"))
+
+# Baldes guardados; acima disso os de clientes parados há mais de um minuto
+# são esquecidos (um balde esquecido volta cheio).
+MAX_CLIENTES = 10_000
+# Rota de stream: a conexão fica aberta indefinidamente e não entra na conta.
+ROTAS_LIVRES = ("/contas/eventos",)
+# POST que só lê.
+ROTAS_DE_LEITURA = ("/contas/consulta-lote",)
+
+
+class Limitador:
+    """Vagas de execução com fila limitada e espera máxima."""
+
+    def __init__(self, capacidade: int, fila: int, espera_s: float):
+        self.capacidade = capacidade
+        self.fila = fila
+        self.espera_s = espera_s
+        self.em_curso = 0
+        self._esperando: deque[asyncio.Future] = deque()
+
+    @property
+    def na_fila(self) -> int:
+        return len(self._esperando)
+
+    async def entrar(self) -> Optional[str]:
+        """None com a vaga obtida; senão o motivo da recusa."""
+        if self.em_curso < self.capacidade and not self._esperando:
+            self.em_curso += 1
+            return None
+        if len(self._esperando) >= self.fila:
+            return "FILA_CHEIA"
+
+        vez = asyncio.get_running_loop().create_future()
+        self._esperando.append(vez)
+        try:
+            await asyncio.wait_for(asyncio.shield(vez), self.espera_s)
+            return None
+        except asyncio.TimeoutError:
+            # A vaga pode ter chegado junto com o fim da espera.
+            return None if vez.done() else "ESPERA_ESGOTADA"
+        except asyncio.CancelledError:
+            if vez.done():
+                # Cliente foi embora com a vaga já dada: passa adiante.
+                self.sair()
+            raise
+        finally:
+            if not vez.done():
+                vez.cancel()
+                self._esperando.remove(vez)
+
+    def sair(self) -> None:
+        # A vaga passa direto para o primeiro da fila. Quem desiste de
+        # esperar sai da fila em entrar(), então ninguém nela está pronto.
+        if self._esperando:
+            self._esperando.popleft().set_result(None)
+            return
+        self.em_curso -= 1
+
+
+class BaldeTokens:
+    """Um balde por cliente: ``taxa`` tokens por segundo, até ``rajada``."""
+
+    def __init__(self, taxa: float, rajada: Optional[float] = None):
+        self.taxa = taxa
+        self.rajada = rajada or max(1.0, taxa)
+        self._baldes: dict[str, tuple[float, float]] = {}
+
+    def retirar(self, cliente: str, agora: Optional[float] = None) -> float:
+        """0 se passou; senão quantos segundos faltam para o próximo token."""
+        if self.taxa <= 0:
+            return 0.0
+        agora = time.monotonic() if agora is None else agora
+        tokens, visto = self._baldes.get(cliente, (self.rajada, agora))
+        tokens = min(self.rajada, tokens + (agora - visto) * self.taxa)
+        if tokens < 1:
+            self._baldes[cliente] = (tokens, agora)
+            return (1 - tokens) / self.taxa
+        self._baldes[cliente] = (tokens - 1, agora)
+        if len(self._baldes) > MAX_CLIENTES:
+            self._esquecer(agora)
+        return 0.0
+
+    def _esquecer(self, agora: float) -> None:
+        for cliente, (_, visto) in list(self._baldes.items()):
+            if agora - visto > 60:
+                del self._baldes[cliente]
+
+
+class Orcamento:
+    def __init__(self, capacidade: int, fila: int, espera_s: float, taxa: float):
+        self.limitador = Limitador(capacidade, fila, espera_s)
+        self.balde = BaldeTokens(taxa)
+        self.aceitas = 0
+        self.recusadas: dict[str, int] = {
+            "LIMITE_DE_TAXA": 0, "FILA_CHEIA": 0, "ESPERA_ESGOTADA": 0,
+        }
+
+
+def criar_orcamentos() -> dict[str, Orcamento]:
+    return {
+        "leitura": Orcamento(LEITURAS_SIMULTANEAS, FILA_LEITURAS, ESPERA_FILA_S, TAXA_LEITURAS),
+        "escrita": Orcamento(ESCRITAS_SIMULTANEAS, FILA_ESCRITAS, ESPERA_FILA_S, TAXA_ESCRITAS),
+    }
+
+
+orcamentos = criar_orcamentos()
+
+
+def metricas() -> dict:
+    return {
+        classe: {
+            "capacidade": o.limitador.capacidade,
+            "em_curso": o.limitador.em_curso,
+            "na_fila": o.limitador.na_fila,
+            "aceitas": o.aceitas,
+            "recusadas": dict(o.recusadas),
+        }
+        for classe, o in orcamentos.items()
+    }
+
+
+def _cliente(scope) -> str:
+    for nome, valor in scope.get("headers", ()):
+        if nome == b"x-cliente-id":
+            return valor.decode("latin-1")
+    cliente = scope.get("client")
+    return cliente[0] if cliente else "-"
+
+
+async def _recusar(send, status: int, code: str, message: str, retry_after: float) -> None:
+    corpo = json.dumps(
+        {"detail": {"status": status, "code": code, "message": message}}, ensure_ascii=False
+    ).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(corpo)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": corpo})
+
+
+class Admissao:
+    """Middleware ASGI com o controle de admissão das rotas /contas."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        caminho = scope.get("path", "")
+        if (
+            scope["type"] != "http"
+            or not caminho.startswith("/contas")
+            or caminho in ROTAS_LIVRES
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        leitura = scope["method"] in ("GET", "HEAD") or caminho in ROTAS_DE_LEITURA
+        classe = "leitura" if leitura else "escrita"
+        orcamento = orcamentos[classe]
+
+        espera = orcamento.balde.retirar(_cliente(scope))
+        if espera:
+            orcamento.recusadas["LIMITE_DE_TAXA"] += 1
+            await _recusar(
+                send, 429, "LIMITE_DE_TAXA",
+                "Limite de requisições do cliente excedido", espera,
+            )
+            return
+
+        motivo = await orcamento.limitador.entrar()
+        if motivo:
+            orcamento.recusadas[motivo] += 1
+            await _recusar(
+                send, 503, "GATEWAY_SOBRECARREGADO",
+                "Gateway sem capacidade no momento; tente novamente", 1,
+            )
+            return
+
+        orcamento.aceitas += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            orcamento.limitador.sair()
@@ -1,73 +1,257 @@
 
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Optional
+
 import httpx
+from fastapi import Request
+
+from . import prazo
+from .disjuntor import disjuntor_para
+
+# A consulta em lote é quebrada em requisições de até LOTE_CHAVES chaves
+# (o clientes_db aceita até 1000), com no máximo LOTES_SIMULTANEOS em voo.
+LOTE_CHAVES = 500
+LOTES_SIMULTANEOS = 4
+
+# Conexões mantidas abertas por instância do clientes_db no cliente
+# compartilhado do gateway.
+CONEXOES_POR_BACKEND = int(os.getenv("CLIENTES_API_CONEXOES_POR_BACKEND", "100"))
+
+_clientes: dict[str, httpx.AsyncClient] = {}
+
+# Cabeçalhos da requisição ao gateway que seguem em todas as chamadas dela ao
+# clientes_db: X-Min-Alteracao garante a leitura após escrita pelo gateway.
+REPASSADOS = ("X-Min-Alteracao",)
+_repasse: ContextVar[dict] = ContextVar("repasse", default={})
+
+
+async def repassar_cabecalhos(request: Request) -> None:
+    """Dependência das rotas: guarda os cabeçalhos repassados."""
+    _repasse.set({n: request.headers[n] for n in REPASSADOS if n in request.headers})
+
+
+def cliente_para(base_url: str) -> httpx.AsyncClient:
+    """Um AsyncClient por instância, reaproveitado entre as requisições."""
+    if base_url not in _clientes:
+        limites = httpx.Limits(
+            max_connections=CONEXOES_POR_BACKEND,
+            max_keepalive_connections=CONEXOES_POR_BACKEND,
+        )
+        _clientes[base_url] = httpx.AsyncClient(limits=limites)
+    return _clientes[base_url]
+
+
+async def fechar_clientes() -> None:
+    while _clientes:
+        await _clientes.popitem()[1].aclose()
+
+
+def _cabecalhos(if_match: Optional[str]) -> Optional[dict]:
+    return {"If-Match": if_match} if if_match else None
+
 
 class DbConta:
-    def __init__(self, base_url: str = "http://localhost:8001"):
+    def __init__(self, base_url: str = "http://localhost:8001", compartilhado: bool = False):
         self.base_url = base_url.rstrip("/")
+        # compartilhado=True usa o cliente do pool (cliente_para); sem ele,
+        # cada chamada abre e fecha o seu.
+        self.compartilhado = compartilhado
 
-    async def criar_conta(self, payload: dict) -> dict:
+    @asynccontextmanager
+    async def _cliente(self) -> AsyncIterator[httpx.AsyncClient]:
+        if self.compartilhado:
+            yield cliente_para(self.base_url)
+            return
         async with httpx.AsyncClient() as client:
-            r = await client.post(f"{self.base_url}/contas", json=payload, timeout=10)
+            yield client
+
+    async def _enviar(
+        self, envio, url: str, cabecalhos: Optional[dict] = None,
+        redundante: bool = False, **kwargs
+    ) -> httpx.Response:
+        """Uma chamada ao clientes_db, com o prazo da requisição e pelo
+        disjuntor da instância. redundante=True só em leituras idempotentes.
+        """
+        def requisicao():
+            # Recalculado a cada envio: a segunda requisição leva o que resta.
+            return envio(url, **kwargs, **prazo.opcoes({**_repasse.get(), **(cabecalhos or {})}))
+
+        d = disjuntor_para(self.base_url)
+        if redundante:
+            return await d.chamar_redundante(requisicao)
+        return await d.chamar(requisicao)
+
+    async def criar_conta(self, payload: dict) -> dict:
+        async with self._cliente() as client:
+            r = await self._enviar(client.post, f"{self.base_url}/contas", json=payload)
             r.raise_for_status()
             return r.json()
 
     async def listar_contas(self) -> list[dict]:
-        async with httpx.AsyncClient() as client:
-            r = await client.get(f"{self.base_url}/contas", timeout=10)
+        async with self._cliente() as client:
+            r = await self._enviar(client.get, f"{self.base_url}/contas", redundante=True)
+            r.raise_for_status()
+            return r.json()
+
+    async def consultar_lote(self, chaves: list[dict]) -> dict:
+        lotes = [chaves[i:i + LOTE_CHAVES] for i in range(0, len(chaves), LOTE_CHAVES)]
+        limite = asyncio.Semaphore(LOTES_SIMULTANEOS)
+
+        async with self._cliente() as client:
+            async def consultar(lote: list[dict]) -> dict:
+                async with limite:
+                    r = await self._enviar(
+                        client.post,
+                        f"{self.base_url}/contas/consulta-lote",
+                        json={"chaves": lote}
+                    )
+                    r.raise_for_status()
+                    return r.json()
+
+            respostas = await asyncio.gather(*(consultar(lote) for lote in lotes))
+
+        return {
+            "encontradas": [c for r in respostas for c in r["encontradas"]],
+            "faltantes": [c for r in respostas for c in r["faltantes"]],
+        }
+
+    async def buscar_contas(self, params: dict) -> dict:
+        async with self._cliente() as client:
+            r = await self._enviar(client.get, f"{self.base_url}/contas/busca", params=params)
+            r.raise_for_status()
+            return r.json()
+
+    async def score_credito(self, agencia: str, numero_conta: str) -> dict:
+        async with self._cliente() as client:
+            r = await self._enviar(
+                client.get,
+                f"{self.base_url}/contas/{agencia}/{numero_conta}/score_credito"
+            )
+            r.raise_for_status()
+            return r.json()
+
+    async def alteracoes(self, params: dict) -> dict:
+        async with self._cliente() as client:
+            r = await self._enviar(client.get, f"{self.base_url}/contas/alteracoes", params=params)
+            r.raise_for_status()
+            return r.json()
+
+    async def ranking_score(self, top: int) -> list[dict]:
+        async with self._cliente() as client:
+            r = await self._enviar(client.get, f"{self.base_url}/contas/ranking", params={"top": top})
+            r.raise_for_status()
+            return r.json()
+
+    async def resumo_agencias(self) -> list[dict]:
+        async with self._cliente() as client:
+            r = await self._enviar(client.get, f"{self.base_url}/contas/resumo")
             r.raise_for_status()
             return r.json()
 
     async def obter_conta(self, agencia: str, numero_conta: str) -> dict:
-        async with httpx.AsyncClient() as client:
-            r = await client.get(f"{self.base_url}/contas/{agencia}/{numero_conta}", timeout=10)
+        async with self._cliente() as client:
+            r = await self._enviar(
+                client.get, f"{self.base_url}/contas/{agencia}/{numero_conta}", redundante=True
+            )
             r.raise_for_status()
             return r.json()
 
-    async def atualizar_conta(self, agencia: str, numero_conta: str, payload: dict) -> dict:
-        async with httpx.AsyncClient() as client:
-            r = await client.put(
+    async def obter_conta_se_mudou(
+        self, agencia: str, numero_conta: str, if_none_match: str
+    ) -> tuple[Optional[dict], Optional[str]]:
+        """(conta, etag); conta é None quando o clientes_db responde 304."""
+        async with self._cliente() as client:
+            r = await self._enviar(
+                client.get,
+                f"{self.base_url}/contas/{agencia}/{numero_conta}",
+                cabecalhos={"If-None-Match": if_none_match}
+            )
+            # Antes do raise_for_status, que no httpx trata 3xx como erro.
+            if r.status_code == 304:
+                return None, r.headers.get("ETag")
+            r.raise_for_status()
+            return r.json(), r.headers.get("ETag")
+
+    async def listar_contas_campos(self, campos: str) -> list[dict]:
+        async with self._cliente() as client:
+            r = await self._enviar(client.get, f"{self.base_url}/contas", params={"fields": campos})
+            r.raise_for_status()
+            return r.json()
+
+    async def obter_conta_campos(self, agencia: str, numero_conta: str, campos: str) -> dict:
+        async with self._cliente() as client:
+            r = await self._enviar(
+                client.get,
+                f"{self.base_url}/contas/{agencia}/{numero_conta}",
+                params={"fields": campos}
+            )
+            r.raise_for_status()
+            return r.json()
+
+    async def atualizar_conta(
+        self, agencia: str, numero_conta: str, payload: dict, if_match: Optional[str] = None
+    ) -> dict:
+        async with self._cliente() as client:
+            r = await self._enviar(
+                client.put,
                 f"{self.base_url}/contas/{agencia}/{numero_conta}",
                 json=payload,
-                timeout=10
+                cabecalhos=_cabecalhos(if_match)
             )
             r.raise_for_status()
             return r.json()
 
     async def desativar_conta(self, agencia: str, numero_conta: str) -> None:
-        async with httpx.AsyncClient() as client:
-            r = await client.delete(
-                f"{self.base_url}/contas/{agencia}/{numero_conta}/desativar",
-                timeout=10
+        async with self._cliente() as client:
+            r = await self._enviar(
+                client.delete,
+                f"{self.base_url}/contas/{agencia}/{numero_conta}/desativar"
             )
             r.raise_for_status()
             return None
 
     async def depositar(self, payload: dict) -> dict:
-        async with httpx.AsyncClient() as client:
-            r = await client.post(
+        async with self._cliente() as client:
+            r = await self._enviar(
+                client.post,
                 f"{self.base_url}/contas/operacoes/depositar",
-                json=payload,
-                timeout=10
+                json=payload
             )
             r.raise_for_status()
             return r.json()
 
     async def sacar(self, payload: dict) -> dict:
-        async with httpx.AsyncClient() as client:
-            r = await client.post(
+        async with self._cliente() as client:
+            r = await self._enviar(
+                client.post,
                 f"{self.base_url}/contas/operacoes/sacar",
-                json=payload,
-                timeout=10
+                json=payload
             )
             r.raise_for_status()
             return r.json()
 
-    async def cadastrar_cheque_especial(self, id_: int, payload: dict) -> dict:
-        async with httpx.AsyncClient() as client:
-            r = await client.put(
+    async def cadastrar_cheque_especial(
+        self, id_: int, payload: dict, if_match: Optional[str] = None
+    ) -> dict:
+        async with self._cliente() as client:
+            r = await self._enviar(
+                client.put,
                 f"{self.base_url}/contas/{id_}/cheque_especial/cadastrar",
                 json=payload,
-                timeout=10
+                cabecalhos=_cabecalhos(if_match)
+            )
+            r.raise_for_status()
+            return r.json()
+
+    async def extrato(self, agencia: str, numero_conta: str, params: dict) -> dict:
+        async with self._cliente() as client:
+            r = await self._enviar(
+                client.get,
+                f"{self.base_url}/contas/{agencia}/{numero_conta}/extrato",
+                params=params
             )
             r.raise_for_status()
             return r.json()
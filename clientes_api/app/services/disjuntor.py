@@ -0,0 +1,206 @@
+"""Disjuntor e leituras redundantes nas chamadas ao clientes_db.
+
+Cada instância do clientes_db (base_url) tem um disjuntor que acompanha as
+chamadas dos últimos JANELA_S segundos. Com ao menos MIN_CHAMADAS na janela
+e a fração de falhas em TAXA_ERRO ou acima, ele abre: por ABERTO_S as
+chamadas falham na hora com DisjuntorAberto, um httpx.RequestError que a
+rota já responde com 503 e o roteamento trata como instância fora (a leitura
+vai para a réplica). Passado esse tempo ele fica meio aberto: uma chamada
+de sonda passa por vez; se der certo o disjuntor fecha, se falhar reabre.
+
+Conta como falha: erro de conexão, resposta 5xx (menos 504, que é o prazo
+da própria requisição esgotado) e resposta ou timeout depois de LENTIDAO_S.
+Timeout antes disso vem de um prazo curto de quem chamou e não conta.
+
+Leituras idempotentes podem ser redundantes (LEITURA_REDUNDANTE): sem
+resposta no p95 das latências recentes da instância, sai uma segunda
+requisição igual e vale a primeira que responder.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+import httpx
+
+TAXA_ERRO = float(os.getenv("CLIENTES_API_DISJUNTOR_TAXA_ERRO", "0.5"))
+LENTIDAO_S = float(os.getenv("CLIENTES_API_DISJUNTOR_LENTIDAO_MS", "2000")) / 1000
+JANELA_S = float(os.getenv("CLIENTES_API_DISJUNTOR_JANELA_S", "10"))
+MIN_CHAMADAS = int(os.getenv("CLIENTES_API_DISJUNTOR_MIN_CHAMADAS", "20"))
+ABERTO_S = float(os.getenv("CLIENTES_API_DISJUNTOR_ABERTO_S", "5"))
+LEITURA_REDUNDANTE = os.getenv("CLIENTES_API_LEITURA_REDUNDANTE", "0") == "1"
+
+# Latências guardadas para o p95, e quantas são precisas para confiar nele.
+AMOSTRAS_LATENCIA = 200
+MIN_AMOSTRAS_P95 = 20
+
+FECHADO, ABERTO, MEIO_ABERTO = "FECHADO", "ABERTO", "MEIO_ABERTO"
+
+Requisicao = Callable[[], Awaitable[httpx.Response]]
+
+
+class DisjuntorAberto(httpx.RequestError):
+    """Chamada recusada sem sair do gateway: a instância está com falhas."""
+
+
+class Disjuntor:
+    def __init__(
+        self,
+        taxa_erro: float = TAXA_ERRO,
+        lentidao_s: float = LENTIDAO_S,
+        janela_s: float = JANELA_S,
+        min_chamadas: int = MIN_CHAMADAS,
+        aberto_s: float = ABERTO_S,
+    ):
+        self.taxa_erro = taxa_erro
+        self.lentidao_s = lentidao_s
+        self.janela_s = janela_s
+        self.min_chamadas = min_chamadas
+        self.aberto_s = aberto_s
+        self.estado = FECHADO
+        # (instante, falhou) das chamadas da janela, com as falhas somadas.
+        self._chamadas: deque[tuple[float, bool]] = deque()
+        self._falhas = 0
+        self._latencias: deque[float] = deque(maxlen=AMOSTRAS_LATENCIA)
+        self._aberto_ate = 0.0
+        self._sondando = False
+        self.aberturas = 0
+        self.recusadas = 0
+        self.redundantes = 0
+        self.redundantes_vencedoras = 0
+
+    def entrar(self, agora: Optional[float] = None) -> bool:
+        """True se a chamada é a sonda do estado meio aberto."""
+        agora = time.monotonic() if agora is None else agora
+        if self.estado == ABERTO and agora >= self._aberto_ate:
+            self.estado = MEIO_ABERTO
+        if self.estado == ABERTO or (self.estado == MEIO_ABERTO and self._sondando):
+            self.recusadas += 1
+            raise DisjuntorAberto("clientes_db com falhas; disjuntor aberto")
+        if self.estado == MEIO_ABERTO:
+            self._sondando = True
+            return True
+        return False
+
+    def sair(
+        self, sonda: bool, falhou: Optional[bool], duracao: Optional[float] = None,
+        agora: Optional[float] = None,
+    ) -> None:
+        """Registra o resultado; falhou=None não conta (cancelada, prazo curto)."""
+        agora = time.monotonic() if agora is None else agora
+        if duracao is not None:
+            self._latencias.append(duracao)
+        if sonda:
+            self._sondando = False
+            if falhou:
+                self._abrir(agora)
+            elif falhou is not None:
+                self._fechar()
+            return
+        # Resultados que chegam depois de o disjuntor abrir não contam.
+        if falhou is None or self.estado != FECHADO:
+            return
+        self._chamadas.append((agora, falhou))
+        self._falhas += falhou
+        while self._chamadas and self._chamadas[0][0] < agora - self.janela_s:
+            self._falhas -= self._chamadas.popleft()[1]
+        if (
+            len(self._chamadas) >= self.min_chamadas
+            and self._falhas >= self.taxa_erro * len(self._chamadas)
+        ):
+            self._abrir(agora)
+
+    def _abrir(self, agora: float) -> None:
+        self.estado = ABERTO
+        self._aberto_ate = agora + self.aberto_s
+        self.aberturas += 1
+
+    def _fechar(self) -> None:
+        self.estado = FECHADO
+        self._chamadas.clear()
+        self._falhas = 0
+
+    def p95(self) -> Optional[float]:
+        if len(self._latencias) < MIN_AMOSTRAS_P95:
+            return None
+        ordenadas = sorted(self._latencias)
+        return ordenadas[int(len(ordenadas) * 0.95) - 1]
+
+    async def chamar(self, requisicao: Requisicao) -> httpx.Response:
+        sonda = self.entrar()
+        inicio = time.monotonic()
+        falhou, duracao = None, None
+        try:
+            r = await requisicao()
+            duracao = time.monotonic() - inicio
+            falhou = (r.status_code >= 500 and r.status_code != 504) or duracao >= self.lentidao_s
+            return r
+        except httpx.TimeoutException:
+            if time.monotonic() - inicio >= self.lentidao_s:
+                falhou = True
+            raise
+        except httpx.RequestError:
+            falhou = True
+            raise
+        finally:
+            self.sair(sonda, falhou, duracao)
+
+    async def chamar_redundante(self, requisicao: Requisicao) -> httpx.Response:
+        """chamar(), com uma segunda requisição se a primeira passar do p95.
+
+        Só para leituras idempotentes: as duas podem chegar ao clientes_db.
+        """
+        atraso = self.p95() if LEITURA_REDUNDANTE else None
+        if atraso is None:
+            return await self.chamar(requisicao)
+
+        pendentes = {asyncio.ensure_future(self.chamar(requisicao))}
+        segunda = None
+        try:
+            feitas, pendentes = await asyncio.wait(pendentes, timeout=atraso)
+            if not feitas:
+                self.redundantes += 1
+                segunda = asyncio.ensure_future(self.chamar(requisicao))
+                pendentes.add(segunda)
+            while True:
+                # Todas as exceções são lidas, para nenhuma ficar sem dono.
+                certas = [t for t in feitas if t.exception() is None]
+                if certas:
+                    self.redundantes_vencedoras += certas[0] is segunda
+                    return certas[0].result()
+                if not pendentes:
+                    raise next(iter(feitas)).exception()
+                feitas, pendentes = await asyncio.wait(
+                    pendentes, return_when=asyncio.FIRST_COMPLETED
+                )
+        finally:
+            for t in pendentes:
+                t.cancel()
+
+    def resumo(self) -> dict:
+        p95 = self.p95()
+        return {
+            "estado": self.estado,
+            "chamadas_na_janela": len(self._chamadas),
+            "falhas_na_janela": self._falhas,
+            "aberturas": self.aberturas,
+            "recusadas": self.recusadas,
+            "p95_ms": None if p95 is None else round(p95 * 1000, 3),
+            "redundantes": self.redundantes,
+            "redundantes_vencedoras": self.redundantes_vencedoras,
+        }
+
+
+_disjuntores: dict[str, Disjuntor] = {}
+
+
+def disjuntor_para(base_url: str) -> Disjuntor:
+    if base_url not in _disjuntores:
+        _disjuntores[base_url] = Disjuntor()
+    return _disjuntores[base_url]
+
+
+def metricas() -> dict:
+    return {base_url: d.resumo() for base_url, d in _disjuntores.items()}
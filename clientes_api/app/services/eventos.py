@@ -0,0 +1,148 @@
+import asyncio
+import json
+import os
+from dataclasses import dataclass
+from itertools import count
+from typing import Optional, Union
+
+import httpx
+
+# Mesma política do clientes_db: assinante com o buffer cheio é derrubado,
+# a leitura da conexão de origem nunca espera por ele.
+TAMANHO_BUFFER = int(os.getenv("CLIENTES_API_EVENTOS_BUFFER", "256"))
+KEEPALIVE_S = 15.0
+ESPERA_RECONEXAO_S = 1.0
+
+
+@dataclass(frozen=True)
+class _Derrubada:
+    motivo: str
+
+
+Item = Union[str, _Derrubada]
+
+
+def _repassar(linhas: list[str]) -> Union[str, _Derrubada, None]:
+    """Campos event/data de um quadro da origem; o resto fica no gateway.
+
+    retry, comentários (": ping") e id são da conexão com a origem. Quadro
+    sem data não é evento. O DERRUBADO da origem vira _Derrubada.
+    """
+    campos = [l for l in linhas if l.startswith(("event:", "data:"))]
+    if "event: DERRUBADO" in campos:
+        return _Derrubada("origem desconectada")
+    if not any(c.startswith("data:") for c in campos):
+        return None
+    return "\n".join(campos)
+
+
+class Repetidor:
+    """Uma única conexão com GET /contas/eventos de cada instância do
+    clientes_db, repartida entre todos os assinantes do gateway.
+
+    As conexões de origem abrem com o primeiro assinante e fecham quando o
+    último sai. Enquanto uma origem não conecta, ela é tentada de novo; se
+    uma conexão aberta cai (ou a origem derruba o gateway), eventos podem
+    ter se perdido: todos os assinantes recebem DERRUBADO e são
+    desconectados, para retomar por /contas/alteracoes. Os ids dos eventos
+    são do gateway, sem repetição entre instâncias.
+    """
+
+    def __init__(self, *base_urls: str, tamanho_buffer: int = TAMANHO_BUFFER):
+        self.base_urls = [u.rstrip("/") for u in base_urls]
+        self.tamanho_buffer = tamanho_buffer
+        self._filas: set[asyncio.Queue] = set()
+        self._tarefa: Optional[asyncio.Task] = None
+        self._ids = count(1)
+
+    @property
+    def assinantes(self) -> int:
+        return len(self._filas)
+
+    def _derrubar(self, fila: asyncio.Queue, motivo: str) -> None:
+        self._filas.discard(fila)
+        while not fila.empty():
+            fila.get_nowait()
+        fila.put_nowait(_Derrubada(motivo))
+
+    def _difundir(self, quadro: str) -> None:
+        for fila in list(self._filas):
+            try:
+                fila.put_nowait(quadro)
+            except asyncio.QueueFull:
+                self._derrubar(fila, "buffer cheio")
+
+    def _derrubar_todos(self, motivo: str) -> None:
+        # Quem acompanha recebe antes os eventos que já estão na fila.
+        for fila in list(self._filas):
+            try:
+                fila.put_nowait(_Derrubada(motivo))
+                self._filas.discard(fila)
+            except asyncio.QueueFull:
+                self._derrubar(fila, motivo)
+        # As outras origens também param; o próximo assinante abre todas.
+        if self._tarefa is not None:
+            self._tarefa.cancel()
+            self._tarefa = None
+
+    async def _ler_origens(self) -> None:
+        await asyncio.gather(*(self._ler_origem(url) for url in self.base_urls))
+
+    async def _ler_origem(self, base_url: str) -> None:
+        timeout = httpx.Timeout(10, read=None)
+        while self._filas:
+            conectada = False
+            try:
+                async with httpx.AsyncClient(timeout=timeout) as client:
+                    async with client.stream("GET", f"{base_url}/contas/eventos") as r:
+                        r.raise_for_status()
+                        conectada = True
+                        linhas = []
+                        async for linha in r.aiter_lines():
+                            if linha:
+                                linhas.append(linha)
+                                continue
+                            quadro = _repassar(linhas)
+                            linhas = []
+                            if isinstance(quadro, _Derrubada):
+                                break
+                            if quadro is not None:
+                                self._difundir(f"id: {next(self._ids)}\n{quadro}\n\n")
+            except httpx.HTTPError:
+                pass
+            if conectada:
+                self._derrubar_todos("origem desconectada")
+                return
+            await asyncio.sleep(ESPERA_RECONEXAO_S)
+
+    async def stream(self, keepalive_s: float = KEEPALIVE_S):
+        fila: asyncio.Queue[Item] = asyncio.Queue(self.tamanho_buffer)
+        self._filas.add(fila)
+        if self._tarefa is None or self._tarefa.done():
+            self._tarefa = asyncio.create_task(self._ler_origens())
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    quadro = await asyncio.wait_for(fila.get(), keepalive_s)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if isinstance(quadro, _Derrubada):
+                    yield f"event: DERRUBADO\ndata: {json.dumps({'motivo': quadro.motivo})}\n\n"
+                    return
+                yield quadro
+        finally:
+            self._filas.discard(fila)
+            if not self._filas and self._tarefa is not None:
+                self._tarefa.cancel()
+                self._tarefa = None
+
+
+_repetidores: dict[tuple[str, ...], Repetidor] = {}
+
+
+def repetidor_para(*base_urls: str) -> Repetidor:
+    if base_urls not in _repetidores:
+        _repetidores[base_urls] = Repetidor(*base_urls)
+    return _repetidores[base_urls]
@@ -1,4 +1,7 @@
-﻿from pydantic import BaseModel, EmailStr
+﻿from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel, EmailStr
 
 class ContaModel(BaseModel):
     agencia: str
@@ -13,3 +16,72 @@ class ContaModel(BaseModel):
     limite_cheque_especial: float
     limite_atual: float
     score_credito: float
+
+
+class MovimentacaoModel(BaseModel):
+    tipo: str
+    valor: float
+    saldo_apos: float
+    limite: Optional[float] = None
+    criado_em: datetime
+
+
+class ExtratoModel(BaseModel):
+    agencia: str
+    numero_conta: str
+    saldo_inicial: float
+    movimentacoes: list[MovimentacaoModel]
+    proximo: Optional[int] = None
+
+
+class ResumoAgenciaModel(BaseModel):
+    agencia: str
+    quantidade_contas: int
+    total_depositos: float
+    exposicao_negativa: float
+    cheque_especial_usado: float
+    cheque_especial_disponivel: float
+
+
+class ContaPaginaModel(BaseModel):
+    itens: list[ContaModel]
+    proximo: Optional[str] = None
+
+
+class ChaveContaModel(BaseModel):
+    agencia: str
+    numero_conta: str
+
+
+class ConsultaLoteModel(BaseModel):
+    encontradas: list[ContaModel]
+    faltantes: list[ChaveContaModel]
+
+
+class AlteracaoModel(BaseModel):
+    tipo: str
+    agencia: str
+    numero_conta: str
+    conta: Optional[ContaModel] = None
+    alteracao: int
+    desde: str
+
+
+class AlteracoesModel(BaseModel):
+    itens: list[AlteracaoModel]
+    desde: str
+    tem_mais: bool
+
+
+class ScoreCreditoModel(BaseModel):
+    agencia: str
+    numero_conta: str
+    score_credito: float
+    percentil: float
+
+
+class RankingScoreModel(BaseModel):
+    agencia: str
+    numero_conta: str
+    nome: str
+    score_credito: float
@@ -0,0 +1,77 @@
+"""Prazo das requisições do gateway.
+
+Cada rota de /contas tem um prazo total, contado de quando ela começa:
+CLIENTES_API_PRAZO_MS, ou o valor dado para ela em CLIENTES_API_PRAZOS.
+Quem chama o gateway pode encurtá-lo mandando X-Prazo-Ms. Todas as
+chamadas ao clientes_db feitas pela requisição dividem esse orçamento (a
+desativação, que lê a conta e depois desativa, não ganha dois prazos): o
+timeout de cada chamada é o que resta, e o restante segue em X-Prazo-Ms
+para o clientes_db desistir junto com o gateway.
+"""
+
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+import httpx
+from fastapi import Request
+
+CABECALHO = "X-Prazo-Ms"
+
+PRAZO_PADRAO_S = float(os.getenv("CLIENTES_API_PRAZO_MS", "10000")) / 1000
+# "rota=ms,rota=ms", com o nome da função da rota (ex.: sacar=3000).
+PRAZOS_S = {
+    rota.strip(): float(ms) / 1000
+    for rota, _, ms in (
+        item.partition("=") for item in os.getenv("CLIENTES_API_PRAZOS", "").split(",")
+    )
+    if rota.strip() and ms.strip()
+}
+
+# Instante (time.monotonic) em que o prazo da requisição acaba.
+_fim: ContextVar[Optional[float]] = ContextVar("prazo_fim", default=None)
+
+
+class PrazoEsgotado(httpx.TimeoutException):
+    """O prazo acabou antes de a chamada ao clientes_db sair."""
+
+
+async def definir_prazo(request: Request) -> None:
+    """Dependência das rotas: marca o fim do prazo da requisição."""
+    rota = request.scope.get("route")
+    prazo_s = PRAZOS_S.get(getattr(rota, "name", None), PRAZO_PADRAO_S)
+    pedido = request.headers.get(CABECALHO)
+    if pedido:
+        try:
+            prazo_s = min(prazo_s, max(0.0, float(pedido) / 1000))
+        except ValueError:
+            pass
+    _fim.set(time.monotonic() + prazo_s)
+
+
+def restante() -> Optional[float]:
+    fim = _fim.get()
+    return None if fim is None else fim - time.monotonic()
+
+
+def esgotado() -> bool:
+    r = restante()
+    return r is not None and r <= 0
+
+
+def opcoes(cabecalhos: Optional[dict] = None) -> dict:
+    """timeout e headers de uma chamada ao clientes_db.
+
+    Fora de uma requisição (sem prazo) vale PRAZO_PADRAO_S e nenhum
+    cabeçalho é acrescentado.
+    """
+    r = restante()
+    if r is None:
+        return {"timeout": PRAZO_PADRAO_S, **({"headers": cabecalhos} if cabecalhos else {})}
+    if r <= 0:
+        raise PrazoEsgotado("prazo da requisição esgotado")
+    return {
+        "timeout": r,
+        "headers": {**(cabecalhos or {}), CABECALHO: str(max(1, int(r * 1000)))},
+    }
@@ -0,0 +1,294 @@
+"""Várias instâncias do clientes_db atrás do gateway.
+
+Cada agência pertence a uma instância, escolhida por hash consistente: um
+anel com VNOS pontos por instância. Incluir ou tirar uma instância só muda
+o dono das agências do trecho do anel que ela ganha ou perde (~1/N delas).
+Cada instância pode ter réplicas, usadas pelas leituras quando a principal
+não responde.
+"""
+
+import asyncio
+import base64
+import bisect
+import hashlib
+import heapq
+import json
+import os
+from typing import Awaitable, Callable, Optional
+
+import httpx
+from fastapi import HTTPException
+
+from .db_conta import DbConta
+
+VNOS = 160
+# Instâncias consultadas ao mesmo tempo nas rotas que juntam todas.
+FANOUT_SIMULTANEOS = int(os.getenv("CLIENTES_API_FANOUT", "8"))
+
+
+def _hash(texto: str) -> int:
+    return int.from_bytes(hashlib.md5(texto.encode()).digest()[:8], "big")
+
+
+class AnelHash:
+    def __init__(self, nos: list[str], vnos: int = VNOS):
+        pontos = sorted((_hash(f"{no}#{v}"), no) for no in nos for v in range(vnos))
+        self.nos = list(nos)
+        self._hashes = [h for h, _ in pontos]
+        self._donos = [no for _, no in pontos]
+
+    def no_da_chave(self, chave: str) -> str:
+        i = bisect.bisect(self._hashes, _hash(chave)) % len(self._hashes)
+        return self._donos[i]
+
+
+def ler_instancias(texto: str) -> dict[str, list[str]]:
+    """"http://a|http://a-replica,http://b" -> {principal: [principal, *réplicas]}."""
+    instancias = {}
+    for grupo in texto.split(","):
+        urls = [u.strip().rstrip("/") for u in grupo.split("|") if u.strip()]
+        if urls:
+            instancias[urls[0]] = urls
+    return instancias
+
+
+def _codificar(valores) -> str:
+    # Mesmo formato de cursor do clientes_db.
+    return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode()
+
+
+def _decodificar(cursor: str) -> dict:
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        valores = None
+    if not isinstance(valores, dict):
+        raise HTTPException(
+            status_code=422,
+            detail={
+                "status": 422,
+                "code": "CURSOR_INVALIDO",
+                "message": "Cursor de paginação inválido"
+            }
+        )
+    return valores
+
+
+def _nocase(texto: str) -> str:
+    # A busca por nome vem ordenada pela collation NOCASE do SQLite.
+    return "".join(ch.lower() if ch.isascii() else ch for ch in texto)
+
+
+class DbContas:
+    """Mesma interface do DbConta, repartida entre as instâncias do anel."""
+
+    def __init__(self, instancias: dict[str, list[str]], vnos: int = VNOS):
+        self.instancias = {
+            principal: [DbConta(url, compartilhado=True) for url in urls]
+            for principal, urls in instancias.items()
+        }
+        self.anel = AnelHash(list(self.instancias), vnos)
+
+    def _dono(self, agencia: str) -> list[DbConta]:
+        return self.instancias[self.anel.no_da_chave(agencia)]
+
+    @staticmethod
+    async def _ler(dbs: list[DbConta], chamada: Callable[[DbConta], Awaitable]):
+        # Falha de conexão na principal passa para a próxima réplica; erro
+        # HTTP é resposta e volta como veio.
+        for db in dbs[:-1]:
+            try:
+                return await chamada(db)
+            except httpx.RequestError:
+                continue
+        return await chamada(dbs[-1])
+
+    async def _espalhar(self, trabalhos: dict[str, Callable[[DbConta], Awaitable]]) -> dict:
+        limite = asyncio.Semaphore(FANOUT_SIMULTANEOS)
+
+        async def um(no: str, chamada):
+            async with limite:
+                return await self._ler(self.instancias[no], chamada)
+
+        respostas = await asyncio.gather(*(um(no, c) for no, c in trabalhos.items()))
+        return dict(zip(trabalhos, respostas))
+
+    async def _em_todas(self, chamada: Callable[[DbConta], Awaitable]) -> list:
+        return list((await self._espalhar({no: chamada for no in self.instancias})).values())
+
+    # ---- rotas de uma conta: vão à instância dona da agência ----
+
+    async def criar_conta(self, payload: dict) -> dict:
+        return await self._dono(payload["agencia"])[0].criar_conta(payload)
+
+    async def obter_conta(self, agencia: str, numero_conta: str) -> dict:
+        return await self._ler(self._dono(agencia), lambda db: db.obter_conta(agencia, numero_conta))
+
+    async def obter_conta_se_mudou(
+        self, agencia: str, numero_conta: str, if_none_match: str
+    ) -> tuple[Optional[dict], Optional[str]]:
+        return await self._ler(
+            self._dono(agencia),
+            lambda db: db.obter_conta_se_mudou(agencia, numero_conta, if_none_match),
+        )
+
+    async def obter_conta_campos(self, agencia: str, numero_conta: str, campos: str) -> dict:
+        return await self._ler(
+            self._dono(agencia), lambda db: db.obter_conta_campos(agencia, numero_conta, campos)
+        )
+
+    async def score_credito(self, agencia: str, numero_conta: str) -> dict:
+        return await self._ler(self._dono(agencia), lambda db: db.score_credito(agencia, numero_conta))
+
+    async def extrato(self, agencia: str, numero_conta: str, params: dict) -> dict:
+        return await self._ler(
+            self._dono(agencia), lambda db: db.extrato(agencia, numero_conta, params)
+        )
+
+    async def atualizar_conta(
+        self, agencia: str, numero_conta: str, payload: dict, if_match: Optional[str] = None
+    ) -> dict:
+        return await self._dono(agencia)[0].atualizar_conta(
+            agencia, numero_conta, payload, if_match=if_match
+        )
+
+    async def desativar_conta(self, agencia: str, numero_conta: str) -> None:
+        return await self._dono(agencia)[0].desativar_conta(agencia, numero_conta)
+
+    async def depositar(self, payload: dict) -> dict:
+        return await self._dono(payload["agencia"])[0].depositar(payload)
+
+    async def sacar(self, payload: dict) -> dict:
+        return await self._dono(payload["agencia"])[0].sacar(payload)
+
+    async def cadastrar_cheque_especial(
+        self, id_: int, payload: dict, if_match: Optional[str] = None
+    ) -> dict:
+        # O id é o da instância dona, lido pelo gateway logo antes.
+        return await self._dono(payload["agencia"])[0].cadastrar_cheque_especial(
+            id_, payload, if_match=if_match
+        )
+
+    # ---- rotas que juntam todas as instâncias ----
+
+    async def listar_contas(self) -> list[dict]:
+        return [c for pagina in await self._em_todas(lambda db: db.listar_contas()) for c in pagina]
+
+    async def listar_contas_campos(self, campos: str) -> list[dict]:
+        paginas = await self._em_todas(lambda db: db.listar_contas_campos(campos))
+        return [c for pagina in paginas for c in pagina]
+
+    async def consultar_lote(self, chaves: list[dict]) -> dict:
+        por_no: dict[str, list[dict]] = {}
+        for chave in chaves:
+            por_no.setdefault(self.anel.no_da_chave(chave["agencia"]), []).append(chave)
+        respostas = await self._espalhar({
+            no: (lambda db, lote=lote: db.consultar_lote(lote)) for no, lote in por_no.items()
+        })
+        contas = {
+            (c["agencia"], c["numero_conta"]): c
+            for r in respostas.values() for c in r["encontradas"]
+        }
+        ordem = list(dict.fromkeys((c["agencia"], c["numero_conta"]) for c in chaves))
+        return {
+            "encontradas": [contas[k] for k in ordem if k in contas],
+            "faltantes": [
+                {"agencia": ag, "numero_conta": num} for ag, num in ordem if (ag, num) not in contas
+            ],
+        }
+
+    async def resumo_agencias(self) -> list[dict]:
+        # Cada agência está numa instância só: basta intercalar.
+        paginas = await self._em_todas(lambda db: db.resumo_agencias())
+        return list(heapq.merge(*paginas, key=lambda r: r["agencia"]))
+
+    async def ranking_score(self, top: int) -> list[dict]:
+        paginas = await self._em_todas(lambda db: db.ranking_score(top))
+        return list(heapq.merge(*paginas, key=lambda r: -r["score_credito"]))[:top]
+
+    async def buscar_contas(self, params: dict) -> dict:
+        if len(self.instancias) == 1:
+            return (await self._em_todas(lambda db: db.buscar_contas(params)))[0]
+
+        # O cursor guarda o de cada instância: None antes da primeira
+        # página, False depois da última.
+        limit = params["limit"]
+        estados = _decodificar(params["after"]) if params.get("after") else {}
+        estados = {no: estados.get(no) for no in self.instancias}
+        filtros = {k: v for k, v in params.items() if k != "after"}
+
+        respostas = await self._espalhar({
+            no: (lambda db, after=after: db.buscar_contas(
+                {**filtros, **({"after": after} if after else {})}
+            ))
+            for no, after in estados.items() if after is not False
+        })
+
+        if params.get("nome"):
+            chave = lambda c: (_nocase(c["nome"]), c["id"])  # noqa: E731
+            marca = lambda c: _codificar([c["nome"], c["id"]])  # noqa: E731
+        else:
+            chave = lambda c: c["id"]  # noqa: E731
+            marca = lambda c: _codificar([c["id"]])  # noqa: E731
+
+        fluxos = [[(chave(c), no, c) for c in r["itens"]] for no, r in respostas.items()]
+        itens = list(heapq.merge(*fluxos, key=lambda e: e[:2]))[:limit]
+
+        for no, r in respostas.items():
+            usados = [c for _, dono, c in itens if dono == no]
+            if len(usados) == len(r["itens"]):
+                estados[no] = r["proximo"] or False
+            elif usados:
+                estados[no] = marca(usados[-1])
+
+        fim = all(e is False for e in estados.values())
+        return {
+            "itens": [c for _, _, c in itens],
+            "proximo": None if fim else _codificar(estados),
+        }
+
+    async def alteracoes(self, params: dict) -> dict:
+        # O cursor guarda a marca de cada instância (None antes da primeira
+        # página), também com uma instância só. Cada uma devolve até limit
+        # itens; as páginas são intercaladas por alteracao e só os limit
+        # primeiros saem, e a marca de cada instância é a do último item
+        # dela que saiu.
+        limit = params["limit"]
+        marcas = _decodificar(params["desde"]) if params.get("desde") else {}
+        marcas = {no: marcas.get(no) for no in self.instancias}
+
+        respostas = await self._espalhar({
+            no: (lambda db, desde=desde: db.alteracoes(
+                {"limit": limit, **({"desde": desde} if desde else {})}
+            ))
+            for no, desde in marcas.items()
+        })
+
+        fluxos = [[(i["alteracao"], no, i) for i in r["itens"]] for no, r in respostas.items()]
+        itens = list(heapq.merge(*fluxos, key=lambda e: e[:2]))[:limit]
+
+        tem_mais = False
+        for no, r in respostas.items():
+            usados = [i for _, dono, i in itens if dono == no]
+            if len(usados) == len(r["itens"]):
+                marcas[no] = r["desde"]
+                tem_mais = tem_mais or r["tem_mais"]
+            else:
+                if usados:
+                    marcas[no] = usados[-1]["desde"]
+                tem_mais = True
+
+        return {
+            "itens": [i for _, _, i in itens],
+            "desde": _codificar(marcas),
+            "tem_mais": tem_mais,
+        }
+
+
+_roteadores: dict[str, DbContas] = {}
+
+
+def contas_para(config: str) -> DbContas:
+    if config not in _roteadores:
+        _roteadores[config] = DbContas(ler_instancias(config))
+    return _roteadores[config]
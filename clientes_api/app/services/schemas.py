@@ -31,3 +31,11 @@ class OperacaoPorChavesIn(BaseModel):
 class ChequeEspecialCadastroIn(BaseModel):
     habilitado: bool
     limite: confloat(ge=0)
+
+
+class ChaveContaIn(BaseModel):
+    agencia: str = Field(..., min_length=3, max_length=4, pattern=r"^\d{3,4}$")
+    numero_conta: str = Field(..., min_length=4, max_length=8, pattern=r"^\d{4,8}$")
+
+class ConsultaLoteIn(BaseModel):
+    chaves: list[ChaveContaIn] = Field(..., min_length=1, max_length=10000)
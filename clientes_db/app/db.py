@@ -1,18 +1,437 @@
 ﻿
-from sqlalchemy import create_engine
+import asyncio
+import contextvars
+import functools
+import inspect
+import os
+import random
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Optional
+
+import anyio
+import anyio.to_thread
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.routing import APIRoute
+from sqlalchemy import create_engine, event, make_url, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker, DeclarativeBase, Session
 
-DATABASE_URL = "sqlite:///./clientes.db"
+from . import metricas, prazo, quentes
+
+DATABASE_URL = os.getenv("CLIENTES_DB_DATABASE_URL", "sqlite:///./clientes.db")
+
+# Conexões no pool e threads para as rotas síncronas andam juntas: com mais
+# threads que conexões o excedente só ficaria parado esperando conexão.
+POOL_SIZE = int(os.getenv("CLIENTES_DB_POOL_SIZE", "8"))
+# Os GETs usam um pool próprio, de conexões somente leitura.
+POOL_LEITURA = int(os.getenv("CLIENTES_DB_POOL_LEITURA", str(POOL_SIZE)))
+WORKERS = int(os.getenv("CLIENTES_DB_WORKERS", str(POOL_SIZE + POOL_LEITURA)))
+
+# Escritas concorrentes (inclusive de outros processos) esperam o lock no
+# busy handler do SQLite; se ainda assim ele estiver ocupado, o BEGIN
+# IMMEDIATE é repetido algumas vezes com espera aleatória crescente.
+BUSY_TIMEOUT_S = float(os.getenv("CLIENTES_DB_BUSY_TIMEOUT_S", "2"))
+TENTATIVAS_ESCRITA = int(os.getenv("CLIENTES_DB_TENTATIVAS_ESCRITA", "4"))
+ESPERA_BASE_S = 0.05
+
+ESCRITA = {"transacao_escrita": True}
+
+# Leitura-após-escrita: quem acabou de escrever manda o X-Alteracao recebido
+# em X-Min-Alteracao, e a leitura espera o snapshot alcançar esse valor.
+TENTATIVAS_LEITURA = 3
+ESPERA_LEITURA_S = 0.02
+
+
+def _em_memoria(url: str) -> bool:
+    return make_url(url).database in (None, "", ":memory:")
+
+
+def _argumentos_pool(url: str, tamanho: int = None) -> dict:
+    # SQLite em memória usa SingletonThreadPool, que não tem overflow.
+    if _em_memoria(url):
+        return {}
+    return {"pool_size": tamanho or POOL_SIZE, "max_overflow": 0}
+
+
+def _url_leitura(url: str) -> str:
+    # O pysqlite só aceita mode=ro com a URI do arquivo (uri=true).
+    u = make_url(url)
+    u = u.set(database=f"file:{u.database}", query={**u.query, "mode": "ro", "uri": "true"})
+    return u.render_as_string(hide_password=False)
+
+
+def url_do_shard(url: str, indice: int) -> str:
+    """Shard 0 é o próprio banco; os demais ficam ao lado (clientes.1.db, ...)."""
+    if indice == 0:
+        return url
+    u = make_url(url)
+    raiz, extensao = os.path.splitext(u.database)
+    return u.set(database=f"{raiz}.{indice}{extensao}").render_as_string(hide_password=False)
+
+
+def configurar_sqlite(engine: Engine, somente_leitura: bool = False) -> Engine:
+    """Transações controladas pelo SQLAlchemy e WAL em bancos de arquivo.
+
+    O pysqlite só abre a transação no primeiro INSERT/UPDATE, depois das
+    leituras; duas escritas que leram antes brigam pelo lock e uma recebe
+    SQLITE_BUSY na hora. Aqui o BEGIN é nosso: conexões com ESCRITA nas
+    execution options começam com BEGIN IMMEDIATE e pegam o lock antes de
+    ler. Com WAL, leitores (de qualquer processo) não bloqueiam a escrita.
+
+    Com ``somente_leitura`` as conexões recebem ``query_only`` e nunca pedem
+    o lock de escrita; o modo WAL fica a cargo do engine de escrita.
+    """
+    wal = not _em_memoria(str(engine.url)) and not somente_leitura
+
+    @event.listens_for(engine, "connect")
+    def _conectar(dbapi_connection, registro):
+        dbapi_connection.isolation_level = None
+        if wal:
+            dbapi_connection.execute("PRAGMA journal_mode=WAL")
+        if somente_leitura:
+            dbapi_connection.execute("PRAGMA query_only = ON")
+
+    @event.listens_for(engine, "begin")
+    def _begin(conn):
+        if conn.get_execution_options().get("transacao_escrita") and not somente_leitura:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        else:
+            conn.exec_driver_sql("BEGIN")
+
+    return engine
+
+
+def criar_engines(url: str) -> tuple[Engine, Engine]:
+    """Engine de escrita e engine somente leitura de um arquivo SQLite."""
+    escrita = configurar_sqlite(create_engine(
+        url,
+        connect_args={"check_same_thread": False, "timeout": BUSY_TIMEOUT_S},
+        **_argumentos_pool(url)
+    ))
+    # Em memória cada conexão seria um banco vazio: leitura e escrita dividem
+    # o mesmo engine.
+    if _em_memoria(url):
+        return escrita, escrita
+    leitura = configurar_sqlite(create_engine(
+        _url_leitura(url),
+        connect_args={"check_same_thread": False, "timeout": BUSY_TIMEOUT_S},
+        **_argumentos_pool(url, POOL_LEITURA)
+    ), somente_leitura=True)
+    return escrita, leitura
+
+
+def _fabricas(engines: tuple[Engine, Engine]) -> tuple[sessionmaker, sessionmaker]:
+    return tuple(sessionmaker(bind=e, autocommit=False, autoflush=False) for e in engines)
+
+
+# Contas divididas por agência em vários arquivos, cada um com o próprio lock
+# de escrita. Em memória só existe um shard.
+SHARDS = 1 if _em_memoria(DATABASE_URL) else int(os.getenv("CLIENTES_DB_SHARDS", "1"))
+
+# Shard 0: o banco principal, que também guarda o diretório de contas.
+engine, engine_leitura = criar_engines(DATABASE_URL)
+SessionLocal, SessionLeitura = _fabricas((engine, engine_leitura))
+
+# Shards 1..N-1, como pares (escrita, leitura) de fábricas de sessão.
+SHARDS_EXTRAS = [
+    _fabricas(criar_engines(url_do_shard(DATABASE_URL, i))) for i in range(1, SHARDS)
+]
+
+
+def engines_extras() -> list[Engine]:
+    """Engines de escrita dos shards 1..N-1 (o 0 é ``engine``)."""
+    return [escrita.kw["bind"] for escrita, _ in SHARDS_EXTRAS]
+
+
+def shard_da_agencia(agencia: str, shards: int = None) -> int:
+    # crc32 e não hash(): o resultado não pode mudar entre processos.
+    return zlib.crc32(agencia.encode()) % (shards or SHARDS)
+
+
+def abrir_sessao(indice: int = 0, leitura: bool = False) -> Session:
+    if indice == 0:
+        return (SessionLeitura if leitura else SessionLocal)()
+    escrita, somente_leitura = SHARDS_EXTRAS[indice - 1]
+    return (somente_leitura if leitura else escrita)()
+
+def _descartar_conexoes() -> None:
+    # Com fork depois do import (gunicorn --preload, multiprocessing), o
+    # filho não pode reaproveitar conexões do pai: cada processo abre as suas.
+    engine.dispose(close=False)
+    engine_leitura.dispose(close=False)
+    for escrita, leitura in SHARDS_EXTRAS:
+        escrita.kw["bind"].dispose(close=False)
+        leitura.kw["bind"].dispose(close=False)
+
+# Sem fork (Windows) não há o que registrar.
+getattr(os, "register_at_fork", lambda **_: None)(after_in_child=_descartar_conexoes)
+
+
+_executor_shards = None
+_executor_lock = threading.Lock()
+
+
+def espalhar(funcao, itens) -> list:
+    """Aplica ``funcao`` a cada item (sessões ou índices de shard) em paralelo.
+
+    Os resultados voltam na ordem dos itens. Com um item só roda na própria
+    thread, sem passar pelo executor. Cada item roda numa cópia do contexto
+    de quem chamou, para o prazo da requisição valer também no executor.
+    Se algum falha, o erro só sobe depois que todos terminaram: as sessões
+    dos outros itens ainda estão em uso até lá.
+    """
+    itens = list(itens)
+    if len(itens) <= 1:
+        return [funcao(item) for item in itens]
+    global _executor_shards
+    with _executor_lock:
+        if _executor_shards is None:
+            _executor_shards = ThreadPoolExecutor(
+                max_workers=SHARDS * POOL_LEITURA, thread_name_prefix="shards"
+            )
+    futuros = [
+        _executor_shards.submit(contextvars.copy_context().run, funcao, item)
+        for item in itens
+    ]
+    wait(futuros)
+    return [futuro.result() for futuro in futuros]
+
+
+def banco_ocupado(e: OperationalError) -> bool:
+    return "database is locked" in str(e.orig) or "database is busy" in str(e.orig)
+
+
+def iniciar_escrita(db: Session) -> None:
+    """Abre a transação da sessão com BEGIN IMMEDIATE, com novas tentativas."""
+    if db.in_transaction():
+        db.commit()
+    # Ao menos uma tentativa, mesmo com CLIENTES_DB_TENTATIVAS_ESCRITA=0.
+    tentativa = 1
+    while True:
+        try:
+            db.connection(execution_options=ESCRITA)
+            return
+        except OperationalError as e:
+            db.rollback()
+            if not banco_ocupado(e) or tentativa >= TENTATIVAS_ESCRITA:
+                raise
+            time.sleep(random.uniform(0, ESPERA_BASE_S * 2 ** tentativa))
+            tentativa += 1
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 
 class Base(DeclarativeBase):
     pass
 
-def get_db():
-    db: Session = SessionLocal()
+# Threads das rotas síncronas e das sessões (todo o acesso ao banco): um
+# limitador só delas, dimensionado pelo pool de conexões. O limitador padrão
+# do AnyIO, usado por outras bibliotecas e pelo resto do processo, fica como
+# está. As vagas no pool são reservadas antes de pedir a thread.
+_limitador_banco: Optional[anyio.CapacityLimiter] = None
+
+def limitador_banco() -> anyio.CapacityLimiter:
+    global _limitador_banco
+    if _limitador_banco is None:
+        _limitador_banco = anyio.CapacityLimiter(WORKERS)
+    return _limitador_banco
+
+def _na_thread(na_fila: float, func: Callable, *args, **kwargs):
+    # O tempo desde na_fila é a espera por um token do limitador.
+    metricas.espera_fila.registrar(time.perf_counter() - na_fila)
+    return func(*args, **kwargs)
+
+async def em_thread_do_banco(func: Callable, *args, **kwargs):
+    """Roda func numa thread do limitador do banco (contexto copiado)."""
+    return await anyio.to_thread.run_sync(
+        functools.partial(_na_thread, time.perf_counter(), func, *args, **kwargs),
+        limiter=limitador_banco(),
+    )
+
+async def _fechar(db: Session) -> None:
+    # Como o FastAPI faz com o __exit__ das dependências: o fechamento não
+    # espera token, para nunca ficar atrás de quem espera a conexão dele.
+    await anyio.to_thread.run_sync(db.close, limiter=anyio.CapacityLimiter(1))
+
+class RotaDoBanco(APIRoute):
+    """Rota cujo endpoint síncrono roda no limitador do banco, e não no
+    limitador padrão do AnyIO."""
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        if not inspect.iscoroutinefunction(endpoint):
+            endpoint = _no_limitador_banco(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+def _no_limitador_banco(func: Callable) -> Callable:
+    async def rota(**kwargs):
+        return await em_thread_do_banco(func, **kwargs)
+
+    # Sem functools.wraps: o FastAPI seguiria __wrapped__ até a função
+    # síncrona e mandaria a corrotina para o threadpool.
+    rota.__signature__ = inspect.signature(func)
+    rota.__name__, rota.__qualname__, rota.__doc__ = func.__name__, func.__qualname__, func.__doc__
+    rota.__module__ = func.__module__
+    return rota
+
+def vagas_conexao(app: FastAPI) -> asyncio.Semaphore:
+    vagas = getattr(app.state, "vagas_conexao", None)
+    if vagas is None:
+        vagas = app.state.vagas_conexao = asyncio.Semaphore(POOL_SIZE)
+    return vagas
+
+def vagas_leitura(app: FastAPI) -> asyncio.Semaphore:
+    vagas = getattr(app.state, "vagas_leitura", None)
+    if vagas is None:
+        vagas = app.state.vagas_leitura = asyncio.Semaphore(POOL_LEITURA)
+    return vagas
+
+async def _reservar(vagas: asyncio.Semaphore):
+    # A vaga no pool é reservada no event loop, antes de a requisição pedir
+    # uma thread. Se a espera fosse no checkout, dentro da thread, as threads
+    # paradas ali segurariam todos os tokens e as requisições que já têm
+    # conexão (e só precisam de uma thread para validar a resposta e
+    # devolvê-la) nunca terminariam.
+    inicio = time.perf_counter()
+    metricas.aguardando_conexao += 1
     try:
-        yield db
+        await vagas.acquire()
     finally:
+        metricas.aguardando_conexao -= 1
+    try:
+        metricas.espera_conexao.registrar(time.perf_counter() - inicio)
+        yield
+    finally:
+        vagas.release()
+
+async def reservar_conexao(request: Request):
+    async for _ in _reservar(vagas_conexao(request.app)):
+        yield
+
+async def reservar_conexao_leitura(request: Request):
+    async for _ in _reservar(vagas_leitura(request.app)):
+        yield
+
+async def chave_do_shard(request: Request):
+    """Agência (ou id da conta) que decide o shard da requisição."""
+    if SHARDS == 1:
+        return None
+    parametros = request.path_params
+    if "agencia" in parametros:
+        return parametros["agencia"]
+    if "id" in parametros:
+        return int(parametros["id"]) if parametros["id"].isdigit() else None
+    try:
+        corpo = await request.json()
+    except ValueError:
+        return None
+    agencia = corpo.get("agencia") if isinstance(corpo, dict) else None
+    return agencia if isinstance(agencia, str) else None
+
+def shard_da_chave(chave) -> int:
+    if isinstance(chave, str):
+        return shard_da_agencia(chave)
+    if isinstance(chave, int):
+        # Rotas por id: o diretório, no shard 0, diz a agência da conta.
+        with engine_leitura.connect() as conn:
+            agencia = conn.execute(
+                text("SELECT agencia FROM diretorio_contas WHERE id = :id"), {"id": chave}
+            ).scalar()
+        return shard_da_agencia(agencia) if agencia is not None else 0
+    return 0
+
+async def operacao_quente(request: Request) -> bool:
+    """Depósito/saque numa conta quente: quem abre a transação é o lote."""
+    if not quentes.CONTAS_QUENTES or not request.url.path.startswith("/contas/operacoes/"):
+        return False
+    try:
+        corpo = await request.json()
+    except ValueError:
+        return False
+    return isinstance(corpo, dict) and quentes.quente(
+        corpo.get("agencia"), corpo.get("numero_conta")
+    )
+
+def _sessao_da_rota(
+    chave, leitura: bool = False, escrita: bool = False, minimo: Optional[str] = None
+) -> Session:
+    # Já na thread: o BEGIN IMMEDIATE e a espera pela leitura nova bloqueiam.
+    # A espera pela vaga e pela thread pode ter consumido o prazo todo.
+    prazo.conferir()
+    db: Session = abrir_sessao(shard_da_chave(chave), leitura=leitura)
+    try:
+        if escrita:
+            iniciar_escrita(db)
+        if minimo:
+            _aguardar_alteracao(db, minimo)
+    except BaseException:
         db.close()
+        raise
+    return db
+
+async def get_db(
+    request: Request = None,
+    _vaga: None = Depends(reservar_conexao),
+    chave=Depends(chave_do_shard),
+    quente: bool = Depends(operacao_quente)
+):
+    # Sem o lock desde já, as operações de uma conta quente chegam à fila da
+    # conta juntas e saem num commit só (ver quentes.py).
+    escrita = request is not None and request.method not in ("GET", "HEAD") and not quente
+    db = await em_thread_do_banco(_sessao_da_rota, chave, escrita=escrita)
+    try:
+        yield db
+    finally:
+        await _fechar(db)
+
+def alteracao_atual(db: Session) -> int:
+    """Maior ``alteracao`` visível no snapshot da sessão."""
+    return db.execute(text(
+        "SELECT max(coalesce((SELECT max(alteracao) FROM contas), 0),"
+        " coalesce((SELECT max(alteracao) FROM contas_removidas), 0))"
+    )).scalar()
+
+def _aguardar_alteracao(db: Session, minimo: str) -> None:
+    try:
+        alvo = int(minimo)
+    except ValueError:
+        raise HTTPException(status_code=422, detail={
+            "status": 422, "code": "ALTERACAO_INVALIDA",
+            "message": "X-Min-Alteracao deve ser um inteiro",
+        })
+    for tentativa in range(1, TENTATIVAS_LEITURA + 1):
+        if alteracao_atual(db) >= alvo:
+            return
+        # Encerra o snapshot: a próxima leitura começa outro, mais novo.
+        db.rollback()
+        if tentativa < TENTATIVAS_LEITURA:
+            time.sleep(ESPERA_LEITURA_S * tentativa)
+    raise HTTPException(status_code=503, headers={"Retry-After": "1"}, detail={
+        "status": 503, "code": "LEITURA_DESATUALIZADA",
+        "message": "A leitura ainda não enxerga a alteração pedida; tente novamente.",
+    })
+
+async def get_db_leitura(
+    request: Request = None,
+    _vaga: None = Depends(reservar_conexao_leitura),
+    chave=Depends(chave_do_shard)
+):
+    """Sessão do pool somente leitura, para as rotas GET."""
+    minimo = request.headers.get("X-Min-Alteracao") if request is not None else None
+    db = await em_thread_do_banco(_sessao_da_rota, chave, leitura=True, minimo=minimo)
+    try:
+        yield db
+    finally:
+        await _fechar(db)
+
+async def get_shards_leitura(_vaga: None = Depends(reservar_conexao_leitura)):
+    """Uma sessão somente leitura por shard, para as rotas que consultam todos."""
+    prazo.conferir()
+    # Sessões ainda sem conexão: abri-las não bloqueia.
+    sessoes = [abrir_sessao(i, leitura=True) for i in range(SHARDS)]
+    try:
+        yield sessoes
+    finally:
+        for db in sessoes:
+            await _fechar(db)
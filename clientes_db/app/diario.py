@@ -0,0 +1,644 @@
+"""Escrita adiada dos saldos (write-behind), com diário durável.
+
+Com CLIENTES_DB_WRITE_BEHIND=1 depósitos e saques não esperam o SQLite: o
+saldo das contas em uso fica em memória, a regra do saque (saldo e cheque
+especial) é conferida sob o lock da conta e a operação é confirmada assim
+que o registro dela chega ao disco no diário, um arquivo de linhas JSON com
+fsync em grupo (quem chega dentro da mesma janela divide um fsync só). Uma
+thread leva os registros para a tabela contas, com extrato e resumo, em um
+commit por shard; ao subir, o diário que sobrou de um crash é reaplicado.
+
+Cada conta guarda em diario_seq o último registro aplicado, então reaplicar
+é idempotente. As rotas que mexem na conta por fora do saldo (PUT, cheque
+especial, desativação) aplicam antes os registros pendentes dela, e os
+juros esperam o diário esvaziar com as movimentações suspensas.
+
+A marca de alteração (X-Alteracao) só anda quando o diário é descarregado:
+depósitos e saques devolvem a do que já foi descarregado da conta, que um
+GET com X-Min-Alteracao alcança na hora e que mostra o saldo da memória.
+
+Só vale com um processo: o saldo em memória é deste processo.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import count
+from typing import Iterator, Mapping, Optional
+
+from fastapi import Depends, FastAPI, Request
+from sqlalchemy import func, inspect, make_url, select, update
+from sqlalchemy.orm import Session
+
+from . import db as db_mod
+from . import eventos
+from .db import (
+    abrir_sessao, get_db_leitura, get_shards_leitura, iniciar_escrita, reservar_conexao,
+    shard_da_agencia,
+)
+from .models import Conta, Movimentacao, agora_utc, proxima_alteracao
+from .repositorio import (
+    Conferencia, RepositorioContas, RepositorioSQL, _copia, get_repositorio,
+    get_repositorio_leitura, get_repositorios_leitura,
+)
+from .resumo import aplicar_delta, contribuicao
+
+ATIVO = os.getenv("CLIENTES_DB_WRITE_BEHIND", "0") == "1"
+# Quanto o primeiro a pedir fsync espera pelos que chegam depois dele.
+JANELA_FSYNC_S = float(os.getenv("CLIENTES_DB_DIARIO_JANELA_MS", "2")) / 1000
+# De quanto em quanto tempo os registros confirmados vão para o SQLite.
+INTERVALO_DESCARGA_S = float(os.getenv("CLIENTES_DB_DIARIO_DESCARGA_MS", "50")) / 1000
+# Conta sem movimento há mais que isso sai da memória.
+OCIOSA_S = float(os.getenv("CLIENTES_DB_DIARIO_OCIOSA_S", "60"))
+
+log = logging.getLogger(__name__)
+
+
+def caminho_padrao() -> str:
+    """Ao lado do banco principal: clientes.db -> clientes.db.diario."""
+    return os.getenv(
+        "CLIENTES_DB_DIARIO", f"{make_url(db_mod.DATABASE_URL).database}.diario"
+    )
+
+
+class Diario:
+    """Arquivo só de acréscimos, uma linha JSON por movimentação."""
+
+    def __init__(self, caminho: str, janela_s: float = JANELA_FSYNC_S):
+        self.caminho = caminho
+        self.janela_s = janela_s
+        self._arquivo = open(caminho, "a", encoding="utf-8")
+        self._cond = threading.Condition()
+        # Contam linhas escritas desde a abertura (não posição no arquivo):
+        # truncar o diário não volta as marcas para trás.
+        self.escritos = 0
+        self.duraveis = 0
+        self._sincronizando = False
+
+    def ler(self) -> list[dict]:
+        registros = []
+        with open(self.caminho, encoding="utf-8") as f:
+            for linha in f:
+                try:
+                    registros.append(json.loads(linha))
+                except ValueError:
+                    # Linha cortada pelo crash: nunca foi confirmada.
+                    break
+        return registros
+
+    def escrever(self, registro: dict) -> int:
+        """Acrescenta o registro; devolve a marca a passar para aguardar()."""
+        with self._cond:
+            self._arquivo.write(json.dumps(registro, separators=(",", ":")) + "\n")
+            self.escritos += 1
+            return self.escritos
+
+    def aguardar(self, marca: int) -> None:
+        """Volta quando a linha da marca estiver no disco.
+
+        Um dos que esperam vira líder: dorme a janela, grava tudo o que foi
+        escrito até ali e faz um fsync para todos; os outros só esperam.
+        """
+        with self._cond:
+            while self.duraveis < marca:
+                if self._sincronizando:
+                    self._cond.wait()
+                    continue
+                self._sincronizando = True
+                gravados = None
+                self._cond.release()
+                try:
+                    time.sleep(self.janela_s)
+                    with self._cond:
+                        self._arquivo.flush()
+                        alvo = self.escritos
+                    os.fsync(self._arquivo.fileno())
+                    gravados = alvo
+                finally:
+                    self._cond.acquire()
+                    self._sincronizando = False
+                    if gravados is not None:
+                        self.duraveis = max(self.duraveis, gravados)
+                    self._cond.notify_all()
+
+    def truncar(self) -> None:
+        with self._cond:
+            self._arquivo.flush()
+            self._arquivo.truncate(0)
+            os.fsync(self._arquivo.fileno())
+
+    def fechar(self) -> None:
+        with self._cond:
+            self._arquivo.close()
+
+
+def aplicar(db: Session, registros: list[dict]) -> int:
+    """Leva os registros para a sessão (sem commit); pula os já aplicados.
+
+    Cada registro aplicado ganha a chave "alteracao", a marca que a conta
+    recebeu com ele.
+    """
+    contas = Conta.__table__
+    aplicados = 0
+    for r in registros:
+        linha = db.execute(
+            update(contas)
+            .where(contas.c.id == r["conta_id"], contas.c.diario_seq < r["seq"])
+            .values(
+                saldo_centavos=contas.c.saldo_centavos + r["valor"],
+                versao=r["versao"],
+                alteracao=proxima_alteracao(),
+                diario_seq=r["seq"],
+            )
+            .returning(
+                contas.c.agencia, contas.c.saldo_centavos,
+                contas.c.cheque_especial_contratado, contas.c.limite_centavos,
+                contas.c.alteracao,
+            )
+        ).first()
+        if linha is None:
+            # Já aplicado, ou a conta foi removida depois.
+            continue
+        r["alteracao"] = linha.alteracao
+        depois = Conta(
+            saldo_centavos=linha.saldo_centavos,
+            cheque_especial_contratado=linha.cheque_especial_contratado,
+            limite_centavos=linha.limite_centavos,
+        )
+        antes = Conta(
+            saldo_centavos=linha.saldo_centavos - r["valor"],
+            cheque_especial_contratado=linha.cheque_especial_contratado,
+            limite_centavos=linha.limite_centavos,
+        )
+        db.add(Movimentacao(
+            conta_id=r["conta_id"],
+            tipo=r["tipo"],
+            valor_centavos=r["valor"],
+            saldo_apos_centavos=linha.saldo_centavos,
+            criado_em=datetime.fromisoformat(r["em"]),
+        ))
+        aplicar_delta(db, linha.agencia, contribuicao(antes), contribuicao(depois))
+        aplicados += 1
+    return aplicados
+
+
+def aplicar_nos_shards(registros: list[dict]) -> int:
+    por_shard: dict[int, list[dict]] = {}
+    for r in registros:
+        por_shard.setdefault(shard_da_agencia(r["agencia"]), []).append(r)
+    aplicados = 0
+    for indice, lote in sorted(por_shard.items()):
+        db = abrir_sessao(indice)
+        try:
+            iniciar_escrita(db)
+            aplicados += aplicar(db, lote)
+            db.commit()
+        finally:
+            db.close()
+    return aplicados
+
+
+def _maior_seq_aplicado() -> int:
+    maior = 0
+    for indice in range(db_mod.SHARDS):
+        db = abrir_sessao(indice, leitura=True)
+        try:
+            maior = max(maior, db.scalar(select(func.max(Conta.diario_seq))) or 0)
+        finally:
+            db.close()
+    return maior
+
+
+@dataclass(eq=False)
+class Entrada:
+    # Retrato da conta com o saldo e a versão já confirmados ao cliente.
+    conta: Conta
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    pendentes: int = 0
+    usada_em: float = field(default_factory=time.monotonic)
+    valida: bool = True
+
+
+class SaldosEmMemoria:
+    def __init__(
+        self, diario: Diario, intervalo_s: float = INTERVALO_DESCARGA_S,
+        ociosa_s: float = OCIOSA_S,
+    ):
+        self.diario = diario
+        self.intervalo_s = intervalo_s
+        self.ociosa_s = ociosa_s
+        self._entradas: dict[tuple[str, str], Entrada] = {}
+        self._por_id: dict[int, Entrada] = {}
+        # Registros no diário ainda não aplicados, por seq (em ordem), com a
+        # marca de durabilidade de cada um.
+        self._pendentes: dict[int, tuple[int, dict]] = {}
+        # Protege entradas, pendentes e a sequência; a ordem é sempre lock
+        # da conta -> este -> o do diário.
+        self._lock = threading.Lock()
+        # Muda a cada entrada descartada: quem carregou a conta do SQLite
+        # antes disso carrega de novo.
+        self._geracao = 0
+        self._seq = count(1)
+        self._descarga = threading.Lock()
+        # Movimentações em curso; pausa() espera zerar e segura as novas.
+        self._portao = threading.Condition()
+        self._em_curso = 0
+        self._pausado = False
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- ciclo de vida ----
+
+    def recuperar(self) -> int:
+        """Reaplica o diário deixado por um crash; devolve quantos entraram."""
+        registros = self.diario.ler()
+        aplicados = aplicar_nos_shards(registros)
+        self.diario.truncar()
+        ultimo = max([r["seq"] for r in registros] + [_maior_seq_aplicado()])
+        self._seq = count(ultimo + 1)
+        return aplicados
+
+    def iniciar(self) -> int:
+        aplicados = self.recuperar()
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._rodar, name="diario", daemon=True)
+        self._thread.start()
+        return aplicados
+
+    def parar(self) -> None:
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.diario.aguardar(self.diario.escritos)
+        self.descarregar()
+        self.diario.fechar()
+
+    def _rodar(self) -> None:
+        while not self._parar.wait(self.intervalo_s):
+            try:
+                self.descarregar()
+            except Exception:
+                # Banco ocupado ou fora do ar: os registros continuam no
+                # diário e na lista de pendentes para a próxima rodada.
+                log.exception("Falha ao descarregar o diário")
+
+    # ---- entradas ----
+
+    def _guardar(self, conta: Conta, geracao: Optional[int] = None) -> Optional[Entrada]:
+        chave = (conta.agencia, conta.numero_conta)
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                if geracao is not None and geracao != self._geracao:
+                    return None
+                entrada = self._entradas[chave] = Entrada(conta)
+                self._por_id[conta.id] = entrada
+            return entrada
+
+    def _descartar(self, entrada: Entrada) -> None:
+        # Com self._lock.
+        chave = (entrada.conta.agencia, entrada.conta.numero_conta)
+        if self._entradas.get(chave) is entrada:
+            del self._entradas[chave]
+            del self._por_id[entrada.conta.id]
+        entrada.valida = False
+        self._geracao += 1
+
+    def _entrada(self, agencia: str, numero_conta: str) -> Optional[Entrada]:
+        while True:
+            with self._lock:
+                entrada = self._entradas.get((agencia, numero_conta))
+                geracao = self._geracao
+            if entrada is not None:
+                return entrada
+            db = abrir_sessao(shard_da_agencia(agencia), leitura=True)
+            try:
+                conta = RepositorioSQL(db).obter(agencia, numero_conta)
+                if conta is None:
+                    return None
+                entrada = self._guardar(_copia(conta), geracao)
+            finally:
+                db.close()
+            if entrada is not None:
+                return entrada
+
+    def retrato(self, agencia: str, numero_conta: str) -> Optional[Conta]:
+        """A conta como está em memória, se estiver; não carrega do SQLite."""
+        with self._lock:
+            entrada = self._entradas.get((agencia, numero_conta))
+        return self._retrato(entrada)
+
+    def retrato_por_id(self, conta_id: int) -> Optional[Conta]:
+        with self._lock:
+            entrada = self._por_id.get(conta_id)
+        return self._retrato(entrada)
+
+    @staticmethod
+    def _retrato(entrada: Optional[Entrada]) -> Optional[Conta]:
+        if entrada is None:
+            return None
+        with entrada.lock:
+            return _copia(entrada.conta) if entrada.valida else None
+
+    def _retirar(self, registros: list[dict]) -> None:
+        # Com self._lock. Quem aplicou antes (descarga ou exclusivo) já tirou.
+        # Conta com registro pendente nunca sai da memória, então a entrada
+        # dele está em _por_id.
+        for r in registros:
+            if self._pendentes.pop(r["seq"], None) is not None:
+                self._por_id[r["conta_id"]].pendentes -= 1
+
+    # ---- escrita ----
+
+    @contextmanager
+    def _liberado(self) -> Iterator[None]:
+        with self._portao:
+            while self._pausado:
+                self._portao.wait()
+            self._em_curso += 1
+        try:
+            yield
+        finally:
+            with self._portao:
+                self._em_curso -= 1
+                if not self._em_curso:
+                    self._portao.notify_all()
+
+    def movimentar(
+        self, agencia: str, numero_conta: str, tipo: str, valor_centavos: int,
+        conferir: Optional[Conferencia] = None,
+    ) -> Optional[Conta]:
+        with self._liberado():
+            while True:
+                entrada = self._entrada(agencia, numero_conta)
+                if entrada is None:
+                    return None
+                with entrada.lock:
+                    if not entrada.valida:
+                        continue
+                    conta = entrada.conta
+                    novo_saldo = conta.saldo_centavos + valor_centavos
+                    if conferir is not None:
+                        conferir(_copia(conta), novo_saldo)
+                    with self._lock:
+                        registro = {
+                            "seq": next(self._seq),
+                            "conta_id": conta.id,
+                            "agencia": agencia,
+                            "numero_conta": numero_conta,
+                            "tipo": tipo,
+                            "valor": valor_centavos,
+                            "versao": uuid.uuid4().hex,
+                            "em": agora_utc().isoformat(),
+                        }
+                        marca = self.diario.escrever(registro)
+                        self._pendentes[registro["seq"]] = (marca, registro)
+                        entrada.pendentes += 1
+                    conta.saldo_centavos = novo_saldo
+                    conta.versao = registro["versao"]
+                    entrada.usada_em = time.monotonic()
+                    retrato = _copia(conta)
+                    break
+        # Fora dos locks: o fsync é dividido com quem chegar na janela.
+        self.diario.aguardar(marca)
+        eventos.publicar(tipo, retrato, valor_centavos)
+        return retrato
+
+    def descarregar(self) -> int:
+        """Aplica no SQLite os registros já no disco; devolve quantos."""
+        with self._descarga:
+            with self._lock:
+                duraveis = self.diario.duraveis
+                lote = [r for marca, r in self._pendentes.values() if marca <= duraveis]
+            if lote:
+                aplicar_nos_shards(lote)
+                with self._lock:
+                    self._retirar(lote)
+                    if not self._pendentes:
+                        self.diario.truncar()
+                self._avancar_marcas(lote)
+            self._despejar_ociosas()
+            return len(lote)
+
+    def _avancar_marcas(self, registros: list[dict]) -> None:
+        # A alteracao em memória acompanha o que já foi para o banco, então
+        # um GET com ela em X-Min-Alteracao responde na hora. Conta ocupada
+        # fica com a marca anterior, que só está atrás, nunca à frente.
+        for r in registros:
+            with self._lock:
+                entrada = self._por_id.get(r["conta_id"])
+            if entrada is None or "alteracao" not in r:
+                continue
+            if not entrada.lock.acquire(blocking=False):
+                continue
+            try:
+                entrada.conta.alteracao = max(entrada.conta.alteracao, r["alteracao"])
+            finally:
+                entrada.lock.release()
+
+    def _despejar_ociosas(self) -> None:
+        limite = time.monotonic() - self.ociosa_s
+        with self._lock:
+            candidatas = [
+                e for e in self._entradas.values() if not e.pendentes and e.usada_em <= limite
+            ]
+        for entrada in candidatas:
+            if not entrada.lock.acquire(blocking=False):
+                continue
+            try:
+                with self._lock:
+                    if not entrada.pendentes and entrada.valida:
+                        self._descartar(entrada)
+            finally:
+                entrada.lock.release()
+
+    @contextmanager
+    def exclusivo(self, db: Session, conta: Conta) -> Iterator[None]:
+        """Para rotas que alteram a conta na sessão de escrita ``db``.
+
+        Segura o lock da conta, aplica na sessão (com commit) os registros
+        pendentes dela e recarrega ``conta``; no fim o retrato em memória
+        passa a ser o que a rota gravou.
+        """
+        while True:
+            entrada = self._guardar(_copia(conta))
+            entrada.lock.acquire()
+            if entrada.valida:
+                break
+            entrada.lock.release()
+        try:
+            with self._lock:
+                meus = [r for _, r in self._pendentes.values() if r["conta_id"] == conta.id]
+            if meus:
+                aplicar(db, meus)
+                iniciar_escrita(db)
+                with self._lock:
+                    self._retirar(meus)
+                db.refresh(conta)
+                entrada.conta = _copia(conta)
+            yield
+            with self._lock:
+                if inspect(conta).was_deleted:
+                    self._descartar(entrada)
+                else:
+                    entrada.conta = _copia(conta)
+        finally:
+            entrada.lock.release()
+
+    @contextmanager
+    def pausa(self) -> Iterator[None]:
+        """Suspende as movimentações e esvazia o diário no SQLite.
+
+        Para quem muda saldos direto no banco (juros): no fim a memória é
+        descartada e as contas voltam a ser lidas do SQLite.
+        """
+        with self._portao:
+            while self._pausado:
+                self._portao.wait()
+            self._pausado = True
+            while self._em_curso:
+                self._portao.wait()
+        try:
+            self.diario.aguardar(self.diario.escritos)
+            self.descarregar()
+            yield
+        finally:
+            # Se a descarga falhou, as contas com registros pendentes ficam: o
+            # saldo delas no SQLite ainda não tem esses registros.
+            with self._lock:
+                for entrada in list(self._entradas.values()):
+                    if not entrada.pendentes:
+                        self._descartar(entrada)
+            with self._portao:
+                self._pausado = False
+                self._portao.notify_all()
+
+
+class RepositorioDiario(RepositorioContas):
+    """RepositorioSQL com depósitos e saques pelos saldos em memória.
+
+    As leituras vêm da sessão somente leitura com o saldo e a versão da
+    memória por cima; criar e desativar abrem a própria sessão de escrita.
+    """
+
+    def __init__(self, leitura: Session, saldos: SaldosEmMemoria):
+        self.sql = RepositorioSQL(leitura)
+        self.saldos = saldos
+
+    def obter(self, agencia: str, numero_conta: str) -> Optional[Conta]:
+        return self.saldos.retrato(agencia, numero_conta) or self.sql.obter(agencia, numero_conta)
+
+    def versao(self, agencia: str, numero_conta: str) -> Optional[str]:
+        conta = self.saldos.retrato(agencia, numero_conta)
+        return conta.versao if conta else self.sql.versao(agencia, numero_conta)
+
+    def colunas(self, agencia: str, numero_conta: str, nomes: list[str]) -> Optional[Mapping]:
+        conta = self.saldos.retrato(agencia, numero_conta)
+        if conta is None:
+            return self.sql.colunas(agencia, numero_conta, nomes)
+        return {n: getattr(conta, n) for n in nomes}
+
+    @contextmanager
+    def _escrita(self, agencia: str) -> Iterator[RepositorioSQL]:
+        db = abrir_sessao(shard_da_agencia(agencia))
+        try:
+            iniciar_escrita(db)
+            yield RepositorioSQL(db)
+        finally:
+            db.close()
+
+    def criar(self, conta: Conta) -> Conta:
+        with self._escrita(conta.agencia) as sql:
+            return sql.criar(conta)
+
+    def movimentar(
+        self, agencia: str, numero_conta: str, tipo: str, valor_centavos: int,
+        conferir: Optional[Conferencia] = None,
+    ) -> Optional[Conta]:
+        return self.saldos.movimentar(agencia, numero_conta, tipo, valor_centavos, conferir)
+
+    def pagina(
+        self, depois_de: int, limite: int, nomes: Optional[list[str]] = None
+    ) -> list:
+        pagina = []
+        for item in self.sql.pagina(depois_de, limite, nomes):
+            memoria = self.saldos.retrato_por_id(item.id if nomes is None else item["id"])
+            if memoria is None:
+                pagina.append(item)
+            elif nomes is None:
+                pagina.append(memoria)
+            else:
+                pagina.append({n: getattr(memoria, n) for n in item.keys()})
+        return pagina
+
+    def remover_se_zerada(self, agencia: str, numero_conta: str) -> Optional[bool]:
+        with self._escrita(agencia) as sql:
+            conta = sql.obter(agencia, numero_conta)
+            if conta is None:
+                return None
+            with self.saldos.exclusivo(sql.db, conta):
+                return sql.remover_se_zerada(agencia, numero_conta)
+
+
+saldos: Optional[SaldosEmMemoria] = None
+
+
+def exclusivo(db: Session, conta: Conta):
+    """saldos.exclusivo com a escrita adiada ligada; sem ela, nada a fazer."""
+    return saldos.exclusivo(db, conta) if saldos is not None else nullcontext()
+
+
+def pausa():
+    return saldos.pausa() if saldos is not None else nullcontext()
+
+
+async def _vaga_de_escrita(request: Request):
+    """Vaga no pool de escrita para quem abre sessão em _escrita().
+
+    Criar e desativar abrem a própria sessão de escrita: como em get_db, a
+    vaga é reservada no event loop, antes de a rota pedir a thread.
+    Depósitos e saques só escrevem no diário e não esperam por ela.
+    """
+    if request.url.path.startswith("/contas/operacoes/"):
+        yield
+        return
+    async for _ in reservar_conexao(request):
+        yield
+
+
+def usar_diario(app: FastAPI, novos: SaldosEmMemoria) -> SaldosEmMemoria:
+    """Liga os saldos em memória nas rotas de uma conta."""
+    global saldos
+    saldos = novos
+
+    # A vaga de escrita vem antes da de leitura, na mesma ordem para todas
+    # as rotas: ninguém segura uma esperando a outra em sentido contrário.
+    def repositorio_escrita(
+        _vaga: None = Depends(_vaga_de_escrita), db: Session = Depends(get_db_leitura)
+    ) -> RepositorioContas:
+        return RepositorioDiario(db, novos)
+
+    def repositorio(db: Session = Depends(get_db_leitura)) -> RepositorioContas:
+        return RepositorioDiario(db, novos)
+
+    def repositorios(sessoes: list[Session] = Depends(get_shards_leitura)) -> list:
+        return [RepositorioDiario(db, novos) for db in sessoes]
+
+    app.dependency_overrides[get_repositorio] = repositorio_escrita
+    app.dependency_overrides[get_repositorio_leitura] = repositorio
+    app.dependency_overrides[get_repositorios_leitura] = repositorios
+    return novos
+
+
+def desligar(app: FastAPI) -> None:
+    global saldos
+    for dependencia in (get_repositorio, get_repositorio_leitura, get_repositorios_leitura):
+        app.dependency_overrides.pop(dependencia, None)
+    saldos = None
@@ -0,0 +1,23 @@
+
+from decimal import ROUND_HALF_UP, Decimal
+
+# Valores monetários são gravados e calculados em centavos (int). A conversão
+# de/para reais (float) acontece só na borda da API: entrada dos schemas e
+# montagem das respostas.
+
+CENTAVO = Decimal("0.01")
+
+# Maior valor aceito na entrada, em reais; em centavos fica bem abaixo do
+# INTEGER de 64 bits do SQLite.
+VALOR_MAXIMO = 10**15
+SALDO_MAXIMO_CENTAVOS = 2**63 - 1
+
+
+def para_centavos(reais: float) -> int:
+    # str() devolve o menor decimal que representa o float (0.29, não
+    # 0.28999...), então 0.285 vira 29 centavos e não 28.
+    return int(Decimal(str(reais)).quantize(CENTAVO, rounding=ROUND_HALF_UP) * 100)
+
+
+def para_reais(centavos: int) -> float:
+    return centavos / 100
@@ -0,0 +1,157 @@
+
+"""Diretório de contas no shard 0, usado quando há mais de um shard.
+
+No shard 0 ele é escrito na mesma transação da rota; nos demais, numa
+transação própria no banco principal, confirmada antes da do shard e
+desfeita se a do shard falhar. Os locks são pegos sempre na ordem shard da
+conta -> banco principal, então duas rotas não esperam uma pela outra.
+
+O id da conta nova vem do diretório, então ele é gravado antes da conta.
+Um crash entre os dois commits deixa o diretório adiantado (entrada sem
+conta, ou o CPF novo de uma troca que não chegou ao shard); reconciliar(),
+chamado na subida do serviço, o acerta pelas contas.
+"""
+
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from sqlalchemy import delete, exists, select, update
+from sqlalchemy.orm import Session
+
+from . import db as db_mod
+from .db import abrir_sessao, iniciar_escrita, shard_da_agencia
+from .models import Conta, DiretorioConta
+
+
+@contextmanager
+def _no_principal(db: Session, agencia: str) -> Iterator[Session]:
+    if shard_da_agencia(agencia) == 0:
+        yield db
+        return
+    principal = abrir_sessao(0)
+    try:
+        iniciar_escrita(principal)
+        yield principal
+        principal.commit()
+    finally:
+        principal.close()
+
+
+def cpf_em_uso(cpf: str) -> bool:
+    if db_mod.SHARDS == 1:
+        return False
+    leitura = abrir_sessao(0, leitura=True)
+    try:
+        return leitura.scalar(select(exists().where(DiretorioConta.cpf == cpf)))
+    finally:
+        leitura.close()
+
+
+@contextmanager
+def reserva(db: Session, agencia: str, numero_conta: str, cpf: str) -> Iterator[Optional[int]]:
+    """Id reservado para a conta nova (None com um shard só: vale o do SQLite).
+
+    IntegrityError ao reservar indica CPF ou agência/número já usados.
+    """
+    if db_mod.SHARDS == 1:
+        yield None
+        return
+    with _no_principal(db, agencia) as principal:
+        entrada = DiretorioConta(agencia=agencia, numero_conta=numero_conta, cpf=cpf)
+        principal.add(entrada)
+        principal.flush()
+        conta_id = entrada.id
+    try:
+        yield conta_id
+    except BaseException:
+        if principal is not db:
+            with _no_principal(db, agencia) as principal:
+                principal.execute(delete(DiretorioConta).where(DiretorioConta.id == conta_id))
+        raise
+
+
+@contextmanager
+def troca_de_cpf(db: Session, conta: Conta, cpf_antigo: str) -> Iterator[None]:
+    """Leva o CPF novo da conta ao diretório; volta o antigo se a rota falhar."""
+    if db_mod.SHARDS == 1 or conta.cpf == cpf_antigo:
+        yield
+        return
+
+    def gravar(cpf: str) -> Session:
+        with _no_principal(db, conta.agencia) as principal:
+            principal.execute(
+                update(DiretorioConta).where(DiretorioConta.id == conta.id).values(cpf=cpf)
+            )
+        return principal
+
+    cpf_novo = conta.cpf
+    principal = gravar(cpf_novo)
+    try:
+        yield
+    except BaseException:
+        if principal is not db:
+            gravar(cpf_antigo)
+        raise
+
+
+@contextmanager
+def remocao(db: Session, conta: Conta) -> Iterator[None]:
+    """Tira a conta do diretório junto com a remoção no shard."""
+    if db_mod.SHARDS == 1:
+        yield
+        return
+    conta_id, agencia = conta.id, conta.agencia
+    if shard_da_agencia(agencia) == 0:
+        db.execute(delete(DiretorioConta).where(DiretorioConta.id == conta_id))
+        yield
+        return
+    yield
+    # Só depois do commit no shard: se esta etapa falhar, sobra uma entrada
+    # órfã, que reconciliar() limpa na próxima subida.
+    with _no_principal(db, agencia) as principal:
+        principal.execute(delete(DiretorioConta).where(DiretorioConta.id == conta_id))
+
+
+def reconciliar() -> int:
+    """Acerta o diretório pelas contas dos demais shards; quantas entradas mudaram.
+
+    Roda na subida do serviço, antes da primeira requisição. As entradas do
+    shard 0 são gravadas na transação da própria conta e não são conferidas.
+    """
+    if db_mod.SHARDS == 1:
+        return 0
+    principal = abrir_sessao(0)
+    try:
+        iniciar_escrita(principal)
+        por_shard = defaultdict(list)
+        for entrada in principal.execute(
+            select(DiretorioConta.id, DiretorioConta.agencia, DiretorioConta.cpf)
+        ):
+            indice = shard_da_agencia(entrada.agencia)
+            if indice != 0:
+                por_shard[indice].append(entrada)
+
+        acertos = 0
+        for indice, entradas in por_shard.items():
+            shard = abrir_sessao(indice, leitura=True)
+            try:
+                cpfs = dict(shard.execute(select(Conta.id, Conta.cpf)).all())
+            finally:
+                shard.close()
+            for entrada in entradas:
+                if entrada.id not in cpfs:
+                    principal.execute(delete(DiretorioConta).where(DiretorioConta.id == entrada.id))
+                elif cpfs[entrada.id] != entrada.cpf:
+                    principal.execute(
+                        update(DiretorioConta)
+                        .where(DiretorioConta.id == entrada.id)
+                        .values(cpf=cpfs[entrada.id])
+                    )
+                else:
+                    continue
+                acertos += 1
+        principal.commit()
+        return acertos
+    finally:
+        principal.close()
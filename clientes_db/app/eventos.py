@@ -0,0 +1,129 @@
+
+import asyncio
+import json
+import os
+import threading
+from itertools import count
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .dinheiro import para_reais
+from .models import Conta, agora_utc
+
+# Eventos pendentes por assinante. Quem enche o buffer é derrubado: o
+# escritor nunca espera por um consumidor lento.
+TAMANHO_BUFFER = int(os.getenv("CLIENTES_DB_EVENTOS_BUFFER", "256"))
+KEEPALIVE_S = 15.0
+
+
+class Assinatura:
+    def __init__(self, loop: asyncio.AbstractEventLoop, tamanho: int):
+        self.loop = loop
+        self.fila: asyncio.Queue = asyncio.Queue(tamanho)
+        self.derrubada = False
+
+    def entregar(self, quadro: str) -> None:
+        # Roda no loop do assinante (via call_soon_threadsafe).
+        if self.derrubada:
+            return
+        try:
+            self.fila.put_nowait(quadro)
+        except asyncio.QueueFull:
+            self.derrubada = True
+            while not self.fila.empty():
+                self.fila.get_nowait()
+            self.fila.put_nowait(None)
+
+
+class Hub:
+    """Difusão em processo dos eventos de conta para os streams SSE.
+
+    publicar() pode ser chamado de qualquer thread (as rotas síncronas rodam
+    no threadpool); cada assinatura recebe o quadro no seu event loop.
+    """
+
+    def __init__(self, tamanho_buffer: int = TAMANHO_BUFFER):
+        self.tamanho_buffer = tamanho_buffer
+        self._assinaturas: set[Assinatura] = set()
+        self._lock = threading.Lock()
+        self._ids = count(1)
+
+    def assinar(self) -> Assinatura:
+        assinatura = Assinatura(asyncio.get_running_loop(), self.tamanho_buffer)
+        with self._lock:
+            self._assinaturas.add(assinatura)
+        return assinatura
+
+    def cancelar(self, assinatura: Assinatura) -> None:
+        with self._lock:
+            self._assinaturas.discard(assinatura)
+
+    def publicar(self, evento: dict) -> None:
+        dados = json.dumps(evento, ensure_ascii=False)
+        # O lock garante a mesma ordem (e ids crescentes) para todos.
+        with self._lock:
+            quadro = f"id: {next(self._ids)}\nevent: {evento['tipo']}\ndata: {dados}\n\n"
+            for assinatura in list(self._assinaturas):
+                try:
+                    assinatura.loop.call_soon_threadsafe(assinatura.entregar, quadro)
+                except RuntimeError:
+                    # Loop encerrado: o stream já morreu.
+                    self._assinaturas.discard(assinatura)
+
+    async def stream(self, keepalive_s: float = KEEPALIVE_S):
+        assinatura = self.assinar()
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    quadro = await asyncio.wait_for(assinatura.fila.get(), keepalive_s)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if quadro is None:
+                    yield 'event: DERRUBADO\ndata: {"motivo": "buffer cheio"}\n\n'
+                    return
+                yield quadro
+        finally:
+            self.cancelar(assinatura)
+
+
+hub = Hub()
+
+
+def _evento(tipo: str, conta: Conta, valor_centavos: Optional[int]) -> dict:
+    evento = {
+        "tipo": tipo,
+        "agencia": conta.agencia,
+        "numero_conta": conta.numero_conta,
+        "saldo_cc": para_reais(conta.saldo_centavos),
+        "cheque_especial_contratado": conta.cheque_especial_contratado,
+        "limite_cheque_especial": para_reais(conta.limite_centavos),
+        "em": agora_utc().isoformat(),
+    }
+    if valor_centavos is not None:
+        evento["valor"] = para_reais(valor_centavos)
+    return evento
+
+
+def registrar(db: Session, tipo: str, conta: Conta, valor_centavos: Optional[int] = None) -> None:
+    """Guarda o evento na sessão; só é publicado se o commit der certo."""
+    db.info.setdefault("eventos", []).append(_evento(tipo, conta, valor_centavos))
+
+
+def publicar(tipo: str, conta: Conta, valor_centavos: Optional[int] = None) -> None:
+    """Publica na hora, para escritas que não passam por uma sessão."""
+    hub.publicar(_evento(tipo, conta, valor_centavos))
+
+
+@event.listens_for(Session, "after_commit")
+def _publicar_pendentes(session: Session) -> None:
+    for evento in session.info.pop("eventos", ()):
+        hub.publicar(evento)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _descartar_pendentes(session: Session, transaction) -> None:
+    session.info.pop("eventos", None)
@@ -0,0 +1,210 @@
+
+import argparse
+import sys
+import time
+from datetime import date
+
+from sqlalchemy import DateTime, Integer, String, and_, cast, func, insert, literal, select, update
+from sqlalchemy.orm import Session
+
+from . import db as db_mod
+from .db import SessionLocal, abrir_sessao, espalhar, iniciar_escrita
+from .models import (
+    NOVA_VERSAO_SQL,
+    Conta,
+    ExecucaoJuros,
+    Movimentacao,
+    agora_utc,
+    proxima_alteracao,
+)
+from .resumo import agregados_por_agencia, aplicar_delta
+
+
+class TaxaDivergente(ValueError):
+    pass
+
+
+def _devedoras(ultimo_id: int):
+    return and_(
+        Conta.id > ultimo_id,
+        Conta.saldo_centavos < 0,
+        Conta.cheque_especial_contratado.is_(True),
+    )
+
+
+def _aplicar_lote(db: Session, data_referencia: date, taxa: float, ultimo_id: int, tamanho_lote: int) -> int:
+    iniciar_escrita(db)
+    ids = db.scalars(
+        select(Conta.id)
+        .where(_devedoras(ultimo_id))
+        .order_by(Conta.id)
+        .limit(tamanho_lote)
+    ).all()
+
+    if not ids:
+        db.execute(
+            update(ExecucaoJuros)
+            .where(ExecucaoJuros.data_referencia == data_referencia)
+            .values(concluida=True)
+        )
+        db.commit()
+        return 0
+
+    # Avança o progresso antes de tudo e de forma condicional: garante o lock
+    # de escrita e impede que dois executores cobrem o mesmo lote.
+    avancou = db.execute(
+        update(ExecucaoJuros)
+        .where(
+            ExecucaoJuros.data_referencia == data_referencia,
+            ExecucaoJuros.ultimo_id == ultimo_id,
+        )
+        .values(
+            ultimo_id=ids[-1],
+            contas_processadas=ExecucaoJuros.contas_processadas + len(ids),
+        )
+    ).rowcount
+    if not avancou:
+        db.rollback()
+        return -1
+
+    filtro = and_(_devedoras(ultimo_id), Conta.id <= ids[-1])
+    # Arredonda para o centavo no próprio SQL; round() do SQLite devolve REAL.
+    juros = cast(func.round(-Conta.saldo_centavos * taxa), Integer)
+
+    db.execute(
+        insert(Movimentacao).from_select(
+            ["conta_id", "tipo", "valor_centavos", "saldo_apos_centavos", "criado_em"],
+            select(
+                Conta.id,
+                literal("JUROS", String),
+                -juros,
+                Conta.saldo_centavos - juros,
+                literal(agora_utc(), DateTime),
+            ).where(filtro, juros > 0),
+        )
+    )
+    antes = agregados_por_agencia(db, filtro, juros > 0)
+    db.execute(
+        update(Conta)
+        .where(filtro, juros > 0)
+        .values(
+            saldo_centavos=Conta.saldo_centavos - juros,
+            versao=NOVA_VERSAO_SQL,
+            alteracao=proxima_alteracao(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    for agencia, depois in agregados_por_agencia(db, filtro, juros > 0).items():
+        aplicar_delta(db, agencia, antes[agencia], depois)
+    db.commit()
+    return len(ids)
+
+
+def acumular_juros(
+    db: Session,
+    data_referencia: date,
+    taxa: float,
+    tamanho_lote: int = 500,
+    pausa_s: float = 0.0,
+) -> dict:
+    """Cobra juros sobre o saldo negativo das contas com cheque especial.
+
+    Cada lote é uma transação curta com UPDATE/INSERT em conjunto, então o
+    lock de escrita do SQLite é liberado entre lotes. Rodar de novo para a
+    mesma data continua do último lote gravado ou não faz nada se já concluiu.
+    """
+    iniciar_escrita(db)
+    execucao = db.get(ExecucaoJuros, data_referencia)
+    if execucao is None:
+        execucao = ExecucaoJuros(
+            data_referencia=data_referencia,
+            taxa=taxa,
+            ultimo_id=0,
+            contas_processadas=0,
+            concluida=False,
+        )
+        db.add(execucao)
+        db.commit()
+    elif execucao.taxa != taxa:
+        raise TaxaDivergente(
+            f"Juros de {data_referencia} já iniciados com taxa {execucao.taxa}"
+        )
+
+    lotes = 0
+    while not execucao.concluida:
+        processadas = _aplicar_lote(db, data_referencia, taxa, execucao.ultimo_id, tamanho_lote)
+        db.refresh(execucao)
+        if processadas > 0:
+            lotes += 1
+            if pausa_s:
+                time.sleep(pausa_s)
+
+    return {
+        "data_referencia": execucao.data_referencia,
+        "taxa": execucao.taxa,
+        "contas_processadas": execucao.contas_processadas,
+        "lotes": lotes,
+        "concluida": execucao.concluida,
+    }
+
+
+def acumular_juros_nos_shards(
+    db: Session,
+    data_referencia: date,
+    taxa: float,
+    tamanho_lote: int = 500,
+    pausa_s: float = 0.0,
+) -> dict:
+    """acumular_juros em todos os shards ao mesmo tempo, com os totais somados.
+
+    O shard 0 usa a sessão recebida; cada shard tem o próprio progresso em
+    execucoes_juros e o próprio lock de escrita.
+    """
+    def no_shard(indice: int) -> dict:
+        if indice == 0:
+            return acumular_juros(db, data_referencia, taxa, tamanho_lote, pausa_s)
+        outra = abrir_sessao(indice)
+        try:
+            return acumular_juros(outra, data_referencia, taxa, tamanho_lote, pausa_s)
+        finally:
+            outra.close()
+
+    resultados = espalhar(no_shard, range(db_mod.SHARDS))
+    return {
+        "data_referencia": data_referencia,
+        "taxa": taxa,
+        "contas_processadas": sum(r["contas_processadas"] for r in resultados),
+        "lotes": sum(r["lotes"] for r in resultados),
+        "concluida": all(r["concluida"] for r in resultados),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m clientes_db.app.juros",
+        description="Acumula juros do cheque especial para uma data de referência."
+    )
+    parser.add_argument("--taxa", type=float, required=True, help="Taxa diária, ex.: 0.0005")
+    parser.add_argument("--data", type=date.fromisoformat, default=date.today())
+    parser.add_argument("--lote", type=int, default=500)
+    parser.add_argument("--pausa", type=float, default=0.0, help="Pausa (s) entre lotes")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        resultado = acumular_juros_nos_shards(db, args.data, args.taxa, args.lote, args.pausa)
+    except TaxaDivergente as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+
+    print(
+        f"{resultado['data_referencia']}: {resultado['contas_processadas']} contas "
+        f"em {resultado['lotes']} lotes"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
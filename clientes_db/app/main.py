@@ -1,17 +1,59 @@
 ﻿
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
+from sqlalchemy.exc import OperationalError
+
+from .db import POOL_LEITURA, POOL_SIZE, banco_ocupado, engine, engines_extras
+from . import diario, diretorio, prazo, repositorio
+from .routers import contas, interno
+from .schema import preparar_schema, verificar_schema
+
 
-from .db import Base, engine
-from .routers import contas
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # O schema não é mais criado no import: só quando o serviço sobe.
+    # Com CLIENTES_DB_AUTO_MIGRAR=0 o serviço apenas confere a versão e
+    # a migração fica a cargo de `python -m clientes_db.app.schema`. Com o
+    # repositório em memória o SQLite não é usado.
+    binds = () if repositorio.BACKEND == "memoria" else (engine, *engines_extras())
+    for bind in binds:
+        if os.getenv("CLIENTES_DB_AUTO_MIGRAR", "1") == "1":
+            preparar_schema(bind)
+        else:
+            verificar_schema(bind)
+    # Com vários shards, o que um crash deixou adiantado no diretório
+    # (entradas sem conta, CPF de troca não confirmada) volta a bater.
+    if binds:
+        diretorio.reconciliar()
+    # As rotas síncronas rodam no limitador do banco (db.limitador_banco),
+    # com WORKERS threads; get_db reserva a vaga no pool antes da thread.
+    app.state.vagas_conexao = asyncio.Semaphore(POOL_SIZE)
+    app.state.vagas_leitura = asyncio.Semaphore(POOL_LEITURA)
+    # Escrita adiada: o diário que sobrou de um crash é reaplicado antes da
+    # primeira requisição, e o que estiver pendente vai para o banco ao sair.
+    saldos = None
+    if diario.ATIVO and repositorio.BACKEND != "memoria":
+        saldos = diario.SaldosEmMemoria(diario.Diario(diario.caminho_padrao()))
+        saldos.iniciar()
+        diario.usar_diario(app, saldos)
+    try:
+        yield
+    finally:
+        if saldos is not None:
+            diario.desligar(app)
+            saldos.parar()
 
-Base.metadata.create_all(bind=engine)
 
 app = FastAPI(
     title="PYTHER - contas_db",
     version="1.0.0",
-    description="Serviço interno de armazenamento (SQLite) para contas do banco PYTHER."
+    description="Serviço interno de armazenamento (SQLite) para contas do banco PYTHER.",
+    lifespan=lifespan
 )
 
 @app.exception_handler(RequestValidationError)
@@ -30,7 +72,11 @@ async def validation_exception_handler(request, exc: RequestValidationError):
     errors = []
     for err in exc.errors():
         field = err['loc'][-1]
-        msg = custom_messages.get(field, err['msg'])
+        # Acima do máximo ou infinito: a mensagem do pydantic diz o motivo.
+        if err['type'] in ("less_than_equal", "finite_number"):
+            msg = err['msg']
+        else:
+            msg = custom_messages.get(field, err['msg'])
         errors.append({"campo": field, "mensagem": msg})
 
     return JSONResponse(
@@ -45,4 +91,26 @@ async def validation_exception_handler(request, exc: RequestValidationError):
         }
     )
 
+@app.exception_handler(OperationalError)
+async def banco_ocupado_handler(request, exc: OperationalError):
+    # Lock de escrita não obtido nem depois das novas tentativas.
+    if not banco_ocupado(exc):
+        raise exc
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": "1"},
+        content={
+            "detail": {
+                "status": 503,
+                "code": "BANCO_OCUPADO",
+                "message": "Banco ocupado por outras escritas; tente novamente."
+            }
+        }
+    )
+
 app.include_router(contas.router)
+app.include_router(interno.router)
+app.add_middleware(prazo.Prazo)
+
+if repositorio.BACKEND == "memoria":
+    repositorio.usar_memoria(app)
@@ -0,0 +1,36 @@
+
+import threading
+
+
+class Medidor:
+    """Acumula amostras de espera (segundos) desde que o processo subiu."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.amostras = 0
+        self.total_s = 0.0
+        self.maximo_s = 0.0
+
+    def registrar(self, segundos: float) -> None:
+        with self._lock:
+            self.amostras += 1
+            self.total_s += segundos
+            self.maximo_s = max(self.maximo_s, segundos)
+
+    def resumo(self) -> dict:
+        with self._lock:
+            media = self.total_s / self.amostras if self.amostras else 0.0
+            return {
+                "amostras": self.amostras,
+                "media_ms": round(media * 1000, 3),
+                "max_ms": round(self.maximo_s * 1000, 3),
+            }
+
+
+# Espera por uma thread do limitador do banco (registrada em
+# db.em_thread_do_banco) e por uma vaga no pool de conexões.
+espera_fila = Medidor()
+espera_conexao = Medidor()
+
+# Requisições esperando vaga no pool (só alterado no event loop).
+aguardando_conexao = 0
@@ -1,7 +1,17 @@
 ﻿
-from sqlalchemy import Column, Integer, String, Boolean, Float, UniqueConstraint
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import (
+    Column, Integer, String, Boolean, Float, Date, DateTime, Index, UniqueConstraint,
+    case, event, func, insert, literal_column, select, text,
+)
 from .db import Base
 
+
+def agora_utc() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
 class Conta(Base):
     __tablename__ = "contas"
 
@@ -16,11 +26,178 @@ class Conta(Base):
     email = Column(String, nullable=False)
 
     correntista = Column(Boolean, nullable=False, default=True)
-    saldo_cc = Column(Float, nullable=False, default=0.0)
+    # Valores em centavos (ver dinheiro.py).
+    saldo_centavos = Column(Integer, nullable=False, default=0)
 
     cheque_especial_contratado = Column(Boolean, nullable=False, default=False)
-    limite_cheque_especial = Column(Float, nullable=False, default=0.0)
+    limite_centavos = Column(Integer, nullable=False, default=0)
+
+    # Controle de concorrência otimista: todo UPDATE/DELETE do ORM sai com
+    # "WHERE id = ? AND versao = ?" e grava um token novo. O token (e não um
+    # contador) serve direto de ETag sem colidir com uma conta recriada no
+    # mesmo agência/número.
+    versao = Column(String(32), nullable=False)
+
+    # Posição da última escrita na sequência de alterações (ver
+    # proxima_alteracao); é o que o feed /contas/alteracoes percorre.
+    alteracao = Column(Integer, nullable=False)
+
+    # Último registro do diário de escrita adiada já aplicado nesta conta
+    # (ver diario.py); a reaplicação depois de um crash pula os anteriores.
+    diario_seq = Column(Integer, nullable=False, default=0, server_default="0")
 
     __table_args__ = (
         UniqueConstraint("agencia", "numero_conta", name="uix_agencia_numero"),
+        Index("ix_contas_alteracao", "alteracao", "id"),
+        # Índice parcial: só contas no negativo entram, então o lote de juros
+        # percorre as devedoras sem varrer a tabela e o custo de escrita fica
+        # restrito a quem está no cheque especial.
+        Index("ix_contas_devedoras", "id", sqlite_where=text("saldo_centavos < 0")),
+    )
+
+    __mapper_args__ = {
+        "version_id_col": versao,
+        "version_id_generator": lambda _: uuid.uuid4().hex,
+    }
+
+
+
+# Versão nova gerada no SQL, para UPDATEs em massa que não passam pelo ORM.
+NOVA_VERSAO_SQL = func.lower(func.hex(func.randomblob(16)))
+
+
+class ContaRemovida(Base):
+    # Tombstone de conta desativada: mantém a chave pública e a posição na
+    # sequência de alterações para quem espelha a tabela contas.
+    __tablename__ = "contas_removidas"
+
+    id = Column(Integer, primary_key=True)
+
+    conta_id = Column(Integer, nullable=False)
+    agencia = Column(String, nullable=False)
+    numero_conta = Column(String, nullable=False)
+    alteracao = Column(Integer, nullable=False)
+    removida_em = Column(DateTime, nullable=False, default=agora_utc)
+
+    __table_args__ = (
+        Index("ix_contas_removidas_alteracao", "alteracao", "id"),
+    )
+
+
+class DiretorioConta(Base):
+    # Uma linha por conta, no shard 0, quando há mais de um shard: reserva o
+    # id (único entre os shards) e mantém CPF e agência/número únicos com as
+    # contas espalhadas por vários arquivos.
+    __tablename__ = "diretorio_contas"
+
+    id = Column(Integer, primary_key=True)
+
+    agencia = Column(String, nullable=False)
+    numero_conta = Column(String, nullable=False)
+    cpf = Column(String(15), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("agencia", "numero_conta", name="uix_diretorio_agencia_numero"),
+        UniqueConstraint("cpf", name="uix_diretorio_cpf"),
     )
+
+
+def proxima_alteracao():
+    """Próximo valor da sequência de alterações, calculado no próprio statement.
+
+    O SQLite serializa as escritas, então max + 1 lido dentro do INSERT/UPDATE
+    é monotônico: nenhuma transação confirma depois um valor menor que outro
+    já visível. Cada max é uma busca no fim do índice de alteração.
+    """
+    return select(func.max(
+        select(func.coalesce(func.max(Conta.alteracao), 0)).scalar_subquery(),
+        select(func.coalesce(func.max(ContaRemovida.alteracao), 0)).scalar_subquery(),
+    ) + 1).scalar_subquery()
+
+
+@event.listens_for(Conta, "before_insert")
+@event.listens_for(Conta, "before_update")
+def _marcar_alteracao(mapper, connection, conta):
+    conta.alteracao = proxima_alteracao()
+
+
+@event.listens_for(Conta, "before_delete")
+def _registrar_remocao(mapper, connection, conta):
+    # Antes do DELETE: com a linha ainda na tabela, o max + 1 passa da última
+    # alteração da própria conta, e quem já tem essa marca recebe a remoção.
+    connection.execute(insert(ContaRemovida).values(
+        conta_id=conta.id,
+        agencia=conta.agencia,
+        numero_conta=conta.numero_conta,
+        alteracao=proxima_alteracao(),
+        removida_em=agora_utc(),
+    ))
+
+
+# Índices da busca de contas (/contas/busca): e-mail exato e prefixo do nome,
+# ambos sem diferenciar maiúsculas. O CPF já tem índice único.
+Index("ix_contas_email_nocase", Conta.email.collate("NOCASE"))
+Index("ix_contas_nome_nocase", Conta.nome.collate("NOCASE"))
+
+
+# Score de crédito (10% do saldo positivo) como expressão indexada: o SQLite
+# mantém o índice no mesmo UPDATE que muda o saldo. Com o saldo em centavos o
+# score fica inteiro, em milésimos de real (score = valor / 1000). A constante
+# é literal_column para o SQL das consultas sair idêntico ao do índice, senão
+# o planner não reconhece a expressão.
+def score_credito_sql(saldo_centavos):
+    zero = literal_column("0")
+    return case((saldo_centavos < zero, zero), else_=saldo_centavos)
+
+
+SCORE_CREDITO = score_credito_sql(Conta.saldo_centavos)
+Index("ix_contas_score", SCORE_CREDITO, Conta.id)
+
+
+class Movimentacao(Base):
+    # Livro-razão append-only: uma linha por operação que altera a conta,
+    # gravada na mesma transação da alteração. Sem FK para contas, para que o
+    # histórico sobreviva à desativação da conta.
+    __tablename__ = "movimentacoes"
+
+    id = Column(Integer, primary_key=True)
+
+    conta_id = Column(Integer, nullable=False)
+    tipo = Column(String, nullable=False)
+    valor_centavos = Column(Integer, nullable=False)
+    saldo_apos_centavos = Column(Integer, nullable=False)
+    # Só em CHEQUE_ESPECIAL: o limite novo. O valor dessas linhas é 0, porque
+    # o saldo não muda, e a soma dos valores continua batendo com o saldo.
+    limite_centavos = Column(Integer, nullable=True)
+    criado_em = Column(DateTime, nullable=False, default=agora_utc)
+
+    # Extrato: busca por conta + intervalo de datas + keyset no mesmo índice.
+    __table_args__ = (
+        Index("ix_movimentacoes_conta_data_id", "conta_id", "criado_em", "id"),
+    )
+
+
+class ExecucaoJuros(Base):
+    # Progresso do lote de juros do cheque especial, um registro por data de
+    # referência: garante idempotência e permite retomar do último lote.
+    __tablename__ = "execucoes_juros"
+
+    data_referencia = Column(Date, primary_key=True)
+    taxa = Column(Float, nullable=False)
+    ultimo_id = Column(Integer, nullable=False, default=0)
+    contas_processadas = Column(Integer, nullable=False, default=0)
+    concluida = Column(Boolean, nullable=False, default=False)
+
+
+class ResumoAgencia(Base):
+    # Agregados por agência mantidos de forma incremental pelas rotas que
+    # alteram saldo/limite (ver resumo.py). Valores em centavos.
+    __tablename__ = "resumo_agencias"
+
+    agencia = Column(String, primary_key=True)
+
+    quantidade_contas = Column(Integer, nullable=False, default=0)
+    total_depositos = Column(Integer, nullable=False, default=0)
+    exposicao_negativa = Column(Integer, nullable=False, default=0)
+    cheque_especial_usado = Column(Integer, nullable=False, default=0)
+    cheque_especial_disponivel = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,87 @@
+"""Prazo da requisição, repassado pelo gateway.
+
+O gateway manda em X-Prazo-Ms quanto ainda espera pela resposta. Passado
+esse tempo ninguém mais vai ler o resultado, então o serviço para: o prazo
+é conferido antes de a rota abrir a sessão (depois da fila por conexão) e
+antes de cada statement enviado ao SQLite. Esgotado, a requisição termina
+com 504 PRAZO_ESGOTADO e a transação aberta é desfeita no fechamento da
+sessão. Sem o cabeçalho (chamadas diretas, threads de fundo) não há prazo.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+CABECALHO = b"x-prazo-ms"
+
+# Instante (time.monotonic) em que o prazo acaba. Definido no event loop; as
+# threads das rotas recebem o contexto copiado.
+_fim: ContextVar[Optional[float]] = ContextVar("prazo_fim", default=None)
+
+
+class PrazoEsgotado(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=504, detail={
+            "status": 504,
+            "code": "PRAZO_ESGOTADO",
+            "message": "O prazo da requisição acabou antes de o trabalho terminar.",
+        })
+
+
+def restante() -> Optional[float]:
+    fim = _fim.get()
+    return None if fim is None else fim - time.monotonic()
+
+
+def conferir() -> None:
+    r = restante()
+    if r is not None and r <= 0:
+        raise PrazoEsgotado()
+
+
+@contextmanager
+def suspenso() -> Iterator[None]:
+    """Sem prazo no bloco: trabalho feito em nome de outras requisições."""
+    token = _fim.set(None)
+    try:
+        yield
+    finally:
+        _fim.reset(token)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _entre_statements(conn, cursor, statement, parameters, context, executemany):
+    conferir()
+
+
+def _prazo_ms(scope) -> Optional[float]:
+    for nome, valor in scope.get("headers", ()):
+        if nome == CABECALHO:
+            try:
+                return float(valor)
+            except ValueError:
+                return None
+    return None
+
+
+class Prazo:
+    """Middleware ASGI que lê X-Prazo-Ms e marca o fim do prazo."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        ms = _prazo_ms(scope) if scope["type"] == "http" else None
+        if ms is None:
+            await self.app(scope, receive, send)
+            return
+        token = _fim.set(time.monotonic() + ms / 1000)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _fim.reset(token)
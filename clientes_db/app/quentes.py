@@ -0,0 +1,110 @@
+"""Contas quentes: depósitos e saques concorrentes numa mesma conta.
+
+Conta de lojista ou de folha recebe milhares de depósitos ao mesmo tempo,
+todos na mesma linha de contas. No SQLite dividir o saldo em várias linhas
+não ajudaria: o lock de escrita é do arquivo, não da linha, e cada commit
+custa um fsync. Para as contas listadas em CLIENTES_DB_CONTAS_QUENTES as
+operações que chegam juntas entram numa fila da conta e um líder grava o
+lote numa transação só: um UPDATE da conta, uma linha de extrato por
+operação e um delta de resumo, com um commit para todas.
+
+A conferência do saque roda operação a operação sobre o saldo corrente do
+lote, então saldo, limite_atual e cheque especial valem como se cada uma
+tivesse sido gravada sozinha. As operações de um lote respondem com a conta
+como ficou no commit (mesmo ETag).
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from . import prazo
+
+# "agencia/numero,agencia/numero"
+CONTAS_QUENTES = frozenset(
+    tuple(c.strip().split("/", 1))
+    for c in os.getenv("CLIENTES_DB_CONTAS_QUENTES", "").split(",")
+    if "/" in c
+)
+# Quanto o líder espera por mais operações antes de gravar o lote.
+JANELA_S = float(os.getenv("CLIENTES_DB_QUENTES_JANELA_MS", "1")) / 1000
+
+
+@dataclass(eq=False)
+class Operacao:
+    tipo: str
+    valor_centavos: int
+    conferir: Optional[Callable]
+    pronta: threading.Event = field(default_factory=threading.Event)
+    lider: bool = False
+    # Preenchidos por quem grava o lote.
+    resultado: Any = None
+    erro: Optional[BaseException] = None
+
+
+class Fila:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.operacoes: list[Operacao] = []
+        self.gravando = False
+
+
+_filas: dict[tuple[str, str], Fila] = {}
+_filas_lock = threading.Lock()
+
+
+def quente(agencia: str, numero_conta: str) -> bool:
+    return (agencia, numero_conta) in CONTAS_QUENTES
+
+
+def _fila(agencia: str, numero_conta: str) -> Fila:
+    with _filas_lock:
+        return _filas.setdefault((agencia, numero_conta), Fila())
+
+
+def combinar(
+    agencia: str, numero_conta: str, op: Operacao,
+    gravar_lote: Callable[[list[Operacao]], None],
+):
+    """Entra na fila da conta e devolve o resultado da operação.
+
+    Quem chega com a fila parada vira líder: espera JANELA_S, tira o lote
+    da fila e chama gravar_lote (a função de quem é líder, com a sessão
+    dele). Se chegou mais gente enquanto isso, a primeira vira a próxima
+    líder; as demais só esperam o próprio lote.
+    """
+    fila = _fila(agencia, numero_conta)
+    with fila.lock:
+        fila.operacoes.append(op)
+        op.lider = not fila.gravando
+        fila.gravando = True
+
+    if not op.lider:
+        op.pronta.wait()
+    if op.lider:
+        time.sleep(JANELA_S)
+        with fila.lock:
+            lote, fila.operacoes = fila.operacoes, []
+        try:
+            # O lote leva operações de outras requisições: o prazo do líder
+            # não vale para elas.
+            with prazo.suspenso():
+                gravar_lote(lote)
+        except Exception as e:
+            for outra in lote:
+                outra.erro = e
+        with fila.lock:
+            if fila.operacoes:
+                fila.operacoes[0].lider = True
+                fila.operacoes[0].pronta.set()
+            else:
+                fila.gravando = False
+        for outra in lote:
+            if outra is not op:
+                outra.pronta.set()
+
+    if op.erro is not None:
+        raise op.erro
+    return op.resultado
@@ -0,0 +1,381 @@
+
+"""Acesso às contas pelas rotas de uma conta, atrás de uma interface.
+
+RepositorioSQL (padrão) grava no SQLite com extrato, resumo, diretório e
+eventos, como sempre. Com CLIENTES_DB_REPOSITORIO=memoria as mesmas rotas
+usam RepositorioMemoria: dicts com índices por agência/número e CPF e um
+lock por conta, sem persistência. As rotas que dependem do SQL (extrato,
+resumo, busca, alteracoes, ranking, score, cheque especial, PUT e
+/interno) respondem 501 nesse modo.
+"""
+
+import os
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from bisect import bisect_right
+from contextlib import contextmanager
+from itertools import count
+from typing import Callable, Iterator, Mapping, Optional
+
+from fastapi import Depends, FastAPI, HTTPException
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import diretorio, eventos, quentes
+from .db import get_db, get_db_leitura, get_shards_leitura, iniciar_escrita
+from .models import Conta, Movimentacao
+from .resumo import ZERO, aplicar_delta, contribuicao
+
+BACKEND = os.getenv("CLIENTES_DB_REPOSITORIO", "sql")
+
+# Contas por página ao percorrer a tabela inteira (GET /contas).
+TAMANHO_PAGINA = 1000
+
+COLUNAS = [c.name for c in Conta.__table__.columns]
+
+# Recebe a conta e o saldo que ela teria; levanta para recusar.
+Conferencia = Callable[[Conta, int], None]
+
+
+class ChaveEmUso(Exception):
+    """Agência/número ou CPF já cadastrado; code diz qual (ou CONFLITO_UNICO)."""
+
+    def __init__(self, code: str):
+        super().__init__(code)
+        self.code = code
+
+
+def registrar_movimentacao(
+    db: Session, conta: Conta, tipo: str, valor_centavos: int,
+    limite_centavos: Optional[int] = None,
+) -> None:
+    # Só adiciona à sessão: o INSERT sai no flush do mesmo commit da conta,
+    # com o statement já compilado em cache.
+    db.add(Movimentacao(
+        conta_id=conta.id,
+        tipo=tipo,
+        valor_centavos=valor_centavos,
+        saldo_apos_centavos=conta.saldo_centavos,
+        limite_centavos=limite_centavos,
+    ))
+
+
+class RepositorioContas(ABC):
+    @abstractmethod
+    def obter(self, agencia: str, numero_conta: str) -> Optional[Conta]:
+        """A conta com agência/número, ou None se não existe."""
+
+    def versao(self, agencia: str, numero_conta: str) -> Optional[str]:
+        conta = self.obter(agencia, numero_conta)
+        return conta.versao if conta else None
+
+    def colunas(self, agencia: str, numero_conta: str, nomes: list[str]) -> Optional[Mapping]:
+        conta = self.obter(agencia, numero_conta)
+        return {n: getattr(conta, n) for n in nomes} if conta else None
+
+    @abstractmethod
+    def criar(self, conta: Conta) -> Conta:
+        """Grava a conta nova; ChaveEmUso se agência/número ou CPF já existem."""
+
+    @abstractmethod
+    def movimentar(
+        self, agencia: str, numero_conta: str, tipo: str, valor_centavos: int,
+        conferir: Optional[Conferencia] = None,
+    ) -> Optional[Conta]:
+        """Soma valor_centavos ao saldo se conferir não recusar; None se a conta não existe."""
+
+    @abstractmethod
+    def pagina(
+        self, depois_de: int, limite: int, nomes: Optional[list[str]] = None
+    ) -> list:
+        """Contas com id > depois_de em ordem de id (ou só as colunas nomes, com o id)."""
+
+    @abstractmethod
+    def remover_se_zerada(self, agencia: str, numero_conta: str) -> Optional[bool]:
+        """True se removeu, False se o saldo não é zero, None se a conta não existe."""
+
+    def todas(self, nomes: Optional[list[str]] = None) -> Iterator:
+        depois_de = 0
+        while True:
+            pagina = self.pagina(depois_de, TAMANHO_PAGINA, nomes)
+            yield from pagina
+            if len(pagina) < TAMANHO_PAGINA:
+                return
+            depois_de = pagina[-1]["id"] if nomes is not None else pagina[-1].id
+
+
+class RepositorioSQL(RepositorioContas):
+    def __init__(self, db: Session):
+        self.db = db
+
+    @staticmethod
+    def _chave(agencia: str, numero_conta: str) -> tuple:
+        return (Conta.agencia == agencia, Conta.numero_conta == numero_conta)
+
+    def obter(self, agencia: str, numero_conta: str) -> Optional[Conta]:
+        return self.db.query(Conta).filter(*self._chave(agencia, numero_conta)).first()
+
+    def versao(self, agencia: str, numero_conta: str) -> Optional[str]:
+        # Só a versão, pelo índice único: serve o 304 sem carregar a conta.
+        return self.db.scalar(select(Conta.versao).where(*self._chave(agencia, numero_conta)))
+
+    def colunas(self, agencia: str, numero_conta: str, nomes: list[str]) -> Optional[Mapping]:
+        linha = self.db.execute(
+            select(*(Conta.__table__.c[n] for n in nomes))
+            .where(*self._chave(agencia, numero_conta))
+        ).first()
+        return linha._mapping if linha else None
+
+    def criar(self, conta: Conta) -> Conta:
+        db = self.db
+        if db.query(Conta.id).filter(*self._chave(conta.agencia, conta.numero_conta)).first():
+            raise ChaveEmUso("CONTA_DUPLICADA")
+        if db.query(Conta.id).filter(Conta.cpf == conta.cpf).first() or diretorio.cpf_em_uso(conta.cpf):
+            raise ChaveEmUso("CPF_JA_CADASTRADO")
+
+        try:
+            with diretorio.reserva(db, conta.agencia, conta.numero_conta, conta.cpf) as conta_id:
+                conta.id = conta_id
+                db.add(conta)
+                if conta.saldo_centavos:
+                    db.flush()
+                    registrar_movimentacao(db, conta, "ABERTURA", conta.saldo_centavos)
+                aplicar_delta(db, conta.agencia, ZERO, contribuicao(conta))
+                db.commit()
+                db.refresh(conta)
+        except IntegrityError:
+            db.rollback()
+            raise ChaveEmUso("CONFLITO_UNICO")
+        return conta
+
+    def movimentar(
+        self, agencia: str, numero_conta: str, tipo: str, valor_centavos: int,
+        conferir: Optional[Conferencia] = None,
+    ) -> Optional[Conta]:
+        if quentes.quente(agencia, numero_conta):
+            # Sem transação aberta (ver get_db): só o líder do lote pega o
+            # lock de escrita.
+            return quentes.combinar(
+                agencia, numero_conta,
+                quentes.Operacao(tipo, valor_centavos, conferir),
+                lambda lote: self._gravar_lote(agencia, numero_conta, lote),
+            )
+
+        # A sessão de escrita já está em BEGIN IMMEDIATE: ler, conferir e
+        # gravar acontecem sob o lock de escrita do arquivo.
+        db = self.db
+        conta = self.obter(agencia, numero_conta)
+        if conta is None:
+            return None
+        novo_saldo = conta.saldo_centavos + valor_centavos
+        if conferir is not None:
+            conferir(conta, novo_saldo)
+
+        antes = contribuicao(conta)
+        conta.saldo_centavos = novo_saldo
+        registrar_movimentacao(db, conta, tipo, valor_centavos)
+        eventos.registrar(db, tipo, conta, valor_centavos)
+        aplicar_delta(db, conta.agencia, antes, contribuicao(conta))
+        db.commit()
+        db.refresh(conta)
+        return conta
+
+    def _gravar_lote(self, agencia: str, numero_conta: str, lote: list) -> None:
+        # Uma transação para o lote da conta quente; cada operação é
+        # conferida sobre o saldo deixado pelas anteriores.
+        db = self.db
+        iniciar_escrita(db)
+        conta = self.obter(agencia, numero_conta)
+        if conta is None:
+            db.rollback()
+            return
+
+        antes = contribuicao(conta)
+        gravadas = []
+        for op in lote:
+            novo_saldo = conta.saldo_centavos + op.valor_centavos
+            if op.conferir is not None:
+                try:
+                    op.conferir(conta, novo_saldo)
+                except HTTPException as e:
+                    op.erro = e
+                    continue
+            conta.saldo_centavos = novo_saldo
+            registrar_movimentacao(db, conta, op.tipo, op.valor_centavos)
+            eventos.registrar(db, op.tipo, conta, op.valor_centavos)
+            gravadas.append(op)
+        if not gravadas:
+            db.rollback()
+            return
+
+        aplicar_delta(db, conta.agencia, antes, contribuicao(conta))
+        db.commit()
+        db.refresh(conta)
+        for op in gravadas:
+            op.resultado = _copia(conta)
+
+    def pagina(
+        self, depois_de: int, limite: int, nomes: Optional[list[str]] = None
+    ) -> list:
+        if nomes is None:
+            return self.db.scalars(
+                select(Conta).where(Conta.id > depois_de).order_by(Conta.id).limit(limite)
+            ).all()
+        colunas = [Conta.__table__.c[n] for n in dict.fromkeys(["id", *nomes])]
+        return self.db.execute(
+            select(*colunas).where(Conta.id > depois_de).order_by(Conta.id).limit(limite)
+        ).mappings().all()
+
+    def remover_se_zerada(self, agencia: str, numero_conta: str) -> Optional[bool]:
+        db = self.db
+        conta = self.obter(agencia, numero_conta)
+        if conta is None:
+            return None
+        if conta.saldo_centavos != 0:
+            return False
+
+        aplicar_delta(db, conta.agencia, contribuicao(conta), ZERO)
+        eventos.registrar(db, "DESATIVACAO", conta)
+        with diretorio.remocao(db, conta):
+            db.delete(conta)
+            db.commit()
+        return True
+
+
+def _copia(conta: Conta) -> Conta:
+    # Quem chama recebe um retrato: a conta guardada só muda sob o lock dela.
+    return Conta(**{n: getattr(conta, n) for n in COLUNAS})
+
+
+class RepositorioMemoria(RepositorioContas):
+    def __init__(self):
+        self._contas: dict[tuple[str, str], Conta] = {}
+        self._por_cpf: dict[str, tuple[str, str]] = {}
+        self._por_id: dict[int, tuple[str, str]] = {}
+        self._ids: list[int] = []
+        self._travas: dict[tuple[str, str], threading.Lock] = {}
+        # Protege os índices e o conjunto de locks; a ordem é sempre lock da
+        # conta -> este.
+        self._indices = threading.Lock()
+        self._proximo_id = count(1)
+        self._alteracoes = count(1)
+
+    @contextmanager
+    def _travada(self, chave: tuple[str, str]) -> Iterator[Optional[Conta]]:
+        # Só contas existentes têm lock; quem esperava por uma conta removida
+        # (ou removida e recriada) enquanto isso não a encontra mais.
+        trava = self._travas.get(chave)
+        if trava is None:
+            yield None
+            return
+        with trava:
+            yield self._contas.get(chave) if self._travas.get(chave) is trava else None
+
+    def _gravada(self, conta: Conta) -> None:
+        conta.versao = uuid.uuid4().hex
+        conta.alteracao = next(self._alteracoes)
+
+    def obter(self, agencia: str, numero_conta: str) -> Optional[Conta]:
+        with self._travada((agencia, numero_conta)) as conta:
+            return _copia(conta) if conta else None
+
+    def criar(self, conta: Conta) -> Conta:
+        chave = (conta.agencia, conta.numero_conta)
+        conta = _copia(conta)
+        conta.correntista = True if conta.correntista is None else conta.correntista
+        conta.saldo_centavos = conta.saldo_centavos or 0
+        conta.cheque_especial_contratado = bool(conta.cheque_especial_contratado)
+        conta.limite_centavos = conta.limite_centavos or 0
+        with self._indices:
+            if chave in self._contas:
+                raise ChaveEmUso("CONTA_DUPLICADA")
+            if conta.cpf in self._por_cpf:
+                raise ChaveEmUso("CPF_JA_CADASTRADO")
+            conta.id = next(self._proximo_id)
+            self._gravada(conta)
+            self._contas[chave] = conta
+            self._travas[chave] = threading.Lock()
+            self._por_cpf[conta.cpf] = chave
+            self._por_id[conta.id] = chave
+            self._ids.append(conta.id)
+            return _copia(conta)
+
+    def movimentar(
+        self, agencia: str, numero_conta: str, tipo: str, valor_centavos: int,
+        conferir: Optional[Conferencia] = None,
+    ) -> Optional[Conta]:
+        with self._travada((agencia, numero_conta)) as conta:
+            if conta is None:
+                return None
+            novo_saldo = conta.saldo_centavos + valor_centavos
+            if conferir is not None:
+                conferir(_copia(conta), novo_saldo)
+            conta.saldo_centavos = novo_saldo
+            self._gravada(conta)
+            retrato = _copia(conta)
+        eventos.publicar(tipo, retrato, valor_centavos)
+        return retrato
+
+    def pagina(
+        self, depois_de: int, limite: int, nomes: Optional[list[str]] = None
+    ) -> list:
+        with self._indices:
+            inicio = bisect_right(self._ids, depois_de)
+            contas = [self._contas[self._por_id[i]] for i in self._ids[inicio:inicio + limite]]
+            if nomes is None:
+                return [_copia(c) for c in contas]
+            return [{n: getattr(c, n) for n in ["id", *nomes]} for c in contas]
+
+    def remover_se_zerada(self, agencia: str, numero_conta: str) -> Optional[bool]:
+        chave = (agencia, numero_conta)
+        with self._travada(chave) as conta:
+            if conta is None:
+                return None
+            if conta.saldo_centavos != 0:
+                return False
+            with self._indices:
+                del self._contas[chave]
+                del self._por_cpf[conta.cpf]
+                del self._por_id[conta.id]
+                self._ids.pop(bisect_right(self._ids, conta.id) - 1)
+                del self._travas[chave]
+        eventos.publicar("DESATIVACAO", conta)
+        return True
+
+
+def get_repositorio(db: Session = Depends(get_db)) -> RepositorioContas:
+    return RepositorioSQL(db)
+
+
+def get_repositorio_leitura(db: Session = Depends(get_db_leitura)) -> RepositorioContas:
+    return RepositorioSQL(db)
+
+
+def get_repositorios_leitura(
+    sessoes: list[Session] = Depends(get_shards_leitura),
+) -> list[RepositorioContas]:
+    return [RepositorioSQL(db) for db in sessoes]
+
+
+def _sem_suporte():
+    raise HTTPException(
+        status_code=501,
+        detail={
+            "status": 501,
+            "code": "REPOSITORIO_SEM_SUPORTE",
+            "message": "Rota indisponível com CLIENTES_DB_REPOSITORIO=memoria"
+        }
+    )
+
+
+def usar_memoria(app: FastAPI, repositorio: Optional[RepositorioMemoria] = None) -> RepositorioMemoria:
+    """Troca o repositório das rotas pelo em memória; as que pedem sessão SQL dão 501."""
+    repositorio = repositorio or RepositorioMemoria()
+    app.dependency_overrides[get_repositorio] = lambda: repositorio
+    app.dependency_overrides[get_repositorio_leitura] = lambda: repositorio
+    app.dependency_overrides[get_repositorios_leitura] = lambda: [repositorio]
+    for dependencia in (get_db, get_db_leitura, get_shards_leitura):
+        app.dependency_overrides[dependencia] = _sem_suporte
+    return repositorio
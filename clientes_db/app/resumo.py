@@ -0,0 +1,165 @@
+
+import argparse
+import sys
+
+from sqlalchemy import case, delete, func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from . import db as db_mod
+from .db import SessionLocal, abrir_sessao, iniciar_escrita
+from .dinheiro import para_reais
+from .models import Conta, ResumoAgencia
+
+CAMPOS = (
+    "quantidade_contas",
+    "total_depositos",
+    "exposicao_negativa",
+    "cheque_especial_usado",
+    "cheque_especial_disponivel",
+)
+
+ZERO = (0, 0, 0, 0, 0)
+
+
+def contribuicao(conta: Conta) -> tuple:
+    """Quanto uma conta soma em cada agregado da sua agência (em centavos)."""
+    saldo = conta.saldo_centavos or 0
+    limite = conta.limite_centavos or 0
+    negativo = -saldo if saldo < 0 else 0
+
+    if conta.cheque_especial_contratado:
+        usado = negativo
+        disponivel = max(0, limite - negativo)
+    else:
+        usado = 0
+        disponivel = 0
+
+    return (1, max(saldo, 0), negativo, usado, disponivel)
+
+
+def aplicar_delta(db: Session, agencia: str, antes: tuple, depois: tuple) -> None:
+    delta = {campo: d - a for campo, a, d in zip(CAMPOS, antes, depois)}
+    if not any(delta.values()):
+        return
+
+    stmt = sqlite_insert(ResumoAgencia).values(agencia=agencia, **delta)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ResumoAgencia.agencia],
+        set_={c: ResumoAgencia.__table__.c[c] + stmt.excluded[c] for c in CAMPOS},
+    )
+    db.execute(stmt)
+
+
+def _colunas_sql() -> tuple:
+    saldo = Conta.saldo_centavos
+    negativo = case((saldo < 0, -saldo), else_=0)
+    contratado = Conta.cheque_especial_contratado.is_(True)
+    return (
+        func.count(Conta.id),
+        func.sum(case((saldo > 0, saldo), else_=0)),
+        func.sum(negativo),
+        func.sum(case((contratado, negativo), else_=0)),
+        func.sum(case(
+            (contratado, func.max(0, Conta.limite_centavos - negativo)),
+            else_=0,
+        )),
+    )
+
+
+def _select_agregados(*filtros):
+    return (
+        select(Conta.agencia, *_colunas_sql())
+        .where(*filtros)
+        .group_by(Conta.agencia)
+    )
+
+
+def agregados_por_agencia(db: Session, *filtros) -> dict:
+    linhas = db.execute(_select_agregados(*filtros)).all()
+    return {linha[0]: tuple(linha[1:]) for linha in linhas}
+
+
+def insert_recalculado():
+    """INSERT ... SELECT que reconstrói resumo_agencias a partir de contas."""
+    return insert(ResumoAgencia).from_select(["agencia", *CAMPOS], _select_agregados())
+
+
+def listar_resumo(db: Session) -> list[dict]:
+    linhas = (
+        db.query(ResumoAgencia)
+        .filter(ResumoAgencia.quantidade_contas > 0)
+        .order_by(ResumoAgencia.agencia)
+        .all()
+    )
+    return [
+        {
+            "agencia": r.agencia,
+            "quantidade_contas": r.quantidade_contas,
+            **{c: para_reais(getattr(r, c)) for c in CAMPOS[1:]},
+        }
+        for r in linhas
+    ]
+
+
+def recalcular_resumo(db: Session, aplicar: bool = True) -> dict:
+    """Recalcula os agregados a partir de `contas` e compara com a tabela.
+
+    Serve para verificar a manutenção incremental; com aplicar=True a tabela
+    é reconstruída com os valores recalculados.
+    """
+    if aplicar:
+        iniciar_escrita(db)
+    esperado = agregados_por_agencia(db)
+    atual = {
+        r.agencia: tuple(getattr(r, c) for c in CAMPOS)
+        for r in db.query(ResumoAgencia).all()
+    }
+
+    divergencias = []
+    for agencia in sorted(set(esperado) | set(atual)):
+        e = esperado.get(agencia, ZERO)
+        a = atual.get(agencia, ZERO)
+        if e != a:
+            divergencias.append({"agencia": agencia, "esperado": e, "atual": a})
+
+    if aplicar:
+        db.execute(delete(ResumoAgencia))
+        db.execute(insert_recalculado())
+        db.commit()
+
+    return {"agencias": len(esperado), "divergencias": divergencias}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m clientes_db.app.resumo",
+        description="Recalcula o resumo por agência a partir da tabela contas."
+    )
+    parser.add_argument(
+        "--verificar",
+        action="store_true",
+        help="Só compara com os agregados gravados, sem reescrever."
+    )
+    args = parser.parse_args(argv)
+
+    # Cada agência está num shard só: os resultados dos shards se somam.
+    agencias, divergencias = 0, []
+    for indice in range(db_mod.SHARDS):
+        db = SessionLocal() if indice == 0 else abrir_sessao(indice)
+        try:
+            resultado = recalcular_resumo(db, aplicar=not args.verificar)
+        finally:
+            db.close()
+        agencias += resultado["agencias"]
+        divergencias += resultado["divergencias"]
+
+    for d in divergencias:
+        print(f"agência {d['agencia']}: esperado {d['esperado']}, gravado {d['atual']}")
+    print(f"{agencias} agências, {len(divergencias)} divergências")
+
+    return 1 if args.verificar and divergencias else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
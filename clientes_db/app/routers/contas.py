@@ -1,20 +1,70 @@
 ﻿
-from fastapi import APIRouter, Depends, HTTPException, status
+import base64
+import heapq
+import json
+from datetime import datetime, timezone
+from itertools import chain, islice
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy import String, and_, column, func, select, tuple_, values
 from sqlalchemy.exc import IntegrityError
 
-from ..db import get_db
-from ..models import Conta
+from .. import diario, diretorio, eventos
+from ..db import (
+    RotaDoBanco, espalhar, get_db, get_db_leitura, get_shards_leitura, shard_da_agencia,
+)
+from ..dinheiro import SALDO_MAXIMO_CENTAVOS, para_centavos, para_reais
+from ..models import SCORE_CREDITO, Conta, ContaRemovida, Movimentacao, score_credito_sql
+from ..repositorio import (
+    ChaveEmUso,
+    RepositorioContas,
+    get_repositorio,
+    get_repositorio_leitura,
+    get_repositorios_leitura,
+    registrar_movimentacao,
+)
+from ..resumo import aplicar_delta, contribuicao, listar_resumo
 from ..schemas import (
     ContaCreate,
     ContaUpdate,
     ContaOut,
     OperacaoPorChaves,
     ChequeEspecialCadastro,
+    ExtratoOut,
+    ResumoAgenciaOut,
+    ContaPaginaOut,
+    ConsultaLoteIn,
+    ConsultaLoteOut,
+    ScoreCreditoOut,
+    RankingScoreOut,
+    AlteracoesOut,
 )
 
-router = APIRouter(prefix="/contas", tags=["contas"])
+# Rotas síncronas no limitador de threads do banco (ver db.RotaDoBanco).
+router = APIRouter(prefix="/contas", tags=["contas"], route_class=RotaDoBanco)
+
+# Chaves por SELECT na consulta em lote (2 parâmetros por chave; fica abaixo
+# do limite de 999 variáveis de SQLites antigos).
+TAMANHO_LOTE_CHAVES = 450
+
+# Colunas de que cada campo depende quando o nome difere do campo da API
+# (valores em centavos e campos calculados; usado no ?fields=).
+DEPENDENCIAS_CAMPOS = {
+    "saldo_cc": ("saldo_centavos",),
+    "limite_cheque_especial": ("limite_centavos",),
+    "limite_atual": ("saldo_centavos", "cheque_especial_contratado", "limite_centavos"),
+    "score_credito": ("saldo_centavos",),
+}
+
+MENSAGENS_CHAVE_EM_USO = {
+    "CONTA_DUPLICADA": "Conta já existe para essa agência e número",
+    "CPF_JA_CADASTRADO": "Já existe uma conta cadastrada para este CPF.",
+    "CONFLITO_UNICO": "Agência/número ou CPF já cadastrado.",
+}
 
 
 def _err(status_code: int, code: str, message: str) -> HTTPException:
@@ -42,15 +92,181 @@ def _get_by_agencia_numero_or_404(db: Session, agencia: str, numero_conta: str)
     return conta
 
 
-def _to_out(c: Conta) -> dict:
+def _etag(conta: Conta) -> str:
+    return f'"{conta.versao}"'
 
-    if c.cheque_especial_contratado and c.saldo_cc < 0:
-        limite_atual = max(0.0, c.limite_cheque_especial + c.saldo_cc)
-    else:
-        limite_atual = c.limite_cheque_especial
+
+def _com_etag(response: Optional[Response], conta: Conta) -> None:
+    if response is not None:
+        response.headers["ETag"] = _etag(conta)
+        # Marca da escrita: um GET com X-Min-Alteracao >= este valor a enxerga.
+        response.headers["X-Alteracao"] = str(conta.alteracao)
+
+
+def _conferir_if_match(conta: Conta, if_match: Optional[str]) -> None:
+    # Comparação forte (RFC 9110): ETags fracas nunca casam com If-Match.
+    if if_match is None or if_match.strip() == "*":
+        return
+    if _etag(conta) not in (t.strip() for t in if_match.split(",")):
+        raise _erro_versao()
+
+
+def _etag_confere(etag: str, if_none_match: str) -> bool:
+    # If-None-Match usa comparação fraca: W/"x" casa com "x".
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (t.strip().removeprefix("W/") for t in if_none_match.split(","))
+
+
+def _erro_versao() -> HTTPException:
+    return _err(
+        412,
+        "VERSAO_DIVERGENTE",
+        "A conta foi alterada por outra operação; busque a versão atual e tente de novo"
+    )
+
+
+def _commit_versionado(db: Session) -> None:
+    # O UPDATE com "AND versao = ?" não afetou linha: alguém gravou antes.
+    try:
+        db.commit()
+    except StaleDataError:
+        db.rollback()
+        raise _erro_versao()
+
+
+def _utc_naive(dt: Optional[datetime]) -> Optional[datetime]:
+    if dt is None or dt.tzinfo is None:
+        return dt
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _saldo_antes(db: Session, conta_id: int, desde: Optional[datetime]) -> int:
+    # Cada movimentação guarda o saldo após a operação, então o saldo de
+    # abertura é uma única busca no índice (conta_id, criado_em, id).
+    if desde is None:
+        return 0
+    anterior = (
+        db.query(Movimentacao.saldo_apos_centavos)
+        .filter(Movimentacao.conta_id == conta_id, Movimentacao.criado_em < desde)
+        .order_by(Movimentacao.criado_em.desc(), Movimentacao.id.desc())
+        .first()
+    )
+    return anterior.saldo_apos_centavos if anterior else 0
+
+
+def _codificar_cursor(*valores) -> str:
+    return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode()
+
+
+def _decodificar_cursor(cursor: str, tamanho: int) -> list:
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        valores = None
+    if not isinstance(valores, list) or len(valores) != tamanho:
+        raise _err(422, "CURSOR_INVALIDO", "Cursor de paginação inválido")
+    return valores
+
+
+def _nocase(texto: str) -> str:
+    # Mesma dobra da collation NOCASE do SQLite: só letras ASCII.
+    return "".join(ch.lower() if ch.isascii() else ch for ch in texto)
+
+
+def _faixa_prefixo(prefixo: str) -> tuple[str, str]:
+    # Normalizando como o NOCASE, o limite superior da faixa continua correto
+    # (ex.: "Z" vira "z", cujo sucessor é "{").
+    inicio = _nocase(prefixo)
+    return inicio, inicio[:-1] + chr(ord(inicio[-1]) + 1)
+
+
+def _buscar_por_chaves(db: Session, chaves: list[tuple[str, str]]) -> list[Conta]:
+    # JOIN com uma CTE de VALUES: cada chave vira uma busca no índice único
+    # (agencia, numero_conta). Um IN de tuplas faria o SQLite varrer a tabela.
+    encontradas = []
+    for i in range(0, len(chaves), TAMANHO_LOTE_CHAVES):
+        lote = (
+            values(column("agencia", String), column("numero_conta", String), name="chaves")
+            .data(chaves[i:i + TAMANHO_LOTE_CHAVES])
+            .cte()
+        )
+        encontradas.extend(db.scalars(
+            select(Conta)
+            .select_from(lote)
+            .join(Conta, and_(
+                Conta.agencia == lote.c.agencia,
+                Conta.numero_conta == lote.c.numero_conta,
+            ))
+        ))
+    return encontradas
+
+
+def _limite_atual(saldo: int, contratado: bool, limite: int) -> int:
+    if contratado and saldo < 0:
+        return max(0, limite + saldo)
+    return limite
+
+
+def _score_credito(score_milesimos: int) -> float:
+    return score_milesimos / 1000
+
+
+def _score_da_conta(saldo: int) -> float:
+    # Mesma regra de models.SCORE_CREDITO, para a conta já carregada.
+    return _score_credito(max(saldo, 0))
+
+
+def _valor_operacao(valor: float) -> int:
+    centavos = para_centavos(valor)
+    if centavos <= 0:
+        raise _err(422, "VALOR_INVALIDO", "Valor deve ser de pelo menos R$ 0,01")
+    return centavos
+
+
+def _campos_pedidos(fields: Optional[str]) -> Optional[list[str]]:
+    if fields is None:
+        return None
+    campos = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    invalidos = [f for f in campos if f not in ContaOut.model_fields]
+    if not campos or invalidos:
+        raise _err(
+            422,
+            "CAMPOS_INVALIDOS",
+            "Campos inválidos em fields: " + (", ".join(invalidos) or "(vazio)")
+        )
+    return campos
+
+
+def _colunas_campos(campos: list[str]) -> list[str]:
+    # Só as colunas necessárias: nada de entidade ORM nem ContaOut.
+    colunas = []
+    for campo in campos:
+        for nome in DEPENDENCIAS_CAMPOS.get(campo, (campo,)):
+            if nome not in colunas:
+                colunas.append(nome)
+    return colunas
+
+
+def _linha_campos(m, campos: list[str]) -> dict:
+    out = {}
+    for campo in campos:
+        if campo == "limite_atual":
+            out[campo] = para_reais(_limite_atual(
+                m["saldo_centavos"], m["cheque_especial_contratado"], m["limite_centavos"]
+            ))
+        elif campo == "score_credito":
+            out[campo] = _score_da_conta(m["saldo_centavos"])
+        elif campo in ("saldo_cc", "limite_cheque_especial"):
+            out[campo] = para_reais(m[DEPENDENCIAS_CAMPOS[campo][0]])
+        else:
+            out[campo] = m[campo]
+    return out
 
 
-    score = 0.0 if c.saldo_cc < 0 else round(c.saldo_cc * 0.1, 4)
+def _to_out(c: Conta) -> dict:
+
+    limite_atual = _limite_atual(c.saldo_centavos, c.cheque_especial_contratado, c.limite_centavos)
 
     return {
         "id": c.id,
@@ -61,11 +277,13 @@ def _to_out(c: Conta) -> dict:
         "telefone": c.telefone,
         "email": c.email,
         "correntista": c.correntista,
-        "saldo_cc": float(c.saldo_cc),
+        "saldo_cc": para_reais(c.saldo_centavos),
         "cheque_especial_contratado": bool(c.cheque_especial_contratado),
-        "limite_cheque_especial": float(c.limite_cheque_especial),
-        "limite_atual": float(limite_atual),
-        "score_credito": float(score),
+        "limite_cheque_especial": para_reais(c.limite_centavos),
+        "limite_atual": para_reais(limite_atual),
+        "score_credito": _score_da_conta(c.saldo_centavos),
+        "versao": c.versao,
+        "alteracao": c.alteracao,
     }
 
 
@@ -75,8 +293,12 @@ def _to_out(c: Conta) -> dict:
     status_code=status.HTTP_201_CREATED,
     summary="Criar conta"
 )
-def criar_conta(body: ContaCreate, db: Session = Depends(get_db)):
-    saldo_inicial = body.saldo_cc or 0.0
+def criar_conta(
+    body: ContaCreate,
+    repo: RepositorioContas = Depends(get_repositorio),
+    response: Response = None
+):
+    saldo_inicial = para_centavos(body.saldo_cc or 0.0)
 
 
     if saldo_inicial < 0:
@@ -92,19 +314,6 @@ def criar_conta(body: ContaCreate, db: Session = Depends(get_db)):
             raise _err(422, "LIMITE_CHEQUE_ESPECIAL_INVALIDO", "Limite deve ser >= 0 ao habilitar cheque especial")
 
 
-    existente_ag_num = (
-        db.query(Conta)
-        .filter(and_(Conta.agencia == body.agencia, Conta.numero_conta == body.numero_conta))
-        .first()
-    )
-    if existente_ag_num:
-        raise _err(409, "CONTA_DUPLICADA", "Conta já existe para essa agência e número")
-
-
-    existente_cpf = db.query(Conta).filter(Conta.cpf == body.cpf).first()
-    if existente_cpf:
-        raise _err(409, "CPF_JA_CADASTRADO", "Já existe uma conta cadastrada para este CPF.")
-
     conta = Conta(
         agencia=body.agencia,
         numero_conta=body.numero_conta,
@@ -113,19 +322,17 @@ def criar_conta(body: ContaCreate, db: Session = Depends(get_db)):
         telefone=body.telefone,
         email=body.email,
         correntista=body.correntista,
-        saldo_cc=saldo_inicial,
+        saldo_centavos=saldo_inicial,
         cheque_especial_contratado=body.cheque_especial_contratado,
-        limite_cheque_especial=body.limite_cheque_especial or 0.0,
+        limite_centavos=para_centavos(body.limite_cheque_especial or 0.0),
     )
 
     try:
-        db.add(conta)
-        db.commit()
-        db.refresh(conta)
-    except IntegrityError:
-        db.rollback()
-        raise _err(409, "CONFLITO_UNICO", "Agência/número ou CPF já cadastrado.")
+        conta = repo.criar(conta)
+    except ChaveEmUso as e:
+        raise _err(409, e.code, MENSAGENS_CHAVE_EM_USO[e.code])
 
+    _com_etag(response, conta)
     return _to_out(conta)
 
 
@@ -134,18 +341,253 @@ def criar_conta(body: ContaCreate, db: Session = Depends(get_db)):
     response_model=list[ContaOut],
     summary="Listar todas as contas"
 )
-def listar_contas(db: Session = Depends(get_db)):
-    contas = db.query(Conta).all()
+def listar_contas(
+    fields: Optional[str] = Query(None, description="Campos separados por vírgula"),
+    repos: list[RepositorioContas] = Depends(get_repositorios_leitura)
+):
+    campos = _campos_pedidos(fields)
+    if campos is not None:
+        colunas = _colunas_campos(campos)
+        linhas = chain.from_iterable(espalhar(lambda r: list(r.todas(colunas)), repos))
+        return JSONResponse([_linha_campos(linha, campos) for linha in linhas])
+
+    contas = chain.from_iterable(espalhar(lambda r: list(r.todas()), repos))
     return [_to_out(c) for c in contas]
 
 
+@router.post(
+    "/consulta-lote",
+    response_model=ConsultaLoteOut,
+    summary="Consultar várias contas por agência/número"
+)
+def consultar_lote(body: ConsultaLoteIn, sessoes: list[Session] = Depends(get_shards_leitura)):
+    chaves = list(dict.fromkeys((c.agencia, c.numero_conta) for c in body.chaves))
+    por_shard = [[] for _ in sessoes]
+    for chave in chaves:
+        por_shard[shard_da_agencia(chave[0], len(sessoes))].append(chave)
+    encontradas = espalhar(
+        lambda i: _buscar_por_chaves(sessoes[i], por_shard[i]),
+        [i for i, lote in enumerate(por_shard) if lote],
+    )
+    contas = {(c.agencia, c.numero_conta): c for c in chain.from_iterable(encontradas)}
+
+    return {
+        "encontradas": [_to_out(contas[k]) for k in chaves if k in contas],
+        "faltantes": [
+            {"agencia": ag, "numero_conta": num}
+            for ag, num in chaves if (ag, num) not in contas
+        ],
+    }
+
+
+@router.get(
+    "/busca",
+    response_model=ContaPaginaOut,
+    summary="Buscar contas por CPF, e-mail ou prefixo do nome (paginado)"
+)
+def buscar_contas(
+    cpf: Optional[str] = None,
+    email: Optional[str] = None,
+    nome: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    sessoes: list[Session] = Depends(get_shards_leitura)
+):
+    if not (cpf or email or nome):
+        raise _err(422, "FILTRO_OBRIGATORIO", "Informe ao menos um filtro: cpf, email ou nome")
+
+    filtros = []
+    if cpf:
+        filtros.append(Conta.cpf == cpf)
+    if email:
+        filtros.append(Conta.email.collate("NOCASE") == email)
+
+    if nome:
+        chave_nome = Conta.nome.collate("NOCASE")
+        inicio, fim = _faixa_prefixo(nome)
+        filtros += [chave_nome >= inicio, chave_nome < fim]
+        ordem = (chave_nome, Conta.id)
+        chave_merge = lambda c: (_nocase(c.nome), c.id)  # noqa: E731
+    else:
+        ordem = (Conta.id,)
+        chave_merge = lambda c: c.id  # noqa: E731
+
+    if after:
+        filtros.append(tuple_(*ordem) > tuple(_decodificar_cursor(after, len(ordem))))
+
+    # Cada shard devolve a própria página já ordenada; o merge fica com as
+    # limit + 1 primeiras do conjunto.
+    paginas = espalhar(
+        lambda db: db.query(Conta).filter(*filtros).order_by(*ordem).limit(limit + 1).all(),
+        sessoes,
+    )
+    contas = list(islice(heapq.merge(*paginas, key=chave_merge), limit + 1))
+
+    proximo = None
+    if len(contas) > limit:
+        ultima = contas[limit - 1]
+        proximo = (
+            _codificar_cursor(ultima.nome, ultima.id) if nome else _codificar_cursor(ultima.id)
+        )
+
+    return {"itens": [_to_out(c) for c in contas[:limit]], "proximo": proximo}
+
+
+@router.get(
+    "/resumo",
+    response_model=list[ResumoAgenciaOut],
+    summary="Saldos e exposição ao cheque especial por agência"
+)
+def resumo_agencias(sessoes: list[Session] = Depends(get_shards_leitura)):
+    # Cada agência está num shard só: basta intercalar os resumos.
+    return list(heapq.merge(*espalhar(listar_resumo, sessoes), key=lambda r: r["agencia"]))
+
+
+@router.get(
+    "/eventos",
+    response_class=StreamingResponse,
+    summary="Stream (SSE) de depósitos, saques, cheque especial e desativações"
+)
+async def stream_eventos():
+    # Só eventos já commitados; assinante que não acompanha é derrubado.
+    return StreamingResponse(
+        eventos.hub.stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get(
+    "/alteracoes",
+    response_model=AlteracoesOut,
+    summary="Contas alteradas ou removidas desde uma marca (sincronização incremental)"
+)
+def listar_alteracoes(
+    desde: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=1000),
+    sessoes: list[Session] = Depends(get_shards_leitura)
+):
+    # Cada shard tem a própria sequência: a marca guarda um par
+    # (alteracao, id) por shard, na ordem dos shards.
+    valores = _decodificar_cursor(desde, 2 * len(sessoes)) if desde else [0, 0] * len(sessoes)
+    marcas = [tuple(valores[i:i + 2]) for i in range(0, len(valores), 2)]
+
+    def no_shard(indice: int) -> list:
+        # Keyset em (alteracao, id) nas duas tabelas, cada uma pelo seu
+        # índice; o custo acompanha o volume de alterações, não o tamanho da
+        # tabela.
+        db, marca = sessoes[indice], marcas[indice]
+        contas = (
+            db.query(Conta)
+            .filter(tuple_(Conta.alteracao, Conta.id) > marca)
+            .order_by(Conta.alteracao, Conta.id)
+            .limit(limit + 1)
+            .all()
+        )
+        removidas = (
+            db.query(ContaRemovida)
+            .filter(tuple_(ContaRemovida.alteracao, ContaRemovida.id) > marca)
+            .order_by(ContaRemovida.alteracao, ContaRemovida.id)
+            .limit(limit + 1)
+            .all()
+        )
+        return sorted(
+            [(c.alteracao, c.id, indice, "ALTERADA", c) for c in contas]
+            + [(r.alteracao, r.id, indice, "REMOVIDA", r) for r in removidas],
+            key=lambda e: e[:2],
+        )
+
+    # As páginas dos shards são intercaladas; de cada um sai um prefixo da
+    # própria sequência, então a marca de cada shard é o último que entrou.
+    eventos = list(islice(
+        heapq.merge(*espalhar(no_shard, range(len(sessoes))), key=lambda e: e[:2]),
+        limit + 1,
+    ))
+    # Cada item leva a marca logo depois dele: quem junta várias instâncias
+    # (o gateway) pode parar no meio da página.
+    itens = []
+    for alteracao, id_, indice, tipo, linha in eventos[:limit]:
+        marcas[indice] = (alteracao, id_)
+        itens.append({
+            "tipo": tipo,
+            "agencia": linha.agencia,
+            "numero_conta": linha.numero_conta,
+            "conta": _to_out(linha) if tipo == "ALTERADA" else None,
+            "alteracao": alteracao,
+            "desde": _codificar_cursor(*chain.from_iterable(marcas)),
+        })
+
+    return {
+        "itens": itens,
+        "desde": _codificar_cursor(*chain.from_iterable(marcas)),
+        "tem_mais": len(eventos) > limit,
+    }
+
+
+@router.get(
+    "/ranking",
+    response_model=list[RankingScoreOut],
+    summary="Contas com maior score de crédito"
+)
+def ranking_score(
+    top: int = Query(10, ge=1, le=100),
+    sessoes: list[Session] = Depends(get_shards_leitura)
+):
+    # Percorre o índice ix_contas_score do fim: lê só as N primeiras entradas
+    # de cada shard, e o merge fica com as N maiores do conjunto.
+    linhas = heapq.merge(
+        *espalhar(lambda db: db.execute(
+            select(Conta.agencia, Conta.numero_conta, Conta.nome, SCORE_CREDITO, Conta.id)
+            .order_by(SCORE_CREDITO.desc(), Conta.id.desc())
+            .limit(top)
+        ).all(), sessoes),
+        key=lambda linha: (-linha[3], -linha[4]),
+    )
+    return [
+        {
+            "agencia": agencia,
+            "numero_conta": numero_conta,
+            "nome": nome,
+            "score_credito": _score_credito(score),
+        }
+        for agencia, numero_conta, nome, score, _ in islice(linhas, top)
+    ]
+
+
 @router.get(
     "/{agencia}/{numero_conta}",
     response_model=ContaOut,
     summary="Buscar conta por agência/número"
 )
-def buscar_conta(agencia: str, numero_conta: str, db: Session = Depends(get_db)):
-    conta = _get_by_agencia_numero_or_404(db, agencia, numero_conta)
+def buscar_conta(
+    agencia: str,
+    numero_conta: str,
+    fields: Optional[str] = Query(None, description="Campos separados por vírgula"),
+    repo: RepositorioContas = Depends(get_repositorio_leitura),
+    if_none_match: Annotated[Optional[str], Header()] = None,
+    response: Response = None
+):
+    campos = _campos_pedidos(fields)
+    if campos is not None:
+        linha = repo.colunas(agencia, numero_conta, _colunas_campos(campos))
+        if linha is None:
+            raise _err(404, "CONTA_NAO_ENCONTRADA", "Conta não encontrada")
+        return JSONResponse(_linha_campos(linha, campos))
+
+    if if_none_match:
+        # Consulta só a versão pelo índice único: se o cliente já tem essa
+        # representação, responde 304 sem carregar nem validar a conta.
+        versao = repo.versao(agencia, numero_conta)
+        if versao is None:
+            raise _err(404, "CONTA_NAO_ENCONTRADA", "Conta não encontrada")
+        etag = f'"{versao}"'
+        if _etag_confere(etag, if_none_match):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    conta = repo.obter(agencia, numero_conta)
+    if conta is None:
+        raise _err(404, "CONTA_NAO_ENCONTRADA", "Conta não encontrada")
+    _com_etag(response, conta)
     return _to_out(conta)
 
 
@@ -158,25 +600,33 @@ def atualizar_conta(
     agencia: str,
     numero_conta: str,
     body: ContaUpdate,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    if_match: Annotated[Optional[str], Header()] = None,
+    response: Response = None
 ):
     conta = _get_by_agencia_numero_or_404(db, agencia, numero_conta)
+    # Com a escrita adiada, o saldo pendente da conta entra antes da conferência.
+    with diario.exclusivo(db, conta):
+        _conferir_if_match(conta, if_match)
 
 
-    if body.correntista is False and conta.saldo_cc != 0:
-        raise _err(422, "SALDO_INVALIDO_CORRENTISTA_FALSE", "Conta correntista= False deve ter saldo 0")
+        if body.correntista is False and conta.saldo_centavos != 0:
+            raise _err(422, "SALDO_INVALIDO_CORRENTISTA_FALSE", "Conta correntista= False deve ter saldo 0")
 
 
-    for field, value in body.model_dump(exclude_unset=True).items():
-        setattr(conta, field, value)
+        cpf_antigo = conta.cpf
+        for field, value in body.model_dump(exclude_unset=True).items():
+            setattr(conta, field, value)
 
-    try:
-        db.commit()
-        db.refresh(conta)
-    except IntegrityError:
-        db.rollback()
-        raise _err(409, "CONFLITO_UNICO", "Dados atualizados violam restrição de unicidade (CPF).")
+        try:
+            with diretorio.troca_de_cpf(db, conta, cpf_antigo):
+                _commit_versionado(db)
+                db.refresh(conta)
+        except IntegrityError:
+            db.rollback()
+            raise _err(409, "CONFLITO_UNICO", "Dados atualizados violam restrição de unicidade (CPF).")
 
+    _com_etag(response, conta)
     return _to_out(conta)
 
 
@@ -185,60 +635,74 @@ def atualizar_conta(
     status_code=status.HTTP_204_NO_CONTENT,
     summary="Desativar conta (deletar) por agência/número"
 )
-def desativar_conta(agencia: str, numero_conta: str, db: Session = Depends(get_db)):
-    conta = _get_by_agencia_numero_or_404(db, agencia, numero_conta)
+def desativar_conta(
+    agencia: str,
+    numero_conta: str,
+    repo: RepositorioContas = Depends(get_repositorio)
+):
+    removida = repo.remover_se_zerada(agencia, numero_conta)
+    if removida is None:
+        raise _err(404, "CONTA_NAO_ENCONTRADA", "Conta não encontrada")
 
 
-    if float(conta.saldo_cc) != 0.0:
+    if not removida:
         raise _err(409, "SALDO_NAO_ZERADO", "Só é possível desativar conta com saldo zerado")
-
-    db.delete(conta)
-    db.commit()
     return None
 
 
+def _conferir_deposito(conta: Conta, novo_saldo: int) -> None:
+    if novo_saldo > SALDO_MAXIMO_CENTAVOS:
+        raise _err(422, "SALDO_ACIMA_DO_MAXIMO", "O saldo passaria do máximo aceito")
+
+
 @router.post(
     "/operacoes/depositar",
     response_model=ContaOut,
     summary="Depositar"
 )
-def depositar(body: OperacaoPorChaves, db: Session = Depends(get_db)):
-    conta = _get_by_agencia_numero_or_404(db, body.agencia, body.numero_conta)
-    conta.saldo_cc += body.valor
-    db.commit()
-    db.refresh(conta)
+def depositar(
+    body: OperacaoPorChaves,
+    repo: RepositorioContas = Depends(get_repositorio),
+    response: Response = None
+):
+    valor = _valor_operacao(body.valor)
+    conta = repo.movimentar(
+        body.agencia, body.numero_conta, "DEPOSITO", valor, _conferir_deposito
+    )
+    if conta is None:
+        raise _err(404, "CONTA_NAO_ENCONTRADA", "Conta não encontrada")
+    _com_etag(response, conta)
     return _to_out(conta)
 
 
-@router.post(
-    "/operacoes/sacar",
-    response_model=ContaOut,
-    summary="Sacar"
-)
-def sacar(body: OperacaoPorChaves, db: Session = Depends(get_db)):
-    conta = _get_by_agencia_numero_or_404(db, body.agencia, body.numero_conta)
-
-    valor = body.valor
-    novo_saldo = conta.saldo_cc - valor
-
-
+def _conferir_saque(conta: Conta, novo_saldo: int) -> None:
     if novo_saldo >= 0:
-        conta.saldo_cc = novo_saldo
-        db.commit()
-        db.refresh(conta)
-        return _to_out(conta)
+        return
 
 
     if not conta.cheque_especial_contratado:
         raise _err(409, "SALDO_INSUFICIENTE", "Saldo insuficiente")
 
 
-    if novo_saldo < -conta.limite_cheque_especial:
+    if novo_saldo < -conta.limite_centavos:
         raise _err(409, "CHEQUE_ESPECIAL_EXCEDIDO", "Limite do cheque especial excedido")
 
-    conta.saldo_cc = novo_saldo
-    db.commit()
-    db.refresh(conta)
+
+@router.post(
+    "/operacoes/sacar",
+    response_model=ContaOut,
+    summary="Sacar"
+)
+def sacar(
+    body: OperacaoPorChaves,
+    repo: RepositorioContas = Depends(get_repositorio),
+    response: Response = None
+):
+    valor = _valor_operacao(body.valor)
+    conta = repo.movimentar(body.agencia, body.numero_conta, "SAQUE", -valor, _conferir_saque)
+    if conta is None:
+        raise _err(404, "CONTA_NAO_ENCONTRADA", "Conta não encontrada")
+    _com_etag(response, conta)
     return _to_out(conta)
 
 
@@ -250,25 +714,150 @@ def sacar(body: OperacaoPorChaves, db: Session = Depends(get_db)):
 def cadastrar_cheque_especial(
     id: int,
     body: ChequeEspecialCadastro,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    if_match: Annotated[Optional[str], Header()] = None,
+    response: Response = None
 ):
     conta = _get_by_id_or_404(db, id)
+    with diario.exclusivo(db, conta):
+        _conferir_if_match(conta, if_match)
 
 
-    if body.habilitado is False and conta.saldo_cc < 0:
-        raise _err(
-            409,
-            "CHEQUE_ESPECIAL_COM_SALDO_NEGATIVO",
-            "Não pode desabilitar cheque especial com saldo negativo"
-        )
+        if body.habilitado is False and conta.saldo_centavos < 0:
+            raise _err(
+                409,
+                "CHEQUE_ESPECIAL_COM_SALDO_NEGATIVO",
+                "Não pode desabilitar cheque especial com saldo negativo"
+            )
 
 
-    if body.habilitado is True and body.limite < 0:
-        raise _err(422, "LIMITE_INVALIDO", "Limite deve ser >= 0")
+        if body.habilitado is True and body.limite < 0:
+            raise _err(422, "LIMITE_INVALIDO", "Limite deve ser >= 0")
 
-    conta.cheque_especial_contratado = body.habilitado
-    conta.limite_cheque_especial = body.limite
+        limite = para_centavos(body.limite)
+        antes = contribuicao(conta)
+        conta.cheque_especial_contratado = body.habilitado
+        conta.limite_centavos = limite
+        registrar_movimentacao(
+            db, conta, "CHEQUE_ESPECIAL", 0,
+            limite_centavos=limite if body.habilitado else 0,
+        )
+        eventos.registrar(db, "CHEQUE_ESPECIAL", conta)
+        aplicar_delta(db, conta.agencia, antes, contribuicao(conta))
 
-    db.commit()
-    db.refresh(conta)
+        _commit_versionado(db)
+        db.refresh(conta)
+    _com_etag(response, conta)
     return _to_out(conta)
+
+
+
+@router.get(
+    "/{agencia}/{numero_conta}/score_credito",
+    response_model=ScoreCreditoOut,
+    summary="Score de crédito e percentil da conta"
+)
+def score_credito(
+    agencia: str,
+    numero_conta: str,
+    sessoes: list[Session] = Depends(get_shards_leitura)
+):
+    # Um único SELECT no shard da conta: a conta pelo índice único e as
+    # contagens do percentil como subconsultas sobre ix_contas_score /
+    # ix_contas_id. Os outros shards só somam as suas contagens.
+    outra = Conta.__table__.alias("outra")
+
+    def abaixo_de(score):
+        return (
+            select(func.count())
+            .select_from(outra)
+            .where(score_credito_sql(outra.c.saldo_centavos) < score)
+            .scalar_subquery()
+        )
+
+    total = select(func.count()).select_from(outra).scalar_subquery()
+
+    indice = shard_da_agencia(agencia, len(sessoes))
+    linha = sessoes[indice].execute(
+        select(SCORE_CREDITO, abaixo_de(SCORE_CREDITO), total)
+        .where(Conta.agencia == agencia, Conta.numero_conta == numero_conta)
+    ).first()
+    if linha is None:
+        raise _err(404, "CONTA_NAO_ENCONTRADA", "Conta não encontrada")
+
+    score, contas_abaixo, contas = linha
+    outros = [db for i, db in enumerate(sessoes) if i != indice]
+    for abaixo_outro, total_outro in espalhar(
+        lambda db: db.execute(select(abaixo_de(score), total)).one(), outros
+    ):
+        contas_abaixo += abaixo_outro
+        contas += total_outro
+    return {
+        "agencia": agencia,
+        "numero_conta": numero_conta,
+        "score_credito": _score_credito(score),
+        "percentil": round(100.0 * contas_abaixo / contas, 2),
+    }
+
+
+@router.get(
+    "/{agencia}/{numero_conta}/extrato",
+    response_model=ExtratoOut,
+    summary="Extrato da conta por período (paginado por cursor)"
+)
+def extrato(
+    agencia: str,
+    numero_conta: str,
+    desde: Optional[datetime] = None,
+    ate: Optional[datetime] = None,
+    after: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db_leitura)
+):
+    conta = _get_by_agencia_numero_or_404(db, agencia, numero_conta)
+    desde = _utc_naive(desde)
+    ate = _utc_naive(ate)
+
+    filtros = [Movimentacao.conta_id == conta.id]
+    if desde is not None:
+        filtros.append(Movimentacao.criado_em >= desde)
+    if ate is not None:
+        filtros.append(Movimentacao.criado_em <= ate)
+
+    if after is not None:
+        cursor = db.get(Movimentacao, after)
+        if cursor is None or cursor.conta_id != conta.id:
+            raise _err(422, "CURSOR_INVALIDO", "Cursor de paginação inválido")
+        filtros.append(
+            tuple_(Movimentacao.criado_em, Movimentacao.id) > (cursor.criado_em, cursor.id)
+        )
+        saldo_inicial = cursor.saldo_apos_centavos
+    else:
+        saldo_inicial = _saldo_antes(db, conta.id, desde)
+
+    itens = (
+        db.query(Movimentacao)
+        .filter(*filtros)
+        .order_by(Movimentacao.criado_em, Movimentacao.id)
+        .limit(limit + 1)
+        .all()
+    )
+    proximo = itens[limit - 1].id if len(itens) > limit else None
+
+    return {
+        "agencia": conta.agencia,
+        "numero_conta": conta.numero_conta,
+        "saldo_inicial": para_reais(saldo_inicial),
+        "movimentacoes": [
+            {
+                "id": m.id,
+                "tipo": m.tipo,
+                "valor": para_reais(m.valor_centavos),
+                "saldo_apos": para_reais(m.saldo_apos_centavos),
+                "limite": None if m.limite_centavos is None else para_reais(m.limite_centavos),
+                "criado_em": m.criado_em,
+            }
+            for m in itens[:limit]
+        ],
+        "proximo": proximo,
+    }
@@ -0,0 +1,51 @@
+
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+
+from .. import diario, metricas
+from ..db import RotaDoBanco, engine, engine_leitura, get_db, limitador_banco
+from ..juros import TaxaDivergente, acumular_juros_nos_shards
+from ..schemas import JurosIn, JurosOut, MetricasExecutorOut
+from .contas import _err
+
+router = APIRouter(prefix="/interno", tags=["interno"], route_class=RotaDoBanco)
+
+
+@router.post(
+    "/juros",
+    response_model=JurosOut,
+    summary="Acumular juros do cheque especial (idempotente por data)"
+)
+def acumular_juros_cheque_especial(body: JurosIn, db: Session = Depends(get_db)):
+    try:
+        # Os juros mexem no saldo direto no banco: com a escrita adiada, o
+        # diário é esvaziado antes e as movimentações esperam o fim. A
+        # descarga precisa do lock que get_db já pegou; acumular_juros abre
+        # a própria transação de escrita.
+        db.rollback()
+        with diario.pausa():
+            return acumular_juros_nos_shards(db, body.data_referencia, body.taxa, body.tamanho_lote)
+    except TaxaDivergente as e:
+        raise _err(409, "TAXA_DIVERGENTE", str(e))
+
+
+@router.get(
+    "/metricas/executor",
+    response_model=MetricasExecutorOut,
+    summary="Threads das rotas síncronas, fila por thread e espera por conexão"
+)
+async def metricas_executor():
+    # async: lê o limitador no próprio loop, sem ocupar uma thread.
+    limitador = limitador_banco()
+    return {
+        "workers": int(limitador.total_tokens),
+        "workers_ativos": limitador.borrowed_tokens,
+        "aguardando_thread": limitador.statistics().tasks_waiting,
+        "espera_fila": metricas.espera_fila.resumo(),
+        "pool_tamanho": engine.pool.size(),
+        "pool_em_uso": engine.pool.checkedout(),
+        "pool_leitura_tamanho": engine_leitura.pool.size(),
+        "pool_leitura_em_uso": engine_leitura.pool.checkedout(),
+        "aguardando_conexao": metricas.aguardando_conexao,
+        "espera_conexao": metricas.espera_conexao.resumo(),
+    }
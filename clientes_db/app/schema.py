@@ -0,0 +1,389 @@
+
+import argparse
+import sys
+
+from sqlalchemy import inspect, update
+from sqlalchemy.engine import Connection, Engine
+
+from .db import ESCRITA, Base, engine, engines_extras
+from . import models
+from .resumo import insert_recalculado
+
+# Versão gravada em PRAGMA user_version. Bancos criados antes do controle de
+# versão ficam com 0 e passam por todas as migrações a partir da 1.
+SCHEMA_VERSION = 13
+
+
+class SchemaIncompativel(RuntimeError):
+    pass
+
+
+def _criar_indices(conn: Connection, tabela, *nomes: str) -> None:
+    for indice in tabela.indexes:
+        if not nomes or indice.name in nomes:
+            indice.create(bind=conn, checkfirst=True)
+
+
+# As migrações 1 a 8 usam o DDL da época (os models já estão na versão
+# atual) e são idempotentes: IF NOT EXISTS / checkfirst.
+def _migracao_1(conn: Connection) -> None:
+    conn.exec_driver_sql(
+        """
+        CREATE TABLE IF NOT EXISTS contas (
+            id INTEGER NOT NULL,
+            agencia VARCHAR NOT NULL,
+            numero_conta VARCHAR NOT NULL,
+            nome VARCHAR NOT NULL,
+            cpf VARCHAR(15) NOT NULL,
+            telefone INTEGER NOT NULL,
+            email VARCHAR NOT NULL,
+            correntista BOOLEAN NOT NULL,
+            saldo_cc FLOAT NOT NULL,
+            cheque_especial_contratado BOOLEAN NOT NULL,
+            limite_cheque_especial FLOAT NOT NULL,
+            PRIMARY KEY (id),
+            CONSTRAINT uix_agencia_numero UNIQUE (agencia, numero_conta)
+        )
+        """
+    )
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_contas_id ON contas (id)")
+    conn.exec_driver_sql("CREATE UNIQUE INDEX IF NOT EXISTS ix_contas_cpf ON contas (cpf)")
+
+
+def _migracao_2(conn: Connection) -> None:
+    conn.exec_driver_sql(
+        """
+        CREATE TABLE IF NOT EXISTS movimentacoes (
+            id INTEGER NOT NULL,
+            conta_id INTEGER NOT NULL,
+            tipo VARCHAR NOT NULL,
+            valor FLOAT NOT NULL,
+            saldo_apos FLOAT NOT NULL,
+            criado_em DATETIME NOT NULL,
+            PRIMARY KEY (id)
+        )
+        """
+    )
+
+
+def _migracao_3(conn: Connection) -> None:
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_movimentacoes_conta_data_id "
+        "ON movimentacoes (conta_id, criado_em, id)"
+    )
+
+    # Contas anteriores ao livro-razão ganham uma linha de abertura com o
+    # saldo atual, que serve de ponto de partida para o extrato.
+    conn.exec_driver_sql(
+        """
+        INSERT INTO movimentacoes (conta_id, tipo, valor, saldo_apos, criado_em)
+        SELECT c.id, 'ABERTURA', c.saldo_cc, c.saldo_cc, CURRENT_TIMESTAMP
+        FROM contas c
+        WHERE c.saldo_cc != 0
+          AND NOT EXISTS (SELECT 1 FROM movimentacoes m WHERE m.conta_id = c.id)
+        """
+    )
+
+
+def _migracao_4(conn: Connection) -> None:
+    models.ExecucaoJuros.__table__.create(bind=conn, checkfirst=True)
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_contas_devedoras ON contas (id) WHERE saldo_cc < 0"
+    )
+
+
+def _migracao_5(conn: Connection) -> None:
+    # Os agregados são recalculados pela migração 8, já em centavos.
+    conn.exec_driver_sql(
+        """
+        CREATE TABLE IF NOT EXISTS resumo_agencias (
+            agencia VARCHAR NOT NULL,
+            quantidade_contas INTEGER NOT NULL,
+            total_depositos FLOAT NOT NULL,
+            exposicao_negativa FLOAT NOT NULL,
+            cheque_especial_usado FLOAT NOT NULL,
+            cheque_especial_disponivel FLOAT NOT NULL,
+            PRIMARY KEY (agencia)
+        )
+        """
+    )
+
+
+def _migracao_6(conn: Connection) -> None:
+    _criar_indices(
+        conn, models.Conta.__table__, "ix_contas_email_nocase", "ix_contas_nome_nocase"
+    )
+
+
+def _migracao_7(conn: Connection) -> None:
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_contas_score ON contas "
+        "(CASE WHEN (saldo_cc < 0) THEN 0.0 ELSE round(saldo_cc * 0.1, 4) END, id)"
+    )
+
+
+DDL_V8 = (
+    """
+    CREATE TABLE contas (
+        id INTEGER NOT NULL,
+        agencia VARCHAR NOT NULL,
+        numero_conta VARCHAR NOT NULL,
+        nome VARCHAR NOT NULL,
+        cpf VARCHAR(15) NOT NULL,
+        telefone INTEGER NOT NULL,
+        email VARCHAR NOT NULL,
+        correntista BOOLEAN NOT NULL,
+        saldo_centavos INTEGER NOT NULL,
+        cheque_especial_contratado BOOLEAN NOT NULL,
+        limite_centavos INTEGER NOT NULL,
+        PRIMARY KEY (id),
+        CONSTRAINT uix_agencia_numero UNIQUE (agencia, numero_conta)
+    )
+    """,
+    "CREATE INDEX ix_contas_id ON contas (id)",
+    "CREATE UNIQUE INDEX ix_contas_cpf ON contas (cpf)",
+    "CREATE INDEX ix_contas_devedoras ON contas (id) WHERE saldo_centavos < 0",
+    'CREATE INDEX ix_contas_email_nocase ON contas (email COLLATE "NOCASE")',
+    'CREATE INDEX ix_contas_nome_nocase ON contas (nome COLLATE "NOCASE")',
+    "CREATE INDEX ix_contas_score ON contas "
+    "(CASE WHEN (saldo_centavos < 0) THEN 0 ELSE saldo_centavos END, id)",
+    """
+    CREATE TABLE movimentacoes (
+        id INTEGER NOT NULL,
+        conta_id INTEGER NOT NULL,
+        tipo VARCHAR NOT NULL,
+        valor_centavos INTEGER NOT NULL,
+        saldo_apos_centavos INTEGER NOT NULL,
+        criado_em DATETIME NOT NULL,
+        PRIMARY KEY (id)
+    )
+    """,
+    "CREATE INDEX ix_movimentacoes_conta_data_id ON movimentacoes (conta_id, criado_em, id)",
+    """
+    CREATE TABLE resumo_agencias (
+        agencia VARCHAR NOT NULL,
+        quantidade_contas INTEGER NOT NULL,
+        total_depositos INTEGER NOT NULL,
+        exposicao_negativa INTEGER NOT NULL,
+        cheque_especial_usado INTEGER NOT NULL,
+        cheque_especial_disponivel INTEGER NOT NULL,
+        PRIMARY KEY (agencia)
+    )
+    """,
+)
+
+
+def _migracao_8(conn: Connection) -> None:
+    # Valores monetários passam de FLOAT (reais) para INTEGER (centavos). O
+    # SQLite não muda o tipo de uma coluna: cada tabela é renomeada, recriada
+    # (com os índices) e os dados são copiados convertidos.
+    tabelas = ("contas", "movimentacoes", "resumo_agencias")
+    for tabela in tabelas:
+        conn.exec_driver_sql(f"ALTER TABLE {tabela} RENAME TO {tabela}_v7")
+
+    # Os índices acompanham a tabela renomeada e ocupariam os mesmos nomes.
+    indices = conn.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+        "AND tbl_name IN ('contas_v7', 'movimentacoes_v7')"
+    ).scalars().all()
+    for nome in indices:
+        conn.exec_driver_sql(f'DROP INDEX "{nome}"')
+
+    for ddl in DDL_V8:
+        conn.exec_driver_sql(ddl)
+
+    conn.exec_driver_sql(
+        """
+        INSERT INTO contas (
+            id, agencia, numero_conta, nome, cpf, telefone, email, correntista,
+            saldo_centavos, cheque_especial_contratado, limite_centavos
+        )
+        SELECT
+            id, agencia, numero_conta, nome, cpf, telefone, email, correntista,
+            CAST(round(saldo_cc * 100) AS INTEGER), cheque_especial_contratado,
+            CAST(round(limite_cheque_especial * 100) AS INTEGER)
+        FROM contas_v7
+        """
+    )
+    conn.exec_driver_sql(
+        """
+        INSERT INTO movimentacoes (id, conta_id, tipo, valor_centavos, saldo_apos_centavos, criado_em)
+        SELECT
+            id, conta_id, tipo,
+            CAST(round(valor * 100) AS INTEGER), CAST(round(saldo_apos * 100) AS INTEGER),
+            criado_em
+        FROM movimentacoes_v7
+        """
+    )
+    conn.execute(insert_recalculado())
+
+    for tabela in tabelas:
+        conn.exec_driver_sql(f"DROP TABLE {tabela}_v7")
+
+
+def _migracao_9(conn: Connection) -> None:
+    colunas = {c["name"] for c in inspect(conn).get_columns("contas")}
+    if "versao" not in colunas:
+        conn.exec_driver_sql(
+            "ALTER TABLE contas ADD COLUMN versao VARCHAR(32) NOT NULL DEFAULT ''"
+        )
+    conn.execute(
+        update(models.Conta).where(models.Conta.versao == "").values(versao=models.NOVA_VERSAO_SQL)
+    )
+
+
+def _migracao_10(conn: Connection) -> None:
+    colunas = {c["name"] for c in inspect(conn).get_columns("contas")}
+    if "alteracao" not in colunas:
+        # As contas existentes entram na sequência na ordem do id.
+        conn.exec_driver_sql(
+            "ALTER TABLE contas ADD COLUMN alteracao INTEGER NOT NULL DEFAULT 0"
+        )
+        conn.exec_driver_sql("UPDATE contas SET alteracao = id")
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_contas_alteracao ON contas (alteracao, id)"
+    )
+    conn.exec_driver_sql(
+        """
+        CREATE TABLE IF NOT EXISTS contas_removidas (
+            id INTEGER NOT NULL,
+            conta_id INTEGER NOT NULL,
+            agencia VARCHAR NOT NULL,
+            numero_conta VARCHAR NOT NULL,
+            alteracao INTEGER NOT NULL,
+            removida_em DATETIME NOT NULL,
+            PRIMARY KEY (id)
+        )
+        """
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_contas_removidas_alteracao "
+        "ON contas_removidas (alteracao, id)"
+    )
+
+
+def _migracao_11(conn: Connection) -> None:
+    conn.exec_driver_sql(
+        """
+        CREATE TABLE IF NOT EXISTS diretorio_contas (
+            id INTEGER NOT NULL,
+            agencia VARCHAR NOT NULL,
+            numero_conta VARCHAR NOT NULL,
+            cpf VARCHAR(15) NOT NULL,
+            PRIMARY KEY (id),
+            CONSTRAINT uix_diretorio_agencia_numero UNIQUE (agencia, numero_conta),
+            CONSTRAINT uix_diretorio_cpf UNIQUE (cpf)
+        )
+        """
+    )
+    # Até aqui havia um só banco: o diretório começa com as contas dele.
+    conn.exec_driver_sql(
+        "INSERT OR IGNORE INTO diretorio_contas (id, agencia, numero_conta, cpf) "
+        "SELECT id, agencia, numero_conta, cpf FROM contas"
+    )
+
+
+def _migracao_12(conn: Connection) -> None:
+    colunas = {c["name"] for c in inspect(conn).get_columns("contas")}
+    if "diario_seq" not in colunas:
+        conn.exec_driver_sql(
+            "ALTER TABLE contas ADD COLUMN diario_seq INTEGER NOT NULL DEFAULT 0"
+        )
+
+
+def _migracao_13(conn: Connection) -> None:
+    # O limite do cheque especial sai do valor: linhas de CHEQUE_ESPECIAL
+    # não movem dinheiro e passam a ter valor 0.
+    colunas = {c["name"] for c in inspect(conn).get_columns("movimentacoes")}
+    if "limite_centavos" not in colunas:
+        conn.exec_driver_sql("ALTER TABLE movimentacoes ADD COLUMN limite_centavos INTEGER")
+        conn.exec_driver_sql(
+            "UPDATE movimentacoes SET limite_centavos = valor_centavos, valor_centavos = 0"
+            " WHERE tipo = 'CHEQUE_ESPECIAL'"
+        )
+
+MIGRACOES = {
+    1: _migracao_1,
+    2: _migracao_2,
+    3: _migracao_3,
+    4: _migracao_4,
+    5: _migracao_5,
+    6: _migracao_6,
+    7: _migracao_7,
+    8: _migracao_8,
+    9: _migracao_9,
+    10: _migracao_10,
+    11: _migracao_11,
+    12: _migracao_12,
+    13: _migracao_13,
+}
+
+
+def versao_schema(conn: Connection) -> int:
+    return int(conn.exec_driver_sql("PRAGMA user_version").scalar() or 0)
+
+
+def preparar_schema(bind: Engine = engine) -> int:
+    # BEGIN IMMEDIATE: com vários workers subindo juntos, um migra e os
+    # outros esperam o lock e encontram o banco já na versão atual.
+    with bind.execution_options(**ESCRITA).begin() as conn:
+        versao = versao_schema(conn)
+
+        if versao > SCHEMA_VERSION:
+            raise SchemaIncompativel(
+                f"Banco na versão {versao}, código suporta até {SCHEMA_VERSION}"
+            )
+
+        if versao == SCHEMA_VERSION:
+            return versao
+
+        if versao == 0 and not inspect(conn).has_table("contas"):
+            Base.metadata.create_all(bind=conn)
+        else:
+            for v in range(versao + 1, SCHEMA_VERSION + 1):
+                MIGRACOES[v](conn)
+
+        conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        return SCHEMA_VERSION
+
+
+def verificar_schema(bind: Engine = engine) -> int:
+    with bind.connect() as conn:
+        versao = versao_schema(conn)
+    if versao != SCHEMA_VERSION:
+        raise SchemaIncompativel(
+            f"Banco na versão {versao}, esperado {SCHEMA_VERSION}. "
+            "Rode: python -m clientes_db.app.schema"
+        )
+    return versao
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m clientes_db.app.schema",
+        description="Cria ou migra o schema do clientes_db."
+    )
+    parser.add_argument(
+        "--verificar",
+        action="store_true",
+        help="Apenas confere a versão do schema, sem alterar o banco."
+    )
+    args = parser.parse_args(argv)
+
+    # Todos os shards ficam na mesma versão.
+    try:
+        for bind in (engine, *engines_extras()):
+            if args.verificar:
+                versao = verificar_schema(bind)
+            else:
+                versao = preparar_schema(bind)
+    except SchemaIncompativel as e:
+        print(str(e), file=sys.stderr)
+        return 1
+
+    print(f"schema na versão {versao}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
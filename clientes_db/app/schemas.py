@@ -1,7 +1,11 @@
 ﻿
-from pydantic import BaseModel, Field, EmailStr, confloat, ConfigDict
+from datetime import date, datetime
+
+from pydantic import BaseModel, Field, EmailStr, confloat, conint, ConfigDict
 from typing import Optional
 
+from .dinheiro import VALOR_MAXIMO
+
 class ContaCreate(BaseModel):
     agencia: str = Field(..., min_length=3, max_length=4, pattern=r"^\d{3,4}$")
     numero_conta: str = Field(..., min_length=4, max_length=8, pattern=r"^\d{4,8}$")
@@ -12,10 +16,14 @@ class ContaCreate(BaseModel):
     email: EmailStr
 
     correntista: bool = True
-    saldo_cc: Optional[float] = Field(0.0)
+    saldo_cc: Optional[float] = Field(
+        0.0, ge=-VALOR_MAXIMO, le=VALOR_MAXIMO, allow_inf_nan=False
+    )
 
     cheque_especial_contratado: bool = False
-    limite_cheque_especial: Optional[float] = Field(0.0, ge=0)
+    limite_cheque_especial: Optional[float] = Field(
+        0.0, ge=0, le=VALOR_MAXIMO, allow_inf_nan=False
+    )
 
 
 class ContaUpdate(BaseModel):
@@ -45,14 +53,125 @@ class ContaOut(BaseModel):
     limite_cheque_especial: float
     limite_atual: float
     score_credito: float
+    versao: str
+    # Mesma marca de X-Alteracao e de GET /contas/alteracoes.
+    alteracao: int
 
 
 class OperacaoPorChaves(BaseModel):
     agencia: str = Field(..., min_length=3, max_length=4, pattern=r"^\d{3,4}$")
     numero_conta: str = Field(..., min_length=4, max_length=8, pattern=r"^\d{4,8}$")
-    valor: confloat(gt=0) = Field(..., alias="saldo")
+    valor: confloat(gt=0, le=VALOR_MAXIMO, allow_inf_nan=False) = Field(..., alias="saldo")
 
 
 class ChequeEspecialCadastro(BaseModel):
     habilitado: bool
-    limite: confloat(ge=0)
+    limite: confloat(ge=0, le=VALOR_MAXIMO, allow_inf_nan=False)
+
+
+class MovimentacaoOut(BaseModel):
+    id: int
+    tipo: str
+    valor: float
+    saldo_apos: float
+    # Limite novo, nas linhas de CHEQUE_ESPECIAL.
+    limite: Optional[float] = None
+    criado_em: datetime
+
+
+class ExtratoOut(BaseModel):
+    agencia: str
+    numero_conta: str
+    saldo_inicial: float
+    movimentacoes: list[MovimentacaoOut]
+    proximo: Optional[int] = None
+
+
+class JurosIn(BaseModel):
+    data_referencia: date
+    taxa: confloat(gt=0, le=1)
+    tamanho_lote: conint(ge=1, le=5000) = 500
+
+
+class JurosOut(BaseModel):
+    data_referencia: date
+    taxa: float
+    contas_processadas: int
+    lotes: int
+    concluida: bool
+
+
+class EsperaOut(BaseModel):
+    amostras: int
+    media_ms: float
+    max_ms: float
+
+
+class MetricasExecutorOut(BaseModel):
+    workers: int
+    workers_ativos: int
+    aguardando_thread: int
+    espera_fila: EsperaOut
+    pool_tamanho: int
+    pool_em_uso: int
+    pool_leitura_tamanho: int
+    pool_leitura_em_uso: int
+    aguardando_conexao: int
+    espera_conexao: EsperaOut
+
+
+class ResumoAgenciaOut(BaseModel):
+    agencia: str
+    quantidade_contas: int
+    total_depositos: float
+    exposicao_negativa: float
+    cheque_especial_usado: float
+    cheque_especial_disponivel: float
+
+
+class ContaPaginaOut(BaseModel):
+    itens: list[ContaOut]
+    proximo: Optional[str] = None
+
+
+class ChaveConta(BaseModel):
+    agencia: str = Field(..., min_length=3, max_length=4, pattern=r"^\d{3,4}$")
+    numero_conta: str = Field(..., min_length=4, max_length=8, pattern=r"^\d{4,8}$")
+
+
+class ConsultaLoteIn(BaseModel):
+    chaves: list[ChaveConta] = Field(..., min_length=1, max_length=1000)
+
+
+class ConsultaLoteOut(BaseModel):
+    encontradas: list[ContaOut]
+    faltantes: list[ChaveConta]
+
+
+class AlteracaoOut(BaseModel):
+    tipo: str
+    agencia: str
+    numero_conta: str
+    conta: Optional[ContaOut] = None
+    alteracao: int
+    desde: str
+
+
+class AlteracoesOut(BaseModel):
+    itens: list[AlteracaoOut]
+    desde: str
+    tem_mais: bool
+
+
+class ScoreCreditoOut(BaseModel):
+    agencia: str
+    numero_conta: str
+    score_credito: float
+    percentil: float
+
+
+class RankingScoreOut(BaseModel):
+    agencia: str
+    numero_conta: str
+    nome: str
+    score_credito: float
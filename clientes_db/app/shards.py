@@ -0,0 +1,176 @@
+
+import argparse
+import os
+import sys
+
+from sqlalchemy import delete, func, insert, make_url, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from . import db as db_mod
+from .db import criar_engines, iniciar_escrita, shard_da_agencia, url_do_shard
+from .models import Conta, DiretorioConta, Movimentacao, ResumoAgencia
+from .schema import preparar_schema
+
+# Colunas copiadas ao mover a conta; alteracao e versao são geradas de novo
+# no destino, onde a conta entra como alterada.
+COLUNAS_CONTA = [
+    c.name for c in Conta.__table__.columns if c.name not in ("alteracao", "versao")
+]
+COLUNAS_MOVIMENTACAO = [c.name for c in Movimentacao.__table__.columns if c.name != "id"]
+
+
+def arquivos_existentes(url: str) -> int:
+    """Quantos shards já têm arquivo em disco (o 0 conta sempre)."""
+    total = 1
+    while os.path.exists(make_url(url_do_shard(url, total)).database):
+        total += 1
+    return total
+
+
+def _agencias_fora_do_lugar(db: Session, indice: int, shards: int) -> list[str]:
+    agencias = db.scalars(select(Conta.agencia).distinct().order_by(Conta.agencia))
+    return [a for a in agencias if shard_da_agencia(a, shards) != indice]
+
+
+def _mover_agencia(origem: Session, destino: Session, agencia: str) -> int:
+    contas = origem.scalars(select(Conta).where(Conta.agencia == agencia)).all()
+    ids = [c.id for c in contas]
+
+    # Primeiro copia e confirma no destino; só depois apaga da origem. Se o
+    # processo parar no meio, rodar de novo pula as contas já copiadas.
+    iniciar_escrita(destino)
+    copiadas = set(destino.scalars(select(Conta.id).where(Conta.id.in_(ids))))
+    novas = [c for c in contas if c.id not in copiadas]
+    for conta in novas:
+        destino.add(Conta(**{nome: getattr(conta, nome) for nome in COLUNAS_CONTA}))
+    destino.flush()
+    movimentacoes = origem.execute(
+        select(*(Movimentacao.__table__.c[n] for n in COLUNAS_MOVIMENTACAO))
+        .where(Movimentacao.conta_id.in_([c.id for c in novas]))
+        .order_by(Movimentacao.id)
+    ).mappings().all()
+    if movimentacoes:
+        destino.execute(insert(Movimentacao), [dict(m) for m in movimentacoes])
+    resumo = origem.get(ResumoAgencia, agencia)
+    if resumo is not None:
+        destino.merge(ResumoAgencia(**{
+            c.name: getattr(resumo, c.name) for c in ResumoAgencia.__table__.columns
+        }))
+    destino.commit()
+
+    # Na origem a remoção passa pelo ORM: cada conta deixa o tombstone em
+    # contas_removidas, e quem espelha pelo feed de alterações a apaga dali.
+    iniciar_escrita(origem)
+    for conta in origem.scalars(select(Conta).where(Conta.id.in_(ids))):
+        origem.delete(conta)
+    origem.execute(delete(Movimentacao).where(Movimentacao.conta_id.in_(ids)))
+    origem.execute(delete(ResumoAgencia).where(ResumoAgencia.agencia == agencia))
+    origem.commit()
+    return len(ids)
+
+
+def _reconstruir_diretorio(fabricas: list[sessionmaker]) -> int:
+    principal = fabricas[0]()
+    try:
+        iniciar_escrita(principal)
+        principal.execute(delete(DiretorioConta))
+        total = 0
+        for fabrica in fabricas:
+            db = fabrica()
+            try:
+                linhas = db.execute(
+                    select(Conta.id, Conta.agencia, Conta.numero_conta, Conta.cpf)
+                ).mappings().all()
+            finally:
+                db.close()
+            if linhas:
+                principal.execute(insert(DiretorioConta), [dict(l) for l in linhas])
+            total += len(linhas)
+        principal.commit()
+        return total
+    finally:
+        principal.close()
+
+
+def rebalancear(engines: list[Engine], shards: int, aplicar: bool = True) -> dict:
+    """Deixa cada agência no shard ``shard_da_agencia(agencia, shards)``.
+
+    ``engines`` são todos os arquivos existentes, que podem ser mais que
+    ``shards`` quando o número diminui: os excedentes ficam vazios. Com
+    aplicar=False só informa o que seria movido. Ao aplicar, o diretório no
+    shard 0 é reconstruído a partir das contas, o que também limpa entradas
+    órfãs. Roda com o serviço parado.
+    """
+    if aplicar:
+        for engine in engines:
+            preparar_schema(engine)
+    fabricas = [sessionmaker(bind=e, autoflush=False) for e in engines]
+
+    movidas = {}
+    for indice, fabrica in enumerate(fabricas):
+        origem = fabrica()
+        try:
+            for agencia in _agencias_fora_do_lugar(origem, indice, shards):
+                movidas[agencia] = shard_da_agencia(agencia, shards)
+                if not aplicar:
+                    continue
+                destino = fabricas[movidas[agencia]]()
+                try:
+                    _mover_agencia(origem, destino, agencia)
+                finally:
+                    destino.close()
+        finally:
+            origem.close()
+
+    contas = []
+    for fabrica in fabricas:
+        db = fabrica()
+        try:
+            contas.append(db.scalar(select(func.count()).select_from(Conta)))
+        finally:
+            db.close()
+
+    diretorio = _reconstruir_diretorio(fabricas) if aplicar else None
+    return {"movidas": movidas, "contas_por_shard": contas, "diretorio": diretorio}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m clientes_db.app.shards",
+        description=(
+            "Redistribui as contas entre os shards conforme CLIENTES_DB_SHARDS "
+            "(serviço parado)."
+        ),
+    )
+    parser.add_argument(
+        "--verificar",
+        action="store_true",
+        help="Só lista as agências fora do shard certo, sem mover nada."
+    )
+    args = parser.parse_args(argv)
+
+    # Ao verificar, só os arquivos que já existem; ao aplicar, também os
+    # shards novos.
+    url = db_mod.DATABASE_URL
+    arquivos = arquivos_existentes(url)
+    if not args.verificar:
+        arquivos = max(arquivos, db_mod.SHARDS)
+    engines = [db_mod.engine] + [
+        criar_engines(url_do_shard(url, i))[0] for i in range(1, arquivos)
+    ]
+    resultado = rebalancear(engines, db_mod.SHARDS, aplicar=not args.verificar)
+
+    for agencia, destino in sorted(resultado["movidas"].items()):
+        acao = "fora do lugar, vai para" if args.verificar else "movida para"
+        print(f"agência {agencia}: {acao} o shard {destino}")
+    for indice, total in enumerate(resultado["contas_por_shard"]):
+        print(f"shard {indice}: {total} contas")
+    if resultado["diretorio"] is not None:
+        print(f"diretório: {resultado['diretorio']} contas")
+
+    return 1 if args.verificar and resultado["movidas"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
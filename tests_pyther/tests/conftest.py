@@ -1,4 +1,7 @@
 
+import os
+import tempfile
+
 import pytest
 import pytest_asyncio
 import httpx
@@ -8,11 +11,28 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
+# O banco padrão do clientes_db aponta para um arquivo temporário nos testes,
+# nunca para o clientes.db da raiz do projeto.
+os.environ.setdefault(
+    "CLIENTES_DB_DATABASE_URL",
+    "sqlite:///" + os.path.join(tempfile.mkdtemp(), "clientes_test.db"),
+)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema_banco_padrao():
+    from clientes_db.app.db import engine
+    from clientes_db.app.schema import preparar_schema
+
+    preparar_schema(engine)
+    yield
+
+
 # ---- clientes_db (sync app) fixtures ----
 @pytest.fixture(scope="function")
 def db_test_client():
     from clientes_db.app.main import app as db_app
-    from clientes_db.app.db import Base, get_db
+    from clientes_db.app.db import Base, get_db, get_db_leitura, get_shards_leitura
 
     engine = create_engine(
         "sqlite://",
@@ -30,6 +50,13 @@ def db_test_client():
             db.close()
 
     db_app.dependency_overrides[get_db] = override_get_db
+    db_app.dependency_overrides[get_db_leitura] = override_get_db
+
+    def override_get_shards():
+        for db in override_get_db():
+            yield [db]
+
+    db_app.dependency_overrides[get_shards_leitura] = override_get_shards
     client = TestClient(db_app)
     try:
         yield client
@@ -96,7 +123,7 @@ async def api_async_client():
                 "score_credito": 10.0,
             }
 
-        async def atualizar_conta(self, agencia, numero_conta, payload):
+        async def atualizar_conta(self, agencia, numero_conta, payload, if_match=None):
             base = await self.obter_conta(agencia, numero_conta)
             base.update(payload)
             return base
@@ -110,7 +137,7 @@ async def api_async_client():
         async def sacar(self, payload):
             return await self.obter_conta(payload["agencia"], payload["numero_conta"])
 
-        async def cadastrar_cheque_especial(self, id_, payload):
+        async def cadastrar_cheque_especial(self, id_, payload, if_match=None):
             base = await self.obter_conta(payload["agencia"], payload["numero_conta"])
             base.update({
                 "cheque_especial_contratado": payload.get("habilitado", False),
@@ -0,0 +1,87 @@
+
+import pytest
+import httpx
+
+from clientes_api.app.services.db_conta import DbConta
+
+def _criar(c):
+    r = c.post("/contas", json={
+        "agencia": "0101", "numero_conta": "9999", "nome": "Ca", "cpf": "01010101010",
+        "telefone": 11999999999, "email": "c@ex.com", "saldo_cc": 0.0,
+        "cheque_especial_contratado": True, "limite_cheque_especial": 100.0,
+    })
+    assert r.status_code == 201
+    c.post("/contas/operacoes/sacar", json={"agencia": "0101", "numero_conta": "9999", "saldo": 40.0})
+
+def test_fields_seleciona_colunas_e_calcula_derivados(db_test_client):
+    c = db_test_client
+    _criar(c)
+
+    r = c.get("/contas/0101/9999", params={"fields": "saldo_cc,limite_atual"})
+    assert r.status_code == 200
+    assert r.json() == {"saldo_cc": -40.0, "limite_atual": 60.0}
+
+    r = c.get("/contas", params={"fields": "numero_conta, score_credito,cheque_especial_contratado"})
+    assert r.json() == [{"numero_conta": "9999", "score_credito": 0.0, "cheque_especial_contratado": True}]
+
+    # mesmos valores do formato completo
+    completo = c.get("/contas/0101/9999").json()
+    parcial = c.get("/contas/0101/9999", params={"fields": ",".join(completo)}).json()
+    assert parcial == completo
+
+def test_fields_invalidos_e_404(db_test_client):
+    c = db_test_client
+    _criar(c)
+    for fields in ("saldo_cc,senha", ",", ""):
+        r = c.get("/contas", params={"fields": fields})
+        assert r.status_code == 422
+        assert r.json()["detail"]["code"] == "CAMPOS_INVALIDOS"
+
+    r = c.get("/contas/0101/0000", params={"fields": "saldo_cc"})
+    assert r.status_code == 404
+
+@pytest.mark.asyncio
+async def test_fields_no_gateway(api_async_client):
+    client, fake = api_async_client
+    pedidos = []
+
+    async def listar_campos(campos):
+        pedidos.append(campos)
+        return [{"saldo_cc": 1.0}]
+    async def obter_campos(ag, num, campos):
+        pedidos.append((ag, num, campos))
+        return {"saldo_cc": 1.0, "limite_atual": 0.0}
+    fake.listar_contas_campos = listar_campos
+    fake.obter_conta_campos = obter_campos
+
+    r = await client.get("/contas", params={"fields": "saldo_cc"})
+    assert r.json() == [{"saldo_cc": 1.0}]
+    r = await client.get("/contas/1234/5678", params={"fields": "saldo_cc,limite_atual,saldo_cc"})
+    assert r.json() == {"saldo_cc": 1.0, "limite_atual": 0.0}
+    assert pedidos == ["saldo_cc", ("1234", "5678", "saldo_cc,limite_atual")]
+
+    r = await client.get("/contas/1234/5678", params={"fields": "id,saldo_cc"})
+    assert r.status_code == 422
+    assert r.json()["detail"]["code"] == "CAMPOS_INVALIDOS"
+    r = await client.get("/contas", params={"fields": ""})
+    assert r.status_code == 422
+
+@pytest.mark.asyncio
+async def test_db_conta_metodos_com_fields(monkeypatch):
+    chamadas = []
+
+    class _Client:
+        async def __aenter__(self): return self
+        async def __aexit__(self, *a): pass
+        async def get(self, url, params=None, timeout=None):
+            chamadas.append((url, params))
+            return httpx.Response(200, json={}, request=httpx.Request("GET", url))
+
+    monkeypatch.setattr(httpx, "AsyncClient", _Client)
+    db = DbConta("http://fake")
+    await db.listar_contas_campos("saldo_cc")
+    await db.obter_conta_campos("1", "2", "nome")
+    assert chamadas == [
+        ("http://fake/contas", {"fields": "saldo_cc"}),
+        ("http://fake/contas/1/2", {"fields": "nome"}),
+    ]
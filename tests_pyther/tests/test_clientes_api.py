@@ -87,7 +87,7 @@ async def test_cheque_especial_api(api_async_client):
     async def obter_com_id(ag, num):
         return {"id": 99}
     fake.obter_conta = obter_com_id
-    async def cadastrar(id_, payload):
+    async def cadastrar(id_, payload, if_match=None):
         return {
             "agencia": payload["agencia"],
             "numero_conta": payload["numero_conta"],
@@ -112,16 +112,17 @@ async def test_cheque_especial_api(api_async_client):
 @pytest.mark.asyncio
 async def test_score_credito_api(api_async_client):
     client, fake = api_async_client
-    async def obter_pos(ag, num):
-        return {"saldo_cc": 200.0}
-    fake.obter_conta = obter_pos
+    async def score_pos(ag, num):
+        return {"agencia": ag, "numero_conta": num, "score_credito": 20.0, "percentil": 75.0}
+    fake.score_credito = score_pos
     r = await client.get("/contas/1234/5678/score_credito")
     assert r.status_code == 200
     assert r.json()["score_credito"] == 20.0
+    assert r.json()["percentil"] == 75.0
 
-    async def obter_neg(ag, num):
-        return {"saldo_cc": -10.0}
-    fake.obter_conta = obter_neg
+    async def score_neg(ag, num):
+        return {"agencia": ag, "numero_conta": num, "score_credito": 0.0, "percentil": 0.0}
+    fake.score_credito = score_neg
     r = await client.get("/contas/1234/5678/score_credito")
     assert r.status_code == 200
     assert r.json()["score_credito"] == 0.0
@@ -158,7 +159,7 @@ async def test_api_requesterror_por_endpoint(api_async_client):
     assert r.status_code == 503
 
     # 4) PUT /contas/{ag}/{num} -> atualizar_conta
-    async def boom_atualizar(ag, num, payload):
+    async def boom_atualizar(ag, num, payload, if_match=None):
         raise httpx.RequestError("unavailable", request=httpx.Request("PUT", "http://x"))
     fake.atualizar_conta = boom_atualizar
     r = await client.put("/contas/111/2222", json={"nome": "BB"})
@@ -196,7 +197,7 @@ async def test_api_requesterror_por_endpoint(api_async_client):
     async def ok_obter_id(ag, num):
         return {"id": 7}
     fake.obter_conta = ok_obter_id
-    async def boom_cheque(id_, payload=None):
+    async def boom_cheque(id_, payload=None, if_match=None):
         raise httpx.RequestError("unavailable", request=httpx.Request("PUT", "http://x"))
     fake.cadastrar_cheque_especial = boom_cheque
     r = await client.put("/contas/123/0000/cheque_especial/cadastrar", json={"habilitado": True, "limite": 10.0})
@@ -235,7 +236,7 @@ async def test_api_httpstatuserror_por_endpoint(api_async_client):
     assert r.json()["detail"]["code"] == "NAO"
 
     # 4) PUT /contas/{ag}/{num}
-    async def err_atualizar(ag, num, payload):
+    async def err_atualizar(ag, num, payload, if_match=None):
         raise _http_status_error(400, {"status": 400, "code": "REQ", "message": "inv"})
     fake.atualizar_conta = err_atualizar
     r = await client.put("/contas/111/2222", json={"nome": "CC"})
@@ -273,7 +274,7 @@ async def test_api_httpstatuserror_por_endpoint(api_async_client):
     async def ok_obter_id(ag, num):
         return {"id": 7}
     fake.obter_conta = ok_obter_id
-    async def err_cheque(id_, payload=None):
+    async def err_cheque(id_, payload=None, if_match=None):
         raise _http_status_error(400, {"status": 400, "code": "CHEQUE_ERR", "message": "..."})
     fake.cadastrar_cheque_especial = err_cheque
     r = await client.put("/contas/123/0000/cheque_especial/cadastrar", json={"habilitado": True, "limite": 10.0})
@@ -286,7 +287,7 @@ async def test_score_credito_httpstatuserror(api_async_client):
     client, fake = api_async_client
     async def boom(ag, num):
         raise _http_status_error(404, {"status": 404, "code": "NAO", "message": "sem"})
-    fake.obter_conta = boom
+    fake.score_credito = boom
     r = await client.get("/contas/111/2222/score_credito")
     assert r.status_code == 404
     assert r.json()["detail"]["code"] == "NAO"
@@ -0,0 +1,183 @@
+from datetime import date
+
+import httpx
+import pytest
+from sqlalchemy import create_engine
+
+from clientes_db.app.db import get_db
+from clientes_db.app.juros import acumular_juros
+from clientes_db.app.schema import preparar_schema
+
+CONTA = {
+    "agencia": "0001", "numero_conta": "0001", "nome": "Ana", "cpf": "12345678901",
+    "telefone": 11999999999, "email": "a@ex.com", "saldo_cc": 10.0,
+    "cheque_especial_contratado": True, "limite_cheque_especial": 100.0,
+}
+
+
+def _conta(numero, cpf, **extra):
+    return {**CONTA, "numero_conta": numero, "cpf": cpf, **extra}
+
+
+def _tudo(c, desde=None, limit=500):
+    itens = []
+    while True:
+        params = {"limit": limit}
+        if desde:
+            params["desde"] = desde
+        r = c.get("/contas/alteracoes", params=params)
+        assert r.status_code == 200
+        corpo = r.json()
+        itens += corpo["itens"]
+        desde = corpo["desde"]
+        if not corpo["tem_mais"]:
+            return itens, desde
+
+
+def test_alteracoes_desde_a_marca(db_test_client):
+    c = db_test_client
+    for i in range(3):
+        c.post("/contas", json=_conta(f"000{i}", f"1234567890{i}", saldo_cc=0.0))
+
+    itens, marca = _tudo(c, limit=2)
+    assert [i["numero_conta"] for i in itens] == ["0000", "0001", "0002"]
+    assert all(i["tipo"] == "ALTERADA" and i["conta"]["versao"] for i in itens)
+    # A marca de cada item continua logo depois dele.
+    r = c.get("/contas/alteracoes", params={"desde": itens[0]["desde"]}).json()
+    assert [i["numero_conta"] for i in r["itens"]] == ["0001", "0002"]
+    assert r["desde"] == itens[-1]["desde"] == marca
+    assert [i["alteracao"] for i in itens] == sorted(i["alteracao"] for i in itens)
+
+    # Sem escritas novas a mesma marca volta e a página vem vazia.
+    r = c.get("/contas/alteracoes", params={"desde": marca}).json()
+    assert r == {"itens": [], "desde": marca, "tem_mais": False}
+
+    op = {"agencia": "0001", "numero_conta": "0000", "saldo": 5.0}
+    c.post("/contas/operacoes/depositar", json=op)
+    c.delete("/contas/0001/0002/desativar")
+
+    itens, _ = _tudo(c, marca)
+    assert [(i["tipo"], i["numero_conta"]) for i in itens] == [
+        ("ALTERADA", "0000"), ("REMOVIDA", "0002"),
+    ]
+    assert itens[0]["conta"]["saldo_cc"] == 5.0
+    assert itens[1]["conta"] is None
+
+
+def test_alteracoes_incluem_juros_em_lote(db_test_client):
+    c = db_test_client
+    c.post("/contas", json=_conta("0001", "12345678901", saldo_cc=0.0))
+    c.post("/contas", json=_conta("0002", "12345678902"))
+    c.post("/contas/operacoes/sacar", json={"agencia": "0001", "numero_conta": "0001", "saldo": 10.0})
+    _, marca = _tudo(c)
+
+    db = next(c.app.dependency_overrides[get_db]())
+    acumular_juros(db, date(2024, 1, 1), 0.1)
+    db.close()
+
+    itens, _ = _tudo(c, marca)
+    assert [i["numero_conta"] for i in itens] == ["0001"]
+    assert itens[0]["conta"]["saldo_cc"] == -11.0
+
+
+def test_alteracoes_marca_invalida(db_test_client):
+    r = db_test_client.get("/contas/alteracoes", params={"desde": "xx"})
+    assert r.status_code == 422
+    assert r.json()["detail"]["code"] == "CURSOR_INVALIDO"
+
+
+def test_migracao_10_preenche_sequencia(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'v9.db'}")
+    preparar_schema(engine)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DROP TABLE contas_removidas")
+        conn.exec_driver_sql("DROP INDEX ix_contas_alteracao")
+        conn.exec_driver_sql("ALTER TABLE contas DROP COLUMN alteracao")
+        conn.exec_driver_sql(
+            "INSERT INTO contas (id, agencia, numero_conta, nome, cpf, telefone, email, "
+            "correntista, saldo_centavos, cheque_especial_contratado, limite_centavos, versao) "
+            "VALUES (7, '0001', '0001', 'Ana', '1', 1, 'a@a', 1, 0, 0, 0, 'v')"
+        )
+        conn.exec_driver_sql("PRAGMA user_version = 9")
+
+    preparar_schema(engine)
+
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT alteracao FROM contas").scalar() == 7
+        plano = conn.exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT id FROM contas WHERE (alteracao, id) > (1, 1) "
+            "ORDER BY alteracao, id"
+        ).all()
+        assert "ix_contas_alteracao" in str(plano)
+        assert conn.exec_driver_sql("SELECT count(*) FROM contas_removidas").scalar() == 0
+
+
+
+@pytest.mark.asyncio
+async def test_alteracoes_no_gateway(api_async_client):
+    client, fake = api_async_client
+    pedidos = []
+
+    async def alteracoes(params):
+        pedidos.append(params)
+        conta = await fake.obter_conta("1234", "5678")
+        return {
+            "itens": [
+                {"tipo": "ALTERADA", "agencia": "1234", "numero_conta": "5678",
+                 "conta": {**conta, "id": 1, "versao": "v"}, "alteracao": 1, "desde": "m1a"},
+                {"tipo": "REMOVIDA", "agencia": "1234", "numero_conta": "9999", "conta": None,
+                 "alteracao": 2, "desde": "m2"},
+            ],
+            "desde": "m2",
+            "tem_mais": False,
+        }
+    fake.alteracoes = alteracoes
+
+    r = await client.get("/contas/alteracoes", params={"desde": "m1", "limit": 10})
+    assert r.status_code == 200
+    corpo = r.json()
+    assert pedidos == [{"limit": 10, "desde": "m1"}]
+    assert corpo["desde"] == "m2"
+    assert "id" not in corpo["itens"][0]["conta"]
+    assert corpo["itens"][1]["conta"] is None
+
+
+@pytest.mark.asyncio
+async def test_alteracoes_no_gateway_com_erro_do_clientes_db(api_async_client):
+    client, fake = api_async_client
+    pedidos = []
+
+    async def marca_invalida(params):
+        pedidos.append(params)
+        resposta = httpx.Response(422, json={"detail": {
+            "status": 422, "code": "CURSOR_INVALIDO", "message": "Cursor de paginação inválido",
+        }}, request=httpx.Request("GET", "http://db/contas/alteracoes"))
+        raise httpx.HTTPStatusError("422", request=resposta.request, response=resposta)
+
+    fake.alteracoes = marca_invalida
+    r = await client.get("/contas/alteracoes", params={"desde": "xx"})
+    assert r.status_code == 422
+    assert r.json()["detail"]["code"] == "CURSOR_INVALIDO"
+
+    async def fora_do_ar(params):
+        pedidos.append(params)
+        raise httpx.ConnectError("recusada", request=httpx.Request("GET", "http://db"))
+
+    fake.alteracoes = fora_do_ar
+    r = await client.get("/contas/alteracoes")
+    assert r.status_code == 503
+    assert r.json()["detail"]["code"] == "CLIENTES_DB_INDISPONIVEL"
+    # Sem marca, o gateway não manda "desde".
+    assert pedidos == [{"limit": 500, "desde": "xx"}, {"limit": 500}]
+
+
+def test_remocao_da_conta_alterada_por_ultimo(db_test_client):
+    c = db_test_client
+    c.post("/contas", json=_conta("0000", "12345678900", saldo_cc=0.0))
+    c.post("/contas", json=_conta("0001", "12345678901", saldo_cc=0.0))
+    # A marca termina exatamente na última alteração da conta removida.
+    _, marca = _tudo(c)
+    c.delete("/contas/0001/0001/desativar")
+
+    itens, _ = _tudo(c, marca)
+    assert [(i["tipo"], i["numero_conta"]) for i in itens] == [("REMOVIDA", "0001")]
@@ -0,0 +1,65 @@
+
+import pytest
+
+def _criar(c, i, nome, email):
+    r = c.post("/contas", json={
+        "agencia": "0001", "numero_conta": f"{i:04d}", "nome": nome,
+        "cpf": f"{i:011d}", "telefone": 11999999999, "email": email,
+    })
+    assert r.status_code == 201, r.text
+
+@pytest.fixture
+def cliente_com_contas(db_test_client):
+    c = db_test_client
+    _criar(c, 1, "Maria Silva", "maria@ex.com")
+    _criar(c, 2, "mariana Souza", "mariana@ex.com")
+    _criar(c, 3, "Marcos Lima", "MARCOS@ex.com")
+    _criar(c, 4, "Zoe Maria", "zoe@ex.com")
+    _criar(c, 5, "Maria Alves", "maria.alves@ex.com")
+    return c
+
+def test_busca_por_cpf(cliente_com_contas):
+    r = cliente_com_contas.get("/contas/busca", params={"cpf": "00000000003"})
+    assert r.status_code == 200
+    body = r.json()
+    assert [c["nome"] for c in body["itens"]] == ["Marcos Lima"]
+    assert body["proximo"] is None
+
+def test_busca_por_email_sem_diferenciar_maiusculas(cliente_com_contas):
+    r = cliente_com_contas.get("/contas/busca", params={"email": "marcos@EX.com"})
+    assert [c["numero_conta"] for c in r.json()["itens"]] == ["0003"]
+
+def test_busca_por_prefixo_do_nome_paginada(cliente_com_contas):
+    c = cliente_com_contas
+    r = c.get("/contas/busca", params={"nome": "MARI", "limit": 2})
+    body = r.json()
+    assert [x["nome"] for x in body["itens"]] == ["Maria Alves", "Maria Silva"]
+    assert body["proximo"]
+
+    r = c.get("/contas/busca", params={"nome": "MARI", "limit": 2, "after": body["proximo"]})
+    body = r.json()
+    assert [x["nome"] for x in body["itens"]] == ["mariana Souza"]
+    assert body["proximo"] is None
+
+    r = c.get("/contas/busca", params={"nome": "z"})
+    assert [x["nome"] for x in r.json()["itens"]] == ["Zoe Maria"]
+
+def test_busca_paginada_por_id_com_filtros_combinados(cliente_com_contas):
+    c = cliente_com_contas
+    _criar(c, 6, "Outra Maria", "maria@ex.com")
+    r = c.get("/contas/busca", params={"email": "maria@ex.com", "limit": 1})
+    body = r.json()
+    assert [x["numero_conta"] for x in body["itens"]] == ["0001"]
+    r = c.get("/contas/busca", params={"email": "maria@ex.com", "limit": 1, "after": body["proximo"]})
+    assert [x["numero_conta"] for x in r.json()["itens"]] == ["0006"]
+
+def test_busca_sem_filtro_ou_cursor_invalido(cliente_com_contas):
+    c = cliente_com_contas
+    r = c.get("/contas/busca")
+    assert r.status_code == 422
+    assert r.json()["detail"]["code"] == "FILTRO_OBRIGATORIO"
+
+    for cursor in ("nao-e-base64!!", "WzFd"):  # "WzFd" = [1], tamanho errado para nome
+        r = c.get("/contas/busca", params={"nome": "Ma", "after": cursor})
+        assert r.status_code == 422
+        assert r.json()["detail"]["code"] == "CURSOR_INVALIDO"
@@ -18,8 +18,8 @@ def test_cheque_especial_retorno_final():
     conta = Conta(
         agencia="8888", numero_conta="1234", nome="Carla",
         cpf="99999999999", telefone=11999999999, email="c@ex.com",
-        correntista=True, saldo_cc=0.0,
-        cheque_especial_contratado=False, limite_cheque_especial=0.0
+        correntista=True, saldo_centavos=0,
+        cheque_especial_contratado=False, limite_centavos=0
     )
     db.add(conta); db.commit(); db.refresh(conta)
 
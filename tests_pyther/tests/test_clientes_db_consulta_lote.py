@@ -0,0 +1,96 @@
+
+import pytest
+import httpx
+
+from clientes_db.app.routers import contas as rotas_db
+from clientes_api.app.services import db_conta as db_conta_mod
+from clientes_api.app.services.db_conta import DbConta
+
+def _criar(c, i):
+    r = c.post("/contas", json={
+        "agencia": f"{i % 2 + 1:04d}", "numero_conta": f"{i:04d}", "nome": "Cliente",
+        "cpf": f"{i:011d}", "telefone": 11999999999, "email": "c@ex.com", "saldo_cc": float(i),
+    })
+    assert r.status_code == 201, r.text
+
+def test_consulta_lote_encontradas_e_faltantes(db_test_client, monkeypatch):
+    c = db_test_client
+    for i in range(1, 8):
+        _criar(c, i)
+    monkeypatch.setattr(rotas_db, "TAMANHO_LOTE_CHAVES", 3)
+
+    chaves = [{"agencia": f"{i % 2 + 1:04d}", "numero_conta": f"{i:04d}"} for i in (7, 1, 2, 3, 4, 5, 6)]
+    chaves += [{"agencia": "0009", "numero_conta": "0001"}, {"agencia": "0001", "numero_conta": "0001"}]
+
+    r = c.post("/contas/consulta-lote", json={"chaves": chaves})
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert [x["numero_conta"] for x in body["encontradas"]] == ["0007", "0001", "0002", "0003", "0004", "0005", "0006"]
+    assert body["encontradas"][0]["saldo_cc"] == 7.0
+    assert body["faltantes"] == [
+        {"agencia": "0009", "numero_conta": "0001"},
+        {"agencia": "0001", "numero_conta": "0001"},
+    ]
+
+def test_consulta_lote_chaves_repetidas_e_validacao(db_test_client):
+    c = db_test_client
+    _criar(c, 1)
+    chave = {"agencia": "0002", "numero_conta": "0001"}
+    r = c.post("/contas/consulta-lote", json={"chaves": [chave, chave]})
+    assert len(r.json()["encontradas"]) == 1
+
+    r = c.post("/contas/consulta-lote", json={"chaves": []})
+    assert r.status_code == 422
+
+@pytest.mark.asyncio
+async def test_db_conta_consulta_lote_quebra_em_lotes(monkeypatch):
+    enviados = []
+
+    class _Client:
+        async def __aenter__(self): return self
+        async def __aexit__(self, *a): pass
+        async def post(self, url, json=None, timeout=None):
+            enviados.append([k["numero_conta"] for k in json["chaves"]])
+            encontradas = [k for k in json["chaves"] if int(k["numero_conta"]) % 2]
+            faltantes = [k for k in json["chaves"] if not int(k["numero_conta"]) % 2]
+            return httpx.Response(200, json={"encontradas": encontradas, "faltantes": faltantes},
+                                  request=httpx.Request("POST", url))
+
+    monkeypatch.setattr(httpx, "AsyncClient", _Client)
+    monkeypatch.setattr(db_conta_mod, "LOTE_CHAVES", 2)
+
+    chaves = [{"agencia": "0001", "numero_conta": f"{i:04d}"} for i in range(1, 6)]
+    out = await DbConta("http://fake").consultar_lote(chaves)
+    assert enviados == [["0001", "0002"], ["0003", "0004"], ["0005"]]
+    assert [k["numero_conta"] for k in out["encontradas"]] == ["0001", "0003", "0005"]
+    assert [k["numero_conta"] for k in out["faltantes"]] == ["0002", "0004"]
+
+@pytest.mark.asyncio
+async def test_consulta_lote_gateway(api_async_client):
+    client, fake = api_async_client
+
+    async def consultar(chaves):
+        conta = await fake.obter_conta(chaves[0]["agencia"], chaves[0]["numero_conta"])
+        return {"encontradas": [conta], "faltantes": chaves[1:]}
+    fake.consultar_lote = consultar
+
+    r = await client.post("/contas/consulta-lote", json={"chaves": [
+        {"agencia": "1234", "numero_conta": "5678"}, {"agencia": "1234", "numero_conta": "0000"}
+    ]})
+    assert r.status_code == 200
+    body = r.json()
+    assert "id" not in body["encontradas"][0]
+    assert body["faltantes"] == [{"agencia": "1234", "numero_conta": "0000"}]
+
+    async def fora(chaves):
+        raise httpx.RequestError("unavailable", request=httpx.Request("POST", "http://x"))
+    fake.consultar_lote = fora
+    r = await client.post("/contas/consulta-lote", json={"chaves": [{"agencia": "1234", "numero_conta": "5678"}]})
+    assert r.status_code == 503
+
+    async def erro(chaves):
+        req = httpx.Request("POST", "http://x")
+        raise httpx.HTTPStatusError("err", request=req, response=httpx.Response(422, json={"detail": "x"}))
+    fake.consultar_lote = erro
+    r = await client.post("/contas/consulta-lote", json={"chaves": [{"agencia": "1234", "numero_conta": "5678"}]})
+    assert r.status_code == 422
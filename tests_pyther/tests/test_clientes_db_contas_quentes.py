@@ -0,0 +1,151 @@
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException, Request
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from clientes_db.app import quentes
+from clientes_db.app.db import abrir_sessao, iniciar_escrita, operacao_quente, shard_da_agencia
+from clientes_db.app.main import app
+from clientes_db.app.models import Conta, Movimentacao, ResumoAgencia
+from clientes_db.app.repositorio import RepositorioSQL
+from clientes_db.app.resumo import CAMPOS, contribuicao
+from clientes_db.app.routers.contas import _conferir_saque
+
+
+@pytest.fixture
+def conta_quente(request, monkeypatch):
+    agencia, numero = request.param, "0001"
+    monkeypatch.setattr(quentes, "CONTAS_QUENTES", frozenset({(agencia, numero)}))
+    db = abrir_sessao(shard_da_agencia(agencia))
+    try:
+        iniciar_escrita(db)
+        conta = RepositorioSQL(db).criar(Conta(
+            agencia=agencia, numero_conta=numero, nome="Loja", cpf=f"4714714{agencia}",
+            telefone=11999999999, email="loja@ex.com", saldo_centavos=0,
+            cheque_especial_contratado=True, limite_centavos=5_000,
+        ))
+    finally:
+        db.close()
+    return conta
+
+
+@pytest.mark.parametrize("conta_quente", ["0471"], indirect=True)
+def test_lote_da_conta_quente_confere_cada_saque(conta_quente):
+    confirmados = []
+
+    def operar(valor, conferir):
+        db = abrir_sessao(shard_da_agencia("0471"))
+        try:
+            for _ in range(40):
+                try:
+                    RepositorioSQL(db).movimentar("0471", "0001", "X", valor, conferir)
+                    confirmados.append(valor)
+                except HTTPException as e:
+                    assert e.detail["code"] == "CHEQUE_ESPECIAL_EXCEDIDO"
+        finally:
+            db.close()
+
+    threads = [
+        threading.Thread(target=operar, args=a)
+        for a in ((100, None), (-300, _conferir_saque)) * 4
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    db = abrir_sessao(shard_da_agencia("0471"), leitura=True)
+    try:
+        conta = db.get(Conta, conta_quente.id)
+        assert conta.saldo_centavos == sum(confirmados) >= -5_000
+        extrato = db.scalars(
+            select(Movimentacao).where(Movimentacao.conta_id == conta.id).order_by(Movimentacao.id)
+        ).all()
+        # Uma linha por operação, com o saldo corrente de cada uma.
+        saldo = 0
+        for m in extrato:
+            saldo += m.valor_centavos
+            assert m.saldo_apos_centavos == saldo >= -5_000
+        assert len(extrato) == len(confirmados)
+        resumo = db.get(ResumoAgencia, "0471")
+        assert tuple(getattr(resumo, c) for c in CAMPOS) == contribuicao(conta)
+    finally:
+        db.close()
+
+
+@pytest.mark.parametrize("conta_quente", ["0472"], indirect=True)
+def test_rotas_da_conta_quente(conta_quente):
+    client = TestClient(app)
+    op = {"agencia": "0472", "numero_conta": "0001"}
+    r = client.post("/contas/operacoes/depositar", json={**op, "saldo": 10.0})
+    assert r.json()["saldo_cc"] == 10.0
+    r = client.post("/contas/operacoes/sacar", json={**op, "saldo": 70.0})
+    assert r.json()["detail"]["code"] == "CHEQUE_ESPECIAL_EXCEDIDO"
+    r = client.post("/contas/operacoes/sacar", json={**op, "saldo": 40.0})
+    assert r.json()["saldo_cc"] == -30.0
+    assert r.json()["limite_atual"] == 20.0
+    assert client.get("/contas/0472/0001").headers["etag"] == r.headers["etag"]
+    r = client.post("/contas/operacoes/depositar", json={"agencia": "0472", "numero_conta": "0002", "saldo": 1.0})
+    assert r.status_code == 404
+
+
+def test_falha_do_lote_e_proximo_lider():
+    gravando, liberar = threading.Event(), threading.Event()
+    lotes, resultados = [], {}
+
+    def gravar_lote(lote):
+        lotes.append([op.valor_centavos for op in lote])
+        if len(lotes) == 1:
+            gravando.set()
+            liberar.wait()
+            raise RuntimeError("disco cheio")
+        for op in lote:
+            op.resultado = op.valor_centavos
+
+    def operar(valor):
+        try:
+            resultados[valor] = quentes.combinar(
+                "0474", "0001", quentes.Operacao("DEPOSITO", valor, None), gravar_lote
+            )
+        except RuntimeError as e:
+            resultados[valor] = str(e)
+
+    threads = [threading.Thread(target=operar, args=(v,)) for v in (1, 2, 3)]
+    threads[0].start()
+    gravando.wait()
+    # Chegam enquanto o primeiro lote grava: a primeira delas lidera o próximo.
+    for t in threads[1:]:
+        t.start()
+    while len(quentes._fila("0474", "0001").operacoes) < 2:
+        time.sleep(0.001)
+    liberar.set()
+    for t in threads:
+        t.join()
+
+    assert lotes == [[1], [2, 3]]
+    assert resultados == {1: "disco cheio", 2: 2, 3: 3}
+
+
+def test_conta_quente_inexistente(monkeypatch):
+    monkeypatch.setattr(quentes, "CONTAS_QUENTES", frozenset({("0475", "0001")}))
+    db = abrir_sessao(shard_da_agencia("0475"))
+    try:
+        assert RepositorioSQL(db).movimentar("0475", "0001", "DEPOSITO", 100) is None
+    finally:
+        db.close()
+
+
+async def test_corpo_invalido_nao_e_operacao_quente(monkeypatch):
+    monkeypatch.setattr(quentes, "CONTAS_QUENTES", frozenset({("0476", "0001")}))
+
+    async def receber():
+        return {"type": "http.request", "body": b"{", "more_body": False}
+
+    request = Request({
+        "type": "http", "method": "POST", "path": "/contas/operacoes/depositar",
+        "headers": [], "path_params": {},
+    }, receber)
+    assert await operacao_quente(request) is False
@@ -7,6 +7,7 @@ from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException
 
 from clientes_db.app.db import Base
+from clientes_db.app.repositorio import RepositorioSQL
 from clientes_db.app.schemas import ContaCreate
 from clientes_db.app.routers.contas import criar_conta
 
@@ -30,7 +31,7 @@ def test_criar_conta_integrityerror_no_commit(monkeypatch):
     monkeypatch.setattr(db, "commit", bad_commit)
 
     with pytest.raises(HTTPException) as exc:
-        criar_conta(body=body, db=db)
+        criar_conta(body=body, repo=RepositorioSQL(db))
     assert exc.value.status_code == 409
     assert exc.value.detail["code"] == "CONFLITO_UNICO"
 
@@ -0,0 +1,143 @@
+
+import random
+
+import pytest
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from clientes_db.app.db import Base
+from clientes_db.app.dinheiro import para_centavos, para_reais
+from clientes_db.app.models import Conta, Movimentacao
+from clientes_db.app.repositorio import RepositorioSQL
+from clientes_db.app.resumo import recalcular_resumo
+from clientes_db.app.routers.contas import (
+    criar_conta,
+    depositar,
+    desativar_conta,
+    sacar,
+)
+from clientes_db.app.schemas import ContaCreate, OperacaoPorChaves
+
+def _session_mem():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine, autocommit=False, autoflush=False)()
+
+def test_conversao_ida_e_volta_e_exata():
+    rnd = random.Random(35)
+    for _ in range(5000):
+        centavos = rnd.randint(-10**11, 10**11)
+        assert para_centavos(para_reais(centavos)) == centavos
+
+def test_conversao_arredonda_meio_centavo_para_cima():
+    assert para_centavos(0.285) == 29
+    assert para_centavos(1.005) == 101
+    assert para_centavos(0.1 + 0.2) == 30
+    assert para_centavos(-0.285) == -29
+    assert para_centavos(0.004) == 0
+
+def test_saldo_bate_com_soma_das_operacoes():
+    db = _session_mem()
+    rnd = random.Random(2026)
+    conta = criar_conta(body=ContaCreate(
+        agencia="0001", numero_conta="0001", nome="Ana", cpf="12345678901",
+        telefone=11999999999, email="a@a.com", saldo_cc=0.0,
+        cheque_especial_contratado=True, limite_cheque_especial=1000.0,
+    ), repo=RepositorioSQL(db))
+
+    for _ in range(400):
+        valor = rnd.randint(1, 50000) / 100
+        op = OperacaoPorChaves(agencia="0001", numero_conta="0001", saldo=valor)
+        try:
+            (depositar if rnd.random() < 0.5 else sacar)(body=op, repo=RepositorioSQL(db))
+        except HTTPException:
+            db.rollback()
+
+    conta = db.get(Conta, conta["id"])
+    esperado = db.query(func.sum(Movimentacao.valor_centavos)).scalar()
+    assert conta.saldo_centavos == esperado
+    assert conta.saldo_centavos >= -100000
+    assert recalcular_resumo(db, aplicar=False)["divergencias"] == []
+
+def test_dez_depositos_de_dez_centavos_zeram_sem_resto():
+    # Em float, 0.1 somado 10 vezes não dá 1.0 e a conta não podia ser
+    # desativada depois do saque.
+    db = _session_mem()
+    criar_conta(body=ContaCreate(
+        agencia="0001", numero_conta="0002", nome="Bia", cpf="12345678902",
+        telefone=11999999999, email="b@b.com",
+    ), repo=RepositorioSQL(db))
+    op = OperacaoPorChaves(agencia="0001", numero_conta="0002", saldo=0.1)
+    for _ in range(10):
+        depositar(body=op, repo=RepositorioSQL(db))
+
+    out = sacar(body=OperacaoPorChaves(agencia="0001", numero_conta="0002", saldo=1.0), repo=RepositorioSQL(db))
+    assert out["saldo_cc"] == 0.0
+    desativar_conta(agencia="0001", numero_conta="0002", repo=RepositorioSQL(db))
+    assert db.query(Conta).count() == 0
+
+def test_valor_abaixo_de_um_centavo_e_recusado(db_test_client):
+    c = db_test_client
+    c.post("/contas", json={
+        "agencia": "0001", "numero_conta": "0003", "nome": "Caio", "cpf": "12345678903",
+        "telefone": 11999999999, "email": "c@ex.com", "saldo_cc": 10.0,
+    })
+    r = c.post("/contas/operacoes/depositar", json={"agencia": "0001", "numero_conta": "0003", "saldo": 0.004})
+    assert r.status_code == 422
+    assert r.json()["detail"]["code"] == "VALOR_INVALIDO"
+
+    r = c.post("/contas/operacoes/sacar", json={"agencia": "0001", "numero_conta": "0003", "saldo": 0.005})
+    assert r.json()["saldo_cc"] == 9.99
+
+def _enviar_json(client, metodo, rota, corpo: str):
+    # Corpo escrito à mão, com os números exatamente como o cliente mandaria.
+    return client.request(metodo, rota, content=corpo, headers={"Content-Type": "application/json"})
+
+def test_valores_fora_do_limite_sao_recusados(db_test_client):
+    c = db_test_client
+    c.post("/contas", json={
+        "agencia": "0351", "numero_conta": "0001", "nome": "Ana", "cpf": "35135135101",
+        "telefone": 11999999999, "email": "d@ex.com", "saldo_cc": 10.0,
+        "cheque_especial_contratado": True, "limite_cheque_especial": 10.0,
+    })
+    chave = '"agencia": "0351", "numero_conta": "0001"'
+    for valor in ("Infinity", "NaN", "1e300", "1e20"):
+        for rota in ("/contas/operacoes/depositar", "/contas/operacoes/sacar"):
+            r = _enviar_json(c, "POST", rota, f'{{{chave}, "saldo": {valor}}}')
+            assert r.status_code == 422, (rota, valor)
+            assert r.json()["detail"]["code"] == "VALIDACAO_REQUISICAO"
+        r = _enviar_json(c, "POST", "/contas", (
+            '{"agencia": "0351", "numero_conta": "0002", "nome": "Bia", "cpf": "35135135102",'
+            f' "telefone": 11999999999, "email": "e@ex.com", "saldo_cc": {valor}}}'
+        ))
+        assert r.status_code == 422, valor
+        r = _enviar_json(
+            c, "PUT", "/contas/1/cheque_especial/cadastrar",
+            f'{{"habilitado": true, "limite": {valor}}}',
+        )
+        assert r.status_code == 422, valor
+    assert c.get("/contas/0351/0001").json()["saldo_cc"] == 10.0
+
+def test_deposito_que_estouraria_o_saldo():
+    db = _session_mem()
+    conta = criar_conta(body=ContaCreate(
+        agencia="0352", numero_conta="0001", nome="Ana", cpf="35235235201",
+        telefone=11999999999, email="d@ex.com", saldo_cc=0.0,
+    ), repo=RepositorioSQL(db))
+    db.get(Conta, conta["id"]).saldo_centavos = 2**63 - 100
+    db.commit()
+
+    op = dict(agencia="0352", numero_conta="0001")
+    with pytest.raises(HTTPException) as erro:
+        depositar(body=OperacaoPorChaves(**op, saldo=1.0), repo=RepositorioSQL(db))
+    assert erro.value.status_code == 422
+    assert erro.value.detail["code"] == "SALDO_ACIMA_DO_MAXIMO"
+    db.rollback()
+    depositar(body=OperacaoPorChaves(**op, saldo=0.99), repo=RepositorioSQL(db))
+    assert db.get(Conta, conta["id"]).saldo_centavos == 2**63 - 1
+    # Sem conferência o repositório só soma; o limite é regra da rota.
+    conta = RepositorioSQL(db).movimentar("0352", "0001", "SAQUE", -99)
+    assert conta.saldo_centavos == 2**63 - 100
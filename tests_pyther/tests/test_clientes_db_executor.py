@@ -0,0 +1,85 @@
+import asyncio
+
+import anyio
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from clientes_db.app import db as db_mod
+from clientes_db.app.main import app
+from clientes_db.app.schema import preparar_schema
+
+CONTA = {
+    "agencia": "0404", "numero_conta": "4040", "nome": "Ana", "cpf": "40404040404",
+    "telefone": 11999999999, "email": "exec@ex.com", "saldo_cc": 10.0,
+}
+
+def test_metricas_do_executor():
+    with TestClient(app) as c:
+        c.post("/contas", json=CONTA)
+        assert c.get("/contas/0404/4040").status_code == 200
+
+        m = c.get("/interno/metricas/executor").json()
+
+    assert m["workers"] == db_mod.WORKERS
+    assert m["pool_tamanho"] == db_mod.POOL_SIZE
+    assert m["pool_leitura_tamanho"] == db_mod.engine_leitura.pool.size()
+    assert m["workers_ativos"] == 0 and m["aguardando_thread"] == 0
+    assert m["espera_conexao"]["amostras"] >= 2
+    assert m["espera_fila"]["amostras"] >= 2
+    assert m["espera_fila"]["max_ms"] >= m["espera_fila"]["media_ms"] >= 0
+
+def test_pool_do_tamanho_configurado():
+    assert db_mod._argumentos_pool("sqlite:///x.db") == {
+        "pool_size": db_mod.POOL_SIZE, "max_overflow": 0,
+    }
+    assert db_mod._argumentos_pool("sqlite:///x.db", 3)["pool_size"] == 3
+    # Em memória o SingletonThreadPool não aceita tamanho nem overflow.
+    assert db_mod._argumentos_pool("sqlite://") == {}
+
+@pytest.mark.asyncio
+async def test_threads_iguais_ao_pool_nao_travam(tmp_path, monkeypatch):
+    # Pool e threads do mesmo tamanho, com muito mais requisições que os dois:
+    # quem já tem conexão precisa de outra thread para validar a resposta,
+    # então ninguém pode ficar parado no checkout segurando uma thread.
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'exec.db'}",
+        connect_args={"check_same_thread": False},
+        pool_size=2, max_overflow=0, pool_timeout=2,
+    )
+    preparar_schema(engine)
+    fabrica = sessionmaker(bind=engine, autoflush=False)
+    monkeypatch.setattr(db_mod, "SessionLocal", fabrica)
+    monkeypatch.setattr(db_mod, "SessionLeitura", fabrica)
+    monkeypatch.setattr(app.state, "vagas_conexao", asyncio.Semaphore(2), raising=False)
+    monkeypatch.setattr(app.state, "vagas_leitura", asyncio.Semaphore(2), raising=False)
+
+    monkeypatch.setattr(db_mod, "_limitador_banco", anyio.CapacityLimiter(2))
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+        assert (await client.post("/contas", json=CONTA)).status_code == 201
+        respostas = await asyncio.wait_for(
+            asyncio.gather(*(client.get("/contas/0404/4040") for _ in range(40))), 10
+        )
+
+    assert [r.status_code for r in respostas] == [200] * 40
+
+
+def test_rotas_no_limitador_do_banco(monkeypatch):
+    usados = []
+    original = db_mod.limitador_banco
+
+    def limitador():
+        usados.append(original())
+        return usados[-1]
+
+    monkeypatch.setattr(db_mod, "limitador_banco", limitador)
+    with TestClient(app) as c:
+        c.post("/contas", json=CONTA)
+        assert c.get("/contas/0404/4040").status_code == 200
+
+    # Sessão e endpoint das duas rotas: ao menos quatro passagens pelo limitador.
+    assert len(usados) >= 4
+    assert all(u.total_tokens == db_mod.WORKERS for u in usados)
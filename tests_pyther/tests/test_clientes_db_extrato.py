@@ -0,0 +1,92 @@
+
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from clientes_db.app.db import Base
+from clientes_db.app.models import Conta, Movimentacao
+from clientes_db.app.routers.contas import extrato
+
+def _session_mem():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine, autocommit=False, autoflush=False)()
+
+def _conta_com_historico(db):
+    conta = Conta(
+        agencia="1234", numero_conta="0001", nome="Ana", cpf="12345678901",
+        telefone=11999999999, email="a@a.com", saldo_centavos=6000
+    )
+    db.add(conta); db.flush()
+    saldo = 0
+    for dia, valor in [(1, 10000), (2, -1000), (3, -2000), (4, 500), (5, -1500)]:
+        saldo += valor
+        db.add(Movimentacao(
+            conta_id=conta.id, tipo="DEPOSITO" if valor > 0 else "SAQUE",
+            valor_centavos=valor, saldo_apos_centavos=saldo, criado_em=datetime(2026, 1, dia, 12)
+        ))
+    db.commit()
+    return conta
+
+def test_extrato_periodo_usa_saldo_de_abertura_do_checkpoint():
+    db = _session_mem()
+    _conta_com_historico(db)
+
+    out = extrato("1234", "0001", desde=datetime(2026, 1, 3), ate=datetime(2026, 1, 4, 23), after=None, limit=50, db=db)
+    assert out["saldo_inicial"] == 90.0
+    assert [m["valor"] for m in out["movimentacoes"]] == [-20.0, 5.0]
+    assert out["proximo"] is None
+
+def test_extrato_paginacao_por_cursor():
+    db = _session_mem()
+    _conta_com_historico(db)
+
+    p1 = extrato("1234", "0001", desde=None, ate=None, after=None, limit=2, db=db)
+    assert p1["saldo_inicial"] == 0.0
+    assert [m["valor"] for m in p1["movimentacoes"]] == [100.0, -10.0]
+    assert p1["proximo"] == p1["movimentacoes"][-1]["id"]
+
+    p2 = extrato("1234", "0001", desde=None, ate=None, after=p1["proximo"], limit=2, db=db)
+    assert p2["saldo_inicial"] == 90.0
+    assert [m["valor"] for m in p2["movimentacoes"]] == [-20.0, 5.0]
+
+    p3 = extrato("1234", "0001", desde=None, ate=None, after=p2["proximo"], limit=2, db=db)
+    assert [m["saldo_apos"] for m in p3["movimentacoes"]] == [60.0]
+    assert p3["proximo"] is None
+
+def test_extrato_cursor_de_outra_conta_e_invalido():
+    db = _session_mem()
+    _conta_com_historico(db)
+    outra = Conta(
+        agencia="1234", numero_conta="0002", nome="Bia", cpf="12345678902",
+        telefone=11999999999, email="b@b.com"
+    )
+    db.add(outra); db.commit()
+
+    with pytest.raises(HTTPException) as exc:
+        extrato("1234", "0002", desde=None, ate=None, after=1, limit=10, db=db)
+    assert exc.value.status_code == 422
+    assert exc.value.detail["code"] == "CURSOR_INVALIDO"
+
+def test_extrato_http_com_timezone(db_test_client):
+    c = db_test_client
+    c.post("/contas", json={
+        "agencia": "0101", "numero_conta": "9999", "nome": "Ca", "cpf": "01010101010",
+        "telefone": 11999999999, "email": "c@ex.com", "saldo_cc": 10.0,
+    })
+    c.post("/contas/operacoes/depositar", json={"agencia": "0101", "numero_conta": "9999", "saldo": 5.0})
+
+    r = c.get("/contas/0101/9999/extrato", params={"desde": "2000-01-01T00:00:00-03:00", "limit": 1})
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["saldo_inicial"] == 0.0
+    assert [m["tipo"] for m in body["movimentacoes"]] == ["ABERTURA"]
+
+    r = c.get("/contas/0101/9999/extrato", params={"after": body["proximo"]})
+    assert [m["saldo_apos"] for m in r.json()["movimentacoes"]] == [15.0]
+
+    assert c.get("/contas/0101/0000/extrato").status_code == 404
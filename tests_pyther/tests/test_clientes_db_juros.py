@@ -0,0 +1,155 @@
+
+import runpy
+import sys
+import warnings
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from clientes_db.app import db as db_mod
+from clientes_db.app import juros as juros_mod
+from clientes_db.app.db import Base
+from clientes_db.app.juros import TaxaDivergente, acumular_juros
+from clientes_db.app.models import Conta, ExecucaoJuros, Movimentacao
+
+DIA = date(2026, 1, 31)
+
+def _session_mem():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine, autocommit=False, autoflush=False)()
+
+def _popular(db):
+    contas = [
+        # (saldo em centavos, cheque_especial)
+        (-10000, True),
+        (-5000, True),
+        (-1000, False),   # sem cheque especial: fora do lote
+        (20000, True),    # positivo: fora do lote
+        (-1, True),       # juros arredondado a zero
+        (-100000, True),
+    ]
+    for i, (saldo, cheque) in enumerate(contas):
+        db.add(Conta(
+            agencia="0001", numero_conta=f"{i:04d}", nome="X", cpf=f"{i:011d}",
+            telefone=11999999999, email="x@x.com", saldo_centavos=saldo,
+            cheque_especial_contratado=cheque, limite_centavos=200000
+        ))
+    db.commit()
+
+def _saldos(db):
+    return [c.saldo_centavos for c in db.query(Conta).order_by(Conta.id)]
+
+def test_juros_em_lotes_e_idempotente_por_data():
+    db = _session_mem()
+    _popular(db)
+
+    out = acumular_juros(db, DIA, 0.01, tamanho_lote=2)
+    assert out["concluida"] is True
+    assert out["contas_processadas"] == 4
+    assert out["lotes"] == 2
+    assert _saldos(db) == [-10100, -5050, -1000, 20000, -1, -101000]
+
+    movs = db.query(Movimentacao).filter(Movimentacao.tipo == "JUROS").order_by(Movimentacao.conta_id).all()
+    assert [(m.conta_id, m.valor_centavos, m.saldo_apos_centavos) for m in movs] == [
+        (1, -100, -10100), (2, -50, -5050), (6, -1000, -101000)
+    ]
+
+    # segunda execução na mesma data não cobra de novo
+    out = acumular_juros(db, DIA, 0.01, tamanho_lote=2)
+    assert out["lotes"] == 0
+    assert _saldos(db) == [-10100, -5050, -1000, 20000, -1, -101000]
+
+def test_juros_retoma_do_ultimo_lote(monkeypatch):
+    db = _session_mem()
+    _popular(db)
+
+    original = juros_mod._aplicar_lote
+    chamadas = {"n": 0}
+    def falha_no_segundo(*a, **k):
+        chamadas["n"] += 1
+        if chamadas["n"] == 2:
+            raise RuntimeError("queda")
+        return original(*a, **k)
+    monkeypatch.setattr(juros_mod, "_aplicar_lote", falha_no_segundo)
+
+    with pytest.raises(RuntimeError):
+        acumular_juros(db, DIA, 0.01, tamanho_lote=2)
+    execucao = db.get(ExecucaoJuros, DIA)
+    assert execucao.ultimo_id == 2 and execucao.concluida is False
+
+    monkeypatch.setattr(juros_mod, "_aplicar_lote", original)
+    out = acumular_juros(db, DIA, 0.01, tamanho_lote=2)
+    assert out["concluida"] is True
+    assert _saldos(db) == [-10100, -5050, -1000, 20000, -1, -101000]
+
+def test_lote_concorrente_nao_cobra_duas_vezes():
+    db = _session_mem()
+    _popular(db)
+    acumular_juros(db, DIA, 0.01, tamanho_lote=10)
+
+    # outro executor com visão antiga do progresso (ultimo_id=0)
+    db.query(ExecucaoJuros).update({"concluida": False})
+    db.commit()
+    assert juros_mod._aplicar_lote(db, DIA, 0.01, 0, 10) == -1
+    assert _saldos(db)[0] == -10100
+
+def test_taxa_divergente_para_mesma_data():
+    db = _session_mem()
+    _popular(db)
+    acumular_juros(db, DIA, 0.01)
+    with pytest.raises(TaxaDivergente):
+        acumular_juros(db, DIA, 0.02)
+
+def test_endpoint_interno_juros(db_test_client):
+    c = db_test_client
+    c.post("/contas", json={
+        "agencia": "0101", "numero_conta": "9999", "nome": "Ca", "cpf": "01010101010",
+        "telefone": 11999999999, "email": "c@ex.com", "saldo_cc": 0.0,
+        "cheque_especial_contratado": True, "limite_cheque_especial": 500.0,
+    })
+    c.post("/contas/operacoes/sacar", json={"agencia": "0101", "numero_conta": "9999", "saldo": 200.0})
+
+    r = c.post("/interno/juros", json={"data_referencia": "2026-01-31", "taxa": 0.1})
+    assert r.status_code == 200, r.text
+    assert r.json()["contas_processadas"] == 1
+    assert c.get("/contas/0101/9999").json()["saldo_cc"] == -220.0
+
+    r = c.post("/interno/juros", json={"data_referencia": "2026-01-31", "taxa": 0.2})
+    assert r.status_code == 409
+    assert r.json()["detail"]["code"] == "TAXA_DIVERGENTE"
+
+def test_pausa_entre_lotes(monkeypatch):
+    db = _session_mem()
+    _popular(db)
+    pausas = []
+    monkeypatch.setattr(juros_mod.time, "sleep", pausas.append)
+
+    out = acumular_juros(db, DIA, 0.01, tamanho_lote=2, pausa_s=0.25)
+    # Uma pausa por lote com contas; o lote vazio do fim não espera.
+    assert pausas == [0.25] * out["lotes"] and out["lotes"] == 2
+
+def test_cli_juros(monkeypatch, capsys):
+    db = _session_mem()
+    _popular(db)
+    monkeypatch.setattr(juros_mod, "SessionLocal", lambda: db)
+
+    assert juros_mod.main(["--taxa", "0.01", "--data", "2026-01-31", "--lote", "3"]) == 0
+    assert "4 contas em 2 lotes" in capsys.readouterr().out
+    assert juros_mod.main(["--taxa", "0.05", "--data", "2026-01-31"]) == 1
+
+
+def test_cli_juros_como_modulo(monkeypatch, capsys):
+    db = _session_mem()
+    _popular(db)
+    monkeypatch.setattr(db_mod, "SessionLocal", lambda: db)
+    monkeypatch.setattr(sys, "argv", ["juros", "--taxa", "0.01", "--data", "2026-01-31"])
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        with pytest.raises(SystemExit) as saida:
+            runpy.run_module("clientes_db.app.juros", run_name="__main__")
+    assert saida.value.code == 0
+    assert "4 contas em 1 lotes" in capsys.readouterr().out
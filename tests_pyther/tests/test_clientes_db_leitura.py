@@ -0,0 +1,108 @@
+import asyncio
+
+import httpx
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from clientes_db.app import db as db_mod
+from clientes_db.app.db import _url_leitura, configurar_sqlite
+from clientes_db.app.main import app
+from clientes_db.app.schema import preparar_schema
+
+CONTA = {
+    "agencia": "0808", "numero_conta": "8080", "nome": "Ana", "cpf": "80808080808",
+    "telefone": 11999999999, "email": "leitura@ex.com", "saldo_cc": 10.0,
+}
+
+
+def _engines(tmp_path):
+    escrita = configurar_sqlite(create_engine(
+        f"sqlite:///{tmp_path / 'rw.db'}", connect_args={"check_same_thread": False}
+    ))
+    preparar_schema(escrita)
+    leitura = configurar_sqlite(create_engine(
+        _url_leitura(str(escrita.url)), connect_args={"check_same_thread": False}
+    ), somente_leitura=True)
+    return escrita, leitura
+
+@pytest.fixture
+def pools(tmp_path, monkeypatch):
+    escrita, leitura = _engines(tmp_path)
+    monkeypatch.setattr(db_mod, "SessionLocal", sessionmaker(bind=escrita, autoflush=False))
+    monkeypatch.setattr(db_mod, "SessionLeitura", sessionmaker(bind=leitura, autoflush=False))
+    monkeypatch.setattr(db_mod, "ESPERA_LEITURA_S", 0.0)
+    monkeypatch.setattr(app.state, "vagas_conexao", asyncio.Semaphore(2), raising=False)
+    monkeypatch.setattr(app.state, "vagas_leitura", asyncio.Semaphore(2), raising=False)
+    return escrita, leitura
+
+def test_engine_de_leitura_nao_escreve(tmp_path):
+    _, leitura = _engines(tmp_path)
+    with leitura.connect() as conn:
+        assert conn.execute(text("PRAGMA query_only")).scalar() == 1
+        with pytest.raises(OperationalError):
+            conn.execute(text("DELETE FROM contas"))
+
+@pytest.mark.asyncio
+async def test_get_usa_o_pool_de_leitura_e_enxerga_a_escrita(pools):
+    _, leitura = pools
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+        criada = await client.post("/contas", json=CONTA)
+        op = {"agencia": "0808", "numero_conta": "8080", "saldo": 5.0}
+        deposito = await client.post("/contas/operacoes/depositar", json=op)
+        marca = deposito.headers["x-alteracao"]
+        lida = await client.get("/contas/0808/8080", headers={"X-Min-Alteracao": marca})
+
+    assert int(marca) > int(criada.headers["x-alteracao"])
+    assert lida.status_code == 200
+    assert lida.json()["saldo_cc"] == 15.0
+    assert lida.headers["x-alteracao"] == marca
+    assert leitura.pool.checkedin() == 1
+
+@pytest.mark.asyncio
+async def test_min_alteracao_a_frente_ou_invalida(pools):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+        criada = await client.post("/contas", json=CONTA)
+        adiante = str(int(criada.headers["x-alteracao"]) + 1000)
+        atrasada = await client.get("/contas/0808/8080", headers={"X-Min-Alteracao": adiante})
+        invalida = await client.get("/contas/0808/8080", headers={"X-Min-Alteracao": "x"})
+
+    assert atrasada.status_code == 503
+    assert atrasada.headers["retry-after"] == "1"
+    assert atrasada.json()["detail"]["code"] == "LEITURA_DESATUALIZADA"
+    assert invalida.status_code == 422
+    assert invalida.json()["detail"]["code"] == "ALTERACAO_INVALIDA"
+
+@pytest.mark.asyncio
+async def test_leitura_apos_escrita_pelo_gateway(pools, monkeypatch):
+    from clientes_api.app.main import app as gateway
+    from clientes_api.app.routers.contas import get_db as gateway_get_db
+    from clientes_api.app.services import db_conta
+    from clientes_api.app.services.db_conta import DbConta
+
+    interno = httpx.AsyncClient(transport=httpx.ASGITransport(app=app))
+    monkeypatch.setitem(db_conta._clientes, "http://db", interno)
+    monkeypatch.setitem(
+        gateway.dependency_overrides, gateway_get_db,
+        lambda: DbConta("http://db", compartilhado=True),
+    )
+    transport = httpx.ASGITransport(app=gateway)
+    async with httpx.AsyncClient(transport=transport, base_url="http://api") as client, interno:
+        await client.post("/contas", json=CONTA)
+        op = {"agencia": "0808", "numero_conta": "8080", "saldo": 5.0}
+        deposito = await client.post("/contas/operacoes/depositar", json=op)
+        marca = deposito.headers["x-alteracao"]
+        lida = await client.get("/contas/0808/8080", headers={"X-Min-Alteracao": marca})
+        adiante = str(int(marca) + 1000)
+        atrasada = await client.get("/contas/0808/8080", headers={"X-Min-Alteracao": adiante})
+
+    assert lida.status_code == 200
+    assert lida.json()["saldo_cc"] == 15.0
+    assert lida.headers["x-alteracao"] == marca
+    assert "alteracao" not in lida.json()
+    # O cabeçalho chegou ao clientes_db, que esperou e desistiu.
+    assert atrasada.status_code == 503
+    assert atrasada.json()["detail"]["code"] == "LEITURA_DESATUALIZADA"
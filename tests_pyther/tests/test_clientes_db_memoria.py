@@ -0,0 +1,122 @@
+import threading
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from clientes_db.app import repositorio as repositorio_mod
+from clientes_db.app.main import app
+from clientes_db.app.models import Conta
+from clientes_db.app.repositorio import RepositorioContas, RepositorioMemoria, usar_memoria
+from clientes_db.app.routers.contas import _conferir_saque
+
+CONTA = {
+    "agencia": "0707", "numero_conta": "7070", "nome": "Ana", "cpf": "70707070707",
+    "telefone": 11999999999, "email": "memoria@ex.com", "saldo_cc": 10.0,
+}
+CHAVE = {"agencia": "0707", "numero_conta": "7070"}
+
+
+@pytest.fixture
+def memoria():
+    repositorio = usar_memoria(app)
+    try:
+        yield TestClient(app), repositorio
+    finally:
+        app.dependency_overrides.clear()
+
+@pytest.fixture(params=["sql", "memoria"])
+def cliente(request):
+    if request.param == "sql":
+        return request.getfixturevalue("db_test_client")
+    return request.getfixturevalue("memoria")[0]
+
+def test_mesmas_regras_nos_dois_repositorios(cliente):
+    criada = cliente.post("/contas", json=CONTA)
+    assert criada.status_code == 201
+    assert cliente.post("/contas", json={**CONTA, "cpf": "70707070708"}).json()["detail"]["code"] == "CONTA_DUPLICADA"
+    assert cliente.post("/contas", json={**CONTA, "numero_conta": "7071"}).json()["detail"]["code"] == "CPF_JA_CADASTRADO"
+
+    etag = criada.headers["etag"]
+    assert cliente.get("/contas/0707/7070", headers={"If-None-Match": etag}).status_code == 304
+    assert cliente.get("/contas/0707/7070", params={"fields": "nome,limite_atual"}).json() == {
+        "nome": "Ana", "limite_atual": 0.0
+    }
+
+    deposito = cliente.post("/contas/operacoes/depositar", json={**CHAVE, "saldo": 5.0})
+    assert deposito.json()["saldo_cc"] == 15.0
+    assert deposito.headers["etag"] != etag
+    saque = cliente.post("/contas/operacoes/sacar", json={**CHAVE, "saldo": 20.0})
+    assert saque.json()["detail"]["code"] == "SALDO_INSUFICIENTE"
+    assert cliente.delete("/contas/0707/7070/desativar").json()["detail"]["code"] == "SALDO_NAO_ZERADO"
+
+    assert cliente.post("/contas/operacoes/sacar", json={**CHAVE, "saldo": 15.0}).json()["saldo_cc"] == 0.0
+    assert [c["numero_conta"] for c in cliente.get("/contas").json()] == ["7070"]
+    assert cliente.delete("/contas/0707/7070/desativar").status_code == 204
+    assert cliente.get("/contas/0707/7070").status_code == 404
+    assert cliente.get("/contas").json() == []
+
+def test_conta_inexistente_e_listagem_em_paginas(cliente, monkeypatch):
+    monkeypatch.setattr(repositorio_mod, "TAMANHO_PAGINA", 1)
+    cliente.post("/contas", json=CONTA)
+    cliente.post("/contas", json={**CONTA, "numero_conta": "7071", "cpf": "70707070708"})
+    assert [c["numero_conta"] for c in cliente.get("/contas").json()] == ["7070", "7071"]
+    assert cliente.get("/contas", params={"fields": "numero_conta"}).json() == [
+        {"numero_conta": "7070"}, {"numero_conta": "7071"}
+    ]
+
+    falta = {"agencia": "0707", "numero_conta": "7079", "saldo": 1.0}
+    for rota in ("/contas/operacoes/depositar", "/contas/operacoes/sacar"):
+        assert cliente.post(rota, json=falta).json()["detail"]["code"] == "CONTA_NAO_ENCONTRADA"
+    r = cliente.delete("/contas/0707/7079/desativar")
+    assert r.status_code == 404
+
+def test_interface_so_declara_as_operacoes():
+    with pytest.raises(TypeError):
+        RepositorioContas()
+
+    # Quem esquece uma operação falha ao instanciar, não na primeira chamada.
+    class SemRemover(RepositorioMemoria):
+        remover_se_zerada = RepositorioContas.remover_se_zerada
+
+    with pytest.raises(TypeError, match="remover_se_zerada"):
+        SemRemover()
+    assert RepositorioContas.__abstractmethods__ == {
+        "obter", "criar", "movimentar", "pagina", "remover_se_zerada",
+    }
+
+def test_rotas_que_dependem_do_sql_respondem_501(memoria):
+    client, _ = memoria
+    client.post("/contas", json=CONTA)
+    r = client.get("/contas/0707/7070/extrato")
+    assert r.status_code == 501
+    assert r.json()["detail"]["code"] == "REPOSITORIO_SEM_SUPORTE"
+
+def test_lock_por_conta_nao_perde_nem_estoura_saldo():
+    repositorio = RepositorioMemoria()
+    repositorio.criar(Conta(
+        agencia="0001", numero_conta="0001", nome="Ana", cpf="00000000001",
+        telefone=11999999999, email="a@ex.com", saldo_centavos=0,
+        cheque_especial_contratado=True, limite_centavos=10_000,
+    ))
+
+    def depositar():
+        for _ in range(200):
+            repositorio.movimentar("0001", "0001", "DEPOSITO", 100)
+
+    def sacar():
+        for _ in range(200):
+            try:
+                repositorio.movimentar("0001", "0001", "SAQUE", -150, _conferir_saque)
+            except HTTPException:
+                pass
+
+    threads = [threading.Thread(target=f) for f in (depositar, sacar) * 4]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    saldo = repositorio.obter("0001", "0001").saldo_centavos
+    assert saldo >= -10_000
+    assert (4 * 200 * 100 - saldo) % 150 == 0
@@ -0,0 +1,71 @@
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from clientes_db.app.db import Base
+from clientes_db.app.models import Movimentacao
+from clientes_db.app.repositorio import RepositorioSQL
+from clientes_db.app.schemas import ContaCreate, OperacaoPorChaves, ChequeEspecialCadastro
+from clientes_db.app.routers.contas import criar_conta, depositar, sacar, cadastrar_cheque_especial
+
+def _session_mem():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine, autocommit=False, autoflush=False)()
+
+def _movimentacoes(db, conta_id):
+    return (
+        db.query(Movimentacao)
+        .filter(Movimentacao.conta_id == conta_id)
+        .order_by(Movimentacao.id)
+        .all()
+    )
+
+def test_operacoes_gravam_movimentacoes_com_saldo_apos():
+    db = _session_mem()
+    conta = criar_conta(body=ContaCreate(
+        agencia="1234", numero_conta="0001", nome="Ana", cpf="12345678901",
+        telefone=11999999999, email="a@a.com", saldo_cc=100.0
+    ), repo=RepositorioSQL(db))
+
+    depositar(body=OperacaoPorChaves(agencia="1234", numero_conta="0001", saldo=50.0), repo=RepositorioSQL(db))
+    sacar(body=OperacaoPorChaves(agencia="1234", numero_conta="0001", saldo=30.0), repo=RepositorioSQL(db))
+    cadastrar_cheque_especial(id=conta["id"], body=ChequeEspecialCadastro(habilitado=True, limite=200.0), db=db)
+    sacar(body=OperacaoPorChaves(agencia="1234", numero_conta="0001", saldo=150.0), repo=RepositorioSQL(db))
+
+    movs = _movimentacoes(db, conta["id"])
+    assert [(m.tipo, m.valor_centavos, m.saldo_apos_centavos, m.limite_centavos) for m in movs] == [
+        ("ABERTURA", 10000, 10000, None),
+        ("DEPOSITO", 5000, 15000, None),
+        ("SAQUE", -3000, 12000, None),
+        # Mudar o limite não move dinheiro: os valores somam o saldo.
+        ("CHEQUE_ESPECIAL", 0, 12000, 20000),
+        ("SAQUE", -15000, -3000, None),
+    ]
+    assert sum(m.valor_centavos for m in movs) == movs[-1].saldo_apos_centavos
+    assert all(m.criado_em is not None for m in movs)
+
+def test_conta_sem_saldo_inicial_nao_grava_abertura():
+    db = _session_mem()
+    conta = criar_conta(body=ContaCreate(
+        agencia="1234", numero_conta="0002", nome="Bia", cpf="12345678902",
+        telefone=11999999999, email="b@b.com"
+    ), repo=RepositorioSQL(db))
+    assert _movimentacoes(db, conta["id"]) == []
+
+def test_saque_recusado_nao_grava_movimentacao():
+    db = _session_mem()
+    conta = criar_conta(body=ContaCreate(
+        agencia="1234", numero_conta="0003", nome="Caio", cpf="12345678903",
+        telefone=11999999999, email="c@c.com", saldo_cc=10.0
+    ), repo=RepositorioSQL(db))
+
+    with pytest.raises(HTTPException) as exc:
+        sacar(body=OperacaoPorChaves(agencia="1234", numero_conta="0003", saldo=20.0), repo=RepositorioSQL(db))
+    assert exc.value.detail["code"] == "SALDO_INSUFICIENTE"
+    db.rollback()
+
+    assert [m.tipo for m in _movimentacoes(db, conta["id"])] == ["ABERTURA"]
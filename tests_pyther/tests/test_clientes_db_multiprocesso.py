@@ -0,0 +1,145 @@
+import asyncio
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from clientes_db.app import db as db_mod
+from clientes_db.app.db import _url_leitura, banco_ocupado, configurar_sqlite, iniciar_escrita
+from clientes_db.app.main import app
+from clientes_db.app.schema import SCHEMA_VERSION, preparar_schema
+
+RAIZ = Path(__file__).resolve().parents[2]
+
+
+def _engine(tmp_path, timeout=0.05):
+    return configurar_sqlite(create_engine(
+        f"sqlite:///{tmp_path / 'mp.db'}",
+        connect_args={"check_same_thread": False, "timeout": timeout},
+    ))
+
+def _conta(numero, cpf):
+    return {
+        "agencia": "0707", "numero_conta": numero, "nome": "Ana", "cpf": cpf,
+        "telefone": 11999999999, "email": f"{numero}@ex.com", "saldo_cc": 0.0,
+    }
+
+def test_begin_immediate_serializa_escritas_sem_bloquear_leitura(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_mod, "TENTATIVAS_ESCRITA", 2)
+    monkeypatch.setattr(db_mod, "ESPERA_BASE_S", 0.001)
+    engine = _engine(tmp_path)
+    preparar_schema(engine)
+    fabrica = sessionmaker(bind=engine)
+    a, b, leitor = fabrica(), fabrica(), fabrica()
+
+    iniciar_escrita(a)
+    with pytest.raises(OperationalError) as exc:
+        iniciar_escrita(b)
+    assert banco_ocupado(exc.value)
+
+    # WAL: a leitura segue enquanto há uma escrita aberta.
+    assert leitor.execute(text("SELECT count(*) FROM contas")).scalar() == 0
+    assert leitor.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+
+    a.commit()
+    iniciar_escrita(b)
+    b.commit()
+
+def test_escrita_sem_novas_tentativas_ainda_tenta_uma_vez(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_mod, "TENTATIVAS_ESCRITA", 0)
+    engine = _engine(tmp_path)
+    preparar_schema(engine)
+    fabrica = sessionmaker(bind=engine)
+    a, b = fabrica(), fabrica()
+
+    iniciar_escrita(a)
+    assert a.in_transaction()
+    with pytest.raises(OperationalError):
+        iniciar_escrita(b)
+    a.rollback()
+
+def test_filho_do_fork_abre_conexoes_proprias(tmp_path, monkeypatch):
+    escrita, leitura = db_mod.criar_engines(f"sqlite:///{tmp_path / 'fork.db'}")
+    monkeypatch.setattr(db_mod, "engine", escrita)
+    monkeypatch.setattr(db_mod, "engine_leitura", leitura)
+    monkeypatch.setattr(db_mod, "SHARDS_EXTRAS", [db_mod._fabricas((escrita, leitura))])
+    pools = [escrita.pool, leitura.pool]
+
+    db_mod._descartar_conexoes()
+    assert escrita.pool is not pools[0] and leitura.pool is not pools[1]
+
+@pytest.mark.asyncio
+async def test_depositos_concorrentes_na_mesma_conta(monkeypatch):
+    # O BEGIN IMMEDIATE pega o lock antes de ler o saldo: nenhum depósito
+    # concorrente perde a versão (antes: StaleDataError e 500).
+    monkeypatch.setattr(app.state, "vagas_conexao", asyncio.Semaphore(db_mod.POOL_SIZE), raising=False)
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+        assert (await client.post("/contas", json=_conta("7070", "70707070707"))).status_code == 201
+        op = {"agencia": "0707", "numero_conta": "7070", "saldo": 1.0}
+        respostas = await asyncio.gather(
+            *(client.post("/contas/operacoes/depositar", json=op) for _ in range(30))
+        )
+        conta = (await client.get("/contas/0707/7070")).json()
+
+    assert [r.status_code for r in respostas] == [200] * 30
+    assert conta["saldo_cc"] == 30.0
+
+@pytest.mark.asyncio
+async def test_banco_ocupado_vira_503(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_mod, "TENTATIVAS_ESCRITA", 2)
+    monkeypatch.setattr(db_mod, "ESPERA_BASE_S", 0.001)
+    engine = _engine(tmp_path)
+    preparar_schema(engine)
+    leitura = configurar_sqlite(create_engine(
+        _url_leitura(str(engine.url)), connect_args={"check_same_thread": False}
+    ), somente_leitura=True)
+    monkeypatch.setattr(db_mod, "SessionLocal", sessionmaker(bind=engine, autoflush=False))
+    monkeypatch.setattr(db_mod, "SessionLeitura", sessionmaker(bind=leitura, autoflush=False))
+    monkeypatch.setattr(app.state, "vagas_conexao", asyncio.Semaphore(2), raising=False)
+    monkeypatch.setattr(app.state, "vagas_leitura", asyncio.Semaphore(2), raising=False)
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+        await client.post("/contas", json=_conta("7071", "70707070708"))
+
+        outro = sessionmaker(bind=engine)()
+        iniciar_escrita(outro)
+        try:
+            op = {"agencia": "0707", "numero_conta": "7071", "saldo": 1.0}
+            r = await client.post("/contas/operacoes/depositar", json=op)
+            leitura = await client.get("/contas/0707/7071")
+        finally:
+            outro.rollback()
+
+    assert r.status_code == 503
+    assert r.headers["retry-after"] == "1"
+    assert r.json()["detail"]["code"] == "BANCO_OCUPADO"
+    assert leitura.status_code == 200
+
+def test_workers_sobem_juntos_e_migram_uma_vez(tmp_path):
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(RAIZ),
+        "CLIENTES_DB_DATABASE_URL": f"sqlite:///{tmp_path / 'workers.db'}",
+    }
+    codigo = (
+        "from clientes_db.app.db import engine\n"
+        "from clientes_db.app.schema import preparar_schema\n"
+        "print(preparar_schema(engine))\n"
+    )
+    workers = [
+        subprocess.Popen([sys.executable, "-c", codigo], env=env, cwd=tmp_path,
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        for _ in range(4)
+    ]
+    saidas = [w.communicate(timeout=60) for w in workers]
+
+    assert [w.returncode for w in workers] == [0] * 4, [e for _, e in saidas]
+    assert [o.strip() for o, _ in saidas] == [str(SCHEMA_VERSION)] * 4
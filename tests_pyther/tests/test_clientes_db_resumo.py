@@ -0,0 +1,137 @@
+
+import random
+import runpy
+import sys
+import warnings
+from datetime import date
+
+import pytest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from fastapi import HTTPException
+
+from clientes_db.app import db as db_mod
+from clientes_db.app import resumo as resumo_mod
+from clientes_db.app.db import Base
+from clientes_db.app.juros import acumular_juros
+from clientes_db.app.models import Conta, ResumoAgencia
+from clientes_db.app.repositorio import RepositorioSQL
+from clientes_db.app.resumo import listar_resumo, recalcular_resumo
+from clientes_db.app.schemas import ContaCreate, OperacaoPorChaves, ChequeEspecialCadastro
+from clientes_db.app.routers.contas import (
+    criar_conta, depositar, sacar, cadastrar_cheque_especial, desativar_conta
+)
+
+def _session_mem():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine, autocommit=False, autoflush=False)()
+
+def _chave(i):
+    return {"agencia": f"{i % 3:04d}", "numero_conta": f"{i:04d}"}
+
+def test_resumo_incremental_bate_com_recalculo():
+    db = _session_mem()
+    rnd = random.Random(42)
+    ids = {}
+    for i in range(12):
+        out = criar_conta(body=ContaCreate(
+            **_chave(i), nome="Cliente", cpf=f"{i:011d}", telefone=11999999999,
+            email="c@ex.com", saldo_cc=float(rnd.choice([0, 10, 250])),
+            cheque_especial_contratado=bool(i % 2), limite_cheque_especial=300.0,
+        ), repo=RepositorioSQL(db))
+        ids[i] = out["id"]
+
+    for _ in range(200):
+        i = rnd.randrange(12)
+        op = rnd.choice(["dep", "saq", "cheque"])
+        try:
+            if op == "dep":
+                depositar(body=OperacaoPorChaves(**_chave(i), saldo=rnd.choice([5.0, 40.0])), repo=RepositorioSQL(db))
+            elif op == "saq":
+                sacar(body=OperacaoPorChaves(**_chave(i), saldo=rnd.choice([5.0, 60.0, 120.0])), repo=RepositorioSQL(db))
+            else:
+                cadastrar_cheque_especial(id=ids[i], body=ChequeEspecialCadastro(
+                    habilitado=rnd.random() < 0.7, limite=rnd.choice([0.0, 100.0, 500.0])
+                ), db=db)
+        except HTTPException:
+            db.rollback()
+
+    acumular_juros(db, date(2026, 1, 31), 0.03, tamanho_lote=2)
+
+    for i in range(12):
+        conta = db.get(Conta, ids[i])
+        if conta.saldo_centavos == 0:
+            desativar_conta(agencia=conta.agencia, numero_conta=conta.numero_conta, repo=RepositorioSQL(db))
+
+    assert recalcular_resumo(db, aplicar=False)["divergencias"] == []
+    assert sum(r["quantidade_contas"] for r in listar_resumo(db)) == db.query(Conta).count()
+
+def test_resumo_valores_e_conta_desativada():
+    db = _session_mem()
+    criar_conta(body=ContaCreate(
+        agencia="0001", numero_conta="0001", nome="Ana", cpf="00000000001",
+        telefone=11999999999, email="a@a.com", saldo_cc=100.0,
+        cheque_especial_contratado=True, limite_cheque_especial=50.0,
+    ), repo=RepositorioSQL(db))
+    criar_conta(body=ContaCreate(
+        agencia="0001", numero_conta="0002", nome="Bia", cpf="00000000002",
+        telefone=11999999999, email="b@b.com",
+    ), repo=RepositorioSQL(db))
+    sacar(body=OperacaoPorChaves(agencia="0001", numero_conta="0001", saldo=120.0), repo=RepositorioSQL(db))
+
+    assert listar_resumo(db) == [{
+        "agencia": "0001",
+        "quantidade_contas": 2,
+        "total_depositos": 0.0,
+        "exposicao_negativa": 20.0,
+        "cheque_especial_usado": 20.0,
+        "cheque_especial_disponivel": 30.0,
+    }]
+
+    desativar_conta(agencia="0001", numero_conta="0002", repo=RepositorioSQL(db))
+    assert listar_resumo(db)[0]["quantidade_contas"] == 1
+
+def test_recalculo_corrige_divergencia_e_cli(monkeypatch, capsys):
+    db = _session_mem()
+    criar_conta(body=ContaCreate(
+        agencia="0001", numero_conta="0001", nome="Ana", cpf="00000000001",
+        telefone=11999999999, email="a@a.com", saldo_cc=100.0,
+    ), repo=RepositorioSQL(db))
+    db.query(ResumoAgencia).update({"total_depositos": 1.0})
+    db.commit()
+
+    monkeypatch.setattr(resumo_mod, "SessionLocal", lambda: db)
+    assert resumo_mod.main(["--verificar"]) == 1
+    assert "1 divergências" in capsys.readouterr().out
+
+    assert resumo_mod.main([]) == 0
+    assert resumo_mod.main(["--verificar"]) == 0
+    assert listar_resumo(db)[0]["total_depositos"] == 100.0
+
+def test_cli_resumo_como_modulo(monkeypatch, capsys):
+    db = _session_mem()
+    monkeypatch.setattr(db_mod, "SessionLocal", lambda: db)
+    monkeypatch.setattr(sys, "argv", ["resumo", "--verificar"])
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        with pytest.raises(SystemExit) as saida:
+            runpy.run_module("clientes_db.app.resumo", run_name="__main__")
+    assert saida.value.code == 0
+    assert "0 agências, 0 divergências" in capsys.readouterr().out
+
+def test_resumo_http(db_test_client):
+    c = db_test_client
+    c.post("/contas", json={
+        "agencia": "0101", "numero_conta": "9999", "nome": "Ca", "cpf": "01010101010",
+        "telefone": 11999999999, "email": "c@ex.com", "saldo_cc": 30.0,
+    })
+    r = c.get("/contas/resumo")
+    assert r.status_code == 200
+    assert r.json() == [{
+        "agencia": "0101", "quantidade_contas": 1, "total_depositos": 30.0,
+        "exposicao_negativa": 0.0, "cheque_especial_usado": 0.0,
+        "cheque_especial_disponivel": 0.0,
+    }]
@@ -5,6 +5,7 @@ from sqlalchemy.pool import StaticPool
 
 from clientes_db.app.db import Base
 from clientes_db.app.models import Conta
+from clientes_db.app.repositorio import RepositorioSQL
 from clientes_db.app.schemas import OperacaoPorChaves, ChequeEspecialCadastro
 from clientes_db.app.routers.contas import sacar, cadastrar_cheque_especial
 
@@ -23,14 +24,14 @@ def test_sacar_fastpath_novo_saldo_maior_igual_zero():
     conta = Conta(
         agencia="5555", numero_conta="1212", nome="Rick",
         cpf="55555555555", telefone=11999999999, email="r@ex.com",
-        correntista=True, saldo_cc=200.0,
-        cheque_especial_contratado=False, limite_cheque_especial=0.0
+        correntista=True, saldo_centavos=20000,
+        cheque_especial_contratado=False, limite_centavos=0
     )
     db.add(conta); db.commit(); db.refresh(conta)
 
     
     body = OperacaoPorChaves(agencia="5555", numero_conta="1212", saldo=50.0)
-    out = sacar(body=body, db=db)
+    out = sacar(body=body, repo=RepositorioSQL(db))
     assert out["saldo_cc"] == 150.0  # 200 - 50
 
 def test_cheque_especial_return_final():
@@ -39,8 +40,8 @@ def test_cheque_especial_return_final():
     conta = Conta(
         agencia="4444", numero_conta="3434", nome="Morty",
         cpf="44444444444", telefone=11999999999, email="m@ex.com",
-        correntista=True, saldo_cc=0.0,
-        cheque_especial_contratado=False, limite_cheque_especial=0.0
+        correntista=True, saldo_centavos=0,
+        cheque_especial_contratado=False, limite_centavos=0
     )
     db.add(conta); db.commit(); db.refresh(conta)
 
@@ -0,0 +1,252 @@
+
+import os
+import runpy
+import subprocess
+import sys
+import warnings
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, inspect
+
+from clientes_db.app import schema
+from clientes_db.app.schema import (
+    SCHEMA_VERSION,
+    SchemaIncompativel,
+    preparar_schema,
+    verificar_schema,
+)
+
+RAIZ = Path(__file__).resolve().parents[2]
+
+# Orçamento de import (segundos) de cada app num interpretador novo.
+IMPORT_BUDGET_S = float(os.getenv("PYTHER_IMPORT_BUDGET_S", "3.0"))
+
+
+def _engine_arquivo(tmp_path, nome="schema.db"):
+    return create_engine(f"sqlite:///{tmp_path / nome}")
+
+
+def test_preparar_schema_banco_novo(tmp_path):
+    engine = _engine_arquivo(tmp_path)
+    assert preparar_schema(engine) == SCHEMA_VERSION
+    assert inspect(engine).has_table("contas")
+    assert verificar_schema(engine) == SCHEMA_VERSION
+    # idempotente
+    assert preparar_schema(engine) == SCHEMA_VERSION
+
+
+# Schema do clientes.db criado pelo create_all antes do controle de versão.
+DDL_LEGADO = """
+CREATE TABLE contas (
+    id INTEGER NOT NULL,
+    agencia VARCHAR NOT NULL,
+    numero_conta VARCHAR NOT NULL,
+    nome VARCHAR NOT NULL,
+    cpf VARCHAR(15) NOT NULL,
+    telefone INTEGER NOT NULL,
+    email VARCHAR NOT NULL,
+    correntista BOOLEAN NOT NULL,
+    saldo_cc FLOAT NOT NULL,
+    cheque_especial_contratado BOOLEAN NOT NULL,
+    limite_cheque_especial FLOAT NOT NULL,
+    PRIMARY KEY (id),
+    CONSTRAINT uix_agencia_numero UNIQUE (agencia, numero_conta)
+)
+"""
+
+
+def test_preparar_schema_migra_banco_legado(tmp_path):
+    engine = _engine_arquivo(tmp_path)
+    with engine.begin() as conn:
+        conn.exec_driver_sql(DDL_LEGADO)
+        conn.exec_driver_sql(
+            "INSERT INTO contas VALUES "
+            "(1, '0001', '1234', 'Ana', '12345678901', 11999999999, 'a@a.com', 1, 25.5, 0, 0.0), "
+            "(2, '0001', '4321', 'Bia', '12345678902', 11999999999, 'b@b.com', 1, 0.0, 0, 0.0)"
+        )
+
+    with pytest.raises(SchemaIncompativel):
+        verificar_schema(engine)
+
+    assert preparar_schema(engine) == SCHEMA_VERSION
+    assert verificar_schema(engine) == SCHEMA_VERSION
+
+    with engine.connect() as conn:
+        movs = conn.exec_driver_sql(
+            "SELECT conta_id, tipo, valor_centavos, saldo_apos_centavos FROM movimentacoes"
+        ).all()
+    assert movs == [(1, "ABERTURA", 2550, 2550)]
+
+    with engine.connect() as conn:
+        resumo = conn.exec_driver_sql(
+            "SELECT agencia, quantidade_contas, total_depositos FROM resumo_agencias"
+        ).all()
+    assert resumo == [("0001", 2, 2550)]
+
+    with engine.connect() as conn:
+        versoes = conn.exec_driver_sql("SELECT versao FROM contas").scalars().all()
+    assert len(set(versoes)) == 2 and all(len(v) == 32 for v in versoes)
+
+
+def test_migracao_8_converte_valores_para_centavos(tmp_path):
+    engine = _engine_arquivo(tmp_path)
+    with engine.begin() as conn:
+        conn.exec_driver_sql(DDL_LEGADO)
+        conn.exec_driver_sql(
+            "INSERT INTO contas VALUES "
+            "(1, '0001', '1234', 'Ana', '12345678901', 11999999999, 'a@a.com', 1, ?, 1, 99.99)",
+            (0.1 + 0.2,),
+        )
+
+    preparar_schema(engine)
+
+    with engine.connect() as conn:
+        conta = conn.exec_driver_sql(
+            "SELECT saldo_centavos, limite_centavos, typeof(saldo_centavos) FROM contas"
+        ).one()
+        tabelas = conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE '%_v7'"
+        ).all()
+        indices = conn.exec_driver_sql(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'contas'"
+        ).all()
+    assert tuple(conta) == (30, 9999, "integer")
+    assert tabelas == []
+    sql_indices = dict(indices)
+    assert "saldo_centavos" in sql_indices["ix_contas_score"]
+    assert "saldo_centavos" in sql_indices["ix_contas_devedoras"]
+    assert "ix_contas_cpf" in sql_indices
+
+
+def test_migracao_13_tira_o_limite_do_valor(tmp_path):
+    engine = _engine_arquivo(tmp_path)
+    preparar_schema(engine)
+    with engine.begin() as conn:
+        # Como a versão 12 gravava a troca de limite.
+        conn.exec_driver_sql("ALTER TABLE movimentacoes DROP COLUMN limite_centavos")
+        conn.exec_driver_sql(
+            "INSERT INTO movimentacoes (conta_id, tipo, valor_centavos, saldo_apos_centavos, criado_em) "
+            "VALUES (1, 'DEPOSITO', 500, 500, '2024-01-01'), "
+            "(1, 'CHEQUE_ESPECIAL', 20000, 500, '2024-01-02')"
+        )
+        conn.exec_driver_sql("PRAGMA user_version = 12")
+
+    assert preparar_schema(engine) == SCHEMA_VERSION
+    with engine.connect() as conn:
+        movs = conn.exec_driver_sql(
+            "SELECT tipo, valor_centavos, limite_centavos FROM movimentacoes ORDER BY id"
+        ).all()
+    assert movs == [("DEPOSITO", 500, None), ("CHEQUE_ESPECIAL", 0, 20000)]
+
+
+def test_migracao_9_com_a_coluna_ja_criada(tmp_path):
+    # Banco criado pelo create_all de um código com versao, mas marcado
+    # numa versão anterior: a coluna fica e as versões gravadas também.
+    engine = _engine_arquivo(tmp_path)
+    preparar_schema(engine)
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "INSERT INTO contas (agencia, numero_conta, nome, cpf, telefone, email,"
+            " correntista, saldo_centavos, cheque_especial_contratado, limite_centavos,"
+            " versao, alteracao, diario_seq) VALUES"
+            " ('0001', '0001', 'Ana', '12345678901', 11999999999, 'a@a.com', 1, 0, 0, 0, 'v1', 1, 0),"
+            " ('0001', '0002', 'Bia', '12345678902', 11999999999, 'b@b.com', 1, 0, 0, 0, '', 2, 0)"
+        )
+        conn.exec_driver_sql("PRAGMA user_version = 8")
+
+    assert preparar_schema(engine) == SCHEMA_VERSION
+    with engine.connect() as conn:
+        versoes = conn.exec_driver_sql("SELECT versao FROM contas ORDER BY id").scalars().all()
+    assert versoes[0] == "v1" and len(versoes[1]) == 32
+
+
+def test_migracao_10_mantem_a_sequencia_gravada(tmp_path):
+    engine = _engine_arquivo(tmp_path)
+    preparar_schema(engine)
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "INSERT INTO contas (agencia, numero_conta, nome, cpf, telefone, email,"
+            " correntista, saldo_centavos, cheque_especial_contratado, limite_centavos,"
+            " versao, alteracao, diario_seq) VALUES"
+            " ('0001', '0001', 'Ana', '12345678901', 11999999999, 'a@a.com', 1, 0, 0, 0, 'v1', 7, 0)"
+        )
+        conn.exec_driver_sql("PRAGMA user_version = 9")
+
+    # A coluna já existe: a sequência não volta a ser o id.
+    assert preparar_schema(engine) == SCHEMA_VERSION
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT alteracao FROM contas").scalar() == 7
+
+
+def test_preparar_schema_recusa_versao_mais_nova(tmp_path):
+    engine = _engine_arquivo(tmp_path)
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION + 1}")
+
+    with pytest.raises(SchemaIncompativel):
+        preparar_schema(engine)
+
+
+def test_cli_schema(tmp_path, monkeypatch, capsys):
+    engine = _engine_arquivo(tmp_path)
+    monkeypatch.setattr(schema, "engine", engine)
+
+    assert schema.main(["--verificar"]) == 1
+    assert schema.main([]) == 0
+    assert schema.main(["--verificar"]) == 0
+    assert f"versão {SCHEMA_VERSION}" in capsys.readouterr().out
+
+
+def test_cli_schema_como_modulo(monkeypatch, capsys):
+    # python -m clientes_db.app.schema --verificar, no banco dos testes.
+    monkeypatch.setattr(sys, "argv", ["schema", "--verificar"])
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        with pytest.raises(SystemExit) as saida:
+            runpy.run_module("clientes_db.app.schema", run_name="__main__")
+    assert saida.value.code == 0
+    assert f"versão {SCHEMA_VERSION}" in capsys.readouterr().out
+
+
+def test_lifespan_verifica_schema_sem_auto_migrar(tmp_path, monkeypatch):
+    from clientes_db.app import main
+
+    engine = _engine_arquivo(tmp_path)
+    monkeypatch.setattr(main, "engine", engine)
+    monkeypatch.setenv("CLIENTES_DB_AUTO_MIGRAR", "0")
+
+    with pytest.raises(SchemaIncompativel):
+        with TestClient(main.app):
+            pass
+
+    monkeypatch.setenv("CLIENTES_DB_AUTO_MIGRAR", "1")
+    with TestClient(main.app):
+        pass
+    assert verificar_schema(engine) == SCHEMA_VERSION
+
+
+@pytest.mark.parametrize("modulo", ["clientes_db.app.main", "clientes_api.app.main"])
+def test_import_dentro_do_orcamento_e_sem_tocar_disco(tmp_path, modulo):
+    codigo = (
+        "import time\n"
+        "t = time.perf_counter()\n"
+        f"import {modulo}\n"
+        "print(time.perf_counter() - t)\n"
+    )
+    env = {**os.environ, "PYTHONPATH": str(RAIZ)}
+    env.pop("CLIENTES_DB_DATABASE_URL", None)
+
+    r = subprocess.run(
+        [sys.executable, "-c", codigo],
+        cwd=tmp_path,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    duracao = float(r.stdout.strip().splitlines()[-1])
+    assert duracao < IMPORT_BUDGET_S, f"import de {modulo} levou {duracao:.3f}s"
+    assert not (tmp_path / "clientes.db").exists()
@@ -0,0 +1,74 @@
+
+from sqlalchemy import create_engine
+
+from clientes_db.app.db import Base
+from clientes_db.app.models import SCORE_CREDITO, Conta
+
+
+def _criar(c, numero, saldo, cpf):
+    r = c.post("/contas", json={
+        "agencia": "0001", "numero_conta": numero, "nome": f"Cliente {numero}", "cpf": cpf,
+        "telefone": 11999999999, "email": f"{numero}@ex.com", "saldo_cc": saldo,
+        "cheque_especial_contratado": True, "limite_cheque_especial": 500.0,
+    })
+    assert r.status_code == 201
+
+
+def _popular(c):
+    _criar(c, "0001", 100.0, "00000000001")
+    _criar(c, "0002", 300.0, "00000000002")
+    _criar(c, "0003", 0.0, "00000000003")
+    _criar(c, "0004", 123.45, "00000000004")
+    c.post("/contas/operacoes/sacar", json={"agencia": "0001", "numero_conta": "0003", "saldo": 50.0})
+
+
+def test_ranking_top_n_acompanha_saldo(db_test_client):
+    c = db_test_client
+    _popular(c)
+
+    r = c.get("/contas/ranking", params={"top": 2})
+    assert r.status_code == 200
+    assert [(i["numero_conta"], i["score_credito"]) for i in r.json()] == [
+        ("0002", 30.0), ("0004", 12.345)
+    ]
+
+    # O score muda no mesmo UPDATE do saldo.
+    c.post("/contas/operacoes/depositar", json={"agencia": "0001", "numero_conta": "0003", "saldo": 1050.0})
+    r = c.get("/contas/ranking", params={"top": 1})
+    assert r.json() == [
+        {"agencia": "0001", "numero_conta": "0003", "nome": "Cliente 0003", "score_credito": 100.0}
+    ]
+
+    assert c.get("/contas/ranking", params={"top": 101}).status_code == 422
+
+
+def test_score_e_percentil(db_test_client):
+    c = db_test_client
+    _popular(c)
+
+    r = c.get("/contas/0001/0002/score_credito")
+    assert r.json() == {"agencia": "0001", "numero_conta": "0002", "score_credito": 30.0, "percentil": 75.0}
+
+    r = c.get("/contas/0001/0003/score_credito")
+    assert r.json()["score_credito"] == 0.0
+    assert r.json()["percentil"] == 0.0
+
+    # Mesmo valor do formato completo (_to_out).
+    completo = c.get("/contas/0001/0004").json()
+    assert c.get("/contas/0001/0004/score_credito").json()["score_credito"] == completo["score_credito"]
+
+    r = c.get("/contas/0001/9999/score_credito")
+    assert r.status_code == 404
+    assert r.json()["detail"]["code"] == "CONTA_NAO_ENCONTRADA"
+
+
+def test_consultas_de_score_usam_o_indice():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+
+    ordem = f"ORDER BY {SCORE_CREDITO.compile(engine)} DESC"
+    with engine.connect() as conn:
+        plano = conn.exec_driver_sql(
+            f"EXPLAIN QUERY PLAN SELECT id FROM {Conta.__tablename__} {ordem} LIMIT 5"
+        ).all()
+    assert "ix_contas_score" in " ".join(str(p[-1]) for p in plano)
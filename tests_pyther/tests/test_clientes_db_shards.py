@@ -0,0 +1,340 @@
+import asyncio
+import runpy
+import sys
+import time
+import warnings
+
+import httpx
+import pytest
+from fastapi import Request
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import sessionmaker
+
+from clientes_db.app import db as db_mod
+from clientes_db.app.db import (
+    abrir_sessao, chave_do_shard, criar_engines, shard_da_agencia, shard_da_chave, url_do_shard,
+)
+from clientes_db.app.diretorio import reconciliar, reserva, troca_de_cpf
+from clientes_db.app.main import app
+from clientes_db.app.models import Conta, DiretorioConta, Movimentacao, ResumoAgencia
+from clientes_db.app.routers import contas as rotas
+from clientes_db.app.schema import preparar_schema
+from clientes_db.app.shards import arquivos_existentes, main, rebalancear
+
+SHARDS = 3
+
+
+def _agencias_por_shard(shards=SHARDS) -> dict:
+    # Uma agência de cada shard, para os testes não dependerem do hash.
+    agencias = {}
+    for n in range(1000, 2000):
+        agencias.setdefault(shard_da_agencia(str(n), shards), str(n))
+        if len(agencias) == shards:
+            return dict(sorted(agencias.items()))
+
+AG = _agencias_por_shard()
+
+
+def _conta(agencia, numero, cpf, saldo=0.0, nome="Ana"):
+    return {
+        "agencia": agencia, "numero_conta": numero, "nome": nome, "cpf": cpf,
+        "telefone": 11999999999, "email": f"{numero}@ex.com", "saldo_cc": saldo,
+    }
+
+def _contar(engine):
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(Conta)).scalar()
+
+@pytest.fixture
+def shards(tmp_path, monkeypatch):
+    url = f"sqlite:///{tmp_path / 'sh.db'}"
+    pares = [criar_engines(url_do_shard(url, i)) for i in range(SHARDS)]
+    for escrita, _ in pares:
+        preparar_schema(escrita)
+    fabricas = [
+        tuple(sessionmaker(bind=e, autocommit=False, autoflush=False) for e in par)
+        for par in pares
+    ]
+    monkeypatch.setattr(db_mod, "SHARDS", SHARDS)
+    monkeypatch.setattr(db_mod, "SessionLocal", fabricas[0][0])
+    monkeypatch.setattr(db_mod, "SessionLeitura", fabricas[0][1])
+    monkeypatch.setattr(db_mod, "engine_leitura", pares[0][1])
+    monkeypatch.setattr(db_mod, "SHARDS_EXTRAS", fabricas[1:])
+    monkeypatch.setattr(app.state, "vagas_conexao", asyncio.Semaphore(4), raising=False)
+    monkeypatch.setattr(app.state, "vagas_leitura", asyncio.Semaphore(4), raising=False)
+    return [escrita for escrita, _ in pares]
+
+@pytest.fixture
+async def client(shards):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://t") as c:
+        yield c
+
+async def test_cada_agencia_no_seu_shard_e_cpf_unico_entre_shards(shards, client):
+    criadas = []
+    for indice, agencia in AG.items():
+        r = await client.post("/contas", json=_conta(agencia, "1111", f"1000000000{indice}", 10.0))
+        assert r.status_code == 201
+        criadas.append(r.json())
+
+    assert [_contar(e) for e in shards] == [1, 1, 1]
+    assert len({c["id"] for c in criadas}) == SHARDS
+
+    # Mesmo CPF em outra agência (outro shard): o diretório barra.
+    repetido = await client.post("/contas", json=_conta(AG[1], "2222", "10000000000"))
+    assert repetido.status_code == 409
+    assert repetido.json()["detail"]["code"] == "CPF_JA_CADASTRADO"
+
+    op = {"agencia": AG[2], "numero_conta": "1111", "saldo": 5.0}
+    assert (await client.post("/contas/operacoes/depositar", json=op)).json()["saldo_cc"] == 15.0
+    assert (await client.get(f"/contas/{AG[2]}/1111")).json()["saldo_cc"] == 15.0
+
+    # Rota por id: o diretório diz a agência e, com ela, o shard.
+    cheque = await client.put(
+        f"/contas/{criadas[1]['id']}/cheque_especial/cadastrar",
+        json={"habilitado": True, "limite": 50.0},
+    )
+    assert cheque.status_code == 200
+    assert cheque.json()["agencia"] == AG[1]
+
+async def test_desativar_e_trocar_cpf_atualizam_o_diretorio(shards, client):
+    await client.post("/contas", json=_conta(AG[1], "1111", "20000000001"))
+    await client.post("/contas", json=_conta(AG[2], "1111", "20000000002"))
+
+    troca = await client.put(f"/contas/{AG[2]}/1111", json={"cpf": "20000000001"})
+    assert troca.status_code == 409
+    troca = await client.put(f"/contas/{AG[2]}/1111", json={"cpf": "20000000003"})
+    assert troca.status_code == 200
+
+    assert (await client.delete(f"/contas/{AG[1]}/1111/desativar")).status_code == 204
+    reuso = await client.post("/contas", json=_conta(AG[0], "1111", "20000000001"))
+    assert reuso.status_code == 201
+
+    with sessionmaker(bind=shards[0])() as db:
+        assert sorted(db.scalars(select(DiretorioConta.cpf))) == ["20000000001", "20000000003"]
+
+async def test_consultas_espalhadas_juntam_os_shards(shards, client):
+    for indice, agencia in AG.items():
+        for n in range(3):
+            saldo = 10.0 * (indice * 3 + n)
+            await client.post("/contas", json=_conta(
+                agencia, f"{n:04d}", f"3000000{indice}{n:03d}", saldo, nome=f"Bia {indice}{n}"
+            ))
+
+    assert len((await client.get("/contas")).json()) == 9
+
+    resumo = (await client.get("/contas/resumo")).json()
+    assert [r["agencia"] for r in resumo] == sorted(AG.values())
+
+    ranking = (await client.get("/contas/ranking", params={"top": 4})).json()
+    assert [r["score_credito"] for r in ranking] == [8.0, 7.0, 6.0, 5.0]
+
+    # Percentil sobre as 9 contas, não só as do shard.
+    score = (await client.get(f"/contas/{AG[2]}/0002/score_credito")).json()
+    assert score["percentil"] == round(100 * 8 / 9, 2)
+
+    nomes, cursor = [], None
+    while True:
+        params = {"nome": "bia", "limit": 2, **({"after": cursor} if cursor else {})}
+        pagina = (await client.get("/contas/busca", params=params)).json()
+        nomes += [c["nome"] for c in pagina["itens"]]
+        cursor = pagina["proximo"]
+        if cursor is None:
+            break
+    assert nomes == sorted(nomes) and len(nomes) == 9
+
+    lote = await client.post("/contas/consulta-lote", json={"chaves": [
+        {"agencia": AG[0], "numero_conta": "0001"},
+        {"agencia": AG[2], "numero_conta": "0000"},
+        {"agencia": AG[1], "numero_conta": "9999"},
+    ]})
+    assert len(lote.json()["encontradas"]) == 2
+    assert lote.json()["faltantes"] == [{"agencia": AG[1], "numero_conta": "9999"}]
+
+    vistas, desde = [], None
+    while True:
+        params = {"limit": 4, **({"desde": desde} if desde else {})}
+        pagina = (await client.get("/contas/alteracoes", params=params)).json()
+        vistas += [(i["agencia"], i["numero_conta"]) for i in pagina["itens"]]
+        desde = pagina["desde"]
+        if not pagina["tem_mais"]:
+            break
+    assert len(vistas) == len(set(vistas)) == 9
+
+async def test_prazo_vale_nas_threads_dos_shards(shards, client, monkeypatch):
+    for indice, agencia in AG.items():
+        await client.post("/contas", json=_conta(agencia, "1111", f"4900000000{indice}"))
+
+    # O prazo acaba depois da conferência de entrada, já dentro da rota:
+    # quem lê cada shard é uma thread do executor, que precisa vê-lo.
+    espalhar = db_mod.espalhar
+
+    def atrasado(funcao, itens):
+        time.sleep(0.1)
+        return espalhar(funcao, itens)
+
+    monkeypatch.setattr(rotas, "espalhar", atrasado)
+    r = await client.get("/contas", headers={"X-Prazo-Ms": "50"})
+    assert r.status_code == 504
+    assert r.json()["detail"]["code"] == "PRAZO_ESGOTADO"
+    assert len((await client.get("/contas")).json()) == SHARDS
+
+async def test_juros_em_todos_os_shards(shards, client):
+    for indice, agencia in AG.items():
+        conta = {**_conta(agencia, "1111", f"5000000000{indice}"),
+                 "cheque_especial_contratado": True, "limite_cheque_especial": 100.0}
+        assert (await client.post("/contas", json=conta)).status_code == 201
+        op = {"agencia": agencia, "numero_conta": "1111", "saldo": 10.0 * (indice + 1)}
+        assert (await client.post("/contas/operacoes/sacar", json=op)).status_code == 200
+
+    r = await client.post("/interno/juros", json={"data_referencia": "2026-01-31", "taxa": 0.1})
+    assert r.status_code == 200
+    assert r.json()["contas_processadas"] == SHARDS and r.json()["concluida"] is True
+    saldos = [
+        (await client.get(f"/contas/{agencia}/1111")).json()["saldo_cc"] for agencia in AG.values()
+    ]
+    assert saldos == [-11.0, -22.0, -33.0]
+
+async def test_rebalancear_de_um_para_tres_shards(shards, client, monkeypatch):
+    # Tudo começa no shard 0, como num banco de antes do sharding.
+    monkeypatch.setattr(db_mod, "SHARDS", 1)
+    for indice, agencia in AG.items():
+        r = await client.post("/contas", json=_conta(agencia, "1111", f"4000000000{indice}", 7.0))
+        assert r.status_code == 201
+    op = {"agencia": AG[1], "numero_conta": "1111", "saldo": 1.0}
+    await client.post("/contas/operacoes/depositar", json=op)
+    assert [_contar(e) for e in shards] == [3, 0, 0]
+
+    plano = rebalancear(shards, SHARDS, aplicar=False)
+    assert plano["movidas"] == {AG[1]: 1, AG[2]: 2}
+
+    resultado = rebalancear(shards, SHARDS)
+    assert resultado["contas_por_shard"] == [1, 1, 1]
+    assert resultado["diretorio"] == 3
+    assert rebalancear(shards, SHARDS, aplicar=False)["movidas"] == {}
+
+    monkeypatch.setattr(db_mod, "SHARDS", SHARDS)
+    extrato = (await client.get(f"/contas/{AG[1]}/1111/extrato")).json()
+    assert [m["tipo"] for m in extrato["movimentacoes"]] == ["ABERTURA", "DEPOSITO"]
+    resumo = (await client.get("/contas/resumo")).json()
+    assert {r["agencia"]: r["total_depositos"] for r in resumo} == {
+        AG[0]: 7.0, AG[1]: 8.0, AG[2]: 7.0
+    }
+
+async def test_diretorio_desfeito_quando_a_rota_falha(shards, client):
+    for indice in (0, 1):
+        conta = _conta(AG[indice], "1111", f"6000000000{indice}")
+        assert (await client.post("/contas", json=conta)).status_code == 201
+
+    for indice in (0, 1):
+        db = abrir_sessao(indice)
+        try:
+            with pytest.raises(RuntimeError):
+                with reserva(db, AG[indice], "2222", f"6100000000{indice}"):
+                    raise RuntimeError("falha na rota")
+            db.rollback()
+            conta = db.scalar(select(Conta).where(Conta.agencia == AG[indice]))
+            antigo, conta.cpf = conta.cpf, f"6200000000{indice}"
+            with pytest.raises(RuntimeError):
+                with troca_de_cpf(db, conta, antigo):
+                    raise RuntimeError("falha na rota")
+            db.rollback()
+        finally:
+            db.close()
+
+    with sessionmaker(bind=shards[0])() as db:
+        assert sorted(db.scalars(select(DiretorioConta.cpf))) == ["60000000000", "60000000001"]
+
+    # Conta do shard 0: sai do diretório na mesma transação da remoção.
+    assert (await client.delete(f"/contas/{AG[0]}/1111/desativar")).status_code == 204
+    with sessionmaker(bind=shards[0])() as db:
+        assert list(db.scalars(select(DiretorioConta.cpf))) == ["60000000001"]
+
+async def test_subida_reconcilia_o_diretorio_depois_de_um_crash(shards, client):
+    for indice in (0, 1, 2):
+        conta = _conta(AG[indice], "1111", f"6300000000{indice}")
+        assert (await client.post("/contas", json=conta)).status_code == 201
+    assert reconciliar() == 0
+    diretorio = lambda db: sorted(db.scalars(select(DiretorioConta.cpf)))
+
+    # Crash entre o commit do diretório e o do shard: os blocos não saem
+    # nem pelo caminho normal nem pelo de erro, e o shard perde a transação.
+    db = abrir_sessao(1)
+    try:
+        abertos = [reserva(db, AG[1], "2222", "64000000001")]
+        abertos[0].__enter__()
+        conta = db.scalar(select(Conta).where(Conta.agencia == AG[1]))
+        conta.cpf = "64000000002"
+        abertos.append(troca_de_cpf(db, conta, "63000000001"))
+        abertos[1].__enter__()
+        db.rollback()
+
+        with sessionmaker(bind=shards[0])() as principal:
+            assert diretorio(principal) == [
+                "63000000000", "63000000002", "64000000001", "64000000002",
+            ]
+        repetido = await client.post("/contas", json=_conta(AG[2], "3333", "64000000001"))
+        assert repetido.status_code == 409
+
+        # A entrada sem conta sai e o CPF volta ao que está na conta.
+        assert reconciliar() == 2
+        with sessionmaker(bind=shards[0])() as principal:
+            assert diretorio(principal) == ["63000000000", "63000000001", "63000000002"]
+        for cpf in ("64000000001", "64000000002"):
+            livre = await client.post("/contas", json=_conta(AG[2], cpf[-4:], cpf))
+            assert livre.status_code == 201
+        assert reconciliar() == 0
+    finally:
+        # Os blocos largados só são fechados aqui, com o diretório já acertado.
+        for bloco in abertos:
+            bloco.gen.close()
+        db.close()
+    assert reconciliar() == 0
+
+async def test_corpo_invalido_vai_para_o_shard_0(shards):
+    async def receber():
+        return {"type": "http.request", "body": b"{", "more_body": False}
+
+    request = Request({
+        "type": "http", "method": "POST", "path": "/interno/juros",
+        "headers": [], "path_params": {},
+    }, receber)
+    chave = await chave_do_shard(request)
+    assert chave is None and shard_da_chave(chave) == 0
+
+def test_memoria_divide_o_engine():
+    escrita, leitura = criar_engines("sqlite://")
+    assert escrita is leitura
+
+async def test_cli_shards(shards, client, monkeypatch, capsys):
+    url = shards[0].url.render_as_string(hide_password=False)
+    monkeypatch.setattr(db_mod, "DATABASE_URL", url)
+    monkeypatch.setattr(db_mod, "engine", shards[0])
+    assert arquivos_existentes(url) == SHARDS
+
+    # Sem conta no shard 1, e a agência do shard 2 sem movimentações nem resumo.
+    monkeypatch.setattr(db_mod, "SHARDS", 1)
+    for indice in (0, 2):
+        conta = _conta(AG[indice], "1111", f"7000000000{indice}")
+        assert (await client.post("/contas", json=conta)).status_code == 201
+    with sessionmaker(bind=shards[0])() as db:
+        db.execute(delete(Movimentacao))
+        db.execute(delete(ResumoAgencia).where(ResumoAgencia.agencia == AG[2]))
+        db.commit()
+    monkeypatch.setattr(db_mod, "SHARDS", SHARDS)
+
+    assert main(["--verificar"]) == 1
+    assert f"agência {AG[2]}: fora do lugar, vai para o shard 2" in capsys.readouterr().out
+
+    monkeypatch.setattr(sys, "argv", ["shards"])
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        with pytest.raises(SystemExit) as saida:
+            runpy.run_module("clientes_db.app.shards", run_name="__main__")
+    assert saida.value.code == 0
+    saida = capsys.readouterr().out
+    assert f"agência {AG[2]}: movida para o shard 2" in saida
+    assert "shard 1: 0 contas" in saida and "diretório: 2 contas" in saida
+
+    assert main(["--verificar"]) == 0
+    assert [_contar(e) for e in shards] == [1, 0, 1]
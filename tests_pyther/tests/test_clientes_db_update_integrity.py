@@ -8,6 +8,7 @@ from sqlalchemy.exc import IntegrityError
 
 from clientes_db.app.db import Base
 from clientes_db.app.models import Conta
+from clientes_db.app.repositorio import RepositorioSQL
 from clientes_db.app.schemas import ContaCreate, ChequeEspecialCadastro
 from clientes_db.app.routers.contas import criar_conta, cadastrar_cheque_especial
 
@@ -35,7 +36,7 @@ def test_criar_conta_integrityerror_simulado_monkeypatch(monkeypatch):
     monkeypatch.setattr(db, "commit", bad_commit)
 
     with pytest.raises(HTTPException) as exc:
-        criar_conta(body=body, db=db)
+        criar_conta(body=body, repo=RepositorioSQL(db))
     assert exc.value.status_code == 409
     assert exc.value.detail["code"] == "CONFLITO_UNICO"
 
@@ -45,7 +46,7 @@ def test_cadastrar_cheque_especial_sucesso_cobre_retorno_final():
     c = Conta(
         agencia="2222", numero_conta="9999", nome="Carla",
         cpf="33333333333", telefone=11999999999, email="c@ex.com",
-        correntista=True, saldo_cc=0.0, cheque_especial_contratado=False, limite_cheque_especial=0.0
+        correntista=True, saldo_centavos=0, cheque_especial_contratado=False, limite_centavos=0
     )
     db.add(c); db.commit(); db.refresh(c)
 
@@ -0,0 +1,154 @@
+
+from datetime import date
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from clientes_api.app.services.db_conta import DbConta
+from clientes_db.app.db import Base
+from clientes_db.app.juros import acumular_juros
+from clientes_db.app.models import Conta
+from clientes_db.app.routers.contas import _commit_versionado
+
+CONTA = {
+    "agencia": "0001", "numero_conta": "0001", "nome": "Ana", "cpf": "12345678901",
+    "telefone": 11999999999, "email": "a@ex.com", "saldo_cc": 10.0,
+    "cheque_especial_contratado": True, "limite_cheque_especial": 100.0,
+}
+
+def test_if_match_no_put_e_no_cheque(db_test_client):
+    c = db_test_client
+    id_ = c.post("/contas", json=CONTA).json()["id"]
+
+    r = c.get("/contas/0001/0001")
+    etag = r.headers["etag"]
+    assert etag == f'"{r.json()["versao"]}"'
+
+    r = c.put("/contas/0001/0001", json={"nome": "Ana B"}, headers={"If-Match": etag})
+    assert r.status_code == 200
+    novo = r.headers["etag"]
+    assert novo != etag
+
+    # ETag antiga, fraca ou de outra versão: 412 e nada é gravado.
+    for valor in (etag, f"W/{novo}"):
+        r = c.put("/contas/0001/0001", json={"nome": "Ana C"}, headers={"If-Match": valor})
+        assert r.status_code == 412
+        assert r.json()["detail"]["code"] == "VERSAO_DIVERGENTE"
+    assert c.get("/contas/0001/0001").json()["nome"] == "Ana B"
+
+    r = c.put(f"/contas/{id_}/cheque_especial/cadastrar",
+              json={"habilitado": True, "limite": 50.0}, headers={"If-Match": f'"x", {novo}'})
+    assert r.status_code == 200
+    r = c.put(f"/contas/{id_}/cheque_especial/cadastrar",
+              json={"habilitado": True, "limite": 60.0}, headers={"If-Match": novo})
+    assert r.status_code == 412
+
+    r = c.put("/contas/0001/0001", json={"nome": "Ana D"}, headers={"If-Match": "*"})
+    assert r.status_code == 200
+
+def test_toda_escrita_troca_a_versao(db_test_client):
+    c = db_test_client
+    versoes = [c.post("/contas", json=CONTA).json()["versao"]]
+    op = {"agencia": "0001", "numero_conta": "0001", "saldo": 20.0}
+    versoes.append(c.post("/contas/operacoes/depositar", json=op).json()["versao"])
+    versoes.append(c.post("/contas/operacoes/sacar", json=op).json()["versao"])
+    versoes.append(c.post("/contas/operacoes/sacar", json=op).json()["versao"])
+    assert len(set(versoes)) == 4
+
+def _sessoes():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    fabrica = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+    return fabrica(), fabrica()
+
+def _conta(db, saldo=0):
+    conta = Conta(
+        agencia="0001", numero_conta="0001", nome="Ana", cpf="12345678901",
+        telefone=11999999999, email="a@ex.com", saldo_centavos=saldo,
+        cheque_especial_contratado=True, limite_centavos=100000,
+    )
+    db.add(conta)
+    db.commit()
+    return conta.id
+
+def test_escritores_concorrentes_nao_se_sobrescrevem():
+    a, b = _sessoes()
+    id_ = _conta(a)
+
+    conta_a = a.get(Conta, id_)
+    conta_b = b.get(Conta, id_)
+    conta_a.nome = "Escritor A"
+    conta_b.nome = "Escritor B"
+
+    _commit_versionado(a)
+    with pytest.raises(HTTPException) as exc:
+        _commit_versionado(b)
+    assert exc.value.status_code == 412
+
+    b.expire_all()
+    assert b.get(Conta, id_).nome == "Escritor A"
+
+def test_juros_em_massa_troca_a_versao():
+    db, _ = _sessoes()
+    id_ = _conta(db, saldo=-10000)
+    antes = db.get(Conta, id_).versao
+
+    acumular_juros(db, date(2026, 1, 31), 0.01)
+    db.expire_all()
+    depois = db.get(Conta, id_).versao
+    assert depois != antes and len(depois) == 32
+
+@pytest.mark.asyncio
+async def test_gateway_repassa_if_match_e_etag(api_async_client):
+    client, fake = api_async_client
+    recebido = []
+
+    async def obter(ag, num):
+        return {**(await type(fake).obter_conta(fake, ag, num)), "versao": "v1"}
+    async def atualizar(ag, num, payload, if_match=None):
+        recebido.append(if_match)
+        return {**(await obter(ag, num)), **payload, "versao": "v2"}
+    async def cheque(id_, payload, if_match=None):
+        recebido.append(if_match)
+        raise httpx.HTTPStatusError(
+            "412", request=httpx.Request("PUT", "http://x"),
+            response=httpx.Response(412, json={"detail": {"status": 412, "code": "VERSAO_DIVERGENTE", "message": "x"}}),
+        )
+    fake.obter_conta = obter
+    fake.atualizar_conta = atualizar
+    fake.cadastrar_cheque_especial = cheque
+
+    r = await client.get("/contas/1234/5678")
+    assert r.headers["etag"] == '"v1"'
+    assert "versao" not in r.json()
+
+    r = await client.put("/contas/1234/5678", json={"nome": "Novo"}, headers={"If-Match": '"v1"'})
+    assert r.status_code == 200
+    assert r.headers["etag"] == '"v2"'
+
+    r = await client.put("/contas/1234/5678/cheque_especial/cadastrar",
+                         json={"habilitado": True, "limite": 1.0}, headers={"If-Match": '"v0"'})
+    assert r.status_code == 412
+    assert r.json()["detail"]["code"] == "VERSAO_DIVERGENTE"
+    assert recebido == ['"v1"', '"v0"']
+
+@pytest.mark.asyncio
+async def test_db_conta_envia_if_match(monkeypatch):
+    enviados = []
+
+    class _Client:
+        async def __aenter__(self): return self
+        async def __aexit__(self, *a): pass
+        async def put(self, url, json=None, headers=None, timeout=None):
+            enviados.append(headers)
+            return httpx.Response(200, json={}, request=httpx.Request("PUT", url))
+
+    monkeypatch.setattr(httpx, "AsyncClient", _Client)
+    db = DbConta("http://fake")
+    await db.atualizar_conta("1", "2", {}, if_match='"a"')
+    await db.cadastrar_cheque_especial(1, {})
+    assert enviados == [{"If-Match": '"a"'}, None]
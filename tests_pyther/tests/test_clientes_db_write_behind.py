@@ -0,0 +1,557 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+from clientes_db.app import db as db_mod
+from clientes_db.app import diario
+from clientes_db.app.db import abrir_sessao, iniciar_escrita, shard_da_agencia
+from clientes_db.app.main import app
+from clientes_db.app.models import Conta, Movimentacao
+from clientes_db.app.repositorio import RepositorioSQL
+from clientes_db.app.routers.contas import _conferir_saque
+
+
+def _criar(agencia: str, cpf: str, saldo: int = 0, limite: int = 0) -> Conta:
+    db = abrir_sessao(shard_da_agencia(agencia))
+    try:
+        iniciar_escrita(db)
+        return RepositorioSQL(db).criar(Conta(
+            agencia=agencia, numero_conta="0001", nome="Ana", cpf=cpf,
+            telefone=11999999999, email="wb@ex.com", saldo_centavos=saldo,
+            cheque_especial_contratado=bool(limite), limite_centavos=limite,
+        ))
+    finally:
+        db.close()
+
+
+def _no_banco(conta: Conta) -> tuple[int, int]:
+    db = abrir_sessao(shard_da_agencia(conta.agencia), leitura=True)
+    try:
+        saldo = db.scalar(select(Conta.saldo_centavos).where(Conta.id == conta.id))
+        movimentos = db.scalar(
+            select(func.count()).select_from(Movimentacao).where(Movimentacao.conta_id == conta.id)
+        )
+        return saldo, movimentos
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def saldos(tmp_path):
+    s = diario.SaldosEmMemoria(diario.Diario(str(tmp_path / "diario"), janela_s=0))
+    s.recuperar()
+    yield s
+    s.diario.fechar()
+
+
+def test_diario_reaplicado_depois_de_crash_uma_vez_so(tmp_path, saldos):
+    conta = _criar("0461", "46146146101", saldo=1_000)
+    saldos.movimentar("0461", "0001", "DEPOSITO", 500)
+    saldos.movimentar("0461", "0001", "SAQUE", -200, _conferir_saque)
+    assert _no_banco(conta) == (1_000, 1)
+
+    # Crash: nada foi descarregado; o diário tem os dois registros, e uma
+    # linha cortada no fim que nunca foi confirmada.
+    caminho = saldos.diario.caminho
+    with open(caminho) as f:
+        linhas = f.read()
+    with open(caminho, "a") as f:
+        f.write('{"seq": 99, "conta')
+
+    assert diario.SaldosEmMemoria(diario.Diario(caminho)).recuperar() == 2
+    assert _no_banco(conta) == (1_300, 3)
+
+    # O mesmo diário de novo (crash antes de truncar) não aplica duas vezes.
+    with open(caminho, "w") as f:
+        f.write(linhas)
+    assert diario.SaldosEmMemoria(diario.Diario(caminho)).recuperar() == 0
+    assert _no_banco(conta) == (1_300, 3)
+
+
+def test_saque_concorrente_respeita_o_limite(saldos):
+    conta = _criar("0462", "46246246201", limite=10_000)
+    confirmados = []
+
+    def depositar():
+        for _ in range(100):
+            saldos.movimentar("0462", "0001", "DEPOSITO", 100)
+            confirmados.append(100)
+
+    def sacar():
+        for _ in range(100):
+            try:
+                saldos.movimentar("0462", "0001", "SAQUE", -150, _conferir_saque)
+                confirmados.append(-150)
+            except HTTPException:
+                pass
+
+    threads = [threading.Thread(target=f) for f in (depositar, sacar) * 4]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    em_memoria = saldos.retrato("0462", "0001").saldo_centavos
+    assert em_memoria == sum(confirmados) >= -10_000
+    saldos.descarregar()
+    assert _no_banco(conta) == (em_memoria, len(confirmados))
+
+
+def test_rotas_com_escrita_adiada(saldos):
+    diario.usar_diario(app, saldos)
+    try:
+        client = TestClient(app)
+        conta = _criar("0463", "46346346301", saldo=1_000)
+
+        r = client.post("/contas/operacoes/sacar", json={"agencia": "0463", "numero_conta": "0001", "saldo": 15.0})
+        assert r.json()["detail"]["code"] == "SALDO_INSUFICIENTE"
+        r = client.post("/contas/operacoes/depositar", json={"agencia": "0463", "numero_conta": "0001", "saldo": 5.0})
+        assert r.json()["saldo_cc"] == 15.0
+
+        # Ainda só em memória (e no diário), mas as leituras já veem.
+        assert _no_banco(conta) == (1_000, 1)
+        lida = client.get("/contas/0463/0001")
+        assert lida.json()["saldo_cc"] == 15.0
+        assert lida.headers["etag"] == r.headers["etag"]
+
+        # O PUT aplica o pendente da conta antes e confere o If-Match nele.
+        r = client.put(
+            f"/contas/{conta.id}/cheque_especial/cadastrar",
+            json={"habilitado": True, "limite": 10.0},
+            headers={"If-Match": r.headers["etag"]},
+        )
+        assert r.status_code == 200
+        assert _no_banco(conta) == (1_500, 3)
+
+        r = client.post("/contas/operacoes/sacar", json={"agencia": "0463", "numero_conta": "0001", "saldo": 25.0})
+        assert r.json()["saldo_cc"] == -10.0
+        r = client.post("/contas/operacoes/depositar", json={"agencia": "0463", "numero_conta": "0001", "saldo": 10.0})
+        assert client.delete("/contas/0463/0001/desativar").status_code == 204
+        assert client.get("/contas/0463/0001").status_code == 404
+        assert saldos.descarregar() == 0
+    finally:
+        diario.desligar(app)
+
+
+class _Vagas(asyncio.Semaphore):
+    def __init__(self, valor):
+        super().__init__(valor)
+        self.reservas = 0
+
+    async def acquire(self):
+        self.reservas += 1
+        return await super().acquire()
+
+
+def test_sessao_de_escrita_reserva_vaga_no_pool(saldos, monkeypatch):
+    vagas = _Vagas(1)
+    monkeypatch.setattr(app.state, "vagas_conexao", vagas, raising=False)
+    diario.usar_diario(app, saldos)
+    try:
+        client = TestClient(app)
+        r = client.post("/contas", json={
+            "agencia": "0464", "numero_conta": "0001", "nome": "Ana", "cpf": "46446446401",
+            "telefone": 11999999999, "email": "wb@ex.com", "saldo_cc": 0.0,
+        })
+        assert r.status_code == 201 and vagas.reservas == 1
+        # Depósito só vai para o diário: nenhuma sessão de escrita.
+        client.post("/contas/operacoes/depositar", json={"agencia": "0464", "numero_conta": "0001", "saldo": 5.0})
+        assert vagas.reservas == 1
+        client.post("/contas/operacoes/sacar", json={"agencia": "0464", "numero_conta": "0001", "saldo": 5.0})
+        assert client.delete("/contas/0464/0001/desativar").status_code == 204
+        assert vagas.reservas == 2
+        # A vaga foi devolvida nas duas rotas.
+        assert not vagas.locked()
+    finally:
+        diario.desligar(app)
+
+
+def _aguardar(condicao, limite_s: float = 2.0) -> None:
+    fim = time.monotonic() + limite_s
+    while not condicao():
+        assert time.monotonic() < fim
+        time.sleep(0.01)
+
+
+def _falha_uma_vez(monkeypatch) -> list:
+    falhas = []
+    aplicar = diario.aplicar_nos_shards
+
+    def instavel(registros):
+        if not falhas:
+            falhas.append(registros)
+            raise RuntimeError("banco fora do ar")
+        return aplicar(registros)
+
+    monkeypatch.setattr(diario, "aplicar_nos_shards", instavel)
+    return falhas
+
+
+def test_caminho_padrao_ao_lado_do_banco(monkeypatch):
+    monkeypatch.delenv("CLIENTES_DB_DIARIO", raising=False)
+    monkeypatch.setattr(db_mod, "DATABASE_URL", "sqlite:///./dados/clientes.db")
+    assert diario.caminho_padrao() == "./dados/clientes.db.diario"
+
+
+def test_fsync_com_erro_nao_confirma(saldos, monkeypatch):
+    marca = saldos.diario.escrever({"seq": 1})
+
+    def fsync(fd):
+        raise OSError("disco cheio")
+
+    monkeypatch.setattr(diario.os, "fsync", fsync)
+    with pytest.raises(OSError):
+        saldos.diario.aguardar(marca)
+    assert saldos.diario.duraveis == 0
+    monkeypatch.undo()
+    saldos.diario.aguardar(marca)
+    assert saldos.diario.duraveis == marca
+
+
+def test_thread_de_descarga_continua_depois_de_falhar(tmp_path, monkeypatch, caplog):
+    conta = _criar("0465", "46546546501")
+    saldos = diario.SaldosEmMemoria(
+        diario.Diario(str(tmp_path / "diario"), janela_s=0), intervalo_s=0.01
+    )
+    assert saldos.iniciar() == 0
+    falhas = _falha_uma_vez(monkeypatch)
+
+    saldos.movimentar("0465", "0001", "DEPOSITO", 500)
+    _aguardar(lambda: _no_banco(conta)[0] == 500)
+    assert len(falhas) == 1
+    assert "Falha ao descarregar o diário" in caplog.text
+
+    # Ao parar, o que estiver pendente vai para o banco.
+    saldos.movimentar("0465", "0001", "DEPOSITO", 100)
+    saldos.parar()
+    assert _no_banco(conta)[0] == 600
+
+    nunca_iniciado = diario.SaldosEmMemoria(diario.Diario(str(tmp_path / "outro")))
+    nunca_iniciado.parar()
+
+
+def test_conta_descartada_no_meio_da_operacao(saldos, monkeypatch):
+    conta = _criar("0466", "46646646601", saldo=1_000)
+    _criar("0467", "46746746701")
+    outra = saldos._entrada("0467", "0001")
+
+    # Outra conta sai da memória enquanto esta é lida do SQLite: a leitura
+    # pode ser anterior a um descarte, então é refeita.
+    leituras = []
+
+    class _Leitura(diario.RepositorioSQL):
+        def obter(self, agencia, numero_conta):
+            if not leituras:
+                with saldos._lock:
+                    saldos._descartar(outra)
+            leituras.append(agencia)
+            return super().obter(agencia, numero_conta)
+
+    monkeypatch.setattr(diario, "RepositorioSQL", _Leitura)
+    assert saldos.movimentar("0466", "0001", "DEPOSITO", 100).saldo_centavos == 1_100
+    assert leituras == ["0466", "0466"]
+    monkeypatch.undo()
+    saldos.descarregar()
+
+    # Quem esperava pelo lock de uma entrada descartada busca a nova.
+    def descartar_com_espera(alvo):
+        entrada = saldos._entradas[("0466", "0001")]
+        entrada.lock.acquire()
+        t = threading.Thread(target=alvo)
+        t.start()
+        time.sleep(0.05)
+        with saldos._lock:
+            saldos._descartar(entrada)
+        entrada.lock.release()
+        t.join()
+        # Descartar de novo não tira a entrada nova.
+        with saldos._lock:
+            saldos._descartar(entrada)
+        assert saldos.retrato("0466", "0001") is not None
+
+    descartar_com_espera(lambda: saldos.movimentar("0466", "0001", "DEPOSITO", 100))
+    assert saldos.retrato("0466", "0001").saldo_centavos == 1_200
+    saldos.descarregar()
+
+    db = abrir_sessao(shard_da_agencia("0466"))
+    try:
+        na_sessao = RepositorioSQL(db).obter("0466", "0001")
+
+        def exclusivo():
+            with saldos.exclusivo(db, na_sessao):
+                na_sessao.nome = "Bia"
+                db.commit()
+
+        descartar_com_espera(exclusivo)
+    finally:
+        db.close()
+    assert saldos.retrato("0466", "0001").nome == "Bia"
+    assert _no_banco(conta)[0] == 1_200
+
+
+def test_conta_inexistente(saldos):
+    assert saldos.movimentar("0460", "9999", "DEPOSITO", 100) is None
+    assert saldos.retrato_por_id(-1) is None
+
+
+def test_pausa_espera_as_movimentacoes_e_segura_as_novas(saldos):
+    conta = _criar("0468", "46846846801")
+    na_conferencia, liberar = threading.Event(), threading.Event()
+    dentro, sair = threading.Event(), threading.Event()
+    ordem = []
+
+    def conferir(conta, novo_saldo):
+        na_conferencia.set()
+        liberar.wait()
+
+    def juros():
+        with saldos.pausa():
+            ordem.append("juros")
+            dentro.set()
+            sair.wait()
+
+    def outra_pausa():
+        with saldos.pausa():
+            ordem.append("outra pausa")
+
+    def depositar():
+        saldos.movimentar("0468", "0001", "DEPOSITO", 100)
+        ordem.append("deposito")
+
+    em_curso = threading.Thread(
+        target=saldos.movimentar, args=("0468", "0001", "DEPOSITO", 100, conferir)
+    )
+    threads = [em_curso, threading.Thread(target=juros)]
+    try:
+        em_curso.start()
+        na_conferencia.wait()
+        threads[1].start()
+        time.sleep(0.05)
+        assert ordem == []
+
+        liberar.set()
+        dentro.wait()
+        em_curso.join()
+        # Dentro da pausa o depósito em curso já está no banco.
+        assert _no_banco(conta)[0] == 100
+        threads += [threading.Thread(target=outra_pausa), threading.Thread(target=depositar)]
+        for t in threads[2:]:
+            t.start()
+        time.sleep(0.05)
+        assert ordem == ["juros"]
+    finally:
+        liberar.set()
+        sair.set()
+        for t in threads:
+            if t.is_alive():
+                t.join()
+    assert sorted(ordem[1:]) == ["deposito", "outra pausa"]
+    saldos.descarregar()
+    assert _no_banco(conta)[0] == 200
+
+
+def test_pausa_com_descarga_falha_mantem_os_saldos_pendentes(saldos, monkeypatch):
+    conta = _criar("0459", "45945945901", saldo=1_000)
+    falhas = _falha_uma_vez(monkeypatch)
+    saldos.movimentar("0459", "0001", "DEPOSITO", 500)
+
+    with pytest.raises(RuntimeError):
+        with saldos.pausa():
+            pass
+    assert len(falhas) == 1
+    assert saldos.retrato("0459", "0001").saldo_centavos == 1_500
+    assert saldos.movimentar("0459", "0001", "DEPOSITO", 100).saldo_centavos == 1_600
+    assert saldos.descarregar() == 2
+    assert _no_banco(conta)[0] == 1_600
+
+
+def test_descarga_leva_so_o_que_esta_no_disco(saldos):
+    conta = _criar("0458", "45845845801")
+    saldos.movimentar("0458", "0001", "DEPOSITO", 100)
+
+    # O próximo registro fica esperando a janela do fsync.
+    saldos.diario.janela_s = 0.2
+    t = threading.Thread(target=saldos.movimentar, args=("0458", "0001", "DEPOSITO", 100))
+    t.start()
+    time.sleep(0.05)
+    assert saldos.descarregar() == 1
+    assert _no_banco(conta)[0] == 100
+    assert saldos.diario.ler() != []
+    t.join()
+    assert saldos.descarregar() == 1
+    assert _no_banco(conta)[0] == 200
+    assert saldos.diario.ler() == []
+
+
+def test_contas_ociosas_saem_da_memoria(tmp_path):
+    _criar("0457", "45745745701")
+    _criar("0456", "45645645601")
+    saldos = diario.SaldosEmMemoria(diario.Diario(str(tmp_path / "diario"), janela_s=0), ociosa_s=0)
+    try:
+        saldos.movimentar("0457", "0001", "DEPOSITO", 100)
+        saldos.movimentar("0456", "0001", "DEPOSITO", 100)
+        # Conta em uso por uma rota fica para a próxima rodada.
+        ocupada = saldos._entradas[("0456", "0001")]
+        with ocupada.lock:
+            assert saldos.descarregar() == 2
+        assert saldos.retrato("0457", "0001") is None
+        assert saldos.retrato("0456", "0001").saldo_centavos == 100
+        saldos.descarregar()
+        assert saldos.retrato("0456", "0001") is None
+    finally:
+        saldos.diario.fechar()
+
+
+class _LockComChegada:
+    """Lock da entrada que deixa uma movimentação chegar antes do acquire sem espera."""
+
+    def __init__(self, lock, chegada):
+        self._lock = lock
+        self._chegada = chegada
+
+    def acquire(self, blocking=True):
+        if not blocking and self._chegada is not None:
+            chegada, self._chegada = self._chegada, None
+            chegada()
+        return self._lock.acquire(blocking)
+
+    def release(self):
+        self._lock.release()
+
+    def __enter__(self):
+        self._lock.acquire()
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+
+def test_corridas_da_descarga(tmp_path, monkeypatch):
+    conta = _criar("0453", "45345345301")
+    saldos = diario.SaldosEmMemoria(diario.Diario(str(tmp_path / "diario"), janela_s=0), ociosa_s=0)
+    try:
+        saldos.movimentar("0453", "0001", "DEPOSITO", 100)
+
+        # Uma rota aplica os registros da conta enquanto a descarga os leva
+        # ao banco: quem chega depois não os tira de novo.
+        aplicar = diario.aplicar_nos_shards
+
+        def com_rota_no_meio(registros):
+            db = abrir_sessao(shard_da_agencia("0453"))
+            try:
+                na_sessao = RepositorioSQL(db).obter("0453", "0001")
+                with saldos.exclusivo(db, na_sessao):
+                    db.commit()
+            finally:
+                db.close()
+            return aplicar(registros)
+
+        monkeypatch.setattr(diario, "aplicar_nos_shards", com_rota_no_meio)
+        assert saldos.descarregar() == 1
+        monkeypatch.undo()
+        assert _no_banco(conta)[0] == 100
+
+        # Conta escolhida para sair da memória recebe um depósito antes do
+        # lock: fica, com o registro pendente.
+        entrada = saldos._entrada("0453", "0001")
+        entrada.lock = _LockComChegada(
+            entrada.lock, lambda: saldos.movimentar("0453", "0001", "DEPOSITO", 100)
+        )
+        assert saldos.descarregar() == 0
+        assert saldos.retrato("0453", "0001").saldo_centavos == 200
+        assert saldos.descarregar() == 1
+        assert _no_banco(conta)[0] == 200
+    finally:
+        saldos.diario.fechar()
+
+
+def test_leituras_com_escrita_adiada(saldos):
+    diario.usar_diario(app, saldos)
+    try:
+        client = TestClient(app)
+        _criar("0455", "45545545501", saldo=1_000)
+        _criar("0454", "45445445401", saldo=2_000)
+        client.post("/contas/operacoes/depositar", json={"agencia": "0455", "numero_conta": "0001", "saldo": 5.0})
+
+        saldos_cc = {
+            c["agencia"]: c["saldo_cc"] for c in client.get("/contas").json()
+            if c["agencia"] in ("0454", "0455")
+        }
+        assert saldos_cc == {"0454": 20.0, "0455": 15.0}
+        campos = [
+            c for c in client.get("/contas", params={"fields": "agencia,saldo_cc"}).json()
+            if c["agencia"] in ("0454", "0455")
+        ]
+        assert sorted(campos, key=lambda c: c["agencia"]) == [
+            {"agencia": "0454", "saldo_cc": 20.0}, {"agencia": "0455", "saldo_cc": 15.0}
+        ]
+
+        for agencia, saldo in (("0454", 20.0), ("0455", 15.0)):
+            r = client.get(f"/contas/{agencia}/0001")
+            assert r.json()["saldo_cc"] == saldo
+            repetida = client.get(
+                f"/contas/{agencia}/0001", headers={"If-None-Match": r.headers["etag"]}
+            )
+            assert repetida.status_code == 304
+            r = client.get(f"/contas/{agencia}/0001", params={"fields": "saldo_cc"})
+            assert r.json() == {"saldo_cc": saldo}
+
+        falta = {"agencia": "0455", "numero_conta": "9999", "saldo": 1.0}
+        assert client.post("/contas/operacoes/depositar", json=falta).status_code == 404
+        assert client.delete("/contas/0455/9999/desativar").status_code == 404
+    finally:
+        diario.desligar(app)
+
+
+def test_marca_de_alteracao_anda_na_descarga(saldos):
+    diario.usar_diario(app, saldos)
+    try:
+        client = TestClient(app)
+        _criar("0446", "44644644601", saldo=1_000)
+        op = {"agencia": "0446", "numero_conta": "0001", "saldo": 5.0}
+        antes = int(client.get("/contas/0446/0001").headers["x-alteracao"])
+
+        # Enquanto está só no diário, a marca é a da última descarga.
+        r = client.post("/contas/operacoes/depositar", json=op)
+        assert int(r.headers["x-alteracao"]) == r.json()["alteracao"] == antes
+        lida = client.get("/contas/0446/0001", headers={"X-Min-Alteracao": str(antes)})
+        assert lida.status_code == 200 and lida.json()["saldo_cc"] == 15.0
+
+        # Descarregado, a marca avança e passa a valer para o que veio antes.
+        assert saldos.descarregar() == 1
+        depois = int(client.get("/contas/0446/0001").headers["x-alteracao"])
+        assert depois > antes
+        r = client.post("/contas/operacoes/depositar", json=op)
+        assert int(r.headers["x-alteracao"]) == depois
+        lida = client.get("/contas/0446/0001", headers={"X-Min-Alteracao": str(depois)})
+        assert lida.json()["saldo_cc"] == 20.0
+        assert saldos.descarregar() == 1
+    finally:
+        diario.desligar(app)
+
+
+def test_conta_desativada_durante_a_descarga(saldos, monkeypatch):
+    diario.usar_diario(app, saldos)
+    try:
+        client = TestClient(app)
+        conta = _criar("0445", "44544544501", saldo=0)
+        saldos.movimentar("0445", "0001", "DEPOSITO", 100)
+        saldos.movimentar("0445", "0001", "SAQUE", -100)
+
+        # A desativação aplica os pendentes e tira a conta da memória antes
+        # de a descarga chegar a eles: não há marca a avançar.
+        aplicar = diario.aplicar_nos_shards
+
+        def com_desativacao_no_meio(registros):
+            assert client.delete("/contas/0445/0001/desativar").status_code == 204
+            return aplicar(registros)
+
+        monkeypatch.setattr(diario, "aplicar_nos_shards", com_desativacao_no_meio)
+        assert saldos.descarregar() == 2
+        assert saldos.retrato_por_id(conta.id) is None
+    finally:
+        diario.desligar(app)
@@ -2,7 +2,7 @@
 from fastapi import HTTPException
 from clientes_db.app.models import Conta
 from clientes_db.app.routers.contas import _to_out, _get_by_id_or_404
-from clientes_db.app.db import get_db
+from clientes_db.app.db import abrir_sessao
 
 
 def test_to_out_branches_limite_atual_e_score():
@@ -15,9 +15,9 @@ def test_to_out_branches_limite_atual_e_score():
         telefone=11999999999,
         email="a@a.com",
         correntista=True,
-        saldo_cc=-20.0,
+        saldo_centavos=-2000,
         cheque_especial_contratado=True,
-        limite_cheque_especial=100.0,
+        limite_centavos=10000,
     )
     c1.id = 1
     out1 = _to_out(c1)
@@ -33,9 +33,9 @@ def test_to_out_branches_limite_atual_e_score():
         telefone=11999999999,
         email="b@b.com",
         correntista=True,
-        saldo_cc=50.0,
+        saldo_centavos=5000,
         cheque_especial_contratado=False,
-        limite_cheque_especial=500.0,
+        limite_centavos=50000,
     )
     c2.id = 2
     out2 = _to_out(c2)
@@ -45,8 +45,7 @@ def test_to_out_branches_limite_atual_e_score():
 
 def test_get_by_id_or_404_lanca_404_para_id_inexistente():
     
-    gen = get_db()
-    db = next(gen)
+    db = abrir_sessao()
     try:
         try:
             _get_by_id_or_404(db, id_=999999)
@@ -55,9 +54,4 @@ def test_get_by_id_or_404_lanca_404_para_id_inexistente():
             assert exc.status_code == 404
             assert exc.detail["code"] == "CONTA_NAO_ENCONTRADA"
     finally:
-        
-        try:
-            next(gen)
-        except StopIteration:
-            pass
-
+        db.close()
@@ -31,12 +31,18 @@ class _StubAsyncClient:
             return _FakeResp(200, {**(json or {}), "ok": "sacar"})
         return _FakeResp(200, {**(json or {}), "ok": "post"})
 
-    async def get(self, url, timeout=None):
+    async def get(self, url, params=None, timeout=None):
+        if url.endswith("/contas/busca"):
+            return _FakeResp(200, {"itens": [], "proximo": None, "params": params})
+        if url.endswith("/contas/alteracoes"):
+            return _FakeResp(200, {"itens": [], "desde": params.get("desde"), "tem_mais": False})
+        if url.endswith("/contas/ranking"):
+            return _FakeResp(200, [{"params": params}])
         if url.endswith("/contas"):
             return _FakeResp(200, [{"agencia": "1234", "numero_conta": "5678"}])
         return _FakeResp(200, {"agencia": "1234", "numero_conta": "5678"})
 
-    async def put(self, url, json=None, timeout=None):
+    async def put(self, url, json=None, headers=None, timeout=None):
         if "/cheque_especial/cadastrar" in url:
             return _FakeResp(200, {**(json or {}), "ok": "cheque"})
         return _FakeResp(200, {**(json or {}), "ok": "atualizar"})
@@ -59,6 +65,21 @@ async def test_db_conta_metodos_sucesso(monkeypatch):
     out = await db.obter_conta("1234", "5678")
     assert out["numero_conta"] == "5678"
 
+    out = await db.resumo_agencias()
+    assert out["agencia"] == "1234"
+
+    out = await db.buscar_contas({"nome": "Ma"})
+    assert out["params"] == {"nome": "Ma"}
+
+    out = await db.score_credito("1234", "5678")
+    assert out["numero_conta"] == "5678"
+
+    out = await db.ranking_score(5)
+    assert out == [{"params": {"top": 5}}]
+
+    out = await db.alteracoes({"desde": "m", "limit": 10})
+    assert out["desde"] == "m"
+
     out = await db.atualizar_conta("1234", "5678", {"nome": "X"})
     assert out["ok"] == "atualizar"
 
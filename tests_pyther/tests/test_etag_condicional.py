@@ -0,0 +1,100 @@
+
+import httpx
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from clientes_api.app.services.db_conta import DbConta
+from clientes_db.app.db import Base
+from clientes_db.app.repositorio import RepositorioSQL
+from clientes_db.app.routers.contas import buscar_conta, criar_conta
+from clientes_db.app.schemas import ContaCreate
+
+CONTA = {
+    "agencia": "0001", "numero_conta": "0001", "nome": "Ana", "cpf": "12345678901",
+    "telefone": 11999999999, "email": "a@ex.com", "saldo_cc": 10.0,
+}
+
+def test_if_none_match_responde_304_ate_a_conta_mudar(db_test_client):
+    c = db_test_client
+    c.post("/contas", json=CONTA)
+    etag = c.get("/contas/0001/0001").headers["etag"]
+
+    for valor in (etag, f"W/{etag}", f'"outra", {etag}', "*"):
+        r = c.get("/contas/0001/0001", headers={"If-None-Match": valor})
+        assert r.status_code == 304
+        assert r.headers["etag"] == etag
+        assert r.content == b""
+
+    c.post("/contas/operacoes/depositar", json={"agencia": "0001", "numero_conta": "0001", "saldo": 1.0})
+    r = c.get("/contas/0001/0001", headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.json()["saldo_cc"] == 11.0
+    assert r.headers["etag"] != etag
+
+    r = c.get("/contas/0001/9999", headers={"If-None-Match": etag})
+    assert r.status_code == 404
+
+def test_304_so_le_a_versao():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine, autocommit=False, autoflush=False)()
+    conta = criar_conta(body=ContaCreate(**CONTA), repo=RepositorioSQL(db))
+
+    comandos = []
+    event.listen(engine, "before_cursor_execute", lambda *a: comandos.append(a[2]))
+    r = buscar_conta(
+        agencia="0001", numero_conta="0001", fields=None, repo=RepositorioSQL(db),
+        if_none_match=f'"{conta["versao"]}"'
+    )
+    assert r.status_code == 304
+    assert len(comandos) == 1
+    assert comandos[0].startswith("SELECT contas.versao \nFROM contas")
+
+@pytest.mark.asyncio
+async def test_gateway_repassa_if_none_match(api_async_client):
+    client, fake = api_async_client
+    recebido = []
+
+    async def se_mudou(ag, num, if_none_match):
+        recebido.append(if_none_match)
+        if if_none_match == '"v1"':
+            return None, '"v1"'
+        conta = await fake.obter_conta(ag, num)
+        return {**conta, "versao": "v2"}, '"v2"'
+    fake.obter_conta_se_mudou = se_mudou
+
+    r = await client.get("/contas/1234/5678", headers={"If-None-Match": '"v1"'})
+    assert r.status_code == 304
+    assert r.headers["etag"] == '"v1"'
+    assert r.content == b""
+
+    r = await client.get("/contas/1234/5678", headers={"If-None-Match": '"v0"'})
+    assert r.status_code == 200
+    assert r.headers["etag"] == '"v2"'
+    assert "id" not in r.json() and "versao" not in r.json()
+    assert recebido == ['"v1"', '"v0"']
+
+@pytest.mark.asyncio
+async def test_db_conta_obter_conta_se_mudou(monkeypatch):
+    respostas = [
+        httpx.Response(304, headers={"ETag": '"a"'}),
+        httpx.Response(200, headers={"ETag": '"b"'}, json={"agencia": "1"}),
+    ]
+    enviados = []
+
+    class _Client:
+        async def __aenter__(self): return self
+        async def __aexit__(self, *a): pass
+        async def get(self, url, headers=None, timeout=None):
+            enviados.append(headers)
+            r = respostas.pop(0)
+            r.request = httpx.Request("GET", url)
+            return r
+
+    monkeypatch.setattr(httpx, "AsyncClient", _Client)
+    db = DbConta("http://fake")
+    assert await db.obter_conta_se_mudou("1", "2", '"a"') == (None, '"a"')
+    assert await db.obter_conta_se_mudou("1", "2", '"a"') == ({"agencia": "1"}, '"b"')
+    assert enviados == [{"If-None-Match": '"a"'}] * 2
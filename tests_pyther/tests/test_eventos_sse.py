@@ -0,0 +1,269 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from clientes_api.app.routers.contas import stream_eventos as stream_gateway
+from clientes_api.app.services import eventos as eventos_api
+from clientes_db.app import eventos
+from clientes_db.app.db import Base
+from clientes_db.app.models import Conta
+from clientes_db.app.repositorio import RepositorioSQL
+from clientes_db.app.routers import contas as rotas
+from clientes_db.app.schemas import OperacaoPorChaves
+
+
+def _sessao():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine, autocommit=False, autoflush=False)()
+    db.add(Conta(
+        agencia="0001", numero_conta="0001", nome="Ana", cpf="12345678901",
+        telefone=11999999999, email="a@ex.com", saldo_centavos=1000,
+        cheque_especial_contratado=True, limite_centavos=5000,
+    ))
+    db.commit()
+    return db
+
+def _dados(quadro):
+    linhas = dict(l.split(": ", 1) for l in quadro.strip().splitlines())
+    return linhas["event"], json.loads(linhas["data"])
+
+@pytest.mark.asyncio
+async def test_eventos_publicados_so_apos_commit():
+    db = _sessao()
+    stream = eventos.hub.stream()
+    assert await stream.__anext__() == "retry: 3000\n\n"
+
+    # Evento registrado e desfeito no rollback não chega a ninguém.
+    eventos.registrar(db, "DEPOSITO", db.query(Conta).one(), 999)
+    db.rollback()
+
+    op = OperacaoPorChaves(agencia="0001", numero_conta="0001", saldo=2.5)
+    await asyncio.to_thread(rotas.depositar, body=op, repo=RepositorioSQL(db))
+    await asyncio.to_thread(rotas.sacar, body=OperacaoPorChaves(
+        agencia="0001", numero_conta="0001", saldo=20.0), repo=RepositorioSQL(db))
+
+    tipo, dados = _dados(await stream.__anext__())
+    assert tipo == "DEPOSITO"
+    assert dados["valor"] == 2.5 and dados["saldo_cc"] == 12.5
+    tipo, dados = _dados(await stream.__anext__())
+    assert tipo == "SAQUE"
+    assert dados["valor"] == -20.0 and dados["saldo_cc"] == -7.5
+
+    await stream.aclose()
+    assert not eventos.hub._assinaturas
+
+@pytest.mark.asyncio
+async def test_assinante_lento_e_derrubado_sem_travar_os_outros():
+    hub = eventos.Hub(tamanho_buffer=2)
+    lento, rapido = hub.stream(), hub.stream()
+    await lento.__anext__()
+    await rapido.__anext__()
+
+    for i in range(3):
+        hub.publicar({"tipo": "DEPOSITO", "i": i})
+        assert _dados(await rapido.__anext__())[1] == {"tipo": "DEPOSITO", "i": i}
+
+    assert (await lento.__anext__()).startswith("event: DERRUBADO")
+    with pytest.raises(StopAsyncIteration):
+        await lento.__anext__()
+    assert len(hub._assinaturas) == 1
+    await rapido.aclose()
+
+@pytest.mark.asyncio
+async def test_keepalive_sem_eventos():
+    stream = eventos.Hub().stream(keepalive_s=0.01)
+    await stream.__anext__()
+    assert await stream.__anext__() == ": ping\n\n"
+    await stream.aclose()
+
+@pytest.mark.asyncio
+async def test_rotas_sse_devolvem_event_stream():
+    r = await rotas.stream_eventos()
+    assert r.media_type == "text/event-stream"
+    r = await stream_gateway(eventos_api.Repetidor("http://fake"))
+    assert r.media_type == "text/event-stream"
+
+@pytest.mark.asyncio
+async def test_gateway_reparte_uma_conexao_entre_assinantes(monkeypatch):
+    conexoes = []
+
+    def origem(request):
+        conexoes.append(request.url.path)
+        corpo = (
+            "retry: 3000\n\n"
+            'id: 1\nevent: DEPOSITO\ndata: {"valor": 1.0}\n\n'
+            'id: 2\nevent: SAQUE\ndata: {"valor": -1.0}\n\n'
+        )
+        return httpx.Response(200, text=corpo, headers={"content-type": "text/event-stream"})
+
+    original = httpx.AsyncClient
+    monkeypatch.setattr(
+        httpx, "AsyncClient",
+        lambda *a, **k: original(*a, transport=httpx.MockTransport(origem), **k),
+    )
+    monkeypatch.setattr(eventos_api, "ESPERA_RECONEXAO_S", 10)
+
+    repetidor = eventos_api.Repetidor("http://fake:8001")
+    assinantes = [repetidor.stream() for _ in range(3)]
+    for s in assinantes:
+        await s.__anext__()
+
+    # Só os eventos passam, com os ids do gateway; o fim da conexão de
+    # origem derruba os assinantes depois do que já estava na fila.
+    for s in assinantes:
+        quadros = [await s.__anext__() for _ in range(3)]
+        assert [q.splitlines()[0] for q in quadros[:2]] == ["id: 1", "id: 2"]
+        assert _dados(quadros[0]) == ("DEPOSITO", {"valor": 1.0})
+        assert _dados(quadros[1]) == ("SAQUE", {"valor": -1.0})
+        assert _dados(quadros[2]) == ("DERRUBADO", {"motivo": "origem desconectada"})
+        with pytest.raises(StopAsyncIteration):
+            await s.__anext__()
+    assert conexoes == ["/contas/eventos"]
+    assert repetidor.assinantes == 0 and repetidor._tarefa is None
+
+@pytest.mark.asyncio
+async def test_hub_depois_de_derrubar_e_com_loop_encerrado():
+    hub = eventos.Hub(tamanho_buffer=1)
+    stream = hub.stream(keepalive_s=0.01)
+    await stream.__anext__()
+    # Dois pings seguidos: o stream continua esperando depois de cada um.
+    assert [await stream.__anext__() for _ in range(2)] == [": ping\n\n"] * 2
+
+    # O segundo enche o buffer e derruba; o terceiro já nem entra na fila.
+    for i in range(3):
+        hub.publicar({"tipo": "DEPOSITO", "i": i})
+    await asyncio.sleep(0)
+    assert (await stream.__anext__()).startswith("event: DERRUBADO")
+
+    # Assinante cujo loop já fechou sai na próxima publicação.
+    loop = asyncio.new_event_loop()
+    loop.close()
+    morta = eventos.Assinatura(loop, 1)
+    hub._assinaturas.add(morta)
+    hub.publicar({"tipo": "SAQUE"})
+    assert morta not in hub._assinaturas
+
+@pytest.mark.asyncio
+async def test_repetidor_reconecta_e_derruba_quem_enche_o_buffer(monkeypatch):
+    conexoes = []
+
+    def origem(request):
+        conexoes.append(request.url.path)
+        if len(conexoes) == 1:
+            return httpx.Response(500)
+        corpo = (
+            "\n\n"
+            'id: 1\nevent: DEPOSITO\ndata: {"valor": 1.0}\n\n'
+            'id: 2\nevent: SAQUE\ndata: {"valor": -1.0}\n\n'
+        )
+        return httpx.Response(200, text=corpo, headers={"content-type": "text/event-stream"})
+
+    original = httpx.AsyncClient
+    monkeypatch.setattr(
+        httpx, "AsyncClient",
+        lambda *a, **k: original(*a, transport=httpx.MockTransport(origem), **k),
+    )
+    monkeypatch.setattr(eventos_api, "ESPERA_RECONEXAO_S", 0.01)
+
+    repetidor = eventos_api.Repetidor("http://fake:8001", tamanho_buffer=1)
+    stream = repetidor.stream()
+    await stream.__anext__()
+    # A origem respondeu 500 na primeira vez; na reconexão chegam os dois
+    # eventos de uma vez e o segundo não cabe no buffer.
+    assert (await asyncio.wait_for(stream.__anext__(), 2)).startswith("event: DERRUBADO")
+    with pytest.raises(StopAsyncIteration):
+        await stream.__anext__()
+    assert conexoes == ["/contas/eventos"] * 2
+    assert repetidor.assinantes == 0 and repetidor._tarefa is None
+
+    # Sem assinantes a leitura da origem nem começa.
+    await repetidor._ler_origem("http://fake:8001")
+    assert len(conexoes) == 2
+
+@pytest.mark.asyncio
+async def test_repetidor_manda_keepalive_com_a_origem_fora(monkeypatch):
+    def fora(request):
+        raise httpx.ConnectError("recusada", request=request)
+
+    original = httpx.AsyncClient
+    monkeypatch.setattr(
+        httpx, "AsyncClient",
+        lambda *a, **k: original(*a, transport=httpx.MockTransport(fora), **k),
+    )
+    monkeypatch.setattr(eventos_api, "ESPERA_RECONEXAO_S", 10)
+
+    stream = eventos_api.Repetidor("http://fora:8001").stream(keepalive_s=0.01)
+    await stream.__anext__()
+    assert [await stream.__anext__() for _ in range(2)] == [": ping\n\n"] * 2
+    await stream.aclose()
+    repetidor = eventos_api.repetidor_para("http://fora:8001")
+    assert eventos_api.repetidor_para("http://fora:8001") is repetidor
+
+@pytest.mark.asyncio
+async def test_repetidor_so_repassa_eventos_e_cai_com_a_origem(monkeypatch):
+    async def aberta():
+        # ping, retry e id da origem ficam no gateway; a conexão segue aberta.
+        yield b': ping\n\nretry: 5000\n\nid: 7\nevent: DEPOSITO\ndata: {"valor": 1.0}\n\n'
+        await asyncio.Event().wait()
+
+    async def derruba():
+        await asyncio.sleep(0.05)
+        yield b'id: 7\nevent: SAQUE\ndata: {"valor": -1.0}\n\n'
+        yield b'event: DERRUBADO\ndata: {"motivo": "buffer cheio"}\n\n'
+        yield b'id: 8\nevent: DEPOSITO\ndata: {"valor": 9.0}\n\n'
+
+    def origem(request):
+        corpo = aberta() if request.url.host == "a" else derruba()
+        return httpx.Response(200, content=corpo, headers={"content-type": "text/event-stream"})
+
+    original = httpx.AsyncClient
+    monkeypatch.setattr(
+        httpx, "AsyncClient",
+        lambda *a, **k: original(*a, transport=httpx.MockTransport(origem), **k),
+    )
+
+    repetidor = eventos_api.Repetidor("http://a:8001", "http://b:8001")
+    stream = repetidor.stream(keepalive_s=10)
+    await stream.__anext__()
+    quadros = [await asyncio.wait_for(stream.__anext__(), 2) for _ in range(3)]
+
+    # As duas instâncias mandaram id 7; o gateway numera os eventos de novo.
+    assert [q.splitlines()[0] for q in quadros[:2]] == ["id: 1", "id: 2"]
+    assert [_dados(q) for q in quadros[:2]] == [
+        ("DEPOSITO", {"valor": 1.0}), ("SAQUE", {"valor": -1.0}),
+    ]
+    # O DERRUBADO da origem vira um só aviso do gateway, e nada depois dele.
+    assert _dados(quadros[2]) == ("DERRUBADO", {"motivo": "origem desconectada"})
+    with pytest.raises(StopAsyncIteration):
+        await stream.__anext__()
+    assert repetidor.assinantes == 0 and repetidor._tarefa is None
+
+@pytest.mark.asyncio
+async def test_repetidor_com_buffer_cheio_quando_a_origem_cai(monkeypatch):
+    def origem(request):
+        corpo = 'event: DEPOSITO\ndata: {"valor": 1.0}\n\n'
+        return httpx.Response(200, text=corpo, headers={"content-type": "text/event-stream"})
+
+    original = httpx.AsyncClient
+    monkeypatch.setattr(
+        httpx, "AsyncClient",
+        lambda *a, **k: original(*a, transport=httpx.MockTransport(origem), **k),
+    )
+
+    repetidor = eventos_api.Repetidor("http://fake:8001", tamanho_buffer=1)
+    stream = repetidor.stream()
+    await stream.__anext__()
+    # O evento ocupa o buffer; o aviso da queda toma o lugar dele.
+    assert _dados(await asyncio.wait_for(stream.__anext__(), 2)) == (
+        "DERRUBADO", {"motivo": "origem desconectada"},
+    )
+    assert repetidor._tarefa is None
+    # Sem leitura em curso (nem assinantes) não há o que derrubar.
+    repetidor._derrubar_todos("origem desconectada")
+    assert repetidor._tarefa is None
@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from clientes_api.app.services import admissao
+from clientes_api.app.services.admissao import BaldeTokens, Limitador, Orcamento
+
+
+@pytest.mark.asyncio
+async def test_limitador_fila_curta_e_espera_maxima():
+    limitador = Limitador(capacidade=1, fila=1, espera_s=0.05)
+    assert await limitador.entrar() is None
+
+    esperando = asyncio.ensure_future(limitador.entrar())
+    await asyncio.sleep(0)
+    assert limitador.na_fila == 1
+    assert await limitador.entrar() == "FILA_CHEIA"
+
+    # A vaga passa direto para quem estava na fila.
+    limitador.sair()
+    assert await esperando is None
+    assert (limitador.em_curso, limitador.na_fila) == (1, 0)
+
+    assert await limitador.entrar() == "ESPERA_ESGOTADA"
+    assert limitador.na_fila == 0
+    limitador.sair()
+    assert limitador.em_curso == 0
+
+
+@pytest.mark.asyncio
+async def test_cliente_que_desiste_da_fila():
+    limitador = Limitador(capacidade=1, fila=2, espera_s=1)
+    assert await limitador.entrar() is None
+
+    desistiu = asyncio.ensure_future(limitador.entrar())
+    await asyncio.sleep(0)
+    desistiu.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await desistiu
+    assert limitador.na_fila == 0
+
+    # Cancelado com a vaga já dada: ela passa para o próximo da fila.
+    primeiro = asyncio.ensure_future(limitador.entrar())
+    await asyncio.sleep(0)
+    segundo = asyncio.ensure_future(limitador.entrar())
+    await asyncio.sleep(0)
+    primeiro.cancel()
+    limitador.sair()
+    resultados = await asyncio.gather(primeiro, segundo, return_exceptions=True)
+    assert isinstance(resultados[0], asyncio.CancelledError)
+    assert resultados[1] is None
+    assert (limitador.em_curso, limitador.na_fila) == (1, 0)
+
+
+def test_balde_esquece_clientes_parados(monkeypatch):
+    monkeypatch.setattr(admissao, "MAX_CLIENTES", 2)
+    balde = BaldeTokens(taxa=1)
+    balde.retirar("a", agora=0)
+    balde.retirar("b", agora=50)
+    assert balde.retirar("c", agora=100) == 0
+    assert sorted(balde._baldes) == ["b", "c"]
+    # Esquecido, "a" volta com o balde cheio.
+    assert balde.retirar("a", agora=100) == 0
+
+
+def test_balde_por_cliente():
+    balde = BaldeTokens(taxa=2)
+    assert balde.retirar("a", agora=0) == 0
+    assert balde.retirar("a", agora=0) == 0
+    assert balde.retirar("a", agora=0) == pytest.approx(0.5)
+    assert balde.retirar("b", agora=0) == 0
+    assert balde.retirar("a", agora=0.5) == 0
+    assert BaldeTokens(taxa=0).retirar("a") == 0
+
+
+@pytest.mark.asyncio
+async def test_escritas_lotadas_nao_bloqueiam_leituras(api_async_client, monkeypatch):
+    client, fake = api_async_client
+    monkeypatch.setattr(admissao, "orcamentos", {
+        "leitura": Orcamento(capacidade=4, fila=0, espera_s=0, taxa=0),
+        "escrita": Orcamento(capacidade=1, fila=0, espera_s=0, taxa=2),
+    })
+    liberar = asyncio.Event()
+    original = fake.depositar
+
+    async def depositar_lento(payload):
+        await liberar.wait()
+        return await original(payload)
+
+    monkeypatch.setattr(fake, "depositar", depositar_lento)
+    op = {"agencia": "1234", "numero_conta": "5678", "saldo": 1.0}
+
+    lento = asyncio.ensure_future(client.post("/contas/operacoes/depositar", json=op))
+    await asyncio.sleep(0.05)
+
+    r = await client.post("/contas/operacoes/depositar", json=op)
+    assert r.status_code == 503
+    assert r.headers["retry-after"] == "1"
+    assert r.json()["detail"]["code"] == "GATEWAY_SOBRECARREGADO"
+
+    assert (await client.get("/contas/1234/5678")).status_code == 200
+    liberar.set()
+    assert (await lento).status_code == 200
+
+    # Taxa de 2/s por cliente: a terceira escrita seguida é recusada.
+    r = await client.post("/contas/operacoes/depositar", json=op)
+    assert r.status_code == 429
+    assert r.json()["detail"]["code"] == "LIMITE_DE_TAXA"
+    outro = await client.post(
+        "/contas/operacoes/depositar", json=op, headers={"X-Cliente-Id": "outro"}
+    )
+    assert outro.status_code == 200
+
+    metricas = (await client.get("/interno/metricas/admissao")).json()
+    assert metricas["escrita"]["recusadas"] == {
+        "LIMITE_DE_TAXA": 1, "FILA_CHEIA": 1, "ESPERA_ESGOTADA": 0,
+    }
+    assert metricas["escrita"]["aceitas"] == 2
+    assert metricas["leitura"]["em_curso"] == 0
@@ -0,0 +1,157 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from clientes_api.app.services import disjuntor
+from clientes_api.app.services.db_conta import DbConta
+from clientes_api.app.services.disjuntor import Disjuntor, DisjuntorAberto
+
+
+def test_abre_com_falhas_e_sonda_ao_meio_abrir():
+    d = Disjuntor(taxa_erro=0.5, janela_s=10, min_chamadas=4, aberto_s=5)
+    for falhou in (False, True, False):
+        assert d.entrar(agora=0) is False
+        d.sair(False, falhou, agora=0)
+    assert d.estado == disjuntor.FECHADO
+    d.entrar(agora=1)
+    d.sair(False, True, agora=1)
+    assert d.estado == disjuntor.ABERTO
+
+    with pytest.raises(DisjuntorAberto):
+        d.entrar(agora=5.9)
+    # Meio aberto: uma sonda por vez; a falha dela reabre.
+    assert d.entrar(agora=6) is True
+    with pytest.raises(DisjuntorAberto):
+        d.entrar(agora=6)
+    d.sair(True, True, agora=6.1)
+    assert d.estado == disjuntor.ABERTO
+    # Sonda cancelada não decide nada; a próxima que der certo fecha.
+    assert d.entrar(agora=11.1) is True
+    d.sair(True, None, agora=11.1)
+    assert d.entrar(agora=11.2) is True
+    d.sair(True, False, agora=11.2)
+    assert d.estado == disjuntor.FECHADO
+    assert d.resumo()["aberturas"] == 2 and d.resumo()["recusadas"] == 2
+
+
+@pytest.mark.asyncio
+async def test_lentidao_e_5xx_contam_como_falha():
+    d = Disjuntor(lentidao_s=0.02, min_chamadas=3, aberto_s=5)
+
+    async def lenta():
+        await asyncio.sleep(0.03)
+        return httpx.Response(200)
+
+    async def com_status(status):
+        return httpx.Response(status)
+
+    await d.chamar(lenta)
+    # 504 é o prazo de quem chamou, não falha da instância.
+    await d.chamar(lambda: com_status(504))
+    await d.chamar(lambda: com_status(404))
+    assert d.estado == disjuntor.FECHADO
+    await d.chamar(lambda: com_status(503))
+    assert d.estado == disjuntor.ABERTO
+
+
+@pytest.mark.asyncio
+async def test_so_timeout_lento_conta_como_falha():
+    d = Disjuntor(lentidao_s=0.02, min_chamadas=2, aberto_s=5)
+
+    async def timeout(espera):
+        await asyncio.sleep(espera)
+        raise httpx.ReadTimeout("sem resposta")
+
+    # Timeout antes da lentidão é prazo curto de quem chamou.
+    with pytest.raises(httpx.ReadTimeout):
+        await d.chamar(lambda: timeout(0))
+    assert d.resumo()["chamadas_na_janela"] == 0
+    for _ in range(2):
+        with pytest.raises(httpx.ReadTimeout):
+            await d.chamar(lambda: timeout(0.03))
+    assert d.estado == disjuntor.ABERTO
+
+
+@pytest.mark.asyncio
+async def test_leitura_redundante_depois_do_p95(monkeypatch):
+    monkeypatch.setattr(disjuntor, "LEITURA_REDUNDANTE", True)
+    d = Disjuntor()
+    for _ in range(disjuntor.MIN_AMOSTRAS_P95):
+        d.sair(False, False, duracao=0.01)
+    enviadas = []
+
+    async def requisicao():
+        enviadas.append(time.monotonic())
+        if len(enviadas) == 1:
+            await asyncio.sleep(1)
+            return httpx.Response(200, json="primeira")
+        return httpx.Response(200, json="segunda")
+
+    inicio = time.monotonic()
+    r = await d.chamar_redundante(requisicao)
+    assert r.json() == "segunda"
+    assert time.monotonic() - inicio < 0.5
+    assert enviadas[1] - enviadas[0] >= 0.005
+    assert (d.redundantes, d.redundantes_vencedoras) == (1, 1)
+
+    # Resposta antes do p95: nenhuma segunda requisição.
+    r = await d.chamar_redundante(lambda: asyncio.sleep(0, httpx.Response(204)))
+    assert r.status_code == 204
+    assert d.redundantes == 1
+
+    # Sem p95 (poucas amostras) não há segunda requisição.
+    novo = Disjuntor()
+    await novo.chamar_redundante(lambda: asyncio.sleep(0.02, httpx.Response(200)))
+    assert novo.redundantes == 0
+
+
+@pytest.mark.asyncio
+async def test_leitura_redundante_com_as_duas_falhando(monkeypatch):
+    monkeypatch.setattr(disjuntor, "LEITURA_REDUNDANTE", True)
+    d = Disjuntor()
+    for _ in range(disjuntor.MIN_AMOSTRAS_P95):
+        d.sair(False, False, duracao=0.01)
+    enviadas = []
+
+    async def requisicao():
+        enviadas.append(len(enviadas))
+        if len(enviadas) == 1:
+            await asyncio.sleep(0.05)
+        raise httpx.ConnectError(f"recusada {len(enviadas)}")
+
+    with pytest.raises(httpx.ConnectError):
+        await d.chamar_redundante(requisicao)
+    assert len(enviadas) == 2
+    assert (d.redundantes, d.redundantes_vencedoras) == (1, 0)
+
+
+@pytest.mark.asyncio
+async def test_db_conta_falha_rapido_com_o_disjuntor_aberto(api_async_client, monkeypatch):
+    chamadas = []
+
+    class _Client:
+        async def __aenter__(self): return self
+        async def __aexit__(self, *a): pass
+
+        async def get(self, url, params=None, timeout=None):
+            chamadas.append(url)
+            raise httpx.ConnectError("recusada", request=httpx.Request("GET", url))
+
+    monkeypatch.setattr(httpx, "AsyncClient", _Client)
+    monkeypatch.setitem(
+        disjuntor._disjuntores, "http://quebrado:8001", Disjuntor(min_chamadas=3)
+    )
+    db = DbConta(base_url="http://quebrado:8001")
+
+    for _ in range(3):
+        with pytest.raises(httpx.ConnectError):
+            await db.obter_conta("0501", "0001")
+    with pytest.raises(DisjuntorAberto):
+        await db.listar_contas()
+    assert len(chamadas) == 3
+
+    client, _ = api_async_client
+    r = await client.get("/interno/metricas/disjuntores")
+    assert r.json()["http://quebrado:8001"]["estado"] == "ABERTO"
@@ -0,0 +1,62 @@
+
+import pytest
+import httpx
+
+from clientes_api.app.services.db_conta import DbConta
+
+@pytest.mark.asyncio
+async def test_extrato_gateway_repassa_filtros_e_omite_ids(api_async_client):
+    client, fake = api_async_client
+    recebido = {}
+
+    async def extrato(ag, num, params):
+        recebido.update(params)
+        return {
+            "agencia": ag, "numero_conta": num, "saldo_inicial": 10.0,
+            "movimentacoes": [{
+                "id": 7, "tipo": "DEPOSITO", "valor": 5.0, "saldo_apos": 15.0,
+                "criado_em": "2026-01-01T12:00:00",
+            }],
+            "proximo": 7,
+        }
+    fake.extrato = extrato
+
+    r = await client.get("/contas/1234/5678/extrato", params={"desde": "2026-01-01T00:00:00", "after": 3, "limit": 10})
+    assert r.status_code == 200
+    body = r.json()
+    assert recebido == {"limit": 10, "desde": "2026-01-01T00:00:00", "after": 3}
+    assert "id" not in body["movimentacoes"][0]
+    assert body["proximo"] == 7
+
+@pytest.mark.asyncio
+async def test_extrato_gateway_erros(api_async_client):
+    client, fake = api_async_client
+
+    async def nao_encontrada(ag, num, params):
+        req = httpx.Request("GET", "http://x")
+        raise httpx.HTTPStatusError("err", request=req, response=httpx.Response(404, json={"detail": {"code": "CONTA_NAO_ENCONTRADA"}}))
+    fake.extrato = nao_encontrada
+    r = await client.get("/contas/1234/5678/extrato", params={"ate": "2026-01-01T00:00:00"})
+    assert r.status_code == 404
+
+    async def fora(ag, num, params):
+        raise httpx.RequestError("unavailable", request=httpx.Request("GET", "http://x"))
+    fake.extrato = fora
+    r = await client.get("/contas/1234/5678/extrato")
+    assert r.status_code == 503
+
+@pytest.mark.asyncio
+async def test_db_conta_extrato(monkeypatch):
+    chamadas = []
+
+    class _Client:
+        async def __aenter__(self): return self
+        async def __aexit__(self, *a): pass
+        async def get(self, url, params=None, timeout=None):
+            chamadas.append((url, params))
+            return httpx.Response(200, json={"ok": True}, request=httpx.Request("GET", url))
+
+    monkeypatch.setattr(httpx, "AsyncClient", _Client)
+    out = await DbConta("http://fake:8001").extrato("1234", "5678", {"limit": 5})
+    assert out == {"ok": True}
+    assert chamadas == [("http://fake:8001/contas/1234/5678/extrato", {"limit": 5})]
@@ -0,0 +1,341 @@
+import base64
+import json
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from clientes_api.app.routers import contas as rotas
+from clientes_api.app.services import db_conta
+from clientes_api.app.services.roteamento import (
+    AnelHash, DbContas, _decodificar, contas_para, ler_instancias,
+)
+
+AGENCIAS = [f"{n:04d}" for n in range(2000)]
+
+
+def _instancia(contas: list[dict], chamadas: list):
+    """clientes_db de mentira: listagem, busca, lote, resumo, ranking,
+    alterações e uma conta."""
+
+    def responder(request: httpx.Request) -> httpx.Response:
+        chamadas.append((request.url.host, request.method, request.url.path))
+        partes = request.url.path.strip("/").split("/")
+        if partes == ["contas"] and request.method == "GET":
+            campos = request.url.params.get("fields")
+            if campos:
+                return httpx.Response(200, json=[
+                    {k: c[k] for k in campos.split(",")} for c in contas
+                ])
+            return httpx.Response(200, json=contas)
+        if partes == ["contas", "consulta-lote"]:
+            pedidas = json.loads(request.content)["chaves"]
+            chaves = {(k["agencia"], k["numero_conta"]) for k in pedidas}
+            return httpx.Response(200, json={
+                "encontradas": [c for c in contas if (c["agencia"], c["numero_conta"]) in chaves],
+                "faltantes": [
+                    {"agencia": ag, "numero_conta": num} for ag, num in chaves
+                    if not any((c["agencia"], c["numero_conta"]) == (ag, num) for c in contas)
+                ],
+            })
+        if partes == ["contas", "busca"]:
+            # Por nome, em (nome, id); sem nome, só por id.
+            if "nome" in request.url.params:
+                prefixo = request.url.params["nome"].lower()
+                chave = lambda c: (c["nome"].lower(), c["id"])  # noqa: E731
+                marca = lambda c: [c["nome"], c["id"]]  # noqa: E731
+            else:
+                prefixo = ""
+                chave = lambda c: (c["id"],)  # noqa: E731
+                marca = lambda c: [c["id"]]  # noqa: E731
+            limit = int(request.url.params["limit"])
+            itens = sorted((c for c in contas if c["nome"].lower().startswith(prefixo)), key=chave)
+            if "after" in request.url.params:
+                after = json.loads(base64.urlsafe_b64decode(request.url.params["after"]))
+                inicio = (after[0].lower(), after[1]) if len(after) == 2 else tuple(after)
+                itens = [c for c in itens if chave(c) > inicio]
+            proximo = None
+            if len(itens) > limit:
+                proximo = base64.urlsafe_b64encode(
+                    json.dumps(marca(itens[limit - 1])).encode()
+                ).decode()
+            return httpx.Response(200, json={"itens": itens[:limit], "proximo": proximo})
+        if partes == ["contas", "alteracoes"]:
+            # Sequência própria da instância; a marca é a última alteracao lida.
+            limit = int(request.url.params["limit"])
+            desde = request.url.params.get("desde")
+            inicio = json.loads(base64.urlsafe_b64decode(desde)) if desde else 0
+            novas = sorted(
+                (c for c in contas if c["alteracao"] > inicio), key=lambda c: c["alteracao"]
+            )
+            marca = lambda n: base64.urlsafe_b64encode(json.dumps(n).encode()).decode()  # noqa: E731
+            itens = [
+                {"tipo": "ALTERADA", "agencia": c["agencia"], "numero_conta": c["numero_conta"],
+                 "conta": None, "alteracao": c["alteracao"], "desde": marca(c["alteracao"])}
+                for c in novas[:limit]
+            ]
+            return httpx.Response(200, json={
+                "itens": itens,
+                "desde": itens[-1]["desde"] if itens else (desde or marca(0)),
+                "tem_mais": len(novas) > limit,
+            })
+        if partes == ["contas", "resumo"]:
+            agencias = sorted({c["agencia"] for c in contas})
+            return httpx.Response(200, json=[{"agencia": a} for a in agencias])
+        if partes == ["contas", "ranking"]:
+            ordem = sorted(contas, key=lambda c: -c["score_credito"])
+            return httpx.Response(200, json=ordem[:int(request.url.params["top"])])
+        if request.method == "GET" and len(partes) == 3:
+            conta = next(
+                (c for c in contas if (c["agencia"], c["numero_conta"]) == tuple(partes[1:])), None
+            )
+            return httpx.Response(200, json=conta) if conta else httpx.Response(404, json={})
+        return httpx.Response(200, json={"ok": request.url.host})
+
+    return responder
+
+def _fora_do_ar(request: httpx.Request):
+    raise httpx.ConnectError("recusada", request=request)
+
+@pytest.fixture
+def instancias(monkeypatch):
+    """Três instâncias (a tem réplica), com os clientes compartilhados
+    apontando para transportes em memória."""
+    chamadas = []
+    config = "http://a|http://a2,http://b,http://c"
+    anel = AnelHash(list(ler_instancias(config)))
+    contas = {"a": [], "b": [], "c": []}
+    for id_, agencia in enumerate(AGENCIAS[:30]):
+        dono = anel.no_da_chave(agencia)[len("http://"):]
+        contas[dono].append({
+            "id": len(contas[dono]) + 1, "agencia": agencia, "numero_conta": "0001",
+            "nome": f"Bia {id_:02d}", "score_credito": float(id_),
+            "alteracao": len(contas[dono]) + 1,
+        })
+
+    transportes = {
+        "http://a": _fora_do_ar,
+        "http://a2": _instancia(contas["a"], chamadas),
+        "http://b": _instancia(contas["b"], chamadas),
+        "http://c": _instancia(contas["c"], chamadas),
+    }
+    monkeypatch.setattr(db_conta, "_clientes", {
+        url: httpx.AsyncClient(transport=httpx.MockTransport(t)) for url, t in transportes.items()
+    })
+    return DbContas(ler_instancias(config)), contas, chamadas
+
+def test_nova_instancia_so_leva_a_fatia_dela():
+    quatro = AnelHash(["http://a", "http://b", "http://c", "http://d"])
+    cinco = AnelHash(["http://a", "http://b", "http://c", "http://d", "http://e"])
+
+    movidas = [a for a in AGENCIAS if quatro.no_da_chave(a) != cinco.no_da_chave(a)]
+    assert {cinco.no_da_chave(a) for a in movidas} == {"http://e"}
+    assert 0.1 < len(movidas) / len(AGENCIAS) < 0.3
+
+    tres = AnelHash(["http://a", "http://b", "http://c"])
+    movidas = [a for a in AGENCIAS if quatro.no_da_chave(a) != tres.no_da_chave(a)]
+    assert {quatro.no_da_chave(a) for a in movidas} == {"http://d"}
+
+@pytest.mark.asyncio
+async def test_leitura_passa_para_a_replica_e_escrita_nao(instancias):
+    db, contas, chamadas = instancias
+    conta = contas["a"][0]
+
+    lida = await db.obter_conta(conta["agencia"], conta["numero_conta"])
+    assert lida == conta
+    assert chamadas == [("a2", "GET", f"/contas/{conta['agencia']}/0001")]
+
+    with pytest.raises(httpx.ConnectError):
+        await db.depositar({"agencia": conta["agencia"], "numero_conta": "0001", "saldo": 1.0})
+
+    outra = contas["b"][0]
+    assert (await db.depositar({"agencia": outra["agencia"], "numero_conta": "0001"}))["ok"] == "b"
+
+@pytest.mark.asyncio
+async def test_rotas_agregadas_juntam_as_instancias(instancias):
+    db, contas, _ = instancias
+    todas = [c for lista in contas.values() for c in lista]
+
+    resumo = await db.resumo_agencias()
+    assert [r["agencia"] for r in resumo] == sorted(c["agencia"] for c in todas)
+
+    ranking = await db.ranking_score(5)
+    assert [r["score_credito"] for r in ranking] == [29.0, 28.0, 27.0, 26.0, 25.0]
+
+    nomes, cursor = [], None
+    while True:
+        params = {"nome": "bia", "limit": 4, **({"after": cursor} if cursor else {})}
+        pagina = await db.buscar_contas(params)
+        assert len(pagina["itens"]) <= 4
+        nomes += [c["nome"] for c in pagina["itens"]]
+        cursor = pagina["proximo"]
+        if cursor is None:
+            break
+    assert nomes == sorted(c["nome"] for c in todas)
+
+
+async def _todas_as_alteracoes(db, limit: int) -> list[dict]:
+    vistas, desde = [], None
+    while True:
+        pagina = await db.alteracoes({"limit": limit, **({"desde": desde} if desde else {})})
+        assert len(pagina["itens"]) <= limit
+        vistas += pagina["itens"]
+        desde = pagina["desde"]
+        if not pagina["tem_mais"]:
+            return vistas
+
+
+@pytest.mark.asyncio
+async def test_alteracoes_intercaladas_sem_passar_do_limit(instancias):
+    db, contas, chamadas = instancias
+    todas = [c for lista in contas.values() for c in lista]
+
+    for limit in (1, 2, 4, 7):
+        vistas = await _todas_as_alteracoes(db, limit)
+        assert sorted((i["agencia"], i["alteracao"]) for i in vistas) == sorted(
+            (c["agencia"], c["alteracao"]) for c in todas
+        )
+
+    # Intercalação k-way: a página junta as instâncias por alteracao.
+    pagina = await db.alteracoes({"limit": 3})
+    assert [i["alteracao"] for i in pagina["itens"]] == [1, 1, 1]
+    assert pagina["tem_mais"] is True
+
+    # Sem nada novo, a marca volta igual e a página vem vazia.
+    fim = await db.alteracoes({"limit": 100})
+    assert fim["tem_mais"] is False
+    repetida = await db.alteracoes({"limit": 100, "desde": fim["desde"]})
+    assert repetida == {"itens": [], "desde": fim["desde"], "tem_mais": False}
+
+
+@pytest.mark.asyncio
+async def test_alteracoes_com_uma_instancia_usam_o_mesmo_cursor(monkeypatch):
+    contas = [
+        {"agencia": f"{n:04d}", "numero_conta": "0001", "alteracao": n + 1} for n in range(5)
+    ]
+    monkeypatch.setattr(db_conta, "_clientes", {
+        "http://unica": httpx.AsyncClient(transport=httpx.MockTransport(_instancia(contas, [])))
+    })
+    db = DbContas(ler_instancias("http://unica"))
+
+    pagina = await db.alteracoes({"limit": 2})
+    assert [i["alteracao"] for i in pagina["itens"]] == [1, 2]
+    assert set(_decodificar(pagina["desde"])) == {"http://unica"}
+    assert len(await _todas_as_alteracoes(db, 2)) == 5
+
+    with pytest.raises(HTTPException) as e:
+        await db.alteracoes({"limit": 2, "desde": base64.urlsafe_b64encode(b"[1]").decode()})
+    assert e.value.detail["code"] == "CURSOR_INVALIDO"
+
+
+def test_configuracao_das_instancias(monkeypatch):
+    assert ler_instancias(" http://a/ | http://a2 ,, http://b,|") == {
+        "http://a": ["http://a", "http://a2"],
+        "http://b": ["http://b"],
+    }
+    assert contas_para("http://x,http://y") is contas_para("http://x,http://y")
+    assert list(contas_para("http://x,http://y").instancias) == ["http://x", "http://y"]
+
+    # CLIENTES_DB_URLS tem precedência sobre CLIENTES_DB_URL.
+    monkeypatch.setenv("CLIENTES_DB_URL", "http://unica")
+    monkeypatch.delenv("CLIENTES_DB_URLS", raising=False)
+    assert isinstance(rotas.get_db(), db_conta.DbConta)
+    assert rotas.get_repetidor().base_urls == ["http://unica"]
+    monkeypatch.setenv("CLIENTES_DB_URLS", "http://x|http://x2,http://y")
+    assert rotas.get_db() is contas_para("http://x|http://x2,http://y")
+    assert rotas.get_repetidor().base_urls == ["http://x", "http://y"]
+
+    with pytest.raises(HTTPException) as e:
+        _decodificar("xx")
+    assert e.value.detail["code"] == "CURSOR_INVALIDO"
+
+
+@pytest.mark.asyncio
+async def test_clientes_compartilhados_por_instancia(monkeypatch):
+    monkeypatch.setattr(db_conta, "_clientes", {})
+    cliente = db_conta.cliente_para("http://a")
+    assert db_conta.cliente_para("http://a") is cliente
+    assert db_conta.cliente_para("http://b") is not cliente
+
+    await db_conta.fechar_clientes()
+    assert db_conta._clientes == {} and cliente.is_closed
+
+
+@pytest.mark.asyncio
+async def test_rotas_de_uma_conta_vao_a_instancia_dona(instancias):
+    db, contas, chamadas = instancias
+    na_a = contas["a"][0]["agencia"]
+    na_b = contas["b"][0]["agencia"]
+
+    # Leituras: a principal de a está fora, todas vão à réplica.
+    assert (await db.obter_conta_se_mudou(na_a, "0001", '"v"'))[0]["agencia"] == na_a
+    assert (await db.obter_conta_campos(na_a, "0001", "nome"))["agencia"] == na_a
+    assert await db.score_credito(na_a, "0001") == {"ok": "a2"}
+    assert await db.extrato(na_a, "0001", {"limit": 10}) == {"ok": "a2"}
+    assert {host for host, _, _ in chamadas} == {"a2"}
+
+    # Escritas: só a principal da dona.
+    chamadas.clear()
+    assert (await db.criar_conta({"agencia": na_b}))["ok"] == "b"
+    await db.atualizar_conta(na_b, "0001", {}, if_match='"v"')
+    await db.desativar_conta(na_b, "0001")
+    await db.sacar({"agencia": na_b, "numero_conta": "0001"})
+    await db.cadastrar_cheque_especial(7, {"agencia": na_b}, if_match='"v"')
+    assert chamadas == [
+        ("b", "POST", "/contas"),
+        ("b", "PUT", f"/contas/{na_b}/0001"),
+        ("b", "DELETE", f"/contas/{na_b}/0001/desativar"),
+        ("b", "POST", "/contas/operacoes/sacar"),
+        ("b", "PUT", "/contas/7/cheque_especial/cadastrar"),
+    ]
+
+    # Escrita não vai à réplica: a falha da principal (conexão recusada, ou
+    # o disjuntor já aberto por ela) chega a quem chamou.
+    with pytest.raises(httpx.RequestError):
+        await db.criar_conta({"agencia": na_a})
+
+
+@pytest.mark.asyncio
+async def test_listagens_e_lote_juntam_as_instancias(instancias):
+    db, contas, _ = instancias
+    todas = [c for lista in contas.values() for c in lista]
+
+    assert sorted(c["agencia"] for c in await db.listar_contas()) == sorted(
+        c["agencia"] for c in todas
+    )
+    campos = await db.listar_contas_campos("agencia,nome")
+    assert len(campos) == len(todas) and set(campos[0]) == {"agencia", "nome"}
+
+    a, b = contas["a"][0], contas["b"][1]
+    lote = await db.consultar_lote([
+        {"agencia": b["agencia"], "numero_conta": "0001"},
+        {"agencia": a["agencia"], "numero_conta": "9999"},
+        {"agencia": a["agencia"], "numero_conta": "0001"},
+        {"agencia": b["agencia"], "numero_conta": "0001"},
+    ])
+    # Na ordem pedida, sem repetir, com a instância a lida pela réplica.
+    assert [c["agencia"] for c in lote["encontradas"]] == [b["agencia"], a["agencia"]]
+    assert lote["faltantes"] == [{"agencia": a["agencia"], "numero_conta": "9999"}]
+
+
+@pytest.mark.asyncio
+async def test_busca_por_id_intercala_as_instancias(instancias, monkeypatch):
+    db, contas, _ = instancias
+    ids, cursor = [], None
+    while True:
+        pagina = await db.buscar_contas({"limit": 4, **({"after": cursor} if cursor else {})})
+        assert len(pagina["itens"]) <= 4
+        ids += [c["id"] for c in pagina["itens"]]
+        cursor = pagina["proximo"]
+        if cursor is None:
+            break
+    assert ids == sorted(c["id"] for lista in contas.values() for c in lista)
+
+    # Com uma instância só, a resposta dela volta como veio.
+    unica = [{"id": 1, "agencia": "0001", "numero_conta": "0001", "nome": "Bia"}]
+    monkeypatch.setitem(
+        db_conta._clientes, "http://unica",
+        httpx.AsyncClient(transport=httpx.MockTransport(_instancia(unica, []))),
+    )
+    r = await DbContas(ler_instancias("http://unica")).buscar_contas({"limit": 4})
+    assert r == {"itens": unica, "proximo": None}
@@ -51,9 +51,9 @@ async def test_delete_desativar_requesterror_no_obter(api_async_client):
 async def test_score_credito_zero(api_async_client):
     client, fake = api_async_client
 
-    async def obter_zero(ag, num):
-        return {"saldo_cc": 0.0}
-    fake.obter_conta = obter_zero
+    async def score_zero(ag, num):
+        return {"agencia": ag, "numero_conta": num, "score_credito": 0.0, "percentil": 0.0}
+    fake.score_credito = score_zero
 
     r = await client.get("/contas/1/1/score_credito")
     assert r.status_code == 200
@@ -75,3 +75,96 @@ async def test_desativar_primeiro_try_requesterror(api_async_client):
     r = await client.delete("/contas/321/6543/desativar")
     assert r.status_code == 503
     assert r.json()["detail"]["code"] == "CLIENTES_DB_INDISPONIVEL"
+
+
+@pytest.mark.asyncio
+async def test_resumo_agencias_gateway(api_async_client):
+    client, fake = api_async_client
+    linha = {
+        "agencia": "0001", "quantidade_contas": 2, "total_depositos": 10.0,
+        "exposicao_negativa": 5.0, "cheque_especial_usado": 5.0,
+        "cheque_especial_disponivel": 95.0,
+    }
+
+    async def resumo_ok():
+        return [linha]
+    fake.resumo_agencias = resumo_ok
+    r = await client.get("/contas/resumo")
+    assert r.status_code == 200
+    assert r.json() == [linha]
+
+    async def resumo_erro():
+        raise _http_status_error(500, {"status": 500, "code": "X", "message": "Y"})
+    fake.resumo_agencias = resumo_erro
+    r = await client.get("/contas/resumo")
+    assert r.status_code == 500
+
+    async def resumo_fora():
+        raise httpx.RequestError("unavailable", request=httpx.Request("GET", "http://x"))
+    fake.resumo_agencias = resumo_fora
+    r = await client.get("/contas/resumo")
+    assert r.status_code == 503
+
+
+@pytest.mark.asyncio
+async def test_busca_gateway_sem_id(api_async_client):
+    client, fake = api_async_client
+    recebido = {}
+
+    async def buscar(params):
+        recebido.update(params)
+        conta = await fake.obter_conta("1234", "5678")
+        return {"itens": [conta], "proximo": "abc"}
+    fake.buscar_contas = buscar
+
+    r = await client.get("/contas/busca", params={"nome": "Ma", "limit": 5})
+    assert r.status_code == 200
+    body = r.json()
+    assert recebido == {"nome": "Ma", "limit": 5}
+    assert "id" not in body["itens"][0]
+    assert body["proximo"] == "abc"
+
+    async def buscar_erro(params):
+        raise _http_status_error(422, {"status": 422, "code": "FILTRO_OBRIGATORIO", "message": "x"})
+    fake.buscar_contas = buscar_erro
+    r = await client.get("/contas/busca")
+    assert r.status_code == 422
+    assert r.json()["detail"]["code"] == "FILTRO_OBRIGATORIO"
+
+    async def buscar_fora(params):
+        raise httpx.RequestError("unavailable", request=httpx.Request("GET", "http://x"))
+    fake.buscar_contas = buscar_fora
+    r = await client.get("/contas/busca", params={"cpf": "1"})
+    assert r.status_code == 503
+
+
+@pytest.mark.asyncio
+async def test_ranking_e_score_gateway(api_async_client):
+    client, fake = api_async_client
+    pedidos = []
+
+    async def ranking(top):
+        pedidos.append(top)
+        return [{"agencia": "0001", "numero_conta": "0001", "nome": "Ana", "score_credito": 9.5}]
+    fake.ranking_score = ranking
+
+    r = await client.get("/contas/ranking", params={"top": 3})
+    assert r.status_code == 200
+    assert r.json()[0]["score_credito"] == 9.5
+    assert pedidos == [3]
+
+    r = await client.get("/contas/ranking", params={"top": 0})
+    assert r.status_code == 422
+
+    async def ranking_erro(top):
+        raise _http_status_error(500, {"status": 500, "code": "ERRO", "message": "x"})
+    fake.ranking_score = ranking_erro
+    r = await client.get("/contas/ranking")
+    assert r.status_code == 500
+
+    async def fora(*args):
+        raise httpx.RequestError("unavailable", request=httpx.Request("GET", "http://x"))
+    fake.ranking_score = fora
+    fake.score_credito = fora
+    assert (await client.get("/contas/ranking")).status_code == 503
+    assert (await client.get("/contas/1/1/score_credito")).status_code == 503
@@ -6,9 +6,9 @@ async def test_score_credito_rounding_gateway(api_async_client):
     client, fake = api_async_client
 
     
-    async def obter_custom(ag, num):
-        return {"saldo_cc": 123.45678}
-    fake.obter_conta = obter_custom
+    async def score_custom(ag, num):
+        return {"agencia": ag, "numero_conta": num, "score_credito": 12.3457, "percentil": 0.0}
+    fake.score_credito = score_custom
 
     r = await client.get("/contas/777/8888/score_credito")
     assert r.status_code == 200
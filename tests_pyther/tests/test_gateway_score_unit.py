@@ -3,19 +3,22 @@ import pytest
 from clientes_api.app.routers.contas import calcular_score_gateway
 
 class _FakeDb:
-    def __init__(self, saldo):
-        self._saldo = saldo
-    async def obter_conta(self, ag, num):
-        return {"saldo_cc": self._saldo}
+    def __init__(self, score):
+        self._score = score
+        self.chamadas = []
+    async def score_credito(self, ag, num):
+        self.chamadas.append((ag, num))
+        return {"agencia": ag, "numero_conta": num, "score_credito": self._score, "percentil": 50.0}
 
 @pytest.mark.asyncio
 async def test_score_credito_unit_saldo_zero():
     db = _FakeDb(0.0)  
     resp = await calcular_score_gateway("7", "77", db=db)
-    assert resp == {"agencia": "7", "numero_conta": "77", "score_credito": 0.0}
+    assert resp == {"agencia": "7", "numero_conta": "77", "score_credito": 0.0, "percentil": 50.0}
+    assert db.chamadas == [("7", "77")]
 
 @pytest.mark.asyncio
-async def test_score_credito_unit_rounding():
-    db = _FakeDb(123.45678)  # aciona round(..., 4)
+async def test_score_credito_unit_repassa_score_do_banco():
+    db = _FakeDb(12.3457)
     resp = await calcular_score_gateway("9", "99", db=db)
-    assert resp == {"agencia": "9", "numero_conta": "99", "score_credito": 12.3457}
+    assert resp == {"agencia": "9", "numero_conta": "99", "score_credito": 12.3457, "percentil": 50.0}
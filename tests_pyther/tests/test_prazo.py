@@ -0,0 +1,127 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from sqlalchemy import text
+
+from clientes_api.app.services import prazo as prazo_api
+from clientes_api.app.services.db_conta import DbConta
+from clientes_db.app import prazo as prazo_db
+from clientes_db.app.db import abrir_sessao
+
+CONTA = {
+    "agencia": "0490", "numero_conta": "0001", "nome": "Ana", "cpf": "49049049001",
+    "telefone": 11999999999, "email": "prazo@ex.com", "saldo_cc": 0.0,
+}
+
+
+def test_clientes_db_para_com_o_prazo_esgotado(db_test_client):
+    r = db_test_client.post("/contas", json=CONTA, headers={"X-Prazo-Ms": "0"})
+    assert r.status_code == 504
+    assert r.json()["detail"]["code"] == "PRAZO_ESGOTADO"
+    # Nada foi gravado; com prazo sobrando a mesma requisição passa.
+    assert db_test_client.get("/contas/0490/0001").status_code == 404
+    r = db_test_client.post("/contas", json=CONTA, headers={"X-Prazo-Ms": "5000"})
+    assert r.status_code == 201
+
+
+def test_prazo_invalido_e_ignorado(db_test_client):
+    # Sem um número no cabeçalho a requisição segue sem prazo.
+    conta = {**CONTA, "agencia": "0491"}
+    r = db_test_client.post("/contas", json=conta, headers={"X-Prazo-Ms": "logo"})
+    assert r.status_code == 201
+
+
+def test_prazo_conferido_entre_statements():
+    db = abrir_sessao(leitura=True)
+    token = prazo_db._fim.set(time.monotonic() + 0.05)
+    try:
+        assert db.execute(text("SELECT 1")).scalar() == 1
+        time.sleep(0.06)
+        with pytest.raises(prazo_db.PrazoEsgotado):
+            db.execute(text("SELECT 2"))
+        # Trabalho feito em nome de outras requisições ignora o prazo.
+        with prazo_db.suspenso():
+            assert db.execute(text("SELECT 3")).scalar() == 3
+    finally:
+        prazo_db._fim.reset(token)
+        db.close()
+
+
+@pytest.mark.asyncio
+async def test_desativar_divide_um_prazo_so(api_async_client, monkeypatch):
+    client, fake = api_async_client
+    monkeypatch.setitem(prazo_api.PRAZOS_S, "desativar_conta", 0.2)
+    restantes = []
+
+    async def obter(ag, num):
+        restantes.append(prazo_api.opcoes()["timeout"])
+        await asyncio.sleep(0.05)
+        return {"saldo_cc": 0.0}
+
+    async def desativar(ag, num):
+        restantes.append(prazo_api.opcoes()["timeout"])
+
+    monkeypatch.setattr(fake, "obter_conta", obter)
+    monkeypatch.setattr(fake, "desativar_conta", desativar)
+
+    r = await client.delete("/contas/0490/0001/desativar")
+    assert r.status_code == 204
+    assert 0.2 >= restantes[0] > restantes[1] + 0.04
+
+    # Quem chama pode encurtar o prazo: a segunda chamada nem sai.
+    restantes.clear()
+    r = await client.delete("/contas/0490/0001/desativar", headers={"X-Prazo-Ms": "30"})
+    assert r.status_code == 504
+    assert r.json()["detail"]["code"] == "PRAZO_ESGOTADO"
+    assert len(restantes) == 1
+
+
+@pytest.mark.asyncio
+async def test_gateway_ignora_prazo_invalido(api_async_client, monkeypatch):
+    client, fake = api_async_client
+    restantes = []
+
+    async def obter(ag, num):
+        restantes.append(prazo_api.opcoes()["timeout"])
+        return {"saldo_cc": 0.0}
+
+    async def desativar(ag, num):
+        pass
+
+    monkeypatch.setattr(fake, "obter_conta", obter)
+    monkeypatch.setattr(fake, "desativar_conta", desativar)
+    r = await client.delete("/contas/0490/0001/desativar", headers={"X-Prazo-Ms": "logo"})
+    assert r.status_code == 204
+    assert prazo_api.PRAZO_PADRAO_S - 1 < restantes[0] <= prazo_api.PRAZO_PADRAO_S
+
+
+@pytest.mark.asyncio
+async def test_db_conta_repassa_o_restante(monkeypatch):
+    chamadas = []
+
+    class _Client:
+        async def __aenter__(self): return self
+        async def __aexit__(self, *a): pass
+
+        async def put(self, url, json=None, headers=None, timeout=None):
+            chamadas.append((headers, timeout))
+            return httpx.Response(200, json={}, request=httpx.Request("PUT", url))
+
+    monkeypatch.setattr(httpx, "AsyncClient", _Client)
+    db = DbConta(base_url="http://fake:8001")
+
+    await db.atualizar_conta("0490", "0001", {}, if_match='"v1"')
+    assert chamadas[-1] == ({"If-Match": '"v1"'}, prazo_api.PRAZO_PADRAO_S)
+
+    prazo_api._fim.set(time.monotonic() + 2)
+    await db.atualizar_conta("0490", "0001", {}, if_match='"v1"')
+    cabecalhos, timeout = chamadas[-1]
+    assert cabecalhos["If-Match"] == '"v1"'
+    assert 1.9 < timeout <= 2
+    assert 1900 < int(cabecalhos["X-Prazo-Ms"]) <= 2000
+
+    prazo_api._fim.set(time.monotonic())
+    with pytest.raises(httpx.TimeoutException):
+        await db.atualizar_conta("0490", "0001", {})